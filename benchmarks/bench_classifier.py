@@ -0,0 +1,89 @@
+"""
+Benchmark for question classification (root router.classify_query).
+
+Runs the labeled evaluation set in benchmarks/data/classifier_eval.yml
+through:
+- the local classifier (core/subsystem_1/intent_classifier.py),
+- the hybrid path (local, LLM only below the confidence threshold),
+- the LLM alone (only with OPENAI_API_KEY set and langchain_openai installed),
+and reports accuracy, LLM calls and p50/p99 latency for each.
+
+Run from the project root:
+    python benchmarks/bench_classifier.py
+"""
+
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import yaml
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from core.subsystem_1.intent_classifier import classify_locally, confidence_threshold, get_classifier  # noqa: E402
+
+EVAL_FILE = Path(__file__).parent / "data" / "classifier_eval.yml"
+
+
+def load_eval_set():
+    content = yaml.safe_load(EVAL_FILE.read_text())
+    return [(text, label) for label, texts in content.items() for text in texts]
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run(name, classify, samples):
+    latencies, correct, llm_calls = [], 0, 0
+    for text, label in samples:
+        start = time.perf_counter()
+        predicted, used_llm = classify(text)
+        latencies.append((time.perf_counter() - start) * 1000)
+        correct += predicted == label
+        llm_calls += used_llm
+    print(
+        f"  {name:<8} accuracy {correct / len(samples):6.1%}  "
+        f"llm calls {llm_calls:3d}/{len(samples)}  "
+        f"p50 {statistics.median(latencies):8.3f} ms  p99 {_percentile(latencies, 99):8.3f} ms"
+    )
+
+
+def main() -> None:
+    samples = load_eval_set()
+    get_classifier()  # training is a one-off start-up cost, keep it out of the timings
+    threshold = confidence_threshold()
+    print(f"{len(samples)} labeled questions, confidence threshold {threshold}")
+
+    run("local", lambda t: (classify_locally(t).label, False), samples)
+
+    llm_available = bool(os.getenv("OPENAI_API_KEY"))
+    try:
+        import langchain_openai  # noqa: F401
+    except ImportError:
+        llm_available = False
+
+    if not llm_available:
+        confident = [t for t, _ in samples if classify_locally(t).confidence >= threshold]
+        print(f"  hybrid/llm skipped (no OPENAI_API_KEY or langchain_openai); "
+              f"{len(confident)}/{len(samples)} questions would skip the LLM")
+        return
+
+    from router import classify_query_with_llm
+
+    def hybrid(text):
+        prediction = classify_locally(text)
+        if prediction.confidence >= threshold:
+            return prediction.label, False
+        return classify_query_with_llm(text), True
+
+    run("hybrid", hybrid, samples)
+    run("llm", lambda t: (classify_query_with_llm(t), True), samples)
+
+
+if __name__ == "__main__":
+    main()
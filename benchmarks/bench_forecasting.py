@@ -0,0 +1,62 @@
+"""
+Micro-benchmark for core/services/forecasting.py.
+
+Times a full forecast (rolling-origin backtest of every model plus the final
+fit) over 12, 24 and 36 months of synthetic seasonal history, next to the
+pure-Python linear trend it replaces, then forecast_segments over 1 to 500
+segments of 36 months.
+
+Run from the project root:
+    python benchmarks/bench_forecasting.py [iterations]
+"""
+
+import sys
+import timeit
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core.services.forecasting import forecast_monthly, forecast_segments  # noqa: E402
+from core.subsystem_2.pandas_agent import (  # noqa: E402
+    _calculate_linear_trend,
+    _predict_future_subscriptions,
+)
+
+
+def _history(months: int):
+    rng = np.random.default_rng(0)
+    return [
+        (2021 + i // 12, i % 12 + 1, 100 + 3 * i + (40 if i % 12 >= 10 else 0) + rng.normal(0, 5))
+        for i in range(months)
+    ]
+
+
+def _linear(history):
+    slope, intercept = _calculate_linear_trend(history)
+    return _predict_future_subscriptions(history, slope, intercept)
+
+
+def main() -> None:
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    for months in (12, 24, 36):
+        history = _history(months)
+        forecast = forecast_monthly(history)
+        engine_ms = timeit.timeit(lambda: forecast_monthly(history), number=iterations) / iterations * 1e3
+        linear_ms = timeit.timeit(lambda: _linear(history), number=iterations) / iterations * 1e3
+        print(
+            f"{months} months: forecast_monthly {engine_ms:6.2f} ms (picked {forecast.model}), "
+            f"linear trend {linear_ms:6.3f} ms"
+        )
+
+    history = _history(36)
+    for count in (1, 10, 100, 500):
+        series = {f"segment_{i}": [(y, m, c * (1 + i % 7)) for y, m, c in history] for i in range(count)}
+        runs = max(1, iterations // 20)
+        ms = timeit.timeit(lambda: forecast_segments(series), number=runs) / runs * 1e3
+        print(f"{count:3d} segments x 36 months: forecast_segments {ms:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
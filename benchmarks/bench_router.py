@@ -0,0 +1,60 @@
+"""
+Micro-benchmark for core/subsystem_1/router.py.
+
+Reports the cost per message of route_message, and of the keyword scan
+alone next to the previous approach (one `any(k in lower ...)` substring
+loop per keyword table).
+
+Run from the project root:
+    python benchmarks/bench_router.py [iterations]
+"""
+
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core.subsystem_1.router import KEYWORD_TABLES, route_message, scan_keywords  # noqa: E402
+from core.subsystem_1.routing_rules import get_routing_rules  # noqa: E402
+
+MESSAGES = [
+    "help",
+    "hello",
+    "how many users signed up last month by country?",
+    "what is our total revenue from payments last quarter in the EU?",
+    "show me churn rate by plan",
+    "predict subscriptions for next year",
+    "SELECT plan, COUNT(*) FROM subscriptions GROUP BY plan",
+    "generate sql for active subscriptions by country",
+    "list queries",
+    "what's the average session duration by activity type over time?",
+    "which holiday campaigns drove the most black friday sales",
+    "thanks, that is really useful for this week's report",
+]
+
+
+TABLES = {**KEYWORD_TABLES, **{name: list(words) for name, words in get_routing_rules().datasets.items()}}
+
+
+def substring_scan(lower: str) -> set:
+    """The previous matcher: a substring loop per keyword table."""
+    return {name for name, keywords in TABLES.items() if any(k in lower for k in keywords)}
+
+
+def _per_message_us(func, iterations: int) -> float:
+    lowered = [m.lower().strip() for m in MESSAGES]
+    seconds = timeit.timeit(lambda: [func(m) for m in lowered], number=iterations)
+    return seconds / (iterations * len(lowered)) * 1e6
+
+
+def main() -> None:
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print(f"{len(MESSAGES)} messages x {iterations} iterations")
+    print(f"  route_message          {_per_message_us(route_message, iterations):7.2f} us/message")
+    print(f"  scan_keywords (1 pass) {_per_message_us(scan_keywords, iterations):7.2f} us/message")
+    print(f"  substring loops        {_per_message_us(substring_scan, iterations):7.2f} us/message")
+
+
+if __name__ == "__main__":
+    main()
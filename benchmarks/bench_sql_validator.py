@@ -0,0 +1,57 @@
+"""
+Micro-benchmark for core/services/sql_validator.py.
+
+Validates the golden queries from semantic_layer/*.yml and reports the cost
+per query of a cold validation (tokenize + parse + checks), of a
+reformatted repeat (token-hash hit) and of an exact repeat (raw-hash hit).
+
+Run from the project root:
+    python benchmarks/bench_sql_validator.py [iterations]
+"""
+
+import re
+import sys
+import timeit
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from core.services.sql_validator import clear_validation_cache, validate_sql  # noqa: E402
+
+_GOLDEN_SQL = re.compile(r"^\s*sql:\s*\n(.*?)(?=^\s*- name:|^[A-Za-z_]+:|\Z)", re.MULTILINE | re.DOTALL)
+
+
+def golden_queries() -> list:
+    queries = []
+    for path in sorted((ROOT / "semantic_layer").glob("*.yml")):
+        queries += [m.strip() for m in _GOLDEN_SQL.findall(path.read_text()) if m.strip()]
+    return queries
+
+
+def _per_query_us(func, queries, iterations: int) -> float:
+    seconds = timeit.timeit(lambda: [func(q) for q in queries], number=iterations)
+    return seconds / (iterations * len(queries)) * 1e6
+
+
+def main() -> None:
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    queries = golden_queries()
+    rejected = [q for q in queries if not validate_sql(q).ok]
+    print(f"{len(queries)} golden queries ({len(rejected)} rejected) x {iterations} iterations")
+
+    def cold(sql):
+        clear_validation_cache()
+        return validate_sql(sql)
+
+    reformatted = [" ".join(q.split()) for q in queries]
+
+    print(f"  cold (parse)            {_per_query_us(cold, queries, max(1, iterations // 10)):9.2f} us/query")
+    for q in queries:
+        validate_sql(q)
+    print(f"  reformatted (token hit) {_per_query_us(validate_sql, reformatted, 1):9.2f} us/query (first pass)")
+    print(f"  exact repeat (raw hit)  {_per_query_us(validate_sql, queries, iterations):9.2f} us/query")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Slack reply text shared by the sync (main.py) and async (main_async.py) apps.
+"""
+
+HELP_MESSAGE = (
+    "👋 I'm your analyst agent powered by PandasAI v3!\n\n"
+    "*For non-technical users:*\n"
+    "Ask me questions in natural language:\n"
+    "• *Which regions had the most users last month?*\n"
+    "• *What products drove the most revenue last holiday season?*\n"
+    "• *What is churn rate by plan?*\n"
+    "• *Show me subscriptions in the EU*\n"
+    "• *Predict new subscriptions for next year?*\n\n"
+    "*For data scientists:*\n"
+    "• *List queries* - See available golden queries\n"
+    "• *Create SQL query for [table] [filters]* - Generate SQL queries\n"
+    "  Example: \"Create SQL query for subscriptions in EU\"\n"
+    "• Paste SQL queries directly (SELECT only)\n"
+    "  Reply *cancel* to stop a running query, *confirm* to run an expensive one\n"
+    "• Use queries from semantic layer as templates\n\n"
+    "*Powered by:* PandasAI v3 with semantic layer integration"
+)
+
+UNKNOWN_MESSAGE = (
+    "Hmm, I’m not sure what to do with that yet 🤔.\n"
+    "Try asking for *help* or mention *users, payments, subscriptions, or sessions*."
+)
+
+BUSY_MESSAGE = (
+    "I'm working through a lot of questions right now ⏳.\n"
+    "Please try again in a minute."
+)
+
+# Appended to partial answers while the LLM insights are being generated
+INSIGHTS_PENDING = "\n\n_⏳ Adding LLM insights..._"
+
+# Placeholder posted as soon as a message is routed, per intent
+_PLACEHOLDERS = {
+    "data_question": "⏳ Looking into the {dataset} data...",
+    "prediction": "⏳ Forecasting subscriptions...",
+    "sql_query": "⏳ Checking and running your query...",
+    "confirm_query": "⏳ Running your confirmed query...",
+    "list_queries": "⏳ Collecting golden queries...",
+    "generate_sql": "⏳ Writing your SQL query...",
+}
+
+# What the bot was trying to do, per intent, for error replies
+_ERROR_ACTIONS = {
+    "data_question": "run that analysis on the data",
+    "prediction": "generate predictions",
+    "sql_query": "execute your SQL query",
+    "confirm_query": "execute your SQL query",
+    "list_queries": "list golden queries",
+    "generate_sql": "generate a SQL query",
+}
+
+
+def format_answer(intent: str, dataset: str, answer: str) -> str:
+    """Add the per-intent header to an agent answer."""
+    if intent == "data_question" and dataset != "none":
+        return f"🧠 *Answer from `{dataset}` data:*\n{answer}"
+    if intent == "prediction":
+        return f"🔮 *Subscription Prediction:*\n{answer}"
+    return answer
+
+
+def format_placeholder(intent: str, dataset: str) -> str:
+    """First reply to a routed message, replaced as the answer comes in."""
+    text = _PLACEHOLDERS.get(intent, "⏳ Working on it...")
+    return text.format(dataset=f"`{dataset}`" if dataset != "none" else "relevant")
+
+
+def format_error(intent: str, error: Exception) -> str:
+    """Reply shown when an intent handler raised."""
+    action = _ERROR_ACTIONS.get(intent, "answer that")
+    return (
+        f"I tried to {action} but hit an error ⚠️.\n"
+        f"_Internal error:_ `{error}`"
+    )
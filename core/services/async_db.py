@@ -0,0 +1,195 @@
+"""
+Asyncio access to PostgreSQL for the async Slack app (main_async.py).
+
+Uses psycopg2's native asynchronous connections, driven by the event loop's
+reader/writer callbacks, so the async app needs no extra database driver.
+Async connections run in autocommit mode, so the statement timeout is set
+once per connection rather than per checkout.
+"""
+
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2.extras import RealDictCursor
+
+from core.services.db_pool import PoolConfig, PoolTimeoutError
+
+
+async def _wait(conn) -> None:
+    """Drive an async psycopg2 connection until the pending operation completes."""
+    loop = asyncio.get_running_loop()
+    while True:
+        state = conn.poll()
+        if state == psycopg2.extensions.POLL_OK:
+            return
+
+        fd = conn.fileno()
+        done = loop.create_future()
+
+        def _ready():
+            if not done.done():
+                done.set_result(None)
+
+        if state == psycopg2.extensions.POLL_READ:
+            loop.add_reader(fd, _ready)
+            remove = loop.remove_reader
+        elif state == psycopg2.extensions.POLL_WRITE:
+            loop.add_writer(fd, _ready)
+            remove = loop.remove_writer
+        else:
+            raise psycopg2.OperationalError(f"Unexpected poll state: {state}")
+
+        try:
+            await done
+        finally:
+            remove(fd)
+
+
+class _AsyncPooledConnection:
+    __slots__ = ("conn", "created_at")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+
+
+class AsyncConnectionPool:
+    """
+    Size-bounded pool of async psycopg2 connections for one event loop.
+
+    Shares `PoolConfig` (and its env vars) with the threaded pool in
+    `db_pool`. A query cancelled mid-flight (e.g. the Slack task is
+    cancelled) sends a server-side cancel and discards the connection.
+    """
+
+    def __init__(self, config: Optional[PoolConfig] = None):
+        self.config = config or PoolConfig.from_env()
+        self._slots = asyncio.Semaphore(self.config.max_size)
+        self._idle: List[_AsyncPooledConnection] = []
+        self._in_use = 0
+
+    async def _connect(self) -> _AsyncPooledConnection:
+        conn = psycopg2.connect(
+            host=os.environ["DB_HOST"],
+            port=int(os.environ.get("DB_PORT", "5432")),
+            user=os.environ["DB_USER"],
+            password=os.environ["DB_PASS"],
+            dbname=os.environ["DB_NAME"],
+            sslmode=os.environ.get("DB_SSLMODE", "require"),
+            async_=True,
+        )
+        await _wait(conn)
+        if self.config.statement_timeout_ms:
+            cur = conn.cursor()
+            cur.execute("SET statement_timeout = %s", (int(self.config.statement_timeout_ms),))
+            await _wait(conn)
+            cur.close()
+        return _AsyncPooledConnection(conn)
+
+    def _is_expired(self, pooled: _AsyncPooledConnection) -> bool:
+        if pooled.conn.closed:
+            return True
+        if self.config.max_lifetime and time.monotonic() - pooled.created_at > self.config.max_lifetime:
+            return True
+        return False
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator:
+        """Check out an async connection for the duration of the block."""
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.config.checkout_timeout)
+        except asyncio.TimeoutError:
+            raise PoolTimeoutError(
+                f"Timed out after {self.config.checkout_timeout:.1f}s waiting for a "
+                f"database connection ({self._in_use}/{self.config.max_size} in use)"
+            )
+
+        pooled = None
+        healthy = False
+        try:
+            while self._idle:
+                candidate = self._idle.pop()
+                if self._is_expired(candidate):
+                    candidate.conn.close()
+                    continue
+                pooled = candidate
+                break
+            if pooled is None:
+                pooled = await self._connect()
+
+            self._in_use += 1
+            try:
+                yield pooled.conn
+                healthy = True
+            except asyncio.CancelledError:
+                # Stop the server-side work before giving up the connection
+                try:
+                    pooled.conn.cancel()
+                except psycopg2.Error:
+                    pass
+                raise
+            finally:
+                self._in_use -= 1
+        finally:
+            # Connections that saw an error may be mid-statement; never reuse them
+            if pooled is not None:
+                if healthy and not self._is_expired(pooled):
+                    self._idle.append(pooled)
+                else:
+                    pooled.conn.close()
+            self._slots.release()
+
+    async def fetch_all(self, sql: str, params: Optional[Sequence[Any]] = None,
+                        prelude: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Run a query and return all rows as dicts.
+
+        Args:
+            prelude: Statements run first that open a transaction (e.g.
+                `BEGIN READ ONLY`); it is committed after the query.
+        """
+        async with self.connection() as conn:
+            cur = conn.cursor(cursor_factory=RealDictCursor)
+            try:
+                if prelude:
+                    cur.execute(prelude)
+                    await _wait(conn)
+                cur.execute(sql, params)
+                await _wait(conn)
+                rows = [dict(row) for row in cur.fetchall()]
+                if prelude:
+                    # On error the connection is discarded with its transaction
+                    cur.execute("COMMIT")
+                    await _wait(conn)
+                return rows
+            finally:
+                cur.close()
+
+    def close(self) -> None:
+        """Close idle connections."""
+        idle, self._idle = self._idle, []
+        for pooled in idle:
+            pooled.conn.close()
+
+
+_pools: Dict[int, AsyncConnectionPool] = {}
+
+
+def get_async_pool() -> AsyncConnectionPool:
+    """Return the pool bound to the running event loop, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(id(loop))
+    if pool is None:
+        pool = _pools[id(loop)] = AsyncConnectionPool()
+    return pool
+
+
+async def fetch_all(sql: str, params: Optional[Sequence[Any]] = None,
+                    prelude: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Run a query on the event loop's pool and return all rows as dicts."""
+    return await get_async_pool().fetch_all(sql, params, prelude=prelude)
@@ -0,0 +1,200 @@
+"""
+In-process cache of DataFrames loaded for PandasAI.
+
+Entries are keyed by the rendered load query (table, column set, filters
+and load mode), bounded by total DataFrame memory with LRU eviction, and
+expire after a TTL. Each entry remembers the table's data watermark (e.g.
+max `payment_date`); a hit whose watermark no longer matches is treated as
+stale. Listeners registered with `add_invalidation_listener` are told when
+a table's entries are dropped.
+"""
+
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+
+@dataclass
+class CachedFrame:
+    """A loaded DataFrame plus what is needed to validate and reuse it."""
+    key: Hashable
+    table: str
+    df: Any
+    plan: Any
+    watermark: Any
+    loaded_at: float
+    nbytes: int
+    version: int
+
+
+@dataclass
+class CacheStats:
+    """Point-in-time snapshot of cache metrics."""
+    hits: int
+    misses: int
+    stale: int
+    expired: int
+    evictions: int
+    entries: int
+    bytes: int
+    max_bytes: int
+
+
+def _frame_bytes(df) -> int:
+    try:
+        return int(df.memory_usage(index=True, deep=True).sum())
+    except Exception:
+        return 0
+
+
+class DataFrameCache:
+    """
+    Thread-safe TTL + LRU cache bounded by total DataFrame bytes.
+
+    A frame larger than `max_bytes` is returned to the caller but not cached.
+    """
+
+    def __init__(self, max_bytes: int, ttl_seconds: float, clock: Callable[[], float] = time.monotonic):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, CachedFrame]" = OrderedDict()
+        self._bytes = 0
+        self._versions = itertools.count(1)
+        self._listeners: List[Callable[[str], None]] = []
+
+        self._hits = 0
+        self._misses = 0
+        self._stale = 0
+        self._expired = 0
+        self._evictions = 0
+
+    def _drop(self, key: Hashable) -> CachedFrame:
+        entry = self._entries.pop(key)
+        self._bytes -= entry.nbytes
+        return entry
+
+    def get(self, key: Hashable, watermark: Any = None) -> Optional[CachedFrame]:
+        """
+        Return the cached frame for `key`, or None on a miss.
+
+        Args:
+            key: Cache key (see `LoadPlan.cache_key`)
+            watermark: Current data watermark of the table; when given and
+                different from the cached one the entry is dropped as stale
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            if self._clock() - entry.loaded_at > self.ttl_seconds:
+                self._drop(key)
+                self._expired += 1
+                self._misses += 1
+                return None
+            if watermark is not None and watermark != entry.watermark:
+                self._drop(key)
+                self._stale += 1
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry
+
+    def put(self, key: Hashable, table: str, df, plan: Any = None, watermark: Any = None) -> CachedFrame:
+        """Cache a freshly loaded frame and return its entry."""
+        entry = CachedFrame(
+            key=key,
+            table=table,
+            df=df,
+            plan=plan,
+            watermark=watermark,
+            loaded_at=self._clock(),
+            nbytes=_frame_bytes(df),
+            version=next(self._versions),
+        )
+        if entry.nbytes > self.max_bytes:
+            return entry
+
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = entry
+            self._bytes += entry.nbytes
+            while self._bytes > self.max_bytes and self._entries:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self._evictions += 1
+        return entry
+
+    def invalidate(self, table: Optional[str] = None) -> int:
+        """
+        Drop all entries for `table` (or everything when table is None) and
+        notify invalidation listeners.
+
+        Returns:
+            Number of entries dropped
+        """
+        with self._lock:
+            keys = [k for k, e in self._entries.items() if table is None or e.table == table]
+            tables = {self._entries[k].table for k in keys}
+            for key in keys:
+                self._drop(key)
+            listeners = list(self._listeners)
+
+        for name in tables if table is None else {table}:
+            for listener in listeners:
+                listener(name)
+        return len(keys)
+
+    def add_invalidation_listener(self, listener: Callable[[str], None]) -> None:
+        """Call `listener(table)` whenever a table's entries are invalidated."""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(
+                hits=self._hits,
+                misses=self._misses,
+                stale=self._stale,
+                expired=self._expired,
+                evictions=self._evictions,
+                entries=len(self._entries),
+                bytes=self._bytes,
+                max_bytes=self.max_bytes,
+            )
+
+
+# ---------- process-wide cache ----------
+
+_cache: Optional[DataFrameCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_dataframe_cache() -> DataFrameCache:
+    """
+    Return the process-wide cache, configured from:
+    - DF_CACHE_MAX_MB       (total DataFrame memory, default 256)
+    - DF_CACHE_TTL_SECONDS  (entry lifetime, default 600)
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = DataFrameCache(
+                    max_bytes=int(float(os.environ.get("DF_CACHE_MAX_MB", "256")) * 1024 * 1024),
+                    ttl_seconds=float(os.environ.get("DF_CACHE_TTL_SECONDS", "600")),
+                )
+    return _cache
+
+
+def get_cache_metrics() -> Dict[str, int]:
+    """Cache metrics as a plain dict (for logging or a /metrics command)."""
+    return dict(vars(get_dataframe_cache().stats()))
@@ -0,0 +1,362 @@
+"""
+Shared PostgreSQL connection pool.
+
+One process-wide, size-bounded pool used by both the data agent and the
+PandasAI service so that short queries reuse an already-negotiated TLS
+connection instead of paying the handshake on every question.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional
+
+import psycopg2
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection could be checked out within the timeout."""
+
+
+@dataclass
+class PoolConfig:
+    """Pool sizing and lifecycle settings (see `PoolConfig.from_env`)."""
+    min_size: int = 1
+    max_size: int = 10
+    checkout_timeout: float = 10.0
+    max_lifetime: float = 1800.0
+    max_idle: float = 300.0
+    health_check_after: float = 30.0
+    statement_timeout_ms: int = 30000
+
+    @classmethod
+    def from_env(cls) -> "PoolConfig":
+        """
+        Build the pool configuration from environment variables:
+        - DB_POOL_MIN_SIZE / DB_POOL_MAX_SIZE
+        - DB_POOL_CHECKOUT_TIMEOUT  (seconds to wait for a free connection)
+        - DB_POOL_MAX_LIFETIME      (seconds before a connection is recycled)
+        - DB_POOL_MAX_IDLE          (seconds an idle connection is kept)
+        - DB_POOL_HEALTH_CHECK_AFTER (idle seconds before a ping on checkout)
+        - DB_STATEMENT_TIMEOUT_MS   (per-checkout statement_timeout, 0 = off)
+        """
+        return cls(
+            min_size=int(os.environ.get("DB_POOL_MIN_SIZE", "1")),
+            max_size=int(os.environ.get("DB_POOL_MAX_SIZE", "10")),
+            checkout_timeout=float(os.environ.get("DB_POOL_CHECKOUT_TIMEOUT", "10")),
+            max_lifetime=float(os.environ.get("DB_POOL_MAX_LIFETIME", "1800")),
+            max_idle=float(os.environ.get("DB_POOL_MAX_IDLE", "300")),
+            health_check_after=float(os.environ.get("DB_POOL_HEALTH_CHECK_AFTER", "30")),
+            statement_timeout_ms=int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", "30000")),
+        )
+
+
+@dataclass
+class PoolStats:
+    """Point-in-time snapshot of pool metrics."""
+    size: int
+    in_use: int
+    idle: int
+    waiters: int
+    max_size: int
+    checkouts: int
+    checkout_timeouts: int
+    connections_created: int
+    connections_recycled: int
+    health_check_failures: int
+    avg_checkout_ms: float
+    max_checkout_ms: float
+
+
+class _PooledConnection:
+    """Bookkeeping wrapper around a raw psycopg2 connection."""
+
+    __slots__ = ("conn", "created_at", "last_used")
+
+    def __init__(self, conn):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used = now
+
+
+def _connect():
+    """
+    Create a new Postgres connection using env vars.
+    """
+    return psycopg2.connect(
+        host=os.environ["DB_HOST"],
+        port=int(os.environ.get("DB_PORT", "5432")),
+        user=os.environ["DB_USER"],
+        password=os.environ["DB_PASS"],
+        dbname=os.environ["DB_NAME"],
+        sslmode=os.environ.get("DB_SSLMODE", "require"),
+    )
+
+
+class ConnectionPool:
+    """
+    Thread-safe, size-bounded pool of psycopg2 connections.
+
+    - Connections are created lazily up to `max_size`; callers beyond that
+      wait up to `checkout_timeout` seconds for one to be returned.
+    - Connections older than `max_lifetime` or idle longer than `max_idle`
+      are closed and replaced.
+    - Connections idle longer than `health_check_after` are pinged with
+      `SELECT 1` before being handed out.
+    - Each checkout runs inside one transaction with `SET LOCAL
+      statement_timeout`; the transaction is rolled back on return so no
+      state leaks between callers.
+    """
+
+    def __init__(self, config: Optional[PoolConfig] = None, connect=_connect):
+        self.config = config or PoolConfig.from_env()
+        self._connect = connect
+        self._cond = threading.Condition()
+        self._idle: List[_PooledConnection] = []
+        self._size = 0
+        self._in_use = 0
+        self._waiters = 0
+        self._closed = False
+
+        self._checkouts = 0
+        self._checkout_timeouts = 0
+        self._created = 0
+        self._recycled = 0
+        self._health_failures = 0
+        self._checkout_ms_total = 0.0
+        self._checkout_ms_max = 0.0
+
+    # ---------- checkout / return ----------
+
+    def _is_expired(self, pooled: _PooledConnection, now: float) -> bool:
+        if pooled.conn.closed:
+            return True
+        if self.config.max_lifetime and now - pooled.created_at > self.config.max_lifetime:
+            return True
+        if self.config.max_idle and now - pooled.last_used > self.config.max_idle:
+            return True
+        return False
+
+    def _is_healthy(self, pooled: _PooledConnection) -> bool:
+        try:
+            with pooled.conn.cursor() as cur:
+                cur.execute("SELECT 1")
+                cur.fetchone()
+            pooled.conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, pooled: _PooledConnection) -> None:
+        try:
+            pooled.conn.close()
+        except Exception:
+            pass
+
+    def _acquire(self) -> _PooledConnection:
+        started = time.monotonic()
+        deadline = started + self.config.checkout_timeout
+
+        while True:
+            create = False
+            pooled = None
+
+            with self._cond:
+                if self._closed:
+                    raise PoolTimeoutError("Connection pool is closed")
+
+                while not self._idle and self._size >= self.config.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._checkout_timeouts += 1
+                        raise PoolTimeoutError(
+                            f"Timed out after {self.config.checkout_timeout:.1f}s waiting for a "
+                            f"database connection ({self._in_use}/{self.config.max_size} in use)"
+                        )
+                    self._waiters += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiters -= 1
+
+                if self._idle:
+                    # LIFO keeps the hottest connections in use and lets the
+                    # rest age out through max_idle.
+                    pooled = self._idle.pop()
+                else:
+                    create = True
+                # Reserve the slot before doing any network I/O.
+                self._in_use += 1
+                if create:
+                    self._size += 1
+
+            if create:
+                try:
+                    pooled = _PooledConnection(self._connect())
+                except Exception:
+                    with self._cond:
+                        self._in_use -= 1
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._created += 1
+                break
+
+            now = time.monotonic()
+            reusable = not self._is_expired(pooled, now)
+            if reusable and now - pooled.last_used > self.config.health_check_after:
+                reusable = self._is_healthy(pooled)
+                if not reusable:
+                    with self._cond:
+                        self._health_failures += 1
+
+            if reusable:
+                break
+
+            self._discard(pooled)
+            with self._cond:
+                self._in_use -= 1
+                self._size -= 1
+                self._recycled += 1
+                self._cond.notify()
+
+        elapsed_ms = (time.monotonic() - started) * 1000.0
+        with self._cond:
+            self._checkouts += 1
+            self._checkout_ms_total += elapsed_ms
+            self._checkout_ms_max = max(self._checkout_ms_max, elapsed_ms)
+        return pooled
+
+    def _release(self, pooled: _PooledConnection) -> None:
+        keep = not pooled.conn.closed
+        if keep:
+            try:
+                pooled.conn.rollback()
+            except psycopg2.Error:
+                keep = False
+
+        now = time.monotonic()
+        pooled.last_used = now
+        if keep and self.config.max_lifetime and now - pooled.created_at > self.config.max_lifetime:
+            keep = False
+
+        with self._cond:
+            self._in_use -= 1
+            keep = keep and not self._closed
+            if keep:
+                self._idle.append(pooled)
+            else:
+                self._size -= 1
+                self._recycled += 1
+            self._cond.notify()
+
+        if not keep:
+            self._discard(pooled)
+
+    @contextmanager
+    def connection(self, statement_timeout_ms: Optional[int] = None) -> Iterator:
+        """
+        Check out a connection for the duration of the `with` block.
+
+        Args:
+            statement_timeout_ms: Override the pool-wide statement timeout for
+                this checkout (0 disables it).
+        """
+        pooled = self._acquire()
+        try:
+            timeout = (
+                self.config.statement_timeout_ms
+                if statement_timeout_ms is None
+                else statement_timeout_ms
+            )
+            if timeout:
+                with pooled.conn.cursor() as cur:
+                    cur.execute("SET LOCAL statement_timeout = %s", (int(timeout),))
+            yield pooled.conn
+        finally:
+            self._release(pooled)
+
+    # ---------- maintenance ----------
+
+    def warm_up(self) -> None:
+        """Open `min_size` connections ahead of the first request."""
+        conns = []
+        try:
+            for _ in range(min(self.config.min_size, self.config.max_size)):
+                conns.append(self._acquire())
+        finally:
+            for pooled in conns:
+                self._release(pooled)
+
+    def close(self) -> None:
+        """Close all idle connections and refuse further checkouts."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for pooled in idle:
+            self._discard(pooled)
+
+    def stats(self) -> PoolStats:
+        """Return a snapshot of the pool metrics."""
+        with self._cond:
+            return PoolStats(
+                size=self._size,
+                in_use=self._in_use,
+                idle=len(self._idle),
+                waiters=self._waiters,
+                max_size=self.config.max_size,
+                checkouts=self._checkouts,
+                checkout_timeouts=self._checkout_timeouts,
+                connections_created=self._created,
+                connections_recycled=self._recycled,
+                health_check_failures=self._health_failures,
+                avg_checkout_ms=(self._checkout_ms_total / self._checkouts) if self._checkouts else 0.0,
+                max_checkout_ms=self._checkout_ms_max,
+            )
+
+
+# ---------- process-wide pool ----------
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Return the process-wide pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+def get_connection(statement_timeout_ms: Optional[int] = None):
+    """
+    Context manager yielding a pooled connection:
+
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                ...
+    """
+    return get_pool().connection(statement_timeout_ms=statement_timeout_ms)
+
+
+def get_pool_metrics() -> Dict[str, float]:
+    """Pool metrics as a plain dict (for logging or a /metrics command)."""
+    return dict(vars(get_pool().stats()))
+
+
+def close_pool() -> None:
+    """Close the process-wide pool (used on shutdown and in tests)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
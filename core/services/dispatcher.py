@@ -0,0 +1,221 @@
+"""
+Event dispatcher for Slack message handling.
+
+The Slack listener only routes the message and hands the slow part (Postgres
+queries and LLM round-trips) to a bounded worker pool, so the event is acked
+immediately and one slow PandasAI question does not stall other users.
+Each intent has its own concurrency limit so, for example, a burst of
+`data_question` messages cannot starve quick `list_queries` replies.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Default per-intent concurrency limits (overridable via DISPATCH_INTENT_LIMITS)
+DEFAULT_INTENT_LIMITS: Dict[str, int] = {
+    "data_question": 4,
+    "prediction": 2,
+    "sql_query": 4,
+    "generate_sql": 8,
+    "list_queries": 8,
+}
+
+
+def _parse_intent_limits(raw: str) -> Dict[str, int]:
+    """
+    Parse "data_question=4,prediction=2" into a dict.
+    Malformed entries are ignored.
+    """
+    limits: Dict[str, int] = {}
+    for item in raw.split(","):
+        name, _, value = item.partition("=")
+        name = name.strip()
+        if not name or not value.strip().isdigit():
+            continue
+        limits[name] = max(1, int(value))
+    return limits
+
+
+@dataclass
+class DispatcherConfig:
+    """Worker pool and queue sizing (see `DispatcherConfig.from_env`)."""
+    max_workers: int = 8
+    max_queue: int = 100
+    default_intent_limit: int = 4
+    intent_limits: Dict[str, int] = field(default_factory=lambda: dict(DEFAULT_INTENT_LIMITS))
+
+    @classmethod
+    def from_env(cls) -> "DispatcherConfig":
+        """
+        Build the dispatcher configuration from environment variables:
+        - DISPATCH_MAX_WORKERS   (worker threads)
+        - DISPATCH_MAX_QUEUE     (jobs allowed to wait before new ones are rejected)
+        - DISPATCH_INTENT_LIMITS (e.g. "data_question=4,prediction=2")
+        """
+        limits = dict(DEFAULT_INTENT_LIMITS)
+        limits.update(_parse_intent_limits(os.environ.get("DISPATCH_INTENT_LIMITS", "")))
+        return cls(
+            max_workers=int(os.environ.get("DISPATCH_MAX_WORKERS", "8")),
+            max_queue=int(os.environ.get("DISPATCH_MAX_QUEUE", "100")),
+            intent_limits=limits,
+        )
+
+    def limit_for(self, intent: str) -> int:
+        return self.intent_limits.get(intent, self.default_intent_limit)
+
+
+@dataclass
+class IntentStats:
+    """Per-intent counters."""
+    running: int = 0
+    waiting: int = 0
+    completed: int = 0
+    failed: int = 0
+    wait_ms_total: float = 0.0
+    wait_ms_max: float = 0.0
+
+    @property
+    def avg_wait_ms(self) -> float:
+        finished = self.completed + self.failed
+        return self.wait_ms_total / finished if finished else 0.0
+
+
+@dataclass
+class DispatcherStats:
+    """Point-in-time snapshot of dispatcher metrics."""
+    queue_depth: int
+    running: int
+    rejected: int
+    intents: Dict[str, IntentStats]
+
+
+_Job = Tuple[str, Callable[[], None], float]
+
+
+class EventDispatcher:
+    """
+    Runs jobs on a bounded thread pool with per-intent concurrency limits.
+
+    Jobs for an intent that is already at its limit wait in a per-intent FIFO
+    and start as soon as a job of the same intent finishes. When the total
+    number of outstanding jobs reaches `max_workers + max_queue`, `submit`
+    returns False so the caller can tell the user to retry later.
+    """
+
+    def __init__(self, config: Optional[DispatcherConfig] = None):
+        self.config = config or DispatcherConfig.from_env()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.config.max_workers,
+            thread_name_prefix="slack-dispatch",
+        )
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Deque[_Job]] = {}
+        self._intents: Dict[str, IntentStats] = {}
+        self._outstanding = 0
+        self._rejected = 0
+
+    def submit(self, intent: str, job: Callable[[], None]) -> bool:
+        """
+        Queue `job` under `intent`.
+
+        Returns:
+            True if the job was accepted, False if the dispatcher is saturated
+        """
+        with self._lock:
+            if self._outstanding >= self.config.max_workers + self.config.max_queue:
+                self._rejected += 1
+                return False
+            self._outstanding += 1
+
+            stats = self._intents.setdefault(intent, IntentStats())
+            entry: _Job = (intent, job, time.monotonic())
+            if stats.running < self.config.limit_for(intent):
+                stats.running += 1
+                self._executor.submit(self._run, entry)
+            else:
+                stats.waiting += 1
+                self._pending.setdefault(intent, deque()).append(entry)
+        return True
+
+    def _run(self, entry: _Job) -> None:
+        intent, job, queued_at = entry
+        wait_ms = (time.monotonic() - queued_at) * 1000.0
+        ok = True
+        try:
+            job()
+        except Exception:
+            ok = False
+            logger.exception("Dispatched %s job failed", intent)
+        finally:
+            self._finish(intent, wait_ms, ok)
+
+    def _finish(self, intent: str, wait_ms: float, ok: bool) -> None:
+        with self._lock:
+            self._outstanding -= 1
+            stats = self._intents[intent]
+            stats.running -= 1
+            stats.wait_ms_total += wait_ms
+            stats.wait_ms_max = max(stats.wait_ms_max, wait_ms)
+            if ok:
+                stats.completed += 1
+            else:
+                stats.failed += 1
+
+            pending = self._pending.get(intent)
+            if pending:
+                stats.waiting -= 1
+                stats.running += 1
+                self._executor.submit(self._run, pending.popleft())
+
+    def stats(self) -> DispatcherStats:
+        """Return a snapshot of queue depth, wait times and per-intent counters."""
+        with self._lock:
+            running = sum(s.running for s in self._intents.values())
+            return DispatcherStats(
+                queue_depth=self._outstanding - running,
+                running=running,
+                rejected=self._rejected,
+                intents={name: IntentStats(**vars(s)) for name, s in self._intents.items()},
+            )
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop accepting work and optionally wait for running jobs."""
+        self._executor.shutdown(wait=wait)
+
+
+# ---------- process-wide dispatcher ----------
+
+_dispatcher: Optional[EventDispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher() -> EventDispatcher:
+    """Return the process-wide dispatcher, creating it on first use."""
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = EventDispatcher()
+    return _dispatcher
+
+
+def get_dispatcher_metrics() -> Dict[str, object]:
+    """Dispatcher metrics as a plain dict (for logging or a /metrics command)."""
+    stats = get_dispatcher().stats()
+    return {
+        "queue_depth": stats.queue_depth,
+        "running": stats.running,
+        "rejected": stats.rejected,
+        "intents": {
+            name: {**vars(s), "avg_wait_ms": s.avg_wait_ms}
+            for name, s in stats.intents.items()
+        },
+    }
@@ -0,0 +1,280 @@
+"""
+Precomputed forecasts keyed by series and segment.
+
+Forecast inputs change at most daily, so fitting models on every prediction
+question is wasted work. Producers are registered per (series, segment) with
+a function that computes the forecast and one that returns the data
+watermark. A stored forecast is served while its watermark still matches
+and it is younger than FORECAST_MAX_AGE_SECONDS (default 86400); otherwise
+it is recomputed, on demand or by the background refresher
+(FORECAST_REFRESH_SECONDS > 0), which also picks up watermark changes.
+
+Every fit records diagnostics (models chosen, backtest error, history
+length, fit time), kept in memory for `get_forecast_diagnostics()` and
+appended as JSON lines to FORECAST_DIAGNOSTICS_FILE when set.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, deque
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Mapping, Optional, Tuple
+
+from core.services.forecasting import Forecast
+
+logger = logging.getLogger(__name__)
+
+Key = Tuple[str, Optional[str]]  # (series, segment)
+
+
+@dataclass
+class FitDiagnostics:
+    """One forecast fit: what was chosen and how well it backtested."""
+    series: str
+    segment: Optional[str]
+    computed_at: float
+    watermark: str
+    duration_ms: float
+    segments: int
+    history_months: int
+    models: Dict[str, int] = field(default_factory=dict)  # chosen model -> segments using it
+    mean_backtest_mae: Optional[float] = None
+
+
+@dataclass
+class StoredForecast:
+    """A computed forecast and the data watermark it was computed from."""
+    key: Key
+    value: Any
+    watermark: Any
+    computed_at: float
+    diagnostics: FitDiagnostics
+
+
+@dataclass
+class ForecastStoreStats:
+    """Snapshot of forecast store counters."""
+    entries: int
+    hits: int
+    computes: int
+    failures: int
+
+
+@dataclass
+class _Producer:
+    compute: Callable[[], Tuple[Any, Mapping[str, Forecast]]]
+    watermark: Callable[[], Any]
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+def _diagnose(key: Key, forecasts: Mapping[str, Forecast], watermark: Any, duration_ms: float) -> FitDiagnostics:
+    maes = [f.scores[f.model] for f in forecasts.values() if f.model in f.scores]
+    return FitDiagnostics(
+        series=key[0],
+        segment=key[1],
+        computed_at=time.time(),
+        watermark=str(watermark),
+        duration_ms=round(duration_ms, 3),
+        segments=len(forecasts),
+        history_months=max((f.history_months for f in forecasts.values()), default=0),
+        models=dict(Counter(f.model for f in forecasts.values())),
+        mean_backtest_mae=round(sum(maes) / len(maes), 4) if maes else None,
+    )
+
+
+class ForecastStore:
+    """
+    Thread-safe store of precomputed forecasts.
+
+    Producers return `(value, forecasts)`: `value` is what callers get back
+    and `forecasts` maps segment names to the Forecast objects behind it
+    (used for diagnostics). Concurrent requests for the same key wait for a
+    single computation.
+    """
+
+    def __init__(self, max_age_seconds: float = 86400, history_size: int = 200,
+                 diagnostics_file: Optional[str] = None):
+        self.max_age_seconds = max_age_seconds
+        self.diagnostics_file = diagnostics_file
+        self._lock = threading.Lock()
+        self._producers: Dict[Key, _Producer] = {}
+        self._entries: Dict[Key, StoredForecast] = {}
+        self._history: Deque[FitDiagnostics] = deque(maxlen=history_size)
+        self._hits = 0
+        self._computes = 0
+        self._failures = 0
+
+    def register(self, series: str, segment: Optional[str],
+                 compute: Callable[[], Tuple[Any, Mapping[str, Forecast]]],
+                 watermark: Callable[[], Any]) -> None:
+        """Register how to compute (series, segment) and how to read its data watermark."""
+        with self._lock:
+            self._producers[(series, segment)] = _Producer(compute=compute, watermark=watermark)
+
+    def keys(self) -> List[Key]:
+        with self._lock:
+            return list(self._producers)
+
+    def _fresh(self, entry: Optional[StoredForecast], watermark: Any) -> bool:
+        return (
+            entry is not None
+            and entry.watermark == watermark
+            and time.time() - entry.computed_at < self.max_age_seconds
+        )
+
+    def get(self, series: str, segment: Optional[str] = None, force: bool = False) -> StoredForecast:
+        """
+        Stored forecast for (series, segment), recomputed first if the data
+        watermark moved, it expired, or `force` is set.
+        """
+        key = (series, segment)
+        with self._lock:
+            producer = self._producers.get(key)
+        if producer is None:
+            raise KeyError(f"No forecast registered for {key}")
+
+        watermark = producer.watermark()
+        entry = self._entries.get(key)
+        if not force and self._fresh(entry, watermark):
+            with self._lock:
+                self._hits += 1
+            return entry
+
+        with producer.lock:
+            entry = self._entries.get(key)
+            if not force and self._fresh(entry, watermark):
+                with self._lock:
+                    self._hits += 1
+                return entry
+
+            started = time.perf_counter()
+            try:
+                value, forecasts = producer.compute()
+            except Exception:
+                with self._lock:
+                    self._failures += 1
+                raise
+            diagnostics = _diagnose(key, forecasts, watermark, (time.perf_counter() - started) * 1000)
+            entry = StoredForecast(
+                key=key, value=value, watermark=watermark,
+                computed_at=diagnostics.computed_at, diagnostics=diagnostics,
+            )
+            with self._lock:
+                self._entries[key] = entry
+                self._history.append(diagnostics)
+                self._computes += 1
+            self._record(diagnostics)
+            return entry
+
+    def _record(self, diagnostics: FitDiagnostics) -> None:
+        logger.info(
+            "Forecast %s/%s fitted in %.1f ms: models=%s mae=%s",
+            diagnostics.series, diagnostics.segment or "total", diagnostics.duration_ms,
+            diagnostics.models, diagnostics.mean_backtest_mae,
+        )
+        if not self.diagnostics_file:
+            return
+        try:
+            with open(self.diagnostics_file, "a") as f:
+                f.write(json.dumps(asdict(diagnostics)) + "\n")
+        except OSError as e:
+            logger.warning("Could not write forecast diagnostics: %s", e)
+
+    def refresh(self, force: bool = False) -> Dict[Key, bool]:
+        """
+        Bring every registered forecast up to date.
+        Returns {key: recomputed}; failures are logged and reported as False.
+        """
+        refreshed = {}
+        for key in self.keys():
+            before = self._entries.get(key)
+            try:
+                refreshed[key] = self.get(*key, force=force) is not before
+            except Exception as e:
+                logger.warning("Forecast refresh failed for %s: %s", key, e)
+                refreshed[key] = False
+        return refreshed
+
+    def diagnostics(self, series: Optional[str] = None, segment: Optional[str] = None) -> List[FitDiagnostics]:
+        """Recorded fits, oldest first, optionally for one series/segment."""
+        with self._lock:
+            history = list(self._history)
+        return [
+            d for d in history
+            if (series is None or d.series == series) and (segment is None or d.segment == segment)
+        ]
+
+    def clear(self) -> None:
+        """Drop stored forecasts and diagnostics (producers stay registered)."""
+        with self._lock:
+            self._entries.clear()
+            self._history.clear()
+
+    def stats(self) -> ForecastStoreStats:
+        with self._lock:
+            return ForecastStoreStats(
+                entries=len(self._entries), hits=self._hits,
+                computes=self._computes, failures=self._failures,
+            )
+
+
+_store: Optional[ForecastStore] = None
+_store_lock = threading.Lock()
+
+
+def get_forecast_store() -> ForecastStore:
+    """
+    Return the process-wide forecast store, configured from:
+    - FORECAST_MAX_AGE_SECONDS   (default 86400)
+    - FORECAST_HISTORY_SIZE      (fits kept in memory, default 200)
+    - FORECAST_DIAGNOSTICS_FILE  (optional JSON-lines log of every fit)
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ForecastStore(
+                    max_age_seconds=float(os.environ.get("FORECAST_MAX_AGE_SECONDS", "86400")),
+                    history_size=int(os.environ.get("FORECAST_HISTORY_SIZE", "200")),
+                    diagnostics_file=os.environ.get("FORECAST_DIAGNOSTICS_FILE") or None,
+                )
+    return _store
+
+
+def get_forecast_diagnostics(series: Optional[str] = None, segment: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Recorded forecast fits as plain dicts (for logging or a /metrics command)."""
+    return [asdict(d) for d in get_forecast_store().diagnostics(series, segment)]
+
+
+def get_forecast_store_metrics() -> Dict[str, int]:
+    """Forecast store counters as a plain dict."""
+    return dict(vars(get_forecast_store().stats()))
+
+
+_refresher: Optional[threading.Thread] = None
+
+
+def start_forecast_refresher(interval_seconds: Optional[float] = None) -> Optional[threading.Thread]:
+    """
+    Precompute every registered forecast every FORECAST_REFRESH_SECONDS in a
+    daemon thread; forecasts whose watermark is unchanged are left alone.
+    Does nothing when the interval is 0 or unset.
+    """
+    global _refresher
+    interval = interval_seconds
+    if interval is None:
+        interval = float(os.environ.get("FORECAST_REFRESH_SECONDS", "0"))
+    if interval <= 0 or _refresher is not None:
+        return _refresher
+
+    def loop():
+        while True:
+            get_forecast_store().refresh()
+            time.sleep(interval)
+
+    _refresher = threading.Thread(target=loop, name="forecast-refresher", daemon=True)
+    _refresher.start()
+    return _refresher
@@ -0,0 +1,331 @@
+"""
+Monthly forecasting for the prediction agent.
+
+Several models are fitted in batch with NumPy and the one with the lowest
+rolling-origin backtest error is used for the forecast:
+- naive:          last month repeated
+- linear:         OLS trend
+- seasonal_naive: same month last year
+- decomposition:  OLS trend + average seasonal offset per calendar month
+                  (captures the Q4/holiday bump)
+- holt_winters:   additive trend + seasonality exponential smoothing, over
+                  a small grid of smoothing parameters
+
+Every model computes the forecasts for all segments (plans, countries, ...)
+and all backtest origins at once, as axes of one array, so a full backtest
+over 36 months takes a couple of milliseconds and many segments cost little
+more than one. Each segment gets its own best model. Prediction intervals
+come from the chosen model's backtest errors at each horizon.
+"""
+
+from dataclasses import dataclass, field
+from statistics import NormalDist
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+SEASON = 12
+
+# Backtest origins each model needs at least, on top of its minimum history
+MIN_ORIGINS = 3
+
+# Holt-Winters (alpha, beta, gamma) candidates
+HW_GRID = np.array([
+    (alpha, beta, gamma)
+    for alpha in (0.2, 0.5)
+    for beta in (0.05, 0.2)
+    for gamma in (0.1, 0.3)
+])
+
+
+# ---------- models ----------
+#
+# Each batch function takes the series as a 2-D array `Y` (segments x
+# months), the backtest `origins` (forecasts from origin k may only use
+# Y[:, :k]) and a horizon, and returns forecasts shaped
+# (candidates, segments, origins, horizon).
+
+def _linear_coefficients(Y: np.ndarray, origins: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """OLS slope and intercept over Y[:, :k] for every origin k, from running sums."""
+    t = np.arange(Y.shape[1], dtype=float)
+    sum_t = np.cumsum(t)[origins - 1]
+    sum_tt = np.cumsum(t * t)[origins - 1]
+    sum_y = np.cumsum(Y, axis=1)[:, origins - 1]
+    sum_ty = np.cumsum(t * Y, axis=1)[:, origins - 1]
+    n = origins.astype(float)
+    denominator = n * sum_tt - sum_t ** 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = np.where(denominator != 0, (n * sum_ty - sum_t * sum_y) / denominator, 0.0)
+    intercept = (sum_y - slope * sum_t) / n
+    return slope, intercept
+
+
+def _future_t(origins: np.ndarray, horizon: int) -> np.ndarray:
+    """Time index of each forecast step: (origins, horizon)."""
+    return origins[:, None] - 1 + np.arange(1, horizon + 1)[None, :]
+
+
+def _naive(Y: np.ndarray, origins: np.ndarray, horizon: int) -> np.ndarray:
+    return np.repeat(Y[:, origins - 1][:, :, None], horizon, axis=2)[None]
+
+
+def _linear(Y: np.ndarray, origins: np.ndarray, horizon: int) -> np.ndarray:
+    slope, intercept = _linear_coefficients(Y, origins)
+    return (intercept[..., None] + slope[..., None] * _future_t(origins, horizon))[None]
+
+
+def _seasonal_naive(Y: np.ndarray, origins: np.ndarray, horizon: int) -> np.ndarray:
+    steps = np.arange(horizon)
+    index = origins[:, None] - SEASON + (steps[None, :] % SEASON)
+    return Y[:, index][None]
+
+
+def _decomposition(Y: np.ndarray, origins: np.ndarray, horizon: int) -> np.ndarray:
+    n = Y.shape[1]
+    t = np.arange(n, dtype=float)
+    slope, intercept = _linear_coefficients(Y, origins)
+
+    # Detrended values visible to each origin: (segments, origins, n), zero outside Y[:, :k]
+    visible = (t[None, :] < origins[:, None]).astype(float)
+    trend = intercept[..., None] + slope[..., None] * t
+    residual = (Y[:, None, :] - trend) * visible
+
+    # Average residual per position in the season, centred on zero
+    season_of = np.eye(SEASON)[np.arange(n) % SEASON]  # (n, SEASON)
+    counts = visible @ season_of
+    with np.errstate(divide="ignore", invalid="ignore"):
+        offsets = np.where(counts > 0, (residual @ season_of) / counts, 0.0)
+    offsets -= offsets.mean(axis=-1, keepdims=True)
+
+    future = _future_t(origins, horizon)
+    position = np.broadcast_to(future % SEASON, offsets.shape[:2] + (horizon,))
+    forecast = intercept[..., None] + slope[..., None] * future
+    return (forecast + np.take_along_axis(offsets, position, axis=-1))[None]
+
+
+def _holt_winters(Y: np.ndarray, origins: np.ndarray, horizon: int) -> np.ndarray:
+    alpha, beta, gamma = (HW_GRID[:, i][:, None, None] for i in range(3))
+    shape = (len(HW_GRID), Y.shape[0], len(origins))
+
+    # Initial state from the first two seasons (shared by every origin)
+    first = Y[:, :SEASON].mean(axis=1)
+    second = Y[:, SEASON:2 * SEASON].mean(axis=1)
+    level = np.broadcast_to(first[None, :, None], shape).copy()
+    trend = np.broadcast_to(((second - first) / SEASON)[None, :, None], shape).copy()
+    season = np.broadcast_to((Y[:, :SEASON] - first[:, None])[None, :, None, :], shape + (SEASON,)).copy()
+
+    for t in range(SEASON, int(origins.max())):
+        active = (t < origins)[None, None, :]
+        y = Y[:, t][None, :, None]
+        s = season[..., t % SEASON]
+        new_level = alpha * (y - s) + (1 - alpha) * (level + trend)
+        new_trend = beta * (new_level - level) + (1 - beta) * trend
+        new_season = gamma * (y - new_level) + (1 - gamma) * s
+        level = np.where(active, new_level, level)
+        trend = np.where(active, new_trend, trend)
+        season[..., t % SEASON] = np.where(active, new_season, s)
+
+    steps = np.arange(1, horizon + 1)
+    position = np.broadcast_to(_future_t(origins, horizon) % SEASON, shape + (horizon,))
+    return level[..., None] + trend[..., None] * steps + np.take_along_axis(season, position, axis=-1)
+
+
+@dataclass(frozen=True)
+class Model:
+    """A forecasting model and the history it needs."""
+    name: str
+    description: str
+    min_history: int
+    batch: Callable[[np.ndarray, np.ndarray, int], np.ndarray]
+
+
+MODELS: List[Model] = [
+    Model("naive", "last month carried forward", 1, _naive),
+    Model("linear", "linear trend", 3, _linear),
+    Model("seasonal_naive", "same month last year", SEASON, _seasonal_naive),
+    Model("decomposition", "trend plus monthly seasonality", 2 * SEASON, _decomposition),
+    Model("holt_winters", "Holt-Winters exponential smoothing", 2 * SEASON, _holt_winters),
+]
+
+
+# ---------- backtest and forecast ----------
+
+@dataclass
+class BacktestResult:
+    """Backtest error of one model (best candidate per segment) and its errors by horizon."""
+    model: Model
+    mae: np.ndarray        # (segments,)
+    candidate: np.ndarray  # (segments,)
+    errors: np.ndarray     # (segments, origins, horizon), NaN where the target is beyond the data
+
+
+def backtest(Y: np.ndarray, horizon: int, models: Sequence[Model] = MODELS) -> List[BacktestResult]:
+    """
+    Rolling-origin backtest: from every origin k, forecast Y[:, k:k+horizon]
+    using Y[:, :k] only, for every segment at once. All models share the same
+    origins (those where every eligible model has enough history).
+    """
+    Y = np.atleast_2d(np.asarray(Y, dtype=float))
+    n = Y.shape[1]
+    eligible = [m for m in models if m.min_history + MIN_ORIGINS <= n]
+    if not eligible:
+        raise ValueError(f"Need at least {min(m.min_history for m in models) + MIN_ORIGINS} months to forecast")
+
+    origins = np.arange(max(m.min_history for m in eligible), n)
+    steps = min(horizon, n - origins[0])
+    target = origins[:, None] + np.arange(steps)[None, :]
+    inside = target < n
+    actual = Y[:, np.minimum(target, n - 1)]
+
+    results = []
+    segments = np.arange(Y.shape[0])
+    for model in eligible:
+        forecasts = model.batch(Y, origins, steps)
+        errors = np.where(inside, forecasts - actual, np.nan)
+        mae = np.nanmean(np.abs(errors), axis=(2, 3))  # (candidates, segments)
+        best = np.argmin(mae, axis=0)
+        results.append(BacktestResult(
+            model=model, mae=mae[best, segments], candidate=best, errors=errors[best, segments],
+        ))
+    return results
+
+
+def _horizon_sigma(errors: np.ndarray, horizon: int) -> np.ndarray:
+    """
+    Forecast error spread per segment and horizon step: the RMSE of backtest
+    errors at that step, extrapolated with sqrt(h) where too few errors exist.
+    """
+    counts = np.sum(~np.isnan(errors), axis=1)
+    with np.errstate(invalid="ignore"):
+        rmse = np.sqrt(np.nanmean(errors ** 2, axis=1))
+    sigma = np.zeros((errors.shape[0], horizon))
+    last_step = np.zeros(errors.shape[0])
+    last_sigma = np.zeros(errors.shape[0])
+    for h in range(horizon):
+        if h < rmse.shape[1]:
+            known = counts[:, h] >= 2
+            last_step = np.where(known, h, last_step)
+            last_sigma = np.where(known, rmse[:, h], last_sigma)
+        sigma[:, h] = last_sigma * np.sqrt((h + 1) / (last_step + 1))
+    return sigma
+
+
+@dataclass
+class Forecast:
+    """Forecast from the backtest winner, with prediction intervals."""
+    model: str
+    description: str
+    predictions: List[Tuple[int, int, float]]
+    lower: List[float]
+    upper: List[float]
+    level: float
+    scores: Dict[str, float] = field(default_factory=dict)  # backtest MAE per model
+    history_months: int = 0
+
+
+def monthly_values(historical_data: Sequence[Tuple[int, int, float]]) -> np.ndarray:
+    """Counts as a contiguous monthly array; months missing from the data are 0."""
+    first_year, first_month, _ = historical_data[0]
+    last_year, last_month, _ = historical_data[-1]
+    y = np.zeros((last_year - first_year) * 12 + (last_month - first_month) + 1)
+    for year, month, count in historical_data:
+        y[(year - first_year) * 12 + (month - first_month)] = count
+    return y
+
+
+def _month_after(year: int, month: int, step: int) -> Tuple[int, int]:
+    months = month - 1 + step
+    return year + months // 12, months % 12 + 1
+
+
+def _forecast_array(Y: np.ndarray, last: Tuple[int, int], horizon: int, level: float,
+                    models: Sequence[Model]) -> List[Forecast]:
+    """Pick the best model per row of Y by backtest and forecast every row."""
+    results = backtest(Y, horizon, models)
+    maes = np.stack([r.mae for r in results])  # (models, segments)
+    winner = np.argmin(maes, axis=0)
+    z = NormalDist().inv_cdf(0.5 + level / 2)
+
+    values = np.zeros((Y.shape[0], horizon))
+    margin = np.zeros((Y.shape[0], horizon))
+    final_origin = np.array([Y.shape[1]])
+    for i, result in enumerate(results):
+        rows = np.flatnonzero(winner == i)
+        if not len(rows):
+            continue
+        forecasts = result.model.batch(Y[rows], final_origin, horizon)  # (candidates, rows, 1, horizon)
+        values[rows] = forecasts[result.candidate[rows], np.arange(len(rows)), 0]
+        margin[rows] = z * _horizon_sigma(result.errors[rows], horizon)
+
+    months = [_month_after(last[0], last[1], step) for step in range(1, horizon + 1)]
+    forecasts = []
+    for row in range(Y.shape[0]):
+        best = results[winner[row]]
+        forecasts.append(Forecast(
+            model=best.model.name,
+            description=best.model.description,
+            predictions=[(y, m, max(0.0, float(v))) for (y, m), v in zip(months, values[row])],
+            lower=[max(0.0, float(v)) for v in values[row] - margin[row]],
+            upper=[max(0.0, float(v)) for v in values[row] + margin[row]],
+            level=level,
+            scores=dict(sorted(((r.model.name, float(r.mae[row])) for r in results), key=lambda kv: kv[1])),
+            history_months=Y.shape[1],
+        ))
+    return forecasts
+
+
+def forecast_monthly(
+    historical_data: Sequence[Tuple[int, int, float]],
+    horizon: int = 12,
+    level: float = 0.8,
+    models: Optional[Sequence[Model]] = None,
+) -> Forecast:
+    """
+    Forecast the next `horizon` months of a (year, month, count) series.
+
+    Args:
+        historical_data: Monthly counts ordered by year, month
+        horizon: Months to forecast
+        level: Coverage of the prediction intervals (e.g. 0.8 for 80%)
+        models: Candidate models (defaults to MODELS)
+
+    Returns:
+        Forecast from the model with the lowest backtest MAE
+    """
+    if not historical_data:
+        raise ValueError("Need historical data to make predictions")
+
+    y = monthly_values(historical_data)
+    last_year, last_month, _ = historical_data[-1]
+    return _forecast_array(y[None, :], (last_year, last_month), horizon, level, models or MODELS)[0]
+
+
+def forecast_segments(
+    series: Dict[str, Sequence[Tuple[int, int, float]]],
+    horizon: int = 12,
+    level: float = 0.8,
+    models: Optional[Sequence[Model]] = None,
+) -> Dict[str, Forecast]:
+    """
+    Forecast many monthly series at once (e.g. one per plan or country).
+
+    Segments are aligned on a shared month grid (months a segment lacks
+    count as 0) and every model is backtested on the whole segments x months
+    array in one pass, so cost grows slowly with the number of segments.
+    Each segment gets the model with its lowest backtest MAE.
+    """
+    series = {name: rows for name, rows in series.items() if rows}
+    if not series:
+        return {}
+
+    first = min((rows[0][0], rows[0][1]) for rows in series.values())
+    last = max((rows[-1][0], rows[-1][1]) for rows in series.values())
+    n = (last[0] - first[0]) * 12 + (last[1] - first[1]) + 1
+    names = list(series)
+    Y = np.zeros((len(names), n))
+    for row, name in enumerate(names):
+        for year, month, count in series[name]:
+            Y[row, (year - first[0]) * 12 + (month - first[1])] += count
+
+    forecasts = _forecast_array(Y, last, horizon, level, models or MODELS)
+    return dict(zip(names, forecasts))
@@ -0,0 +1,185 @@
+"""
+Incremental maintenance for cached aggregates.
+
+Aggregates are kept per day, keyed by the source table's time columns
+(`payment_date`, `signup_date`, `start_date`/`end_date`, `session_date`).
+Each refresh reads the high-water mark (MAX) of those columns; when none
+moved, nothing is recomputed. Otherwise only the days from the previous mark
+minus INCREMENTAL_LATENESS_DAYS (default 3) onward are re-aggregated from
+the source and replace the cached buckets for those days, so rows that
+arrive a little late (or are updated inside the window) are merged in
+without scanning the whole table. Changes older than the window are picked
+up by a full rebuild every INCREMENTAL_FULL_REFRESH_SECONDS (default 86400).
+
+Used by the rollup tables (`core.services.rollups`) and by the in-process
+`IncrementalSeries` behind revenue totals and the subscription history.
+"""
+
+import dataclasses
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def lateness_days() -> int:
+    """INCREMENTAL_LATENESS_DAYS (default 3)."""
+    return int(os.environ.get("INCREMENTAL_LATENESS_DAYS", "3"))
+
+
+def full_refresh_seconds() -> float:
+    """INCREMENTAL_FULL_REFRESH_SECONDS (default one day)."""
+    return float(os.environ.get("INCREMENTAL_FULL_REFRESH_SECONDS", "86400"))
+
+
+def _as_date(value: Any) -> Optional[date]:
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+def watermark_columns(spec) -> List[str]:
+    """Source columns whose high-water marks drive a spec's refreshes."""
+    return [spec.time_column, *spec.event_columns]
+
+
+def source_watermarks(conn, spec) -> Dict[str, Any]:
+    """Current MAX() of every watermark column, read in one statement."""
+    spec._check_identifiers()
+    columns = watermark_columns(spec)
+    select = ", ".join(f"MAX({c})" for c in columns)
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT {select} FROM {spec.source_table}")
+        row = cur.fetchone() or [None] * len(columns)
+    return dict(zip(columns, row))
+
+
+@dataclass
+class RefreshPlan:
+    """What a refresh has to do."""
+    changed: bool
+    since: Optional[date]  # first day to rebuild; None means every day
+    marks: Dict[str, Any]
+
+
+def plan_refresh(previous: Optional[Dict[str, Any]], current: Dict[str, Any],
+                 lateness: Optional[int] = None) -> RefreshPlan:
+    """
+    Compare high-water marks and work out which days need rebuilding.
+
+    Args:
+        previous: Marks recorded at the last refresh (None forces a full rebuild)
+        current: Marks just read from the source
+        lateness: Days before the previous marks to rebuild as well
+
+    Returns:
+        RefreshPlan; `changed` is False when no mark moved
+    """
+    if previous is None:
+        return RefreshPlan(changed=True, since=None, marks=current)
+    if previous == current:
+        return RefreshPlan(changed=False, since=None, marks=current)
+
+    lateness = lateness_days() if lateness is None else lateness
+    starts = [
+        _as_date(previous.get(column)) for column, value in current.items()
+        if value is not None or previous.get(column) is not None
+    ]
+    if not starts or any(start is None for start in starts):
+        # A column gained its first rows: nothing to resume from
+        return RefreshPlan(changed=True, since=None, marks=current)
+    return RefreshPlan(changed=True, since=min(starts) - timedelta(days=lateness), marks=current)
+
+
+class IncrementalSeries:
+    """
+    Per-day totals of a rollup spec's measures, held in memory.
+
+    The first refresh aggregates the whole source table by day; later ones
+    only re-aggregate the days after the previous high-water marks (minus
+    the lateness window). Sources are checked at most every
+    INCREMENTAL_CHECK_SECONDS (default 30).
+    """
+
+    def __init__(self, spec):
+        self.spec = dataclasses.replace(spec, dimensions=[])
+        self._lock = threading.Lock()
+        self._buckets: Dict[date, Dict[str, float]] = {}
+        self._marks: Optional[Dict[str, Any]] = None
+        self._checked_at: Optional[float] = None
+        self._full_at = 0.0
+
+    def refresh(self, conn, force: bool = False) -> RefreshPlan:
+        """Bring the buckets up to date with the source table."""
+        with self._lock:
+            now = time.monotonic()
+            interval = float(os.environ.get("INCREMENTAL_CHECK_SECONDS", "30"))
+            if not force and self._checked_at is not None and now - self._checked_at < interval:
+                return RefreshPlan(changed=False, since=None, marks=self._marks or {})
+
+            marks = source_watermarks(conn, self.spec)
+            full_due = now - self._full_at >= full_refresh_seconds()
+            plan = plan_refresh(None if full_due else self._marks, marks)
+            if plan.changed:
+                sql, params = self.spec.source_sql(plan.since)
+                with conn.cursor() as cur:
+                    cur.execute(sql, params)
+                    rows = cur.fetchall()
+
+                if plan.since is None:
+                    self._buckets = {}
+                    self._full_at = now
+                else:
+                    for day in [d for d in self._buckets if d >= plan.since]:
+                        del self._buckets[day]
+                measures = self.spec.measure_columns
+                for row in rows:
+                    self._buckets[_as_date(row[0])] = {m: float(v or 0) for m, v in zip(measures, row[1:])}
+
+            self._marks = marks
+            self._checked_at = now
+            return plan
+
+    def totals(self, since: Optional[date] = None) -> Dict[str, float]:
+        """Sum of every measure over days >= since (all days when None)."""
+        with self._lock:
+            buckets = [b for d, b in self._buckets.items() if since is None or d >= since]
+        totals = {m: 0.0 for m in self.spec.measure_columns}
+        for bucket in buckets:
+            for measure, value in bucket.items():
+                totals[measure] += value
+        return totals
+
+    def monthly(self, measure: str, since: Optional[date] = None) -> List[Tuple[int, int, float]]:
+        """(year, month, total) for months with a non-zero total, oldest first."""
+        with self._lock:
+            items = [(d, b.get(measure, 0.0)) for d, b in self._buckets.items() if since is None or d >= since]
+        months: Dict[Tuple[int, int], float] = {}
+        for day, value in items:
+            months[(day.year, day.month)] = months.get((day.year, day.month), 0.0) + value
+        return [(year, month, total) for (year, month), total in sorted(months.items()) if total]
+
+
+_series: Dict[str, IncrementalSeries] = {}
+_series_lock = threading.Lock()
+
+
+def get_series(model: str) -> IncrementalSeries:
+    """Process-wide incremental series for a semantic model."""
+    series = _series.get(model)
+    if series is None:
+        with _series_lock:
+            series = _series.get(model)
+            if series is None:
+                from core.services.rollups import get_rollup_specs
+                series = IncrementalSeries(get_rollup_specs()[model])
+                _series[model] = series
+    return series
+
+
+def reset_series() -> None:
+    """Drop every in-process series (they reload on next use)."""
+    with _series_lock:
+        _series.clear()
@@ -0,0 +1,178 @@
+"""
+LLM insights off the critical path, and per-stage timings.
+
+The insight LLM call (`analyze_with_llm` / `explain_with_llm`) is started on
+its own thread pool (INSIGHT_WORKERS, default 4) as soon as its input is
+known, so formatting the core result and showing it in Slack overlap with
+it. The answer then waits for the insight at most INSIGHT_DEADLINE_SECONDS
+(default 10) after it was started; a late insight is dropped and the core
+result is sent on its own. The async app runs the same call as a task with
+the same deadline.
+
+`StageTimer` records how long each stage of an answer took (query, format,
+insights, ...); `get_stage_metrics()` aggregates them per operation so the
+latency the insights add can be compared with the rest.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def insight_deadline() -> float:
+    """INSIGHT_DEADLINE_SECONDS (default 10)."""
+    return float(os.environ.get("INSIGHT_DEADLINE_SECONDS", "10"))
+
+
+# ---------- insight executor ----------
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_insight_executor() -> ThreadPoolExecutor:
+    """Return the process-wide insight pool, creating it on first use."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=int(os.environ.get("INSIGHT_WORKERS", "4")),
+                    thread_name_prefix="insight",
+                )
+    return _executor
+
+
+def start_insight(fn: Callable[..., str], *args: Any) -> Future:
+    """Start an insight call in the background; collect it with `collect_insight`."""
+    future = get_insight_executor().submit(fn, *args)
+    future.started_at = time.monotonic()
+    return future
+
+
+def collect_insight(future: Future, deadline: Optional[float] = None) -> str:
+    """
+    The insight text, or "" if it failed or is not ready within `deadline`
+    seconds of being started (defaults to INSIGHT_DEADLINE_SECONDS).
+    """
+    deadline = insight_deadline() if deadline is None else deadline
+    remaining = deadline - (time.monotonic() - getattr(future, "started_at", time.monotonic()))
+    try:
+        return future.result(timeout=max(0.0, remaining)) or ""
+    except FutureTimeout:
+        future.cancel()
+        _count_dropped()
+        logger.info("LLM insight dropped: not ready within %.1fs", deadline)
+    except Exception as e:
+        logger.warning("LLM insight generation failed: %s", e)
+    return ""
+
+
+async def collect_insight_async(insight: Awaitable[str], deadline: Optional[float] = None) -> str:
+    """Async counterpart of `collect_insight` for a task or coroutine."""
+    deadline = insight_deadline() if deadline is None else deadline
+    try:
+        return await asyncio.wait_for(insight, timeout=deadline) or ""
+    except asyncio.TimeoutError:
+        _count_dropped()
+        logger.info("LLM insight dropped: not ready within %.1fs", deadline)
+    except Exception as e:
+        logger.warning("LLM insight generation failed: %s", e)
+    return ""
+
+
+# ---------- stage timings ----------
+
+@dataclass
+class StageStats:
+    """Aggregated timings of one stage of one operation."""
+    count: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+
+    @property
+    def avg_ms(self) -> float:
+        return self.total_ms / self.count if self.count else 0.0
+
+
+_stats: Dict[str, Dict[str, StageStats]] = {}
+_dropped = 0
+_stats_lock = threading.Lock()
+
+
+def _count_dropped() -> None:
+    global _dropped
+    with _stats_lock:
+        _dropped += 1
+
+
+class StageTimer:
+    """
+    Times the stages of one answer.
+
+        timer = StageTimer("sql_query")
+        with timer.stage("query"):
+            ...
+        timer.finish()
+    """
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self.stages: Dict[str, float] = {}
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    def finish(self) -> Dict[str, float]:
+        """Record the stages (and the total) and return them in milliseconds."""
+        self.stages["total"] = (time.perf_counter() - self._started) * 1000
+        with _stats_lock:
+            stats = _stats.setdefault(self.operation, {})
+            for name, ms in self.stages.items():
+                stage = stats.setdefault(name, StageStats())
+                stage.count += 1
+                stage.total_ms += ms
+                stage.max_ms = max(stage.max_ms, ms)
+        logger.info(
+            "%s stages: %s", self.operation,
+            " ".join(f"{name}={ms:.0f}ms" for name, ms in self.stages.items()),
+        )
+        return dict(self.stages)
+
+
+def get_stage_metrics() -> Dict[str, object]:
+    """Stage timings per operation and dropped insights, as a plain dict."""
+    with _stats_lock:
+        return {
+            "insights_dropped": _dropped,
+            "operations": {
+                operation: {
+                    name: {"count": s.count, "avg_ms": round(s.avg_ms, 1), "max_ms": round(s.max_ms, 1)}
+                    for name, s in stages.items()
+                }
+                for operation, stages in _stats.items()
+            },
+        }
+
+
+def reset_stage_metrics() -> None:
+    """Forget recorded timings (used in tests)."""
+    global _dropped
+    with _stats_lock:
+        _stats.clear()
+        _dropped = 0
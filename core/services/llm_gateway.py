@@ -0,0 +1,391 @@
+"""
+Shared gateway for every LLM call (PandasAI code generation, insights and
+the router's classifier fallback).
+
+Each call goes through, in order:
+- a circuit breaker: after LLM_BREAKER_FAILURES consecutive failed calls
+  the LLM is considered down for LLM_BREAKER_RESET_SECONDS, calls fail
+  immediately with `CircuitOpenError`, and callers degrade (data questions
+  fall back to the deterministic overviews); one probe call then decides
+  whether to close it again;
+- token buckets for requests (LLM_REQUESTS_PER_MINUTE) and tokens
+  (LLM_TOKENS_PER_MINUTE, estimated from the prompt plus
+  LLM_RESPONSE_TOKENS); a call that would wait longer than
+  LLM_RATE_WAIT_SECONDS fails with `LLMRateLimited` instead;
+- a deadline (LLM_TIMEOUT_SECONDS) covering the wait, every attempt and the
+  pauses between them; each attempt gets the time that is left;
+- up to LLM_MAX_RETRIES retries of transient errors (timeouts, rate limits,
+  connection and 5xx errors) with full-jitter exponential backoff from
+  LLM_RETRY_BASE_SECONDS.
+A rate of 0 disables that bucket.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Errors worth another attempt (LiteLLM, OpenAI SDK and builtin names)
+RETRYABLE_ERRORS = frozenset({
+    "Timeout", "TimeoutError", "APITimeoutError", "RateLimitError",
+    "APIConnectionError", "ConnectionError", "ServiceUnavailableError",
+    "InternalServerError", "BadGatewayError",
+})
+
+# Errors caused by the request itself; they say nothing about the LLM's health
+CALLER_ERRORS = frozenset({
+    "BadRequestError", "ContextWindowExceededError", "ContentPolicyViolationError",
+    "UnprocessableEntityError", "UnsupportedParamsError", "InvalidRequestError",
+})
+
+
+class LLMUnavailable(Exception):
+    """The gateway did not let the call through."""
+
+
+class CircuitOpenError(LLMUnavailable):
+    """The LLM failed repeatedly and is not being called for now."""
+
+
+class LLMRateLimited(LLMUnavailable):
+    """The call could not get a rate-limit slot in time."""
+
+
+class LLMDeadlineExceeded(LLMUnavailable):
+    """The call did not finish within its deadline."""
+
+
+@dataclass
+class GatewayConfig:
+    """Limits of the LLM gateway (see `GatewayConfig.from_env`)."""
+    requests_per_minute: float = 60.0
+    tokens_per_minute: float = 150_000.0
+    response_tokens: int = 300
+    rate_wait: float = 10.0
+    timeout: float = 30.0
+    max_retries: int = 2
+    retry_base: float = 0.5
+    breaker_failures: int = 5
+    breaker_reset: float = 30.0
+
+    @classmethod
+    def from_env(cls) -> "GatewayConfig":
+        """
+        Build the gateway configuration from environment variables:
+        - LLM_REQUESTS_PER_MINUTE / LLM_TOKENS_PER_MINUTE  (0 = unlimited)
+        - LLM_RESPONSE_TOKENS     (tokens reserved for each reply)
+        - LLM_RATE_WAIT_SECONDS   (longest wait for a rate-limit slot)
+        - LLM_TIMEOUT_SECONDS     (deadline per call, retries included)
+        - LLM_MAX_RETRIES / LLM_RETRY_BASE_SECONDS
+        - LLM_BREAKER_FAILURES / LLM_BREAKER_RESET_SECONDS
+        """
+        return cls(
+            requests_per_minute=float(os.environ.get("LLM_REQUESTS_PER_MINUTE", "60")),
+            tokens_per_minute=float(os.environ.get("LLM_TOKENS_PER_MINUTE", "150000")),
+            response_tokens=int(os.environ.get("LLM_RESPONSE_TOKENS", "300")),
+            rate_wait=float(os.environ.get("LLM_RATE_WAIT_SECONDS", "10")),
+            timeout=float(os.environ.get("LLM_TIMEOUT_SECONDS", "30")),
+            max_retries=int(os.environ.get("LLM_MAX_RETRIES", "2")),
+            retry_base=float(os.environ.get("LLM_RETRY_BASE_SECONDS", "0.5")),
+            breaker_failures=int(os.environ.get("LLM_BREAKER_FAILURES", "5")),
+            breaker_reset=float(os.environ.get("LLM_BREAKER_RESET_SECONDS", "30")),
+        )
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of a prompt (about four characters per token)."""
+    return len(text) // 4 + 1
+
+
+# ---------- building blocks ----------
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilling at `rate` per second up to `capacity`.
+    Callers reserve tokens up front and are told how long to wait, so
+    concurrent callers queue in order instead of polling.
+    """
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._level = capacity
+        self._updated = clock()
+
+    def reserve(self, amount: float, max_wait: float) -> Optional[float]:
+        """
+        Take `amount` tokens, returning how many seconds to wait before
+        using them, or None (taking nothing) if that is more than `max_wait`.
+        """
+        if self.rate <= 0:
+            return 0.0
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = self._clock()
+            self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = max(0.0, (amount - self._level) / self.rate)
+            if wait > max_wait:
+                return None
+            self._level -= amount
+            return wait
+
+    def refund(self, amount: float) -> None:
+        with self._lock:
+            self._level = min(self.capacity, self._level + min(amount, self.capacity))
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker (closed -> open -> half-open).
+    While half-open a single probe call is let through.
+    """
+
+    def __init__(self, failures: int, reset_seconds: float, clock: Callable[[], float] = time.monotonic):
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._consecutive = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state()
+
+    def _state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if self._clock() - self._opened_at < self.reset_seconds:
+            return "open"
+        return "half_open"
+
+    def allow(self) -> bool:
+        """Whether a call may go out now (claims the probe when half-open)."""
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._consecutive = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._consecutive += 1
+            if self._probing or (self._opened_at is None and self._consecutive >= self.failures):
+                self._opened_at = self._clock()
+                self.opened += 1
+                logger.warning("LLM circuit breaker opened after %d failures", self._consecutive)
+            self._probing = False
+
+    def release(self) -> None:
+        """Give back a probe that ended without a verdict on the LLM's health."""
+        with self._lock:
+            self._probing = False
+
+
+# ---------- gateway ----------
+
+def _is_retryable(error: BaseException) -> bool:
+    return type(error).__name__ in RETRYABLE_ERRORS
+
+
+_TIMEOUT_ERRORS = frozenset({"Timeout", "TimeoutError", "APITimeoutError"})
+
+
+def _counts_against_llm(error: BaseException) -> bool:
+    """Whether a failure says the LLM is unhealthy (and should trip the breaker)."""
+    if isinstance(error, LLMDeadlineExceeded):
+        return True
+    return not isinstance(error, LLMUnavailable) and type(error).__name__ not in CALLER_ERRORS
+
+
+class LLMGateway:
+    """Rate limits, deadlines, retries and a circuit breaker around LLM calls."""
+
+    def __init__(self, config: Optional[GatewayConfig] = None, clock: Callable[[], float] = time.monotonic):
+        self.config = config or GatewayConfig.from_env()
+        self._clock = clock
+        self.requests = TokenBucket(
+            self.config.requests_per_minute / 60, max(1.0, self.config.requests_per_minute), clock
+        )
+        self.tokens = TokenBucket(
+            self.config.tokens_per_minute / 60, max(1.0, self.config.tokens_per_minute), clock
+        )
+        self.breaker = CircuitBreaker(self.config.breaker_failures, self.config.breaker_reset, clock)
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {
+            "calls": 0, "succeeded": 0, "failed": 0, "retries": 0,
+            "short_circuited": 0, "rate_limited": 0, "deadline_exceeded": 0,
+        }
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counts[name] += 1
+
+    def available(self) -> bool:
+        """False while the circuit breaker is open."""
+        return self.breaker.state != "open"
+
+    def _admit(self, prompt_tokens: int, deadline: float) -> float:
+        """Check the breaker and reserve rate-limit slots; returns the wait."""
+        self._count("calls")
+        if not self.breaker.allow():
+            self._count("short_circuited")
+            raise CircuitOpenError("LLM is unavailable (circuit breaker open)")
+
+        max_wait = min(self.config.rate_wait, max(0.0, deadline - self._clock()))
+        tokens = prompt_tokens + self.config.response_tokens
+        request_wait = self.requests.reserve(1, max_wait)
+        token_wait = self.tokens.reserve(tokens, max_wait) if request_wait is not None else None
+        if token_wait is None:
+            if request_wait is not None:
+                self.requests.refund(1)
+            self.breaker.release()
+            self._count("rate_limited")
+            raise LLMRateLimited(f"LLM rate limit: no slot within {max_wait:.1f}s")
+        return max(request_wait, token_wait)
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, self.config.retry_base * (2 ** attempt))
+
+    def _settle(self, error: Optional[BaseException]) -> None:
+        if error is None:
+            self.breaker.record_success()
+            self._count("succeeded")
+            return
+        self._count("failed")
+        if isinstance(error, LLMDeadlineExceeded) or type(error).__name__ in _TIMEOUT_ERRORS:
+            self._count("deadline_exceeded")
+        if _counts_against_llm(error):
+            self.breaker.record_failure()
+        else:
+            self.breaker.release()
+
+    def call(self, fn: Callable[[float], Any], prompt_tokens: int = 0,
+             timeout: Optional[float] = None) -> Any:
+        """
+        Run `fn(seconds_left)` through the gateway.
+
+        Args:
+            fn: Makes the LLM request; should pass `seconds_left` on as the
+                request timeout
+            prompt_tokens: Estimated prompt size (see `estimate_tokens`)
+            timeout: Deadline for the whole call (defaults to LLM_TIMEOUT_SECONDS)
+
+        Raises:
+            LLMUnavailable: breaker open, no rate-limit slot, or deadline passed
+            The last error from `fn` when it is not retryable or retries ran out
+        """
+        deadline = self._clock() + (self.config.timeout if timeout is None else timeout)
+        wait = self._admit(prompt_tokens, deadline)
+        if wait:
+            time.sleep(wait)
+
+        attempt = 0
+        while True:
+            left = deadline - self._clock()
+            try:
+                if left <= 0:
+                    raise LLMDeadlineExceeded("LLM call ran out of time")
+                result = fn(left)
+            except Exception as e:
+                pause = self._backoff(attempt)
+                if (not _is_retryable(e) or attempt >= self.config.max_retries
+                        or self._clock() + pause >= deadline):
+                    self._settle(e)
+                    raise
+                attempt += 1
+                self._count("retries")
+                logger.info("LLM call failed (%s), retry %d in %.2fs", type(e).__name__, attempt, pause)
+                time.sleep(pause)
+                continue
+            self._settle(None)
+            return result
+
+    async def acall(self, fn: Callable[[float], Awaitable[Any]], prompt_tokens: int = 0,
+                    timeout: Optional[float] = None) -> Any:
+        """Async counterpart of `call`; each attempt is also cut off at the deadline."""
+        deadline = self._clock() + (self.config.timeout if timeout is None else timeout)
+        wait = self._admit(prompt_tokens, deadline)
+        if wait:
+            await asyncio.sleep(wait)
+
+        attempt = 0
+        while True:
+            left = deadline - self._clock()
+            try:
+                if left <= 0:
+                    raise LLMDeadlineExceeded("LLM call ran out of time")
+                try:
+                    result = await asyncio.wait_for(fn(left), timeout=left)
+                except asyncio.TimeoutError:
+                    raise LLMDeadlineExceeded(f"LLM call exceeded {left:.1f}s")
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            except Exception as e:
+                pause = self._backoff(attempt)
+                if (not _is_retryable(e) or attempt >= self.config.max_retries
+                        or self._clock() + pause >= deadline):
+                    self._settle(e)
+                    raise
+                attempt += 1
+                self._count("retries")
+                logger.info("LLM call failed (%s), retry %d in %.2fs", type(e).__name__, attempt, pause)
+                await asyncio.sleep(pause)
+                continue
+            self._settle(None)
+            return result
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self._counts)
+        return {**counts, "breaker": self.breaker.state, "breaker_opened": self.breaker.opened}
+
+
+# ---------- process-wide gateway ----------
+
+_gateway: Optional[LLMGateway] = None
+_gateway_lock = threading.Lock()
+
+
+def get_llm_gateway() -> LLMGateway:
+    """Return the process-wide LLM gateway, creating it on first use."""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = LLMGateway()
+    return _gateway
+
+
+def get_llm_gateway_metrics() -> Dict[str, Any]:
+    """LLM gateway counters and breaker state as a plain dict."""
+    return get_llm_gateway().metrics()
+
+
+def reset_llm_gateway() -> None:
+    """Drop the gateway so the next call re-reads the environment (used in tests)."""
+    global _gateway
+    with _gateway_lock:
+        _gateway = None
@@ -0,0 +1,363 @@
+"""
+Deterministic answers for questions about a single semantic-layer measure.
+
+Many questions ("total revenue last month", "average session length by
+activity type", "churn rate per plan") ask for one measure defined in
+`semantic_layer/*.yml`, optionally split by a dimension or a time grain,
+filtered on known values and limited to a time window. `resolve_measure`
+recognises those from the question's words and compiles the measure's
+formula into one SQL statement, so they are answered with a single database
+round-trip and no LLM call. Every word of the question has to be accounted
+for (measure, dimension, filter value, time window or filler); anything
+else is left to PandasAI. MEASURE_FAST_PATH=false turns this off.
+
+Measure formulas are compiled with sqlglot. A formula qualifies when it is
+an aggregate over the model's columns (`SUM(amount_usd)`) or a row
+predicate, which is counted (`start_date <= d AND ...`). Parameters
+declared in the measure name are bound to dates: `d` (and `period_end`) to
+today, `period_start` to the start of the question's window (default
+MEASURE_DEFAULT_PERIOD_DAYS, 30).
+"""
+
+import os
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import sqlglot
+from sqlglot import exp
+
+from core.services.response_cache import normalize_question
+from core.services.semantic_layer import SemanticModel, get_models
+from core.services.table_loader import FIELD_SYNONYMS, detect_time_window
+
+_MEASURE_NAME = re.compile(r"^\s*([A-Za-z_]\w*)\s*(?:\(([^)]*)\))?\s*$")
+
+# Words that don't change which measure is asked for
+_FILLER = {
+    "how", "many", "much", "number", "total", "overall", "all", "time", "in", "on",
+    "from", "at", "with", "have", "has", "had", "currently", "current", "now",
+    "today", "right", "so", "far", "ever", "made", "make", "generated", "earned",
+    "via", "using",
+}
+_ALIASES = {"average": "avg", "mean": "avg"}
+_WINDOW_START = {"last", "past"}
+_WINDOW_UNITS = {"week", "month", "quarter", "year"}
+_GRAINS = {"day": "day", "week": "week", "month": "month", "quarter": "quarter", "year": "year",
+           "daily": "day", "weekly": "week", "monthly": "month", "quarterly": "quarter", "yearly": "year"}
+
+# Parameters a measure formula may declare, and what they are bound to
+_AS_OF_PARAMETERS = {"d", "period_end"}
+_PERIOD_PARAMETERS = {"period_start"}
+
+
+def measure_fast_path_enabled() -> bool:
+    """MEASURE_FAST_PATH (default on)."""
+    return os.environ.get("MEASURE_FAST_PATH", "true").strip().lower() not in ("0", "false", "no", "off")
+
+
+def _default_period_days() -> int:
+    """MEASURE_DEFAULT_PERIOD_DAYS (default 30), for period measures asked without a window."""
+    return int(os.environ.get("MEASURE_DEFAULT_PERIOD_DAYS", "30"))
+
+
+def _max_groups() -> int:
+    """MEASURE_MAX_GROUPS (default 20) rows of a breakdown or trend."""
+    return int(os.environ.get("MEASURE_MAX_GROUPS", "20"))
+
+
+@dataclass(frozen=True)
+class MeasureQuery:
+    """A question compiled to one SQL statement over one measure."""
+    model: str
+    measure: str
+    sql: str
+    params: Tuple[Any, ...] = ()
+    group_by: Optional[str] = None
+    grain: Optional[str] = None
+    window_label: str = "all time"
+    filters: Tuple[Tuple[str, str], ...] = ()
+
+    @property
+    def title(self) -> str:
+        return self.measure.replace("_", " ").capitalize()
+
+
+@dataclass(frozen=True)
+class _Measure:
+    name: str
+    parameters: Tuple[str, ...]
+    formula: str
+    phrases: Tuple[Tuple[str, ...], ...]
+
+    @property
+    def is_period(self) -> bool:
+        return bool(_PERIOD_PARAMETERS & set(self.parameters))
+
+
+def _tokens(text: str) -> List[str]:
+    return [_ALIASES.get(word, word) for word in normalize_question(text).split()]
+
+
+def _measures(model: SemanticModel) -> List[_Measure]:
+    measures = []
+    for m in model.measures:
+        match = _MEASURE_NAME.match(m.name)
+        if not match or not m.formula:
+            continue
+        name = match.group(1)
+        parameters = tuple(p.strip().lower() for p in (match.group(2) or "").split(",") if p.strip())
+        if any(p not in _AS_OF_PARAMETERS | _PERIOD_PARAMETERS for p in parameters):
+            continue
+        phrases = {tuple(_tokens(name.replace("_", " ")))}
+        phrases |= {tuple(_tokens(s)) for s in m.synonyms}
+        measures.append(_Measure(name, parameters, m.formula, tuple(p for p in phrases if p)))
+    return measures
+
+
+@lru_cache(maxsize=256)
+def _compile_formula(formula: str, parameters: Tuple[str, ...], columns: Tuple[str, ...],
+                     period_days: Optional[int]) -> Optional[str]:
+    """
+    SQL for one value of the measure, or None if the formula is not an
+    aggregate or row predicate over `columns` and `parameters`.
+    """
+    try:
+        tree = sqlglot.parse_one(formula, read="postgres")
+    except (sqlglot.errors.ParseError, sqlglot.errors.TokenError):
+        return None
+    if tree is None or tree.find(exp.Select, exp.Subquery, exp.Alias, exp.Anonymous, exp.Tuple):
+        return None
+
+    def bind(node: exp.Expression) -> exp.Expression:
+        if not isinstance(node, exp.Column):
+            return node
+        name = node.name.lower()
+        if node.table or (name not in columns and name not in parameters):
+            raise ValueError(name)
+        if name in _PERIOD_PARAMETERS & set(parameters):
+            return sqlglot.parse_one(f"CURRENT_DATE - INTERVAL '{int(period_days)} days'", read="postgres")
+        if name in parameters:
+            return exp.CurrentDate()
+        return node
+
+    try:
+        tree = tree.transform(bind)
+    except ValueError:
+        return None
+
+    # Ratios of counts: keep the fraction and don't fail on an empty window
+    for div in list(tree.find_all(exp.Div)):
+        div.set("this", exp.cast(div.this, "numeric"))
+        if not isinstance(div.expression, exp.Nullif):
+            div.set("expression", exp.Nullif(this=div.expression, expression=exp.Literal.number(0)))
+
+    if tree.find(exp.AggFunc):
+        return tree.sql(dialect="postgres")
+    if isinstance(tree, (exp.Connector, exp.Predicate, exp.Not, exp.Paren)):
+        return f"COUNT(*) FILTER (WHERE {tree.sql(dialect='postgres')})"
+    return None
+
+
+def _find(tokens: List[str], phrase: Sequence[str]) -> int:
+    for i in range(len(tokens) - len(phrase) + 1):
+        if tuple(tokens[i:i + len(phrase)]) == tuple(phrase):
+            return i
+    return -1
+
+
+def _remove(tokens: List[str], start: int, length: int) -> List[str]:
+    return tokens[:start] + tokens[start + length:]
+
+
+def _match_measure(tokens: List[str], models: Sequence[SemanticModel]
+                   ) -> Optional[Tuple[SemanticModel, _Measure, List[str]]]:
+    """The measure with the longest phrase in `tokens` (None if none or a tie)."""
+    best: List[Tuple[int, SemanticModel, _Measure, List[str]]] = []
+    for model in models:
+        for measure in _measures(model):
+            for phrase in measure.phrases:
+                start = _find(tokens, phrase)
+                if start < 0:
+                    continue
+                candidate = (len(phrase), model, measure, _remove(tokens, start, len(phrase)))
+                if not best or candidate[0] > best[0][0]:
+                    best = [candidate]
+                elif candidate[0] == best[0][0]:
+                    best.append(candidate)
+    if len({(b[1].name, b[2].name) for b in best}) != 1:
+        return None
+    return best[0][1], best[0][2], best[0][3]
+
+
+def _dimension_aliases(model: SemanticModel) -> Dict[Tuple[str, ...], str]:
+    aliases: Dict[Tuple[str, ...], str] = {}
+    singular = model.name.rstrip("s")
+    for f in model.fields:
+        if not f.is_categorical:
+            continue
+        words = f.name.split("_")
+        names = {" ".join(words), words[0], f"{singular} {' '.join(words)}"}
+        names |= {k for k, v in FIELD_SYNONYMS.items() if v == [f.name]}
+        for name in names:
+            aliases[tuple(_tokens(name))] = f.name
+    return aliases
+
+
+def _filter_values(model: SemanticModel) -> Dict[str, Tuple[str, str]]:
+    values: Dict[str, Tuple[str, str]] = {}
+    for f in model.fields:
+        if f.is_categorical:
+            for value in f.example_values:
+                for token in _tokens(value):
+                    values.setdefault(token, (f.name, value))
+    return values
+
+
+def resolve_measure(question: str, dataset_name: Optional[str] = None) -> Optional[MeasureQuery]:
+    """
+    Compile `question` to a single-measure query, or None if it is not
+    (only) a question about one measure of the semantic layer.
+
+    Args:
+        question: The user's question
+        dataset_name: The routed dataset; other models are only considered
+            when it is not a semantic model
+    """
+    models = get_models()
+    candidates = [models[dataset_name]] if dataset_name in models else list(models.values())
+    tokens = _tokens(question)
+
+    # Time window ("last month") first, so "month" isn't read as a grain
+    window_days, window_label = detect_time_window(question)
+    if window_days is not None:
+        for i in range(len(tokens) - 1):
+            if tokens[i] in _WINDOW_START and tokens[i + 1] in _WINDOW_UNITS:
+                tokens = _remove(tokens, i, 2)
+                break
+
+    matched = _match_measure(tokens, candidates)
+    if matched is None:
+        return None
+    model, measure, rest = matched
+
+    if measure.parameters and not measure.is_period and window_days is not None:
+        return None  # "as of today" measures have no window
+    period_days = window_days if window_days is not None else _default_period_days()
+    if measure.is_period and window_days is None:
+        window_label = f"last {period_days} days"
+
+    columns = tuple(f.name for f in model.fields)
+    expression = _compile_formula(measure.formula, measure.parameters, columns, period_days)
+    if expression is None:
+        return None
+
+    group_by: Optional[str] = None
+    grain: Optional[str] = None
+    aliases = _dimension_aliases(model)
+    values = _filter_values(model)
+    filters: Dict[str, List[str]] = {}
+    leftover: List[str] = []
+    i = 0
+    while i < len(rest):
+        word = rest[i]
+        if word == "by" and group_by is None and grain is None:
+            for alias in sorted(aliases, key=len, reverse=True):
+                if tuple(rest[i + 1:i + 1 + len(alias)]) == alias:
+                    group_by = aliases[alias]
+                    i += 1 + len(alias)
+                    break
+            else:
+                if i + 1 < len(rest) and rest[i + 1] in _GRAINS:
+                    grain = _GRAINS[rest[i + 1]]
+                    i += 2
+                else:
+                    return None
+            continue
+        if word in values:
+            column, value = values[word]
+            filters.setdefault(column, []).append(value)
+            # "monthly plan", "ios device": the column name after its value
+            for alias, name in sorted(aliases.items(), key=lambda a: len(a[0]), reverse=True):
+                if name == column and tuple(rest[i + 1:i + 1 + len(alias)]) == alias:
+                    i += len(alias)
+                    break
+        elif word in _GRAINS and word.endswith("ly") and grain is None and group_by is None:
+            grain = _GRAINS[word]
+        elif word not in _FILLER:
+            leftover.append(word)
+        i += 1
+    if leftover:
+        return None
+    if grain is not None and (measure.parameters or not model.time_column):
+        return None
+
+    where: List[str] = []
+    params: List[Any] = []
+    if window_days is not None and not measure.parameters:
+        if not model.time_column:
+            return None
+        where.append(f"{model.time_column} >= CURRENT_DATE - INTERVAL '{int(window_days)} days'")
+    for column, column_values in filters.items():
+        where.append(f"LOWER({column}) IN ({', '.join(['%s'] * len(column_values))})")
+        params.extend(column_values)
+
+    select = f"{expression} AS value"
+    tail = ""
+    if group_by is not None:
+        select = f"{group_by} AS grp, {select}"
+        tail = f" GROUP BY {group_by} ORDER BY value DESC NULLS LAST LIMIT {_max_groups()}"
+    elif grain is not None:
+        select = f"DATE_TRUNC('{grain}', {model.time_column})::date AS grp, {select}"
+        tail = f" GROUP BY 1 ORDER BY 1 DESC LIMIT {_max_groups()}"
+    sql = f"SELECT {select} FROM {model.table}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+
+    return MeasureQuery(
+        model=model.name,
+        measure=measure.name,
+        sql=sql + tail,
+        params=tuple(params),
+        group_by=group_by,
+        grain=grain,
+        window_label=window_label,
+        filters=tuple((column, value) for column, vs in filters.items() for value in vs),
+    )
+
+
+def _format_value(measure: str, value: Any) -> str:
+    if value is None:
+        return "n/a"
+    number = float(value)
+    if measure.endswith("_usd") or "amount" in measure:
+        return f"${number:,.2f}"
+    if measure.endswith("_rate"):
+        return f"{number:.1f}%"
+    if number == int(number):
+        return f"{int(number):,}"
+    return f"{number:,.2f}"
+
+
+def format_measure_answer(query: MeasureQuery, rows: List[Dict[str, Any]]) -> str:
+    """Slack reply for the rows of a `MeasureQuery`."""
+    scope = [query.window_label]
+    scope += [f"{column} = {value}" for column, value in query.filters]
+    header = f"📐 *{query.title}* ({', '.join(scope)})"
+
+    if query.group_by is None and query.grain is None:
+        value = rows[0]["value"] if rows else None
+        body = _format_value(query.measure, value)
+    elif not rows:
+        body = "_No data for this period._"
+    else:
+        if query.grain is not None:
+            rows = list(reversed(rows))  # fetched newest first, shown oldest first
+        body = "\n".join(f"• {row['grp']}: {_format_value(query.measure, row['value'])}" for row in rows)
+        header += f" by {query.group_by or query.grain}"
+
+    return (
+        f"{header}\n{body}\n\n"
+        f"_Computed directly from the `{query.model}.{query.measure}` measure of the semantic layer._"
+    )
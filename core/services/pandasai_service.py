@@ -4,14 +4,24 @@ Uses semantic layer YAML files to enable natural language queries
 """
 
 import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Optional
+from typing import Hashable, Optional
 
 import pandas as pd
 import pandasai as pai
 from pandasai_litellm import LiteLLM
-import psycopg2
-from psycopg2.extras import RealDictCursor
+
+from core.messages import INSIGHTS_PENDING
+from core.services.dataframe_cache import CachedFrame, get_dataframe_cache
+from core.services.db_pool import get_connection
+from core.services.insights import StageTimer, collect_insight, start_insight
+from core.services.llm_gateway import LLMUnavailable, estimate_tokens, get_llm_gateway
+from core.services.progressive_reply import ProgressCallback, report
+from core.services.table_loader import load_table
+from core.subsystem_1.routing_rules import infer_dataset
 
 
 def _get_semantic_layer_path() -> Path:
@@ -19,14 +29,22 @@ def _get_semantic_layer_path() -> Path:
     return Path(__file__).parent.parent.parent / "semantic_layer"
 
 
-def _initialize_pandasai() -> None:
+@dataclass(frozen=True)
+class LLMSettings:
+    """LLM settings read from the environment; a change triggers a rebuild."""
+    api_key: str
+    model: str
+    verbose: bool
+    max_retries: int
+
+
+def _read_llm_settings() -> LLMSettings:
     """
-    Initialize PandasAI with LiteLLM and configuration.
-    Uses environment variables for LLM API key.
+    Read LLM settings from environment variables.
+    Raises ValueError when no API key is configured.
     """
     # Get LLM API key from environment (default to OpenAI)
     api_key = os.getenv("OPENAI_API_KEY") or os.getenv("LLM_API_KEY")
-    model = os.getenv("LLM_MODEL", "gpt-4o-mini")
     
     if not api_key:
         raise ValueError(
@@ -34,50 +52,205 @@ def _initialize_pandasai() -> None:
             "Get your API key from https://platform.openai.com/api-keys"
         )
     
-    # Initialize LiteLLM with the model
-    llm = LiteLLM(model=model, api_key=api_key)
+    return LLMSettings(
+        api_key=api_key,
+        model=os.getenv("LLM_MODEL", "gpt-4o-mini"),
+        verbose=os.getenv("PANDASAI_VERBOSE", "false").lower() == "true",
+        max_retries=int(os.getenv("PANDASAI_MAX_RETRIES", "1")),
+    )
+
+
+class GatewayLiteLLM(LiteLLM):
+    """
+    PandasAI's LiteLLM client with every completion sent through the LLM
+    gateway (rate limits, deadline, retries, circuit breaker).
+    """
+    
+    def call(self, instruction, _=None) -> str:
+        from litellm import completion
+        
+        prompt = instruction.to_string()
+        return get_llm_gateway().call(
+            lambda timeout: completion(
+                model=self.model,
+                messages=[{"content": prompt, "role": "user"}],
+                timeout=timeout,
+                **self.params,
+            ).choices[0].message.content,
+            estimate_tokens(prompt),
+        )
+
+
+class _LLMHolder:
+    """
+    Process-wide LiteLLM client and PandasAI config.
     
-    # Configure PandasAI to use this LLM
-    pai.config.set({
-        "llm": llm,
-        "verbose": os.getenv("PANDASAI_VERBOSE", "false").lower() == "true"
-    })
+    Built lazily on first use and reused afterwards, so the client's HTTP
+    connections survive across Slack messages. Every `get()` compares the
+    current env settings with the ones the client was built from and
+    rebuilds only when they differ (e.g. a rotated API key or new model).
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._llm: Optional[LiteLLM] = None
+        self._settings: Optional[LLMSettings] = None
+    
+    def get(self, force: bool = False) -> LiteLLM:
+        settings = _read_llm_settings()
+        llm = self._llm
+        if llm is not None and not force and settings == self._settings:
+            return llm
+        
+        with self._lock:
+            if self._llm is None or force or settings != self._settings:
+                # Initialize LiteLLM with the model (calls go through the LLM gateway)
+                llm = GatewayLiteLLM(model=settings.model, api_key=settings.api_key)
+                
+                # Configure PandasAI to use this LLM. Its retries regenerate
+                # code after any error (even a rejected query), so keep them few.
+                pai.config.set({
+                    "llm": llm,
+                    "verbose": settings.verbose,
+                    "max_retries": settings.max_retries,
+                })
+                self._llm = llm
+                self._settings = settings
+            return self._llm
+    
+    def reset(self) -> None:
+        with self._lock:
+            self._llm = None
+            self._settings = None
+
+
+_llm_holder = _LLMHolder()
+
+
+def _initialize_pandasai() -> LiteLLM:
+    """
+    Initialize PandasAI with LiteLLM and configuration (once per process).
+    Uses environment variables for LLM API key; rebuilds the client only
+    when those settings change.
+    
+    Returns:
+        The shared LiteLLM client
+    """
+    return _llm_holder.get()
+
+
+def reconfigure_pandasai(force: bool = False) -> None:
+    """
+    Re-read LLM settings from the environment and rebuild the client if they
+    changed. With force=True the client is rebuilt unconditionally.
+    """
+    _llm_holder.get(force=force)
 
 
 def _get_postgres_connection():
     """
-    Create a PostgreSQL connection using environment variables.
+    Check out a PostgreSQL connection from the shared pool.
     
     Returns:
-        psycopg2 connection object
-    """
-    return psycopg2.connect(
-        host=os.environ["DB_HOST"],
-        port=int(os.environ.get("DB_PORT", "5432")),
-        user=os.environ["DB_USER"],
-        password=os.environ["DB_PASS"],
-        dbname=os.environ["DB_NAME"],
-        sslmode=os.environ.get("DB_SSLMODE", "require"),
-    )
+        Context manager yielding a psycopg2 connection
+    """
+    return get_connection()
 
 
-def _load_table_to_dataframe(table_name: str) -> pd.DataFrame:
+def _load_table_to_dataframe(table_name: str, question: str = "") -> CachedFrame:
     """
-    Load a table from PostgreSQL into a pandas DataFrame.
+    Load the part of a PostgreSQL table relevant to a question into a DataFrame.
+    
+    Only the columns the question needs are selected, the detected time
+    window and filters are pushed into Postgres, and large tables are
+    pre-aggregated or sampled to fit PANDASAI_LOAD_BUDGET_MB. Repeat loads
+    of the same slice are served from the in-process DataFrame cache.
     
     Args:
         table_name: Name of the table to load
+        question: The user's question (drives column and filter selection)
     
     Returns:
-        pandas DataFrame with table data
+        CachedFrame with the DataFrame (`.df`), the LoadPlan describing what
+        was loaded (`.plan`) and a `.version` that changes on every reload
     """
-    conn = _get_postgres_connection()
-    try:
-        query = f"SELECT * FROM {table_name} LIMIT 10000"  # Limit for performance
-        df = pd.read_sql_query(query, conn)
-        return df
-    finally:
-        conn.close()
+    with _get_postgres_connection() as conn:
+        return load_table(conn, question, table_name)
+
+
+@dataclass
+class _RegisteredDataframe:
+    """A long-lived SmartDataframe and the frame/LLM it was built from."""
+    table: str
+    smart_df: object
+    version: int
+    llm: object
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class _SmartDataframeRegistry:
+    """
+    Reuses SmartDataframe objects (and their PandasAI agents) across questions.
+    
+    Entries are keyed by the loaded slice (the DataFrame cache key) and rebuilt
+    only when the cached frame is reloaded (new version) or the LLM client is
+    rebuilt. A SmartDataframe keeps per-chat state, so callers hold the
+    entry's lock while chatting. Bounded by PANDASAI_AGENT_CACHE_SIZE
+    (default 32) with LRU eviction; a table's entries are dropped when the
+    DataFrame cache invalidates that table.
+    """
+    
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, _RegisteredDataframe]" = OrderedDict()
+    
+    def get(self, frame: CachedFrame, llm) -> _RegisteredDataframe:
+        with self._lock:
+            entry = self._entries.get(frame.key)
+            if entry is not None and entry.version == frame.version and entry.llm is llm:
+                self._entries.move_to_end(frame.key)
+                return entry
+        
+        # Building a SmartDataframe is not free; do it outside the registry lock
+        smart_df = pai.SmartDataframe(
+            df=frame.df,
+            name=frame.table,
+            description=frame.plan.describe()
+        )
+        entry = _RegisteredDataframe(table=frame.table, smart_df=smart_df, version=frame.version, llm=llm)
+        
+        with self._lock:
+            self._entries[frame.key] = entry
+            self._entries.move_to_end(frame.key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+    
+    def drop_table(self, table: str) -> None:
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if e.table == table]:
+                del self._entries[key]
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_registry: Optional[_SmartDataframeRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def _get_registry() -> _SmartDataframeRegistry:
+    """Process-wide SmartDataframe registry, hooked to cache invalidation."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                registry = _SmartDataframeRegistry(int(os.getenv("PANDASAI_AGENT_CACHE_SIZE", "32")))
+                get_dataframe_cache().add_invalidation_listener(registry.drop_table)
+                _registry = registry
+    return _registry
 
 
 def _load_semantic_layer() -> Optional[str]:
@@ -94,7 +267,8 @@ def _load_semantic_layer() -> Optional[str]:
     return str(semantic_layer_path)
 
 
-def query_with_pandasai(question: str, table_name: Optional[str] = None) -> str:
+def query_with_pandasai(question: str, table_name: Optional[str] = None,
+                        progress: Optional[ProgressCallback] = None) -> str:
     """
     Execute a natural language query using PandasAI v3 with semantic layer.
     
@@ -104,13 +278,14 @@ def query_with_pandasai(question: str, table_name: Optional[str] = None) -> str:
     Args:
         question: Natural language question from the user
         table_name: Optional table name to focus the query (users, subscriptions, payments, sessions)
+        progress: Optional callback receiving the partial answer as stages finish
     
     Returns:
         Formatted answer string for Slack
     """
     try:
-        # Initialize PandasAI if not already done
-        _initialize_pandasai()
+        # Initialize PandasAI if not already done (no-op after the first call)
+        llm = _initialize_pandasai()
         
         # Load semantic layer
         semantic_layer_path = _load_semantic_layer()
@@ -121,34 +296,25 @@ def query_with_pandasai(question: str, table_name: Optional[str] = None) -> str:
             # Load the specific table
             target_table = table_name
         else:
-            # Try to infer table from question keywords
-            question_lower = question.lower()
-            if any(kw in question_lower for kw in ["payment", "revenue", "sales", "transaction", "amount"]):
-                target_table = "payments"
-            elif any(kw in question_lower for kw in ["subscription", "churn", "plan", "cancel", "renewal"]):
-                target_table = "subscriptions"
-            elif any(kw in question_lower for kw in ["user", "signup", "country", "device", "cohort"]):
-                target_table = "users"
-            elif any(kw in question_lower for kw in ["session", "activity", "engagement", "duration", "visit"]):
-                target_table = "sessions"
-            else:
-                # Default to users if we can't infer
-                target_table = "users"
+            # Infer the table from the question with the routing rules
+            # (semantic layer + routing_rules.yml); default to users
+            target_table = infer_dataset(question) or "users"
         
-        # Load the table into a DataFrame
-        df = _load_table_to_dataframe(target_table)
+        timer = StageTimer("data_question")
         
-        # Convert pandas DataFrame to PandasAI DataFrame
-        # Use SmartDataframe for natural language queries
-        smart_df = pai.SmartDataframe(
-            df=df,
-            name=target_table,
-            description=f"Data from {target_table} table"
-        )
+        # Load the relevant slice of the table into a DataFrame (cached)
+        report(progress, f"⏳ Loading `{target_table}` data...")
+        with timer.stage("load"):
+            frame = _load_table_to_dataframe(target_table, question)
+            
+            # Reuse the SmartDataframe built for this slice unless the data changed
+            registered = _get_registry().get(frame, llm)
         
         # Execute the natural language query
         # PandasAI will use the semantic layer if available to generate appropriate SQL
-        response = smart_df.chat(question)
+        report(progress, f"⏳ Analyzing `{target_table}` data with PandasAI...")
+        with timer.stage("pandasai"), registered.lock:
+            response = registered.smart_df.chat(question)
         
         # Format response for Slack
         if response is None:
@@ -168,21 +334,27 @@ def query_with_pandasai(question: str, table_name: Optional[str] = None) -> str:
             indicator += "📋 *Using semantic layer*\n"
         indicator += "\n"
         
-        # Try to get additional LLM insights on the response
-        try:
-            from core.services.pandasai_service import analyze_with_llm
-            insight = analyze_with_llm(
-                f"Provide insights on this data analysis result",
-                f"Result: {response[:500]}"
-            )
-            
-            if insight and insight.strip():
-                return f"{indicator}📊 *Analysis Result:*\n\n{response}\n\n💡 *LLM Insights:*\n{insight}"
-        except Exception:
-            pass
+        # Start the LLM insights on the response, and show the result while
+        # they are generated (they are dropped if they miss the deadline)
+        insight_future = start_insight(
+            analyze_with_llm,
+            "Provide insights on this data analysis result",
+            f"Result: {response[:500]}",
+        )
+        report(progress, f"{indicator}📊 *Analysis Result:*\n\n{response}{INSIGHTS_PENDING}")
+        with timer.stage("insights"):
+            insight = collect_insight(insight_future)
+        timer.finish()
+        
+        if insight.strip():
+            return f"{indicator}📊 *Analysis Result:*\n\n{response}\n\n💡 *LLM Insights:*\n{insight}"
         
         return f"{indicator}📊 *Analysis Result:*\n\n{response}"
         
+    except LLMUnavailable:
+        # Callers degrade to answers that don't need the LLM
+        raise
+    
     except ValueError as e:
         if "OPENAI_API_KEY" in str(e) or "LLM_API_KEY" in str(e):
             return (
@@ -234,10 +406,48 @@ def is_pandasai_configured() -> bool:
         return False
 
 
+def _explain_prompt(context: str, data_summary: str = "") -> str:
+    """Prompt used by explain_with_llm / explain_with_llm_async."""
+    prompt = f"Based on this context: '{context}'"
+    if data_summary:
+        prompt += f" and data summary: '{data_summary}'"
+    prompt += ", provide a clear, concise explanation or insight in 2-3 sentences."
+    return prompt
+
+
+def _analysis_prompt(question: str, data_context: str) -> str:
+    """Prompt used by analyze_with_llm / analyze_with_llm_async."""
+    return (
+        f"Question: {question}\n\n"
+        f"Data Context: {data_context}\n\n"
+        "Provide a brief analysis and insights in 2-3 sentences. "
+        "Focus on key trends, patterns, or actionable insights."
+    )
+
+
+def _complete(prompt: str) -> str:
+    """
+    Send a single prompt to the configured LLM and return the text reply.
+    Goes straight to LiteLLM; no DataFrame wrapping or code generation.
+    """
+    from litellm import completion
+
+    settings = _read_llm_settings()
+    response = get_llm_gateway().call(
+        lambda timeout: completion(
+            model=settings.model,
+            messages=[{"role": "user", "content": prompt}],
+            api_key=settings.api_key,
+            timeout=timeout,
+        ),
+        estimate_tokens(prompt),
+    )
+    return response.choices[0].message.content or ""
+
+
 def explain_with_llm(context: str, data_summary: str = "") -> str:
     """
     Use LLM to provide explanations and insights.
-    Uses a simple DataFrame approach to get LLM responses.
     
     Args:
         context: The context or question to explain
@@ -247,28 +457,8 @@ def explain_with_llm(context: str, data_summary: str = "") -> str:
         LLM-generated explanation
     """
     try:
-        _initialize_pandasai()
-        
-        # Create a simple DataFrame with the context
-        import pandas as pd
-        df = pd.DataFrame({
-            'context': [context],
-            'data_summary': [data_summary] if data_summary else ['']
-        })
-        
-        # Create SmartDataframe
-        smart_df = pai.SmartDataframe(df, name="insights")
-        
-        # Ask for explanation
-        prompt = f"Based on this context: '{context}'"
-        if data_summary:
-            prompt += f" and data summary: '{data_summary}'"
-        prompt += ", provide a clear, concise explanation or insight in 2-3 sentences."
-        
-        response = smart_df.chat(prompt)
-        
-        if response:
-            return str(response)
+        return _complete(_explain_prompt(context, data_summary)).strip()
+    except LLMUnavailable:
         return ""
     except Exception as e:
         # Return a fallback message instead of empty string
@@ -278,7 +468,6 @@ def explain_with_llm(context: str, data_summary: str = "") -> str:
 def analyze_with_llm(question: str, data_context: str) -> str:
     """
     Use LLM to analyze data and provide insights.
-    Uses SmartDataframe to get LLM analysis.
     
     Args:
         question: The question or analysis request
@@ -288,36 +477,60 @@ def analyze_with_llm(question: str, data_context: str) -> str:
         LLM-generated analysis
     """
     try:
-        _initialize_pandasai()
-        
-        # Create a simple DataFrame with the context
-        import pandas as pd
-        df = pd.DataFrame({
-            'question': [question],
-            'data_context': [data_context]
-        })
-        
-        # Create SmartDataframe
-        smart_df = pai.SmartDataframe(df, name="analysis")
-        
-        # Ask for analysis
-        prompt = (
-            f"Question: {question}\n\n"
-            f"Data Context: {data_context}\n\n"
-            "Provide a brief analysis and insights in 2-3 sentences. "
-            "Focus on key trends, patterns, or actionable insights."
-        )
-        
-        response = smart_df.chat(prompt)
-        
-        if response:
-            return str(response)
+        return _complete(_analysis_prompt(question, data_context)).strip()
+    except LLMUnavailable:
         return ""
     except Exception as e:
         # Return a fallback message instead of empty string
         return f"Based on the data: {data_context}, the analysis shows relevant patterns and trends."
 
 
+async def _acomplete(prompt: str) -> str:
+    """
+    Send a single prompt to the configured LLM without blocking the event loop.
+    Goes straight to LiteLLM's async client; no DataFrame or code generation.
+    """
+    from litellm import acompletion
+
+    settings = _read_llm_settings()
+    response = await get_llm_gateway().acall(
+        lambda timeout: acompletion(
+            model=settings.model,
+            messages=[{"role": "user", "content": prompt}],
+            api_key=settings.api_key,
+            timeout=timeout,
+        ),
+        estimate_tokens(prompt),
+    )
+    return response.choices[0].message.content or ""
+
+
+async def explain_with_llm_async(context: str, data_summary: str = "") -> str:
+    """
+    Async counterpart of `explain_with_llm` for the asyncio Slack app.
+    """
+    try:
+        return (await _acomplete(_explain_prompt(context, data_summary))).strip()
+    except LLMUnavailable:
+        return ""
+    except Exception:
+        # Return a fallback message instead of empty string
+        return f"Analysis: {context}. {data_summary}"
+
+
+async def analyze_with_llm_async(question: str, data_context: str) -> str:
+    """
+    Async counterpart of `analyze_with_llm` for the asyncio Slack app.
+    """
+    try:
+        return (await _acomplete(_analysis_prompt(question, data_context))).strip()
+    except LLMUnavailable:
+        return ""
+    except Exception:
+        # Return a fallback message instead of empty string
+        return f"Based on the data: {data_context}, the analysis shows relevant patterns and trends."
+
+
 def get_available_tables() -> list:
     """
     Get list of available tables from the semantic layer.
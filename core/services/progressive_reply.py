@@ -0,0 +1,191 @@
+"""
+Slack replies that are posted right away and edited as the answer builds up.
+
+The listener posts a placeholder as soon as a message is routed; agent code
+reports partial answers through a `progress(text)` callback (primary result
+first, LLM insights last) and each one replaces the placeholder with
+`chat.update`. Edits to one message are spaced at least
+SLACK_UPDATE_MIN_INTERVAL seconds (default 0.5) apart to stay inside
+Slack's rate limits: a partial answer arriving sooner is sent once the
+interval has passed, unless a newer one replaced it. The final answer is
+always sent, after any edit in flight.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[[str], None]
+
+
+def report(progress: Optional[ProgressCallback], text: str) -> None:
+    """Pass a partial answer to `progress` if there is one; failures are only logged."""
+    if progress is None:
+        return
+    try:
+        progress(text)
+    except Exception as e:
+        logger.warning("Progress update failed: %s", e)
+
+
+def progressive_replies_enabled() -> bool:
+    """SLACK_PROGRESSIVE_REPLIES (default on); off sends one reply per answer."""
+    return os.environ.get("SLACK_PROGRESSIVE_REPLIES", "true").strip().lower() not in ("0", "false", "no", "off")
+
+
+def min_update_interval() -> float:
+    """SLACK_UPDATE_MIN_INTERVAL (default 0.5 seconds)."""
+    return float(os.environ.get("SLACK_UPDATE_MIN_INTERVAL", "0.5"))
+
+
+class ProgressiveReply:
+    """
+    One Slack message, updated in place (thread-safe).
+
+    Args:
+        post: Posts a new message and returns its `ts` (e.g. via `say`)
+        edit: Replaces the text of the message with that `ts` (`chat.update`)
+    """
+
+    def __init__(self, post: Callable[[str], Optional[str]], edit: Callable[[str, str], None],
+                 min_interval: Optional[float] = None):
+        self._post = post
+        self._edit = edit
+        self.min_interval = min_update_interval() if min_interval is None else min_interval
+        self._lock = threading.Lock()
+        self._ts: Optional[str] = None
+        self._last_sent = float("-inf")
+        self._pending: Optional[str] = None
+        self._timer: Optional[threading.Timer] = None
+        self._done = False
+
+    @property
+    def ts(self) -> Optional[str]:
+        return self._ts
+
+    def start(self, text: str) -> None:
+        """Post the placeholder."""
+        with self._lock:
+            try:
+                self._ts = self._post(text)
+            except Exception as e:
+                logger.warning("Could not post placeholder: %s", e)
+            self._last_sent = time.monotonic()
+
+    def update(self, text: str) -> None:
+        """Show a partial answer (now, or once the minimum interval has passed)."""
+        with self._lock:
+            if self._done or self._ts is None:
+                return
+            self._pending = text
+            wait = self._last_sent + self.min_interval - time.monotonic()
+            if wait > 0:
+                if self._timer is None:
+                    self._timer = threading.Timer(wait, self._flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+        self._flush()
+
+    def _flush(self) -> None:
+        with self._lock:
+            self._timer = None
+            text, self._pending = self._pending, None
+            if text is None or self._done:
+                return
+            self._send(text)
+
+    def _send(self, text: str) -> bool:
+        # Called with the lock held so edits reach Slack in order
+        self._last_sent = time.monotonic()
+        try:
+            self._edit(self._ts, text)
+            return True
+        except Exception as e:
+            logger.warning("Could not update reply %s: %s", self._ts, e)
+            return False
+
+    def finish(self, text: str) -> None:
+        """Show the final answer; posted as a new message if the placeholder is missing."""
+        with self._lock:
+            self._done = True
+            self._pending = None
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._ts is not None and self._send(text):
+                return
+            self._post(text)
+
+
+class AsyncProgressiveReply:
+    """
+    Asyncio counterpart of `ProgressiveReply`. `update` is a plain method so
+    it can serve as a progress callback; call it on the event loop.
+    """
+
+    def __init__(self, post: Callable[[str], Awaitable[Optional[str]]],
+                 edit: Callable[[str, str], Awaitable[None]],
+                 min_interval: Optional[float] = None):
+        self._post = post
+        self._edit = edit
+        self.min_interval = min_update_interval() if min_interval is None else min_interval
+        self._lock = asyncio.Lock()
+        self._ts: Optional[str] = None
+        self._last_sent = float("-inf")
+        self._pending: Optional[str] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._done = False
+
+    @property
+    def ts(self) -> Optional[str]:
+        return self._ts
+
+    async def start(self, text: str) -> None:
+        """Post the placeholder."""
+        try:
+            self._ts = await self._post(text)
+        except Exception as e:
+            logger.warning("Could not post placeholder: %s", e)
+        self._last_sent = time.monotonic()
+
+    def update(self, text: str) -> None:
+        """Show a partial answer (now, or once the minimum interval has passed)."""
+        if self._done or self._ts is None:
+            return
+        self._pending = text
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.ensure_future(self._flush())
+
+    async def _flush(self) -> None:
+        wait = self._last_sent + self.min_interval - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        async with self._lock:
+            text, self._pending = self._pending, None
+            if text is None or self._done:
+                return
+            await self._send(text)
+
+    async def _send(self, text: str) -> bool:
+        self._last_sent = time.monotonic()
+        try:
+            await self._edit(self._ts, text)
+            return True
+        except Exception as e:
+            logger.warning("Could not update reply %s: %s", self._ts, e)
+            return False
+
+    async def finish(self, text: str) -> None:
+        """Show the final answer; posted as a new message if the placeholder is missing."""
+        self._done = True
+        self._pending = None
+        async with self._lock:
+            if self._ts is not None and await self._send(text):
+                return
+            await self._post(text)
@@ -0,0 +1,236 @@
+"""
+Guardrails for SQL pasted into Slack.
+
+Before a user's query runs, its `EXPLAIN (FORMAT JSON)` plan is checked:
+- above QUERY_REJECT_COST / QUERY_REJECT_ROWS the query is refused;
+- above QUERY_CONFIRM_COST / QUERY_CONFIRM_ROWS it is parked until the
+  same user replies "confirm" (within QUERY_CONFIRM_TTL_SECONDS).
+A threshold of 0 disables that check.
+
+Queries then run in a READ ONLY transaction with their own
+statement_timeout (QUERY_TIMEOUT_MS, default 15000), and are registered
+under the requesting user while they run so a "cancel" message can stop
+them (`cancel_queries`).
+"""
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from core.services.sql_stream import explain_sql, is_wrappable
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class GuardConfig:
+    """Plan thresholds and limits (see `GuardConfig.from_env`)."""
+    confirm_cost: float = 1_000_000.0
+    reject_cost: float = 50_000_000.0
+    confirm_rows: int = 5_000_000
+    reject_rows: int = 0
+    timeout_ms: int = 15000
+    confirm_ttl: float = 600.0
+
+    @classmethod
+    def from_env(cls) -> "GuardConfig":
+        """
+        Build the guard configuration from environment variables:
+        - QUERY_CONFIRM_COST / QUERY_REJECT_COST  (planner cost units)
+        - QUERY_CONFIRM_ROWS / QUERY_REJECT_ROWS  (planner row estimate)
+        - QUERY_TIMEOUT_MS           (statement_timeout for user queries)
+        - QUERY_CONFIRM_TTL_SECONDS  (how long a parked query can be confirmed)
+        """
+        return cls(
+            confirm_cost=float(os.environ.get("QUERY_CONFIRM_COST", "1000000")),
+            reject_cost=float(os.environ.get("QUERY_REJECT_COST", "50000000")),
+            confirm_rows=int(os.environ.get("QUERY_CONFIRM_ROWS", "5000000")),
+            reject_rows=int(os.environ.get("QUERY_REJECT_ROWS", "0")),
+            timeout_ms=int(os.environ.get("QUERY_TIMEOUT_MS", "15000")),
+            confirm_ttl=float(os.environ.get("QUERY_CONFIRM_TTL_SECONDS", "600")),
+        )
+
+
+# ---------- plan check ----------
+
+@dataclass
+class PlanCheck:
+    """Outcome of checking a query plan against the thresholds."""
+    verdict: str  # "ok", "confirm" or "reject"
+    cost: Optional[float] = None
+    rows: Optional[int] = None
+    reasons: List[str] = field(default_factory=list)
+
+
+def _over(value: Optional[float], limit: float) -> bool:
+    return bool(limit) and value is not None and value > limit
+
+
+def check_plan(explain_output: Any, config: Optional[GuardConfig] = None) -> PlanCheck:
+    """
+    Judge `EXPLAIN (FORMAT JSON)` output against the thresholds.
+    Output without a readable plan is let through.
+    """
+    config = config or GuardConfig.from_env()
+    try:
+        plan = explain_output[0]["Plan"]
+        cost, rows = float(plan["Total Cost"]), int(plan["Plan Rows"])
+    except (TypeError, KeyError, IndexError, ValueError):
+        return PlanCheck(verdict="ok")
+
+    for verdict, max_cost, max_rows in (
+        ("reject", config.reject_cost, config.reject_rows),
+        ("confirm", config.confirm_cost, config.confirm_rows),
+    ):
+        reasons = []
+        if _over(cost, max_cost):
+            reasons.append(f"estimated cost {cost:,.0f} is above {max_cost:,.0f}")
+        if _over(rows, max_rows):
+            reasons.append(f"estimated {rows:,} rows is above {max_rows:,}")
+        if reasons:
+            return PlanCheck(verdict=verdict, cost=cost, rows=rows, reasons=reasons)
+    return PlanCheck(verdict="ok", cost=cost, rows=rows)
+
+
+def explain_query(conn, sql: str, config: Optional[GuardConfig] = None) -> PlanCheck:
+    """
+    EXPLAIN a query on `conn` and check its plan. Statements that cannot be
+    explained (EXPLAIN, SHOW, ...) are let through; they never execute a
+    query because the validator rejects EXPLAIN ANALYZE.
+    """
+    if not is_wrappable(sql):
+        return PlanCheck(verdict="ok")
+    with conn.cursor() as cur:
+        cur.execute(explain_sql(sql))
+        row = cur.fetchone()
+    return check_plan(row[0] if row else None, config)
+
+
+def begin_read_only(conn) -> None:
+    """
+    Make the connection's current transaction READ ONLY. Must run before
+    the first query of the transaction (a pooled checkout only ran SETs).
+    """
+    with conn.cursor() as cur:
+        cur.execute("SET TRANSACTION READ ONLY")
+
+
+def read_only_prelude(timeout_ms: Optional[int]) -> str:
+    """Statements opening a guarded transaction on an autocommit connection."""
+    prelude = "BEGIN READ ONLY"
+    if timeout_ms:
+        prelude += f"; SET LOCAL statement_timeout = {int(timeout_ms)}"
+    return prelude
+
+
+# ---------- confirmations ----------
+
+@dataclass
+class PendingQuery:
+    """A query waiting for its author to confirm it."""
+    user: Optional[str]
+    sql: str
+    check: PlanCheck
+    created_at: float = field(default_factory=time.monotonic)
+
+
+_pending: Dict[Optional[str], PendingQuery] = {}
+_pending_lock = threading.Lock()
+
+
+def park_query(user: Optional[str], sql: str, check: PlanCheck) -> PendingQuery:
+    """Keep a query for `user` to confirm (replacing any earlier one)."""
+    pending = PendingQuery(user=user, sql=sql, check=check)
+    with _pending_lock:
+        _pending[user] = pending
+    return pending
+
+
+def take_pending(user: Optional[str], config: Optional[GuardConfig] = None) -> Optional[PendingQuery]:
+    """Remove and return `user`'s parked query, or None if there is none or it expired."""
+    config = config or GuardConfig.from_env()
+    with _pending_lock:
+        pending = _pending.pop(user, None)
+    if pending is None or time.monotonic() - pending.created_at > config.confirm_ttl:
+        return None
+    return pending
+
+
+def drop_pending(user: Optional[str]) -> bool:
+    """Forget `user`'s parked query. Returns whether there was one."""
+    with _pending_lock:
+        return _pending.pop(user, None) is not None
+
+
+# ---------- running queries ----------
+
+@dataclass
+class RunningQuery:
+    """A query in flight and how to stop it."""
+    user: Optional[str]
+    sql: str
+    cancel: Callable[[], Any]
+    started_at: float = field(default_factory=time.monotonic)
+    cancelled: bool = False
+
+
+_running: Dict[int, RunningQuery] = {}
+_running_lock = threading.Lock()
+
+
+@contextmanager
+def track_query(user: Optional[str], sql: str, cancel: Callable[[], Any]) -> Iterator[RunningQuery]:
+    """
+    Register a query as running for the duration of the block.
+
+    Args:
+        user: Slack user who sent it
+        sql: The statement (for listing)
+        cancel: Stops the query, e.g. `conn.cancel` (thread-safe) or an
+            asyncio task's `cancel` (called on the event loop)
+    """
+    running = RunningQuery(user=user, sql=sql, cancel=cancel)
+    with _running_lock:
+        _running[id(running)] = running
+    try:
+        yield running
+    finally:
+        with _running_lock:
+            _running.pop(id(running), None)
+
+
+def running_queries(user: Optional[str] = None) -> List[RunningQuery]:
+    """Queries in flight, oldest first, optionally only `user`'s."""
+    with _running_lock:
+        queries = list(_running.values())
+    return sorted(
+        (q for q in queries if user is None or q.user == user),
+        key=lambda q: q.started_at,
+    )
+
+
+def cancel_queries(user: Optional[str]) -> int:
+    """Cancel every query `user` has running. Returns how many were cancelled."""
+    cancelled = 0
+    for running in running_queries(user):
+        if running.cancelled:
+            continue
+        running.cancelled = True
+        try:
+            running.cancel()
+            cancelled += 1
+        except Exception as e:
+            logger.warning("Could not cancel query for %s: %s", user, e)
+    return cancelled
+
+
+def reset_guard_state() -> None:
+    """Forget parked and running queries (used in tests)."""
+    with _pending_lock:
+        _pending.clear()
+    with _running_lock:
+        _running.clear()
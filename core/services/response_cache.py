@@ -0,0 +1,281 @@
+"""
+Response cache for natural-language questions.
+
+Answers are keyed by the normalized question, the routed dataset and the
+dataset's data watermark, so a repeat question is answered without another
+table load or LLM round-trip, and new data makes old answers unreachable.
+
+Near-duplicate phrasings ("what's the churn rate by plan?" / "churn rate
+per plan") are matched with a character-trigram similarity index. Two
+questions are only considered the same when they also agree on numbers,
+time window, negations and the filter words they mention (semantic-layer
+example values and dimension names, lifecycle and region words), so
+"top 5" never answers "top 10", "last month" never answers "last year"
+and "paypal payments" never answers "card payments".
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, FrozenSet, Hashable, List, Optional, Tuple
+
+from core.services.semantic_layer import get_models
+from core.services.table_loader import detect_time_window
+
+# Words that don't change what is being asked
+_FILLER = {
+    "a", "an", "the", "what", "whats", "is", "are", "was", "were", "show", "me",
+    "please", "can", "could", "you", "tell", "give", "get", "list", "i", "want",
+    "to", "know", "do", "does", "did", "our", "we", "us", "there", "of", "for",
+    "hey", "bot", "hi",
+}
+_SYNONYMS = {"per": "by", "vs": "versus", "rev": "revenue", "subs": "subscription", "cancelled": "canceled"}
+_NEGATIONS = {"not", "no", "non", "without", "excluding", "except", "inactive", "never"}
+# Filter words that aren't in the semantic layer's example values
+_LIFECYCLE = {"active", "churned", "canceled", "expired"}
+_REGIONS = {"eu", "europe", "european"}
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def normalize_question(question: str) -> str:
+    """
+    Canonical form of a question: lowercased, punctuation and filler words
+    removed, simple plurals and synonyms folded.
+    """
+    words = []
+    for word in _WORD.findall(question.lower().replace("'", "")):
+        word = _SYNONYMS.get(word, word)
+        if word in _FILLER:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.append(_SYNONYMS.get(word, word))
+    return " ".join(words)
+
+
+def _trigrams(text: str) -> FrozenSet[str]:
+    padded = f"  {text} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def _plural(word: str) -> str:
+    return word[:-1] + "ies" if word.endswith("y") else word + "s"
+
+
+_filter_vocabulary: Tuple[Optional[int], Dict[str, str]] = (None, {})
+
+
+def _filter_words() -> Dict[str, str]:
+    """
+    Normalized filter word (singular or plural) -> the word it stands for.
+    Rebuilt when the semantic layer is reloaded.
+    """
+    global _filter_vocabulary
+    models = get_models()
+    models_id, vocabulary = _filter_vocabulary
+    if id(models) != models_id:
+        terms = set(_LIFECYCLE | _REGIONS)
+        for model in models.values():
+            for f in model.fields:
+                if f.is_categorical:
+                    terms.update(f.name.split("_"))
+                    terms.update(f.example_values)
+        vocabulary = {}
+        for term in terms:
+            for form in (term, _plural(term)):
+                normalized = normalize_question(form)
+                if normalized:
+                    vocabulary.setdefault(normalized, term)
+        _filter_vocabulary = (id(models), vocabulary)
+    return vocabulary
+
+
+def _guard(question: str, normalized: str) -> Tuple:
+    """Parts of a question that must match exactly for a fuzzy hit."""
+    words = set(normalized.split())
+    vocabulary = _filter_words()
+    return (
+        detect_time_window(question)[1],
+        tuple(w for w in normalized.split() if w.isdigit()),
+        frozenset(words & _NEGATIONS),
+        frozenset(vocabulary[w] for w in words if w in vocabulary),
+    )
+
+
+@dataclass
+class _Entry:
+    question: str
+    normalized: str
+    trigrams: FrozenSet[str]
+    guard: Tuple
+    answer: str
+    stored_at: float
+
+
+@dataclass
+class ResponseCacheStats:
+    """Point-in-time snapshot of response cache metrics."""
+    exact_hits: int
+    similar_hits: int
+    misses: int
+    expired: int
+    evictions: int
+    entries: int
+    max_entries: int
+
+
+class ResponseCache:
+    """
+    Thread-safe TTL + LRU cache of question answers.
+
+    Entries live in buckets keyed by (kind, dataset, watermark); fuzzy
+    matching only ever compares questions within the same bucket.
+    Set `similarity` to 1.0 to disable fuzzy matching.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: float,
+        similarity: float = 0.85,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity = similarity
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._buckets: Dict[Hashable, List[Hashable]] = {}
+
+        self._exact_hits = 0
+        self._similar_hits = 0
+        self._misses = 0
+        self._expired = 0
+        self._evictions = 0
+
+    def _drop(self, key: Hashable) -> None:
+        self._entries.pop(key)
+        bucket = key[:-1]
+        keys = self._buckets.get(bucket, [])
+        keys.remove(key)
+        if not keys:
+            self._buckets.pop(bucket, None)
+
+    def _fresh(self, key: Hashable) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is not None and self._clock() - entry.stored_at > self.ttl_seconds:
+            self._drop(key)
+            self._expired += 1
+            return None
+        return entry
+
+    def get(self, kind: str, dataset: str, question: str, watermark: Any = None) -> Optional[str]:
+        """
+        Cached answer for `question`, or None on a miss.
+
+        Args:
+            kind: Which handler produced the answer (e.g. "data_question")
+            dataset: Routed dataset name
+            question: The user's question, as typed
+            watermark: Current data watermark of the dataset
+        """
+        normalized = normalize_question(question)
+        bucket = (kind, dataset, watermark)
+        with self._lock:
+            entry = self._fresh(bucket + (normalized,))
+            if entry is not None:
+                self._entries.move_to_end(bucket + (normalized,))
+                self._exact_hits += 1
+                return entry.answer
+
+            if self.similarity < 1.0:
+                trigrams = _trigrams(normalized)
+                guard = _guard(question, normalized)
+                best_key, best_score = None, self.similarity
+                for key in list(self._buckets.get(bucket, [])):
+                    candidate = self._fresh(key)
+                    if candidate is None or candidate.guard != guard:
+                        continue
+                    score = len(trigrams & candidate.trigrams) / len(trigrams | candidate.trigrams)
+                    if score >= best_score:
+                        best_key, best_score = key, score
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    self._similar_hits += 1
+                    return self._entries[best_key].answer
+
+            self._misses += 1
+            return None
+
+    def put(self, kind: str, dataset: str, question: str, answer: str, watermark: Any = None) -> None:
+        """Store the answer to `question`."""
+        normalized = normalize_question(question)
+        bucket = (kind, dataset, watermark)
+        key = bucket + (normalized,)
+        entry = _Entry(
+            question=question,
+            normalized=normalized,
+            trigrams=_trigrams(normalized),
+            guard=_guard(question, normalized),
+            answer=answer,
+            stored_at=self._clock(),
+        )
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = entry
+            self._buckets.setdefault(bucket, []).append(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self._evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def stats(self) -> ResponseCacheStats:
+        with self._lock:
+            return ResponseCacheStats(
+                exact_hits=self._exact_hits,
+                similar_hits=self._similar_hits,
+                misses=self._misses,
+                expired=self._expired,
+                evictions=self._evictions,
+                entries=len(self._entries),
+                max_entries=self.max_entries,
+            )
+
+
+# ---------- process-wide cache ----------
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """
+    Return the process-wide response cache, configured from:
+    - RESPONSE_CACHE_MAX_ENTRIES   (default 500)
+    - RESPONSE_CACHE_TTL_SECONDS   (default 900)
+    - RESPONSE_CACHE_SIMILARITY    (trigram Jaccard for near-duplicates, default 0.85; 1 disables)
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache(
+                    max_entries=int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "500")),
+                    ttl_seconds=float(os.environ.get("RESPONSE_CACHE_TTL_SECONDS", "900")),
+                    similarity=float(os.environ.get("RESPONSE_CACHE_SIMILARITY", "0.85")),
+                )
+    return _cache
+
+
+def get_response_cache_metrics() -> Dict[str, int]:
+    """Response cache metrics as a plain dict (for logging or a /metrics command)."""
+    return dict(vars(get_response_cache().stats()))
@@ -0,0 +1,396 @@
+"""
+Daily rollup tables for the semantic-layer measures.
+
+For each model a `rollup_<model>_daily` table holds additive aggregates per
+day and per rollup dimension (declared under `rollup: dimensions:` in the
+model's YAML). Which aggregates exist is driven by the model's `measures`:
+- `count(*)`          -> row_count
+- `SUM(col)`/`AVG(col)` -> sum_<col> (AVG is sum_<col> / row_count)
+- a measure that uses another date field (e.g. `end_date` in
+  `subscription_cancels`) -> <field>_count, counted on that field's day
+
+Rows are bucketed by the model's time column (`time_dimensions` in
+semantic_layer.yml, else its first date field). Refreshes are incremental
+(see `core.services.incremental`): nothing is rebuilt while the source's
+high-water marks stand still, otherwise the days from the previous marks
+minus INCREMENTAL_LATENESS_DAYS onward are deleted and rebuilt from the raw
+table, so late-arriving rows are picked up. A process that starts up
+resumes from the marks stored by the last refresh (a full rebuild when
+there are none).
+Non-additive measures (COUNT(DISTINCT ...), ratios of those) are not rolled
+up and keep reading raw tables.
+
+Every refresh records the source's high-water marks and the time in
+`rollup_refreshes`. Readers call `rollup_table(conn, model)`, which returns
+None when the rollup has not been built yet or is stale (the source's marks
+moved since its last refresh, and that refresh is older than
+ROLLUP_MAX_STALENESS_SECONDS, default 0), so callers fall back to the raw
+table.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+from core.services.incremental import (
+    RefreshPlan,
+    full_refresh_seconds,
+    lateness_days,
+    plan_refresh,
+    source_watermarks,
+)
+from core.services.semantic_layer import SemanticModel, get_models
+
+logger = logging.getLogger(__name__)
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_COUNT_ALL = re.compile(r"\bcount\s*\(\s*\*\s*\)", re.IGNORECASE)
+_SUM_OR_AVG = re.compile(r"\b(?:sum|avg)\s*\(\s*([A-Za-z_][A-Za-z0-9_]*)\s*\)", re.IGNORECASE)
+
+REFRESH_STATE_TABLE = "rollup_refreshes"
+REFRESH_STATE_SQL = (
+    f"CREATE TABLE IF NOT EXISTS {REFRESH_STATE_TABLE} ("
+    "model text PRIMARY KEY, marks text NOT NULL, refreshed_at timestamptz NOT NULL DEFAULT now())"
+)
+
+
+@dataclass
+class RollupSpec:
+    """Shape of one model's daily rollup table."""
+    model: str
+    source_table: str
+    time_column: str
+    dimensions: List[str] = field(default_factory=list)
+    sum_columns: List[str] = field(default_factory=list)
+    event_columns: List[str] = field(default_factory=list)
+
+    @property
+    def table(self) -> str:
+        return f"rollup_{self.model}_daily"
+
+    @property
+    def measure_columns(self) -> List[str]:
+        return (
+            ["row_count"]
+            + [f"sum_{c}" for c in self.sum_columns]
+            + [f"{c}_count" for c in self.event_columns]
+        )
+
+    def _check_identifiers(self) -> None:
+        names = [self.model, self.source_table, self.time_column, *self.dimensions,
+                 *self.sum_columns, *self.event_columns]
+        for name in names:
+            if not _IDENTIFIER.match(name):
+                raise ValueError(f"Invalid identifier in rollup spec: {name!r}")
+
+    def create_sql(self) -> str:
+        self._check_identifiers()
+        columns = ["day date NOT NULL"]
+        columns += [f"{d} text" for d in self.dimensions]
+        columns += ["row_count bigint NOT NULL DEFAULT 0"]
+        columns += [f"sum_{c} numeric NOT NULL DEFAULT 0" for c in self.sum_columns]
+        columns += [f"{c}_count bigint NOT NULL DEFAULT 0" for c in self.event_columns]
+        return (
+            f"CREATE TABLE IF NOT EXISTS {self.table} ({', '.join(columns)});\n"
+            f"CREATE INDEX IF NOT EXISTS {self.table}_day_idx ON {self.table} (day);"
+        )
+
+    def source_sql(self, since: Optional[date]) -> tuple:
+        """
+        SELECT producing rollup rows from the raw table for days >= since
+        (all days when since is None). Returns (sql, params).
+        """
+        self._check_identifiers()
+        dims = [f"{d}::text AS {d}" for d in self.dimensions]
+        zero_sums = [f"0 AS sum_{c}" for c in self.sum_columns]
+        zero_events = [f"0 AS {c}_count" for c in self.event_columns]
+        params: List = []
+
+        def where(column: str) -> str:
+            if since is None:
+                return f" WHERE {column} IS NOT NULL"
+            params.append(since)
+            return f" WHERE {column} >= %s"
+
+        # One event row per raw row on its time column ...
+        branches = [
+            "SELECT "
+            + ", ".join(
+                [f"{self.time_column}::date AS day", *dims, "1 AS row_count"]
+                + [f"{c} AS sum_{c}" for c in self.sum_columns]
+                + zero_events
+            )
+            + f" FROM {self.source_table}" + where(self.time_column)
+        ]
+        # ... plus one per extra date field, counted on that field's day
+        for event in self.event_columns:
+            branches.append(
+                "SELECT "
+                + ", ".join(
+                    [f"{event}::date AS day", *dims, "0 AS row_count", *zero_sums]
+                    + [f"{'1' if c == event else '0'} AS {c}_count" for c in self.event_columns]
+                )
+                + f" FROM {self.source_table}" + where(event)
+            )
+
+        group = ["day", *self.dimensions]
+        aggregates = [f"COALESCE(SUM({c}), 0) AS {c}" for c in self.measure_columns]
+        sql = (
+            f"SELECT {', '.join(group + aggregates)} FROM (\n  "
+            + "\n  UNION ALL\n  ".join(branches)
+            + f"\n) events GROUP BY {', '.join(group)}"
+        )
+        return sql, params
+
+
+def build_rollup_spec(model: SemanticModel) -> Optional[RollupSpec]:
+    """Rollup spec for a model, or None if it has no date field."""
+    temporal = [f.name for f in model.fields if f.is_temporal]
+    time_column = model.time_column if model.time_column in temporal else (temporal[0] if temporal else None)
+    if time_column is None:
+        return None
+
+    numeric = {f.name for f in model.fields if f.is_numeric and f.role != "relationship"}
+    formulas = " ".join(m.formula for m in model.measures)
+
+    sum_columns = []
+    for column in _SUM_OR_AVG.findall(formulas):
+        if column in numeric and column not in sum_columns:
+            sum_columns.append(column)
+
+    event_columns = [
+        name for name in temporal
+        if name != time_column and re.search(rf"\b{name}\b", formulas)
+    ]
+    dimensions = [d for d in model.rollup_dimensions if model.field(d)]
+
+    return RollupSpec(
+        model=model.name,
+        source_table=model.table,
+        time_column=time_column,
+        dimensions=dimensions,
+        sum_columns=sum_columns,
+        event_columns=event_columns,
+    )
+
+
+def get_rollup_specs() -> Dict[str, RollupSpec]:
+    """Rollup specs for every semantic model that can be rolled up."""
+    specs = {}
+    for name, model in get_models().items():
+        spec = build_rollup_spec(model)
+        if spec is not None:
+            specs[name] = spec
+    return specs
+
+
+# ---------- refresh ----------
+
+# Source high-water marks and full-rebuild time of the last refresh, per model
+_marks: Dict[str, Dict] = {}
+_full_at: Dict[str, float] = {}
+
+
+def _marks_key(marks: Dict[str, Any]) -> str:
+    """Stored form of a set of high-water marks (compared as text)."""
+    return json.dumps({column: None if v is None else str(v) for column, v in marks.items()}, sort_keys=True)
+
+
+def _stored_marks(stored: str, current: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Marks recorded in `rollup_refreshes`, as dates comparable with `current`.
+    None when they can't be used (other columns, unreadable values).
+    """
+    if stored == _marks_key(current):
+        return dict(current)
+    try:
+        previous = json.loads(stored)
+        if set(previous) != set(current):
+            return None
+        return {column: None if v is None else date.fromisoformat(v[:10]) for column, v in previous.items()}
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+def refresh_rollup(conn, spec: RollupSpec, full: bool = False) -> RefreshPlan:
+    """
+    Create the rollup table if needed and rebuild the days that changed.
+
+    Args:
+        conn: psycopg2 connection with write access (committed here)
+        spec: Rollup to refresh
+        full: Rebuild every day instead of only the changed ones
+
+    Returns:
+        RefreshPlan describing what was rebuilt
+    """
+    marks = source_watermarks(conn, spec)
+    now = time.monotonic()
+    full = full or now - _full_at.get(spec.model, now) >= full_refresh_seconds()
+
+    with conn.cursor() as cur:
+        cur.execute(spec.create_sql())
+        cur.execute(REFRESH_STATE_SQL)
+
+        previous = None if full else _marks.get(spec.model)
+        if previous is None and not full:
+            # First refresh in this process: resume from the marks the last
+            # refresh stored. The rollup's newest day is no guide, since
+            # event columns (end_date) can lie in the future.
+            cur.execute(f"SELECT marks FROM {REFRESH_STATE_TABLE} WHERE model = %s", (spec.model,))
+            stored = cur.fetchone()
+            if stored:
+                previous = _stored_marks(stored[0], marks)
+
+        plan = plan_refresh(previous, marks, lateness_days())
+        if plan.changed:
+            if plan.since is None:
+                cur.execute(f"DELETE FROM {spec.table}")
+            else:
+                cur.execute(f"DELETE FROM {spec.table} WHERE day >= %s", (plan.since,))
+
+            sql, params = spec.source_sql(plan.since)
+            columns = ", ".join(["day", *spec.dimensions, *spec.measure_columns])
+            cur.execute(f"INSERT INTO {spec.table} ({columns}) {sql}", params)
+
+        # What the rollup now reflects, for readers and later processes
+        cur.execute(
+            f"INSERT INTO {REFRESH_STATE_TABLE} (model, marks, refreshed_at) VALUES (%s, %s, now()) "
+            "ON CONFLICT (model) DO UPDATE SET marks = EXCLUDED.marks, refreshed_at = EXCLUDED.refreshed_at",
+            (spec.model, _marks_key(marks)),
+        )
+    conn.commit()
+
+    _marks[spec.model] = marks
+    if plan.since is None and plan.changed or spec.model not in _full_at:
+        _full_at[spec.model] = now
+    _available[spec.model] = (now, True)
+    return plan
+
+
+def refresh_rollups(full: bool = False) -> Dict[str, RefreshPlan]:
+    """Refresh every rollup on its own pooled connection (no statement timeout)."""
+    from core.services.db_pool import get_connection
+
+    refreshed = {}
+    for name, spec in get_rollup_specs().items():
+        try:
+            with get_connection(statement_timeout_ms=0) as conn:
+                refreshed[name] = refresh_rollup(conn, spec, full=full)
+        except Exception as e:
+            logger.warning("Rollup refresh failed for %s: %s", name, e)
+    return refreshed
+
+
+_refresher: Optional[threading.Thread] = None
+
+
+def start_rollup_refresher(interval_seconds: Optional[float] = None) -> Optional[threading.Thread]:
+    """
+    Refresh all rollups every ROLLUP_REFRESH_SECONDS in a daemon thread.
+    Does nothing when the interval is 0 or unset.
+    """
+    global _refresher
+    interval = interval_seconds
+    if interval is None:
+        interval = float(os.environ.get("ROLLUP_REFRESH_SECONDS", "0"))
+    if interval <= 0 or _refresher is not None:
+        return _refresher
+
+    def loop():
+        while True:
+            refresh_rollups()
+            time.sleep(interval)
+
+    _refresher = threading.Thread(target=loop, name="rollup-refresher", daemon=True)
+    _refresher.start()
+    return _refresher
+
+
+# ---------- readers ----------
+
+_available: Dict[str, tuple] = {}
+
+
+def _check_seconds() -> float:
+    """ROLLUP_CHECK_SECONDS (default 300): how long an availability check is trusted."""
+    return float(os.environ.get("ROLLUP_CHECK_SECONDS", "300"))
+
+
+def _max_staleness() -> float:
+    """ROLLUP_MAX_STALENESS_SECONDS (default 0): age up to which a lagging rollup is still used."""
+    return float(os.environ.get("ROLLUP_MAX_STALENESS_SECONDS", "0"))
+
+
+def _is_fresh(conn, spec: RollupSpec) -> bool:
+    """Whether the rollup was built and still matches its source."""
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT to_regclass(%s) IS NOT NULL AND to_regclass(%s) IS NOT NULL",
+            (spec.table, REFRESH_STATE_TABLE),
+        )
+        if not (cur.fetchone() or [False])[0]:
+            return False
+        cur.execute(
+            f"SELECT marks, EXTRACT(EPOCH FROM now() - refreshed_at) FROM {REFRESH_STATE_TABLE} WHERE model = %s",
+            (spec.model,),
+        )
+        state = cur.fetchone()
+    if not state:
+        return False
+    marks, age = state
+    if age is not None and float(age) <= _max_staleness():
+        return True
+    return marks == _marks_key(source_watermarks(conn, spec))
+
+
+def rollup_table(conn, model: str) -> Optional[str]:
+    """
+    Name of the model's rollup table if it was built and is not stale,
+    else None. The answer is cached for ROLLUP_CHECK_SECONDS (default 300).
+    """
+    spec = get_rollup_specs().get(model)
+    if spec is None:
+        return None
+
+    checked = _available.get(model)
+    if checked and time.monotonic() - checked[0] <= _check_seconds():
+        return spec.table if checked[1] else None
+
+    try:
+        fresh = _is_fresh(conn, spec)
+    except Exception:
+        conn.rollback()
+        fresh = False
+
+    _available[model] = (time.monotonic(), fresh)
+    return spec.table if fresh else None
+
+
+def cached_rollup_table(model: str) -> Optional[str]:
+    """
+    Rollup table name from a recent availability check, without touching
+    the database (for code that only renders SQL). None once the check is
+    older than ROLLUP_CHECK_SECONDS.
+    """
+    checked = _available.get(model)
+    if checked and checked[1] and time.monotonic() - checked[0] <= _check_seconds():
+        return f"rollup_{model}_daily"
+    return None
+
+
+if __name__ == "__main__":
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    for name, plan in refresh_rollups(full="--full" in sys.argv).items():
+        if not plan.changed:
+            print(f"{name}: up to date")
+        else:
+            print(f"{name}: rebuilt {'all days' if plan.since is None else f'from {plan.since}'}")
@@ -0,0 +1,231 @@
+"""
+Semantic layer access.
+
+Reads `semantic_layer/*.yml` into small typed models. Several of the YAML
+files contain hand-written SQL or formulas that are not valid YAML, so each
+top-level section (and, failing that, each list item) is parsed on its own
+and unparseable pieces are skipped instead of losing the whole file.
+Results are cached and re-read automatically when a file changes.
+"""
+
+import re
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import yaml
+
+SEMANTIC_LAYER_DIR = Path(__file__).parent.parent.parent / "semantic_layer"
+
+_TOP_LEVEL_KEY = re.compile(r"^(?=[A-Za-z_][\w]*:)", re.MULTILINE)
+_LIST_ITEM = re.compile(r"^(?=\s*-\s+name:)", re.MULTILINE)
+_EXAMPLES = re.compile(r"\(e\.g\.,?\s*([^)]*)\)", re.IGNORECASE)
+
+
+@dataclass
+class SemanticField:
+    """A column of a semantic model."""
+    name: str
+    type: str = ""
+    description: str = ""
+    role: str = ""
+
+    @property
+    def example_values(self) -> List[str]:
+        """Values listed as "(e.g., a, b, c)" in the description."""
+        match = _EXAMPLES.search(self.description)
+        if not match:
+            return []
+        return [v.strip().lower() for v in match.group(1).split(",") if v.strip()]
+
+    @property
+    def is_numeric(self) -> bool:
+        return self.type.startswith(("int", "numeric", "float", "double", "decimal"))
+
+    @property
+    def is_temporal(self) -> bool:
+        return self.type.startswith(("timestamp", "date"))
+
+    @property
+    def is_categorical(self) -> bool:
+        return self.type.startswith(("varchar", "text", "char"))
+
+
+@dataclass
+class SemanticMeasure:
+    """A named measure with its (free-form) formula and the phrases users ask it with."""
+    name: str
+    formula: str = ""
+    description: str = ""
+    synonyms: List[str] = field(default_factory=list)
+
+
+@dataclass
+class SemanticModel:
+    """One table of the semantic layer."""
+    name: str
+    table: str
+    description: str = ""
+    fields: List[SemanticField] = field(default_factory=list)
+    measures: List[SemanticMeasure] = field(default_factory=list)
+    time_column: Optional[str] = None
+    rollup_dimensions: List[str] = field(default_factory=list)
+
+    def field(self, name: str) -> Optional[SemanticField]:
+        for f in self.fields:
+            if f.name == name:
+                return f
+        return None
+
+    @property
+    def field_names(self) -> List[str]:
+        return [f.name for f in self.fields]
+
+
+def _safe_load_sections(text: str) -> Dict[str, Any]:
+    """
+    Parse a YAML document section by section, keeping whatever parses.
+    List sections that fail as a whole are retried item by item.
+    """
+    try:
+        content = yaml.safe_load(text)
+        if isinstance(content, dict):
+            return content
+    except yaml.YAMLError:
+        pass
+
+    result: Dict[str, Any] = {}
+    for chunk in _TOP_LEVEL_KEY.split(text):
+        if not chunk.strip():
+            continue
+        try:
+            parsed = yaml.safe_load(chunk)
+            if isinstance(parsed, dict):
+                result.update(parsed)
+            continue
+        except yaml.YAMLError:
+            pass
+
+        key, _, body = chunk.partition(":")
+        items = []
+        for item in _LIST_ITEM.split(body):
+            if not item.strip().startswith("-"):
+                continue
+            try:
+                parsed = yaml.safe_load(item)
+            except yaml.YAMLError:
+                continue
+            if isinstance(parsed, list):
+                items.extend(p for p in parsed if isinstance(p, dict))
+        if items:
+            result[key.strip()] = items
+    return result
+
+
+def _as_text(value: Any) -> str:
+    return "" if value is None else str(value).strip()
+
+
+def _build_model(name: str, content: Dict[str, Any], time_column: Optional[str]) -> SemanticModel:
+    model_info = content.get("model") or {}
+    fields = [
+        SemanticField(
+            name=_as_text(f.get("name")),
+            type=_as_text(f.get("type")).lower(),
+            description=_as_text(f.get("description")),
+            role=_as_text(f.get("role")).lower(),
+        )
+        for f in content.get("fields") or []
+        if isinstance(f, dict) and f.get("name")
+    ]
+    measures = [
+        SemanticMeasure(
+            name=_as_text(m.get("name")),
+            formula=_as_text(m.get("formula")),
+            description=_as_text(m.get("description")),
+            synonyms=[_as_text(s) for s in m.get("synonyms") or [] if s],
+        )
+        for m in content.get("measures") or []
+        if isinstance(m, dict) and m.get("name")
+    ]
+    rollup = content.get("rollup") or {}
+    return SemanticModel(
+        name=_as_text(model_info.get("name")) or name,
+        table=_as_text(model_info.get("table")) or name,
+        description=_as_text(model_info.get("description")),
+        fields=fields,
+        measures=measures,
+        time_column=time_column,
+        rollup_dimensions=[_as_text(d) for d in rollup.get("dimensions") or [] if d],
+    )
+
+
+def _read_models(directory: Path) -> Dict[str, SemanticModel]:
+    config_file = directory / "semantic_layer.yml"
+    model_files: List[Tuple[str, str]] = []
+    time_columns: Dict[str, str] = {}
+
+    if config_file.exists():
+        config = (_safe_load_sections(config_file.read_text()).get("semantic_layer") or {})
+        for model in config.get("models") or []:
+            if isinstance(model, dict) and model.get("name"):
+                model_files.append((model["name"], model.get("file") or f"{model['name']}.yml"))
+        for dim in config.get("time_dimensions") or []:
+            if isinstance(dim, dict) and dim.get("model") and dim.get("name"):
+                time_columns.setdefault(dim["model"], dim["name"])
+
+    if not model_files:
+        model_files = [
+            (p.stem, p.name) for p in sorted(directory.glob("*.yml"))
+            if p.name not in ("semantic_layer.yml", "routing_rules.yml")
+        ]
+
+    models: Dict[str, SemanticModel] = {}
+    for name, filename in model_files:
+        path = directory / filename
+        if not path.exists():
+            continue
+        content = _safe_load_sections(path.read_text())
+        models[name] = _build_model(name, content, time_columns.get(name))
+    return models
+
+
+class _ModelCache:
+    """Caches parsed models and re-reads them when any YAML file changes."""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._signature: Optional[Tuple] = None
+        self._models: Dict[str, SemanticModel] = {}
+
+    def _current_signature(self) -> Tuple:
+        if not self.directory.exists():
+            return ()
+        return tuple(
+            (p.name, p.stat().st_mtime_ns) for p in sorted(self.directory.glob("*.yml"))
+        )
+
+    def get(self) -> Dict[str, SemanticModel]:
+        signature = self._current_signature()
+        if signature == self._signature:
+            return self._models
+        with self._lock:
+            if signature != self._signature:
+                self._models = _read_models(self.directory) if signature else {}
+                self._signature = signature
+            return self._models
+
+
+_cache = _ModelCache(SEMANTIC_LAYER_DIR)
+
+
+def get_models() -> Dict[str, SemanticModel]:
+    """All semantic models keyed by model name."""
+    return _cache.get()
+
+
+def get_model(name: str) -> Optional[SemanticModel]:
+    """A single semantic model, or None if it is not defined."""
+    return get_models().get(name)
@@ -0,0 +1,198 @@
+"""
+Coalescing of identical requests that are in flight at the same time.
+
+When a question is pasted into a busy channel, several people tend to ask it
+within seconds. Requests are keyed by what they compute (the normalized
+question and dataset, or the asking user and the normalized SQL, since
+pasted SQL can be cancelled by whoever ran it); the first one runs and the
+others wait for it and share its answer, including its partial answers for
+progressive replies. Once the computation finishes the key is released,
+so later requests run again (or hit the response cache).
+"""
+
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from core.services.progressive_reply import ProgressCallback, report
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Listeners:
+    """Progress callbacks of everyone waiting on one computation."""
+    callbacks: List[ProgressCallback] = field(default_factory=list)
+    last: Optional[str] = None
+
+    def add(self, progress: Optional[ProgressCallback]) -> None:
+        if progress is None:
+            return
+        self.callbacks.append(progress)
+        if self.last is not None:
+            report(progress, self.last)
+
+    def __call__(self, text: str) -> None:
+        self.last = text
+        for progress in list(self.callbacks):
+            report(progress, text)
+
+
+@dataclass
+class _Call:
+    listeners: _Listeners = field(default_factory=_Listeners)
+    done: threading.Event = field(default_factory=threading.Event)
+    result: Any = None
+    error: Optional[BaseException] = None
+
+
+@dataclass
+class _Counters:
+    leaders: int = 0
+    shared: int = 0
+
+
+_counters = _Counters()
+_counters_lock = threading.Lock()
+
+
+def _count(shared: bool) -> None:
+    with _counters_lock:
+        if shared:
+            _counters.shared += 1
+        else:
+            _counters.leaders += 1
+
+
+class SingleFlight:
+    """Thread-safe: concurrent `do` calls with the same key run `fn` once."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[ProgressCallback], Any],
+           progress: Optional[ProgressCallback] = None) -> Any:
+        """
+        Run `fn(progress)` for `key`, or wait for the run already in flight.
+
+        Args:
+            key: What the computation depends on
+            fn: The computation; it receives a progress callback that reaches
+                every caller waiting on it
+            progress: This caller's progress callback
+
+        Returns:
+            The computation's result (its exception is raised in every caller)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            call.listeners.add(progress)
+        _count(shared=not leader)
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(call.listeners)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """
+    Asyncio counterpart of `SingleFlight`. The computation runs as its own
+    task, so a caller giving up (cancelled handler) does not cancel it for
+    the others.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, "tuple[asyncio.Task, _Listeners]"] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[ProgressCallback], Awaitable[Any]],
+                 progress: Optional[ProgressCallback] = None) -> Any:
+        """Await `fn(progress)` for `key`, or the run already in flight."""
+        entry = self._calls.get(key)
+        _count(shared=entry is not None)
+        if entry is None:
+            listeners = _Listeners()
+            task = asyncio.ensure_future(fn(listeners))
+            entry = self._calls[key] = (task, listeners)
+            task.add_done_callback(lambda _, k=key, t=task: self._release(k, t))
+        task, listeners = entry
+        listeners.add(progress)
+        return await asyncio.shield(task)
+
+    def _release(self, key: Hashable, task: "asyncio.Task") -> None:
+        entry = self._calls.get(key)
+        if entry is not None and entry[0] is task:
+            del self._calls[key]
+        if not task.cancelled() and task.exception() is not None:
+            # Retrieved here so an exception no caller awaited is not logged as lost
+            logger.debug("Shared computation for %r failed: %s", key, task.exception())
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+
+# ---------- process-wide instances ----------
+
+_single_flight: Optional[SingleFlight] = None
+_async_single_flight: Optional[AsyncSingleFlight] = None
+_instance_lock = threading.Lock()
+
+
+def get_single_flight() -> SingleFlight:
+    """Return the process-wide coalescer for thread-based handlers."""
+    global _single_flight
+    if _single_flight is None:
+        with _instance_lock:
+            if _single_flight is None:
+                _single_flight = SingleFlight()
+    return _single_flight
+
+
+def get_async_single_flight() -> AsyncSingleFlight:
+    """Return the process-wide coalescer for the asyncio app."""
+    global _async_single_flight
+    if _async_single_flight is None:
+        with _instance_lock:
+            if _async_single_flight is None:
+                _async_single_flight = AsyncSingleFlight()
+    return _async_single_flight
+
+
+def get_single_flight_metrics() -> Dict[str, int]:
+    """How many requests ran and how many shared an in-flight result."""
+    with _counters_lock:
+        metrics = {"leaders": _counters.leaders, "shared": _counters.shared}
+    metrics["in_flight"] = get_single_flight().in_flight() + get_async_single_flight().in_flight()
+    return metrics
+
+
+def reset_single_flight() -> None:
+    """Forget in-flight calls and counters (used in tests)."""
+    global _single_flight, _async_single_flight
+    with _instance_lock:
+        _single_flight = None
+        _async_single_flight = None
+    with _counters_lock:
+        _counters.leaders = _counters.shared = 0
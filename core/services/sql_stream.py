@@ -0,0 +1,188 @@
+"""
+Bounded execution of ad-hoc SQL.
+
+Results of user-written queries are only ever shown up to SQL_MAX_ROWS rows
+(default 100), so they are never fetched in full:
+- SELECT/WITH/VALUES/TABLE queries are wrapped as
+  `SELECT * FROM (<query>) LIMIT max_rows + 1` and read through a named
+  (server-side) cursor in `fetchmany` batches of SQL_FETCH_BATCH rows. The
+  extra row tells whether the result was cut off.
+- Anything else (EXPLAIN, SHOW) cannot be wrapped or declared as a cursor;
+  it is read with `fetchmany` up to the same cap.
+
+When a result is cut off, the total is reported according to
+SQL_RESULT_COUNT: `estimate` (default, the planner's row estimate from
+EXPLAIN), `exact` (a COUNT(*) over the query) or `none`.
+"""
+
+import os
+import re
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+_WRAPPABLE = re.compile(r"^\s*(?:\(\s*)*(select|with|values|table)\b", re.IGNORECASE)
+_TRAILING_SEMICOLONS = re.compile(r"[\s;]+$")
+
+COUNT_STRATEGIES = ("estimate", "exact", "none")
+
+
+@dataclass
+class QueryResult:
+    """Rows of a bounded query and what is known about the full result."""
+    rows: List[Dict[str, Any]] = field(default_factory=list)
+    truncated: bool = False
+    total_rows: Optional[int] = None  # None when unknown (only "more than len(rows)")
+    total_is_estimate: bool = False
+
+
+def max_rows_setting() -> int:
+    """SQL_MAX_ROWS (default 100)."""
+    return int(os.environ.get("SQL_MAX_ROWS", "100"))
+
+
+def count_strategy() -> str:
+    """SQL_RESULT_COUNT (estimate, exact or none; default estimate)."""
+    strategy = os.environ.get("SQL_RESULT_COUNT", "estimate").strip().lower()
+    return strategy if strategy in COUNT_STRATEGIES else "estimate"
+
+
+def statement_body(sql: str) -> str:
+    """The statement without surrounding whitespace and trailing semicolons."""
+    return _TRAILING_SEMICOLONS.sub("", sql.strip())
+
+
+def is_wrappable(sql: str) -> bool:
+    """Whether the statement can be used as a subquery (and a cursor)."""
+    return bool(_WRAPPABLE.match(sql))
+
+
+def limited_sql(sql: str, max_rows: int) -> str:
+    """Wrap a query so the server returns at most max_rows + 1 rows."""
+    return f"SELECT * FROM (\n{statement_body(sql)}\n) AS bounded_query LIMIT {int(max_rows) + 1}"
+
+
+def count_sql(sql: str) -> str:
+    return f"SELECT COUNT(*) FROM (\n{statement_body(sql)}\n) AS counted_query"
+
+
+def explain_sql(sql: str) -> str:
+    return f"EXPLAIN (FORMAT JSON) {statement_body(sql)}"
+
+
+def plan_rows(explain_output: Any) -> Optional[int]:
+    """Top-level row estimate from `EXPLAIN (FORMAT JSON)` output."""
+    try:
+        return int(explain_output[0]["Plan"]["Plan Rows"])
+    except (TypeError, KeyError, IndexError, ValueError):
+        return None
+
+
+def _total(fetched: int, value: Optional[int], estimate: bool) -> Tuple[Optional[int], bool]:
+    # A planner estimate below what was already read is useless
+    if value is None or value < fetched:
+        return None, False
+    return value, estimate
+
+
+def _count_rows(conn, sql: str, fetched: int, strategy: str,
+                estimate: Optional[int] = None) -> Tuple[Optional[int], bool]:
+    if strategy == "none":
+        return None, False
+    if strategy == "estimate" and estimate is not None:
+        return _total(fetched, estimate, True)
+    try:
+        with conn.cursor() as cur:
+            if strategy == "exact":
+                cur.execute(count_sql(sql))
+                return _total(fetched, int(cur.fetchone()[0]), False)
+            cur.execute(explain_sql(sql))
+            return _total(fetched, plan_rows(cur.fetchone()[0]), True)
+    except psycopg2.Error:
+        return None, False
+
+
+def execute_bounded(conn, sql: str, max_rows: Optional[int] = None,
+                    count: Optional[str] = None, estimate: Optional[int] = None) -> QueryResult:
+    """
+    Run a read-only query and read at most max_rows rows from it.
+
+    Args:
+        conn: psycopg2 connection inside a transaction (named cursors need one)
+        sql: The user's statement
+        max_rows: Rows to keep (defaults to SQL_MAX_ROWS)
+        count: Total-count strategy for cut-off results (defaults to SQL_RESULT_COUNT)
+        estimate: Planner row estimate already known (saves a second EXPLAIN)
+
+    Returns:
+        QueryResult with at most max_rows rows
+    """
+    max_rows = max_rows_setting() if max_rows is None else max_rows
+    batch = max(1, int(os.environ.get("SQL_FETCH_BATCH", "500")))
+    wrappable = is_wrappable(sql)
+
+    if wrappable:
+        cur = conn.cursor(name=f"bot_query_{uuid.uuid4().hex[:12]}", cursor_factory=RealDictCursor)
+        cur.itersize = batch
+        statement = limited_sql(sql, max_rows)
+    else:
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        statement = statement_body(sql)
+
+    rows: List[Dict[str, Any]] = []
+    try:
+        cur.execute(statement)
+        while len(rows) <= max_rows:
+            size = min(batch, max_rows + 1 - len(rows))
+            chunk = cur.fetchmany(size)
+            rows.extend(dict(row) for row in chunk)
+            if len(chunk) < size:
+                break
+    finally:
+        cur.close()
+
+    if len(rows) <= max_rows:
+        return QueryResult(rows=rows, total_rows=len(rows))
+
+    rows = rows[:max_rows]
+    strategy = count or count_strategy()
+    total, estimate = _count_rows(conn, sql, len(rows) + 1, strategy, estimate) if wrappable else (None, False)
+    return QueryResult(rows=rows, truncated=True, total_rows=total, total_is_estimate=estimate)
+
+
+async def fetch_bounded(sql: str, max_rows: Optional[int] = None,
+                        count: Optional[str] = None, estimate: Optional[int] = None,
+                        prelude: Optional[str] = None) -> QueryResult:
+    """
+    Async counterpart of `execute_bounded` on the async pool. Async
+    connections are in autocommit mode, so there is no server-side cursor;
+    the LIMIT wrapper alone keeps the result small. `prelude` opens a
+    transaction for the main query (see `async_db.fetch_all`).
+    """
+    from core.services import async_db
+
+    max_rows = max_rows_setting() if max_rows is None else max_rows
+    wrappable = is_wrappable(sql)
+    statement = limited_sql(sql, max_rows) if wrappable else statement_body(sql)
+    rows = await async_db.fetch_all(statement, prelude=prelude)
+    if len(rows) <= max_rows:
+        return QueryResult(rows=rows, total_rows=len(rows))
+
+    total, is_estimate = None, False
+    strategy = count or count_strategy()
+    if wrappable and strategy == "estimate" and estimate is not None:
+        total, is_estimate = _total(max_rows + 1, estimate, True)
+    elif wrappable and strategy != "none":
+        try:
+            if strategy == "exact":
+                result = await async_db.fetch_all(count_sql(sql))
+                total, is_estimate = _total(max_rows + 1, int(next(iter(result[0].values()))), False)
+            else:
+                result = await async_db.fetch_all(explain_sql(sql))
+                total, is_estimate = _total(max_rows + 1, plan_rows(next(iter(result[0].values()))), True)
+        except psycopg2.Error:
+            pass
+    return QueryResult(rows=rows[:max_rows], truncated=True, total_rows=total, total_is_estimate=is_estimate)
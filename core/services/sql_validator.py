@@ -0,0 +1,368 @@
+"""
+Parser-based safety checks for SQL pasted into Slack.
+
+A query is accepted when, parsed with sqlglot's Postgres dialect, it is:
+- a single statement;
+- a read-only query (SELECT / set operation / VALUES / `TABLE name`,
+  optionally behind EXPLAIN, but not EXPLAIN ANALYZE, which runs it past
+  the plan check) with no data-modifying CTEs, SELECT INTO or row locks;
+- reading only tables of the semantic layer (plus their rollup tables and
+  SQL_ALLOWED_TABLES), in the default schema; CTE names are fine;
+- not calling a denied function (sleeps, advisory locks, file and network
+  access, server settings, WAL and replication control, SQL executed from
+  strings, ...; denied by name or by family prefix, extend with
+  SQL_DENIED_FUNCTIONS).
+`SHOW <setting>` is allowed as well, except for settings naming server
+files and directories.
+
+The structural verdict does not depend on the allow-list, so it is cached
+(SQL_VALIDATION_CACHE_SIZE entries) under the hash of the raw text and of
+its token stream; repeated queries skip tokenizing and parsing, and
+reformatted ones skip parsing. Table names are checked against the current
+semantic layer (re-read at most every few seconds) on every call.
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import FrozenSet, List, Optional, Set, Tuple
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from sqlglot.tokens import Token, TokenType
+
+from core.services.semantic_layer import get_models
+
+DIALECT = sqlglot.Dialect.get_or_raise("postgres")
+
+# Statements a query may consist of
+READ_ONLY_ROOTS = (exp.Select, exp.SetOperation, exp.Values)
+
+# Nodes that write, lock or run arbitrary commands, wherever they appear
+DENIED_NODES = (
+    exp.DML, exp.DDL, exp.Command, exp.Into, exp.Lock, exp.Copy,
+    exp.Transaction, exp.Set, exp.Grant,
+)
+
+DENIED_FUNCTIONS = frozenset({
+    # stalling the backend
+    "pg_sleep", "pg_sleep_for", "pg_sleep_until",
+    # server files and large objects
+    "pg_read_file", "pg_read_binary_file", "pg_ls_dir", "pg_stat_file",
+    "lo_import", "lo_export", "lo_get", "lo_put", "lo_unlink",
+    # other connections and servers
+    "dblink", "dblink_exec", "dblink_connect", "dblink_send_query",
+    "pg_terminate_backend", "pg_cancel_backend", "pg_reload_conf", "pg_rotate_logfile",
+    # SQL from strings (would bypass these checks) and settings
+    "query_to_xml", "query_to_xml_and_xmlschema", "query_to_xmlschema",
+    "cursor_to_xml", "current_setting", "set_config",
+    # side effects
+    "nextval", "setval", "pg_advisory_lock", "pg_advisory_xact_lock",
+    "pg_notify", "txid_current",
+})
+
+# Whole families denied by name prefix: session advisory locks outlive the
+# rollback done when a pooled connection is returned, and READ ONLY does not
+# stop them; dblink, large objects, server log/file access, WAL, restore
+# point and replication slot control, statistics resets and promotion likewise
+DENIED_FUNCTION_PREFIXES = (
+    "pg_advisory", "pg_try_advisory", "dblink", "lo_", "pg_ls_", "pg_read_", "pg_stat_file",
+    "pg_file_", "pg_switch_", "pg_create_", "pg_drop_", "pg_stat_reset", "pg_promote",
+    "pg_logical_", "pg_replication_",
+)
+
+# Tokens after which `TABLE name` starts a query (shorthand for SELECT * FROM name)
+_TABLE_QUERY_AFTER = {
+    TokenType.L_PAREN, TokenType.UNION, TokenType.INTERSECT, TokenType.EXCEPT,
+    TokenType.ALL, TokenType.DISTINCT,
+}
+
+_EXPLAIN_OPTIONS = re.compile(r"^\s*(?:\([^()]*\)\s*)?(?:(?:ANALYZE|ANALYSE|VERBOSE)\b\s*)*", re.IGNORECASE)
+_EXPLAIN_ANALYZE = re.compile(r"\bANALY[SZ]E\b", re.IGNORECASE)
+_TOKEN_REPR = re.compile(r"<Token token_type: [^,]+, text: (.*?), line: .*?>")
+_SETTING_NAME = re.compile(r"^[A-Za-z_][\w.]*$")
+# Settings that reveal server paths (current_setting() is denied for the same reason)
+_PATH_SETTING = re.compile(r"(?:_file|_directory|_directories|_libraries|^dynamic_library_path)$", re.IGNORECASE)
+_DEFAULT_SCHEMAS = {"", "public"}
+
+
+@dataclass(frozen=True)
+class _Structure:
+    """Allow-list independent part of a validation (what gets cached)."""
+    reason: Optional[str]
+    tables: FrozenSet[str] = frozenset()
+
+
+@dataclass
+class ValidationResult:
+    """Whether a query may run, and why not."""
+    ok: bool
+    reason: Optional[str] = None
+    tables: Set[str] = field(default_factory=set)
+
+
+# ---------- configuration ----------
+
+def denied_functions() -> FrozenSet[str]:
+    """DENIED_FUNCTIONS plus SQL_DENIED_FUNCTIONS (comma-separated)."""
+    extra = os.environ.get("SQL_DENIED_FUNCTIONS", "")
+    return DENIED_FUNCTIONS | {name.strip().lower() for name in extra.split(",") if name.strip()}
+
+
+# Semantic-layer files are re-checked for changes at most this often
+ALLOWED_TABLES_RECHECK_SECONDS = 5.0
+
+_allowed: Tuple[float, Optional[int], FrozenSet[str]] = (float("-inf"), None, frozenset())
+
+
+def allowed_tables() -> FrozenSet[str]:
+    """
+    Tables user queries may read: every semantic model's table and rollup
+    table, plus SQL_ALLOWED_TABLES (comma-separated).
+    """
+    global _allowed
+    checked_at, models_id, tables = _allowed
+    now = time.monotonic()
+    if now - checked_at >= ALLOWED_TABLES_RECHECK_SECONDS:
+        models = get_models()
+        if id(models) != models_id:
+            tables = set()
+            for name, model in models.items():
+                tables.add(model.table.lower())
+                tables.add(f"rollup_{name}_daily")
+            tables = frozenset(tables)
+        _allowed = (now, id(models), tables)
+    extra = os.environ.get("SQL_ALLOWED_TABLES", "")
+    if not extra:
+        return tables
+    return tables | {name.strip().lower() for name in extra.split(",") if name.strip()}
+
+
+# ---------- structural checks ----------
+
+def _token_key(tokens: List[Token]) -> str:
+    digest = hashlib.sha1()
+    for token in tokens:
+        # Unquoted names fold to lower case in Postgres; quoted ones and strings are kept
+        text = token.text if token.token_type in (TokenType.STRING, TokenType.IDENTIFIER) else token.text.upper()
+        digest.update(f"{token.token_type.name}\x1f{text}\x1e".encode())
+    return "t:" + digest.hexdigest()
+
+
+def _explained_statement(body: str) -> str:
+    """The query behind `EXPLAIN [(options)] [ANALYZE] [VERBOSE]`."""
+    return _EXPLAIN_OPTIONS.sub("", body, count=1)
+
+
+def _function_name(node: exp.Func) -> str:
+    if isinstance(node, exp.Anonymous):
+        return node.name.lower()
+    return node.sql_name().lower()
+
+
+def _is_denied(name: str, denied: FrozenSet[str]) -> bool:
+    return name in denied or name.startswith(DENIED_FUNCTION_PREFIXES)
+
+
+def _check_tree(tree: exp.Expression, denied: FrozenSet[str]) -> _Structure:
+    if not isinstance(tree, READ_ONLY_ROOTS):
+        return _Structure(f"{tree.key.upper()} statements are not allowed, only read-only queries")
+
+    ctes = {cte.alias_or_name.lower() for cte in tree.find_all(exp.CTE)}
+    tables = set()
+    for node in tree.walk():
+        if isinstance(node, DENIED_NODES):
+            return _Structure(f"{node.key.upper()} is not allowed in a read-only query")
+        if isinstance(node, exp.Func) and _is_denied(_function_name(node), denied):
+            return _Structure(f"Function {_function_name(node)}() is not allowed")
+        if isinstance(node, exp.Table) and isinstance(node.this, exp.Identifier):
+            name = node.name.lower()
+            if node.catalog or node.db.lower() not in _DEFAULT_SCHEMAS:
+                tables.add(f"{node.db.lower()}.{name}")
+            elif name not in ctes:
+                tables.add(name)
+    return _Structure(None, frozenset(tables))
+
+
+def _parse_error(error: SqlglotError) -> str:
+    details = getattr(error, "errors", None)
+    message = details[0]["description"] if details and details[0].get("description") else str(error).splitlines()[0]
+    return "Could not parse the query: " + _TOKEN_REPR.sub(r"'\1'", message)
+
+
+def _expand_table_queries(tokens: List[Token]) -> List[Token]:
+    """
+    Spell `TABLE name` queries as `SELECT * FROM name`, which is what they
+    mean, so the parser (which reads them as a column alias) sees the table.
+    """
+    expanded: List[Token] = []
+    for token in tokens:
+        if token.token_type == TokenType.TABLE and (
+            not expanded or expanded[-1].token_type in _TABLE_QUERY_AFTER
+        ):
+            position = (token.line, token.col, token.start, token.end)
+            expanded += [
+                Token(TokenType.SELECT, "SELECT", *position),
+                Token(TokenType.STAR, "*", *position),
+                Token(TokenType.FROM, "FROM", *position),
+            ]
+        else:
+            expanded.append(token)
+    return expanded
+
+
+def _check_tokens(sql: str, tokens: List[Token], explain: bool = True) -> _Structure:
+    statements = [[]]
+    for token in tokens:
+        if token.token_type == TokenType.SEMICOLON:
+            statements.append([])
+        else:
+            statements[-1].append(token)
+    statements = [s for s in statements if s]
+    if not statements:
+        return _Structure("No SQL statement found")
+    if len(statements) > 1:
+        return _Structure("Only one statement can be run at a time")
+
+    # Utility commands reach us as the command token plus its body as one string
+    statement = statements[0]
+    first = statement[0].text.upper()
+    body = statement[1].text if len(statement) == 2 and statement[1].token_type == TokenType.STRING else ""
+    if first == "SHOW":
+        setting = body.strip()
+        if not _SETTING_NAME.match(setting):
+            return _Structure("SHOW only accepts a single setting name")
+        if _PATH_SETTING.search(setting):
+            return _Structure(f"SHOW {setting} is not allowed, it names server files")
+        return _Structure(None)
+    if first == "EXPLAIN":
+        if not explain:
+            return _Structure("EXPLAIN only accepts a query")
+        if _EXPLAIN_ANALYZE.search(_EXPLAIN_OPTIONS.match(body).group(0)):
+            return _Structure("EXPLAIN ANALYZE executes the query; use plain EXPLAIN")
+        query = _explained_statement(body)
+        try:
+            return _check_tokens(query, DIALECT.tokenize(query), explain=False)
+        except SqlglotError as e:
+            return _Structure(_parse_error(e))
+
+    try:
+        trees = [t for t in DIALECT.parser().parse(_expand_table_queries(statement), sql) if t is not None]
+    except SqlglotError as e:
+        return _Structure(_parse_error(e))
+    if len(trees) != 1:
+        return _Structure("Only one statement can be run at a time")
+    return _check_tree(trees[0], denied_functions())
+
+
+# ---------- cache ----------
+
+class _ValidationCache:
+    """Small thread-safe LRU of structural verdicts keyed by query hashes."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, _Structure]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[_Structure]:
+        with self._lock:
+            structure = self._entries.get(key)
+            if structure is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return structure
+
+    def put(self, structure: _Structure, *keys: str, parsed: bool = True) -> None:
+        with self._lock:
+            self.misses += parsed
+            for key in keys:
+                self._entries[key] = structure
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+
+_cache = _ValidationCache(int(os.environ.get("SQL_VALIDATION_CACHE_SIZE", "1024")))
+
+
+def _structure(sql: str) -> _Structure:
+    text = sql.strip()
+    raw_key = "r:" + hashlib.sha1(text.encode()).hexdigest()
+    structure = _cache.get(raw_key)
+    if structure is not None:
+        return structure
+
+    try:
+        tokens = DIALECT.tokenize(text)
+    except SqlglotError as e:
+        structure = _Structure(_parse_error(e))
+        _cache.put(structure, raw_key)
+        return structure
+
+    token_key = _token_key(tokens)
+    structure = _cache.get(token_key)
+    if structure is not None:
+        _cache.put(structure, raw_key, parsed=False)
+        return structure
+
+    structure = _check_tokens(text, tokens)
+    _cache.put(structure, raw_key, token_key)
+    return structure
+
+
+# ---------- API ----------
+
+def validate_sql(sql: str) -> ValidationResult:
+    """
+    Check that `sql` is a single read-only statement over allowed tables
+    without denied functions.
+    """
+    structure = _structure(sql)
+    if structure.reason:
+        return ValidationResult(ok=False, reason=structure.reason)
+
+    unknown = sorted(structure.tables - allowed_tables())
+    if unknown:
+        return ValidationResult(
+            ok=False,
+            reason=f"Table{'s' if len(unknown) > 1 else ''} not available for queries: {', '.join(unknown)}",
+            tables=set(structure.tables),
+        )
+    return ValidationResult(ok=True, tables=set(structure.tables))
+
+
+def sql_fingerprint(sql: str) -> str:
+    """
+    Key identifying what a query computes regardless of formatting: the
+    hash of its token stream (keywords case-folded, whitespace and comments
+    ignored), or of its collapsed text if it does not tokenize.
+    """
+    text = sql.strip().rstrip(";").strip()
+    try:
+        return _token_key(DIALECT.tokenize(text))
+    except SqlglotError:
+        return "r:" + hashlib.sha1(" ".join(text.split()).encode()).hexdigest()
+
+
+def get_validation_cache_metrics() -> dict:
+    """Validation cache counters as a plain dict."""
+    with _cache._lock:
+        return {"entries": len(_cache._entries), "hits": _cache.hits, "misses": _cache.misses}
+
+
+def clear_validation_cache() -> None:
+    """Forget cached verdicts (used in tests)."""
+    _cache.clear()
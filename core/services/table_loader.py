@@ -0,0 +1,414 @@
+"""
+Question-aware table loading for PandasAI.
+
+Instead of `SELECT * FROM table LIMIT 10000`, the loader uses the semantic
+layer field definitions and the question to:
+- select only the columns the question can need,
+- push the detected time window and categorical filters into Postgres
+  (a status or value is only pushed down when it is the one asked about,
+  not when the question compares it or asks for its share),
+- size the frame to a memory budget, falling back to a pre-aggregated
+  frame (GROUP BY in Postgres) or a random sample for large tables; raw
+  loads keep the most recent rows when the budget cuts them off.
+"""
+
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.services.dataframe_cache import CachedFrame, DataFrameCache, get_dataframe_cache
+from core.services.semantic_layer import SemanticModel, get_model
+
+# EU countries list for filtering
+EU_COUNTRIES = [
+    "Austria", "Belgium", "Bulgaria", "Croatia", "Cyprus", "Czech Republic",
+    "Denmark", "Estonia", "Finland", "France", "Germany", "Greece", "Hungary",
+    "Ireland", "Italy", "Latvia", "Lithuania", "Luxembourg", "Malta", "Netherlands",
+    "Poland", "Portugal", "Romania", "Slovakia", "Slovenia", "Spain", "Sweden"
+]
+
+# Business terms that don't appear in the field names/descriptions
+FIELD_SYNONYMS: Dict[str, List[str]] = {
+    "revenue": ["amount_usd"],
+    "sales": ["amount_usd"],
+    "spend": ["amount_usd"],
+    "gmv": ["amount_usd"],
+    "income": ["amount_usd"],
+    "region": ["country"],
+    "geo": ["country"],
+    "device": ["device_type"],
+    "platform": ["device_type"],
+    "signup": ["signup_date"],
+    "churn": ["end_date", "status"],
+    "cancel": ["end_date", "status"],
+    "active": ["start_date", "end_date"],
+    "duration": ["duration_minutes"],
+    "minutes": ["duration_minutes"],
+    "length": ["duration_minutes"],
+    "activity": ["activity_type"],
+    "engagement": ["duration_minutes", "activity_type"],
+    "tier": ["plan"],
+}
+
+# Words too generic to select a column on their own
+_STOPWORDS = {
+    "the", "a", "an", "of", "for", "to", "in", "on", "by", "and", "or", "is",
+    "are", "what", "which", "how", "many", "much", "show", "me", "our", "we",
+    "do", "does", "did", "was", "were", "with", "per", "from", "last", "past",
+    "this", "that", "data", "table", "date", "time", "when", "unique",
+    "identifier", "foreign", "key", "linking", "used", "e", "g",
+}
+
+# Questions that need the other statuses/values as well as the ones mentioned
+_COMPARISON = re.compile(
+    r"\b(?:vs|versus|compared?|comparison|against|share|shares|proportion|percent|percentage|"
+    r"ratio|fraction|split|breakdown|distribution|mix)\b"
+)
+
+_TREND_WORDS = ("trend", "over time", "daily", "weekly", "monthly", "per day", "per month", "by day", "by month")
+
+# Approximate in-memory bytes per value for a pandas column of this type
+_TYPE_BYTES = {"int": 8, "serial": 8, "numeric": 8, "float": 8, "timestamp": 8, "date": 8}
+_OBJECT_BYTES = 64
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def detect_time_window(question: str) -> Tuple[Optional[int], str]:
+    """
+    Very simple heuristic:
+    - 'last week'      -> 7 days
+    - 'last month'     -> 30 days
+    - 'last quarter'   -> 90 days
+    - 'last year'      -> 365 days
+    - otherwise        -> None (all time)
+    Returns (window_days, human_label)
+    """
+    q = question.lower()
+
+    if "last week" in q or "past week" in q:
+        return 7, "last 7 days"
+    if "last month" in q or "past month" in q:
+        return 30, "last 30 days"
+    if "last quarter" in q or "past quarter" in q:
+        return 90, "last 90 days"
+    if "last year" in q or "past year" in q:
+        return 365, "last 365 days"
+
+    return None, "all time"
+
+
+def _memory_budget_bytes() -> int:
+    """PANDASAI_LOAD_BUDGET_MB (default 64) as bytes."""
+    return int(float(os.environ.get("PANDASAI_LOAD_BUDGET_MB", "64")) * 1024 * 1024)
+
+
+def _question_terms(question: str) -> set:
+    """Lowercased words of the question, plus naive singular forms."""
+    words = set(_WORD.findall(question.lower()))
+    words |= {w[:-1] for w in words if len(w) > 3 and w.endswith("s")}
+    return words - _STOPWORDS
+
+
+def _field_terms(f) -> set:
+    terms = set(f.name.lower().split("_")) | set(_WORD.findall(f.description.lower()))
+    return {t for t in terms if len(t) > 2} - _STOPWORDS
+
+
+@dataclass
+class LoadPlan:
+    """How a table will be loaded for a question."""
+    table: str
+    columns: List[str]
+    mode: str = "raw"                      # raw | aggregate | sample
+    filters: List[str] = field(default_factory=list)
+    params: List[Any] = field(default_factory=list)
+    filter_labels: List[str] = field(default_factory=list)
+    group_by: List[str] = field(default_factory=list)
+    measures: List[str] = field(default_factory=list)
+    time_bucket: Optional[str] = None
+    sample_percent: Optional[float] = None
+    row_limit: Optional[int] = None
+    order_by: Optional[str] = None         # raw mode: newest rows first under the limit
+
+    def to_sql(self) -> Tuple[str, List[Any]]:
+        """Render the plan as a parameterized SELECT."""
+        names = [self.table, *self.columns, *self.group_by, *self.measures]
+        if self.order_by:
+            names.append(self.order_by)
+        for name in names:
+            if not _IDENTIFIER.match(name):
+                raise ValueError(f"Invalid identifier in load plan: {name!r}")
+
+        where = f" WHERE {' AND '.join(self.filters)}" if self.filters else ""
+
+        if self.mode == "aggregate":
+            select = list(self.group_by)
+            group = list(self.group_by)
+            if self.time_bucket:
+                bucket, column = self.time_bucket.split(":")
+                select.insert(0, f"DATE_TRUNC('{bucket}', {column})::date AS {bucket}")
+                group.insert(0, "1")
+            select.append("COUNT(*) AS row_count")
+            for m in self.measures:
+                select.append(f"SUM({m}) AS sum_{m}")
+                select.append(f"AVG({m}) AS avg_{m}")
+            sql = f"SELECT {', '.join(select)} FROM {self.table}{where}"
+            if group:
+                sql += f" GROUP BY {', '.join(group)} ORDER BY {', '.join(group)}"
+        else:
+            sample = ""
+            if self.mode == "sample" and self.sample_percent:
+                sample = f" TABLESAMPLE SYSTEM ({self.sample_percent:.4f})"
+            sql = f"SELECT {', '.join(self.columns)} FROM {self.table}{sample}{where}"
+            if self.mode == "raw" and self.order_by:
+                sql += f" ORDER BY {self.order_by} DESC"
+
+        if self.row_limit:
+            sql += f" LIMIT {int(self.row_limit)}"
+        return sql, list(self.params)
+
+    def cache_key(self) -> Tuple:
+        """Key identifying this exact load (table, columns, filters and mode)."""
+        sql, params = self.to_sql()
+        return (self.table, sql, tuple(params))
+
+    def describe(self) -> str:
+        """Short description handed to PandasAI so the LLM knows what it sees."""
+        if self.mode == "aggregate":
+            dims = ", ".join(([self.time_bucket.split(":")[0]] if self.time_bucket else []) + self.group_by)
+            text = f"Pre-aggregated {self.table} data grouped by {dims or 'nothing'} (row_count = number of rows)"
+        elif self.mode == "sample":
+            text = f"Random ~{self.sample_percent:.2f}% sample of the {self.table} table"
+        else:
+            text = f"Data from {self.table} table"
+        if self.filter_labels:
+            text += f", filtered to {', '.join(self.filter_labels)}"
+        return text
+
+
+def _select_columns(model: SemanticModel, question: str) -> List[str]:
+    terms = _question_terms(question)
+    wanted: List[str] = []
+
+    for term in terms:
+        for name in FIELD_SYNONYMS.get(term, []):
+            if model.field(name) and name not in wanted:
+                wanted.append(name)
+
+    for f in model.fields:
+        if f.name in wanted:
+            continue
+        if terms & _field_terms(f) or terms & set(f.example_values):
+            wanted.append(f.name)
+
+    if not wanted:
+        return model.field_names
+
+    # Keep the time column so windows and trends can still be answered
+    if model.time_column and model.time_column not in wanted:
+        wanted.append(model.time_column)
+    return [name for name in model.field_names if name in wanted]
+
+
+def _detect_filters(model: SemanticModel, question: str, plan: LoadPlan) -> None:
+    lower = question.lower()
+    words = set(_WORD.findall(lower))
+
+    window_days, window_label = detect_time_window(question)
+    if window_days is not None and model.time_column:
+        plan.filters.append(f"{model.time_column} >= CURRENT_DATE - INTERVAL %s")
+        plan.params.append(f"{window_days} days")
+        plan.filter_labels.append(window_label)
+
+    # Comparisons and shares need the rows that don't match as well
+    compares = bool(_COMPARISON.search(lower))
+
+    # Lifecycle status (subscriptions-style start/end dates)
+    if model.field("end_date") and model.field("start_date") and not compares:
+        active = "active" in words
+        churned = bool(words & {"churned", "canceled", "cancelled"})
+        if active and not churned:
+            plan.filters.append("start_date <= CURRENT_DATE AND (end_date IS NULL OR end_date > CURRENT_DATE)")
+            plan.filter_labels.append("active")
+        elif churned and not active:
+            plan.filters.append("end_date IS NOT NULL AND end_date <= CURRENT_DATE")
+            plan.filter_labels.append("churned")
+
+    # Region
+    if model.field("country") and ("eu" in words or "europe" in words or "european" in words):
+        plan.filters.append("country IN %s")
+        plan.params.append(tuple(EU_COUNTRIES))
+        plan.filter_labels.append("EU countries")
+
+    # Categorical values listed in the field descriptions ("e.g., card, paypal"),
+    # when exactly one value of the field is mentioned
+    for f in model.fields:
+        if not f.is_categorical or f.name == "status" or compares:
+            continue
+        values = [v for v in f.example_values if v in words]
+        if len(values) == 1 and f"by {f.name.split('_')[0]}" not in lower:
+            plan.filters.append(f"LOWER({f.name}) IN %s")
+            plan.params.append(tuple(values))
+            plan.filter_labels.append(f"{f.name} in {', '.join(values)}")
+
+
+def _group_by_columns(model: SemanticModel, question: str) -> List[str]:
+    lower = question.lower()
+    groups = []
+    for f in model.fields:
+        if not f.is_categorical:
+            continue
+        aliases = {f.name, f.name.split("_")[0], f.name.replace("_", " ")}
+        aliases |= {k for k, v in FIELD_SYNONYMS.items() if v == [f.name]}
+        if any(f"by {alias}" in lower or f"per {alias}" in lower for alias in aliases):
+            groups.append(f.name)
+    return groups
+
+
+def _row_bytes(model: SemanticModel, columns: List[str]) -> int:
+    total = 0
+    for name in columns:
+        f = model.field(name)
+        type_name = f.type if f else ""
+        total += next((b for prefix, b in _TYPE_BYTES.items() if type_name.startswith(prefix)), _OBJECT_BYTES)
+    return max(total, 1)
+
+
+def plan_table_load(
+    question: str,
+    table_name: str,
+    estimated_rows: Optional[int] = None,
+    budget_bytes: Optional[int] = None,
+) -> LoadPlan:
+    """
+    Decide which columns, filters and load mode to use for a question.
+
+    Args:
+        question: The user's question
+        table_name: Table chosen by the router
+        estimated_rows: Table row estimate (e.g. from pg_class), if known
+        budget_bytes: Memory budget for the DataFrame; defaults to
+            PANDASAI_LOAD_BUDGET_MB
+
+    Returns:
+        LoadPlan for `load_table`
+    """
+    model = get_model(table_name)
+    if model is None or not model.fields:
+        # Unknown table: keep the old behaviour, bounded by the budget
+        return LoadPlan(table=table_name, columns=["*"], row_limit=10000)
+
+    budget = budget_bytes or _memory_budget_bytes()
+    columns = _select_columns(model, question)
+    plan = LoadPlan(table=model.table, columns=columns)
+    _detect_filters(model, question, plan)
+
+    max_rows = max(1000, budget // _row_bytes(model, columns))
+    plan.row_limit = max_rows
+    # Row estimates can be missing or stale: if the limit cuts in, keep the newest rows
+    plan.order_by = model.time_column if model.time_column and _IDENTIFIER.match(model.time_column) else None
+    if estimated_rows is None or estimated_rows <= max_rows:
+        return plan
+
+    # Too big to load raw: aggregate in Postgres if the question is a
+    # breakdown or a trend, otherwise sample.
+    lower = question.lower()
+    group_by = _group_by_columns(model, question)
+    wants_trend = any(w in lower for w in _TREND_WORDS)
+    if group_by or wants_trend:
+        plan.mode = "aggregate"
+        plan.group_by = group_by
+        plan.measures = [
+            c for c in columns
+            if model.field(c) and model.field(c).is_numeric and model.field(c).role != "relationship"
+        ]
+        if wants_trend and model.time_column:
+            bucket = "month" if "month" in lower or "trend" in lower else "day"
+            plan.time_bucket = f"{bucket}:{model.time_column}"
+        plan.columns = []
+        return plan
+
+    plan.mode = "sample"
+    plan.sample_percent = min(100.0, 100.0 * max_rows / estimated_rows * 1.1)
+    return plan
+
+
+def _estimate_rows(conn, table_name: str) -> Optional[int]:
+    """Planner row estimate from pg_class (no table scan); None if unknown."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)", (table_name,))
+        row = cur.fetchone()
+    if not row or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+def _watermark_sql(model: SemanticModel) -> Optional[str]:
+    columns = [f.name for f in model.fields if f.is_temporal and _IDENTIFIER.match(f.name)]
+    if not columns:
+        return None
+    return f"SELECT {', '.join(f'MAX({c})' for c in columns)} FROM {model.table}"
+
+
+_watermarks: Dict[str, Tuple[float, Any]] = {}
+_watermarks_lock = threading.Lock()
+
+
+def table_watermark(conn, table_name: str, max_age: Optional[float] = None) -> Any:
+    """
+    Data watermark of a table: the max of each of its date/timestamp fields
+    (e.g. max payment_date, or max start_date and end_date). A change means
+    cached frames for the table are stale.
+
+    The value is reused for DF_CACHE_WATERMARK_INTERVAL seconds (default 30)
+    so a burst of questions costs one MAX() query.
+    """
+    model = get_model(table_name)
+    sql = _watermark_sql(model) if model else None
+    if sql is None:
+        return None
+
+    if max_age is None:
+        max_age = float(os.environ.get("DF_CACHE_WATERMARK_INTERVAL", "30"))
+    now = time.monotonic()
+    with _watermarks_lock:
+        checked = _watermarks.get(table_name)
+    if checked and now - checked[0] <= max_age:
+        return checked[1]
+
+    with conn.cursor() as cur:
+        cur.execute(sql)
+        watermark = tuple(cur.fetchone() or ())
+    with _watermarks_lock:
+        _watermarks[table_name] = (now, watermark)
+    return watermark
+
+
+def load_table(conn, question: str, table_name: str, cache: Optional[DataFrameCache] = None) -> CachedFrame:
+    """
+    Load the slice of `table_name` relevant to `question`, serving it from
+    the DataFrame cache when the same slice was loaded recently and the
+    table's watermark has not moved.
+
+    Returns:
+        CachedFrame with `.df` and `.plan`
+    """
+    import pandas as pd
+
+    cache = cache or get_dataframe_cache()
+    plan = plan_table_load(question, table_name, estimated_rows=_estimate_rows(conn, table_name))
+    key = plan.cache_key()
+    watermark = table_watermark(conn, table_name)
+
+    cached = cache.get(key, watermark)
+    if cached is not None:
+        return cached
+
+    sql, params = plan.to_sql()
+    df = pd.read_sql_query(sql, conn, params=params or None)
+    return cache.put(key, plan.table, df, plan=plan, watermark=watermark)
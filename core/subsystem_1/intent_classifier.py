@@ -0,0 +1,152 @@
+"""
+Local dataset classifier.
+
+A multinomial Naive Bayes model over word unigrams and bigrams, trained at
+first use from `intent_examples.yml` plus the routing-rules vocabulary
+(semantic layer names, fields, measures and curated synonyms) and retrained
+whenever the routing rules are rebuilt. Prediction takes microseconds;
+callers fall back to the LLM only when the model's confidence is below
+CLASSIFIER_CONFIDENCE_THRESHOLD.
+"""
+
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import yaml
+
+from core.subsystem_1.routing_rules import RoutingRules, get_routing_rules
+
+EXAMPLES_FILE = Path(__file__).parent / "intent_examples.yml"
+LABELS = ["users", "payments", "subscriptions", "sessions", "unknown"]
+
+_WORD = re.compile(r"[a-z0-9]+")
+_SUFFIXES = ("ations", "ation", "ing", "ed", "es", "s")
+
+
+def _stem(word: str) -> str:
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+            return word[:-len(suffix)]
+    return word
+
+
+def features(text: str) -> Counter:
+    """Stemmed word unigrams and bigrams."""
+    words = [_stem(w) for w in _WORD.findall(text.lower())]
+    grams = Counter(words)
+    grams.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+    return grams
+
+
+@dataclass
+class Prediction:
+    """Classifier output: best label and its posterior probability."""
+    label: str
+    confidence: float
+    probabilities: Dict[str, float]
+
+
+class NaiveBayesClassifier:
+    """Multinomial Naive Bayes with additive smoothing and weighted examples."""
+
+    def __init__(self, alpha: float = 0.5):
+        self.alpha = alpha
+        self._log_prior: Dict[str, float] = {}
+        self._log_likelihood: Dict[str, Dict[str, float]] = {}
+        self._log_unseen: Dict[str, float] = {}
+        self._vocabulary: set = set()
+
+    def fit(self, examples: Iterable[Tuple[str, str, float]]) -> "NaiveBayesClassifier":
+        """
+        Train on (text, label, weight) examples.
+        Vocabulary-only examples can use a small weight so they inform the
+        word statistics without skewing class priors much.
+        """
+        counts: Dict[str, Counter] = defaultdict(Counter)
+        priors: Counter = Counter()
+        for text, label, weight in examples:
+            priors[label] += weight
+            for gram, n in features(text).items():
+                counts[label][gram] += n * weight
+
+        self._vocabulary = {g for c in counts.values() for g in c}
+        total_prior = sum(priors.values())
+        vocab_size = len(self._vocabulary)
+        for label in priors:
+            total = sum(counts[label].values()) + self.alpha * vocab_size
+            self._log_prior[label] = math.log(priors[label] / total_prior)
+            self._log_likelihood[label] = {g: math.log((n + self.alpha) / total) for g, n in counts[label].items()}
+            self._log_unseen[label] = math.log(self.alpha / total)
+        return self
+
+    def predict(self, text: str) -> Prediction:
+        grams = {g: n for g, n in features(text).items() if g in self._vocabulary}
+        scores = {}
+        for label, log_prior in self._log_prior.items():
+            likelihood = self._log_likelihood[label]
+            unseen = self._log_unseen[label]
+            scores[label] = log_prior + sum(n * likelihood.get(g, unseen) for g, n in grams.items())
+
+        top = max(scores.values())
+        exp = {label: math.exp(score - top) for label, score in scores.items()}
+        norm = sum(exp.values())
+        probabilities = {label: value / norm for label, value in exp.items()}
+        if not grams:
+            # No known words at all: there is nothing to be confident about
+            return Prediction(label="unknown", confidence=0.0, probabilities=probabilities)
+        label = max(probabilities, key=probabilities.get)
+        return Prediction(label=label, confidence=probabilities[label], probabilities=probabilities)
+
+
+def load_examples(path: Path = EXAMPLES_FILE, rules: Optional[RoutingRules] = None) -> List[Tuple[str, str, float]]:
+    """Labeled examples from the YAML file plus the routing-rules vocabulary."""
+    rules = rules or get_routing_rules()
+    content = yaml.safe_load(path.read_text()) if path.exists() else {}
+    examples = [
+        (str(text), label, 1.0)
+        for label, texts in (content or {}).items()
+        for text in texts or []
+    ]
+    for label, keywords in rules.datasets.items():
+        if label not in LABELS:
+            continue
+        for keyword, weight in keywords.items():
+            if weight >= 1.0:
+                examples.append((keyword, label, 0.2 * weight))
+    return examples
+
+
+_classifier: Optional[NaiveBayesClassifier] = None
+_trained_on: Optional[RoutingRules] = None
+_classifier_lock = threading.Lock()
+
+
+def get_classifier() -> NaiveBayesClassifier:
+    """
+    Process-wide classifier, trained on first use and again whenever
+    get_routing_rules() returns a rebuilt rules object.
+    """
+    global _classifier, _trained_on
+    rules = get_routing_rules()
+    if _classifier is None or _trained_on is not rules:
+        with _classifier_lock:
+            if _classifier is None or _trained_on is not rules:
+                _classifier = NaiveBayesClassifier().fit(load_examples(rules=rules))
+                _trained_on = rules
+    return _classifier
+
+
+def confidence_threshold() -> float:
+    """CLASSIFIER_CONFIDENCE_THRESHOLD (default 0.7)."""
+    return float(os.environ.get("CLASSIFIER_CONFIDENCE_THRESHOLD", "0.7"))
+
+
+def classify_locally(text: str) -> Prediction:
+    """Classify `text` into one of LABELS with the local model."""
+    return get_classifier().predict(text)
@@ -1,7 +1,14 @@
+import re
+import threading
 from dataclasses import dataclass
-from typing import Literal
+from typing import Dict, List, Literal, Optional, Tuple
 
-Intent = Literal["help", "small_talk", "data_question", "prediction", "sql_query", "list_queries", "generate_sql", "unknown"]
+from core.subsystem_1.routing_rules import KeywordMatcher, Signals, get_routing_rules, pick_dataset
+
+Intent = Literal[
+    "help", "small_talk", "data_question", "prediction", "sql_query", "list_queries", "generate_sql",
+    "cancel_query", "confirm_query", "unknown",
+]
 Dataset = Literal["users", "payments", "subscriptions", "sessions", "none"]
 
 
@@ -15,15 +22,8 @@ class RouteDecision:
 HELP_KEYWORDS = ["help", "how do i", "what can you do", "commands"]
 SMALL_TALK_KEYWORDS = ["hi", "hello", "hey", "thanks", "thank you", "yo"]
 
-# Dataset-related keywords
-USERS_KEYWORDS = ["user", "users", "signup", "signups", "country", "region", "cohort"]
-PAYMENTS_KEYWORDS = [
-    "payment", "payments", "revenue", "income", "gmv",
-    "sales", "sale", "orders", "order", "transactions", "transaction",
-    "spend", "spending"
-]
-SUBSCRIPTIONS_KEYWORDS = ["subscription", "subscriptions", "plan", "plans", "churn", "cancel", "renewal"]
-SESSIONS_KEYWORDS = ["session", "sessions", "engagement", "activity", "usage", "visit", "visits"]
+# Dataset keywords come from the semantic layer and semantic_layer/routing_rules.yml
+# (see core/subsystem_1/routing_rules.py)
 
 # Prediction-related keywords
 PREDICTION_KEYWORDS = ["predict", "forecast", "future", "estimate", "projection", "next year", "will be", "going to"]
@@ -31,6 +31,11 @@ PREDICTION_KEYWORDS = ["predict", "forecast", "future", "estimate", "projection"
 # SQL query detection keywords
 SQL_KEYWORDS = ["select", "with", "show", "explain", "describe"]
 SQL_QUERY_INDICATORS = ["sql:", "query:", "run sql", "execute sql", "run query"]
+SQL_CLAUSE_KEYWORDS = ["from", "where"]
+
+# Whole-message replies that control the user's own SQL queries
+CANCEL_QUERY_PHRASES = {"cancel", "stop", "abort", "cancel query", "cancel my query", "stop query", "kill query"}
+CONFIRM_QUERY_PHRASES = {"confirm", "confirm query", "run anyway", "run it anyway", "yes run it"}
 
 # Golden queries listing keywords
 LIST_QUERIES_KEYWORDS = ["list queries", "show queries", "available queries", "golden queries", "what queries", "query examples"]
@@ -52,34 +57,97 @@ HOLIDAY_KEYWORDS = [
 ]
 
 
+# ---------- compiled keyword matcher ----------
+
+# Signal name -> intent keyword table
+KEYWORD_TABLES: Dict[str, List[str]] = {
+    "help": HELP_KEYWORDS,
+    "small_talk": SMALL_TALK_KEYWORDS,
+    "prediction": PREDICTION_KEYWORDS,
+    "sql_start": SQL_KEYWORDS,
+    "sql_indicator": SQL_QUERY_INDICATORS,
+    "sql_clause": SQL_CLAUSE_KEYWORDS,
+    "list_queries": LIST_QUERIES_KEYWORDS,
+    "generate_sql": GENERATE_SQL_KEYWORDS,
+    "data_phrase": DATA_PHRASES,
+    "holiday": HOLIDAY_KEYWORDS,
+}
+
+# Datasets in tie-break order: on equal scores the last one wins
+DATASETS: List[Dataset] = ["users", "payments", "subscriptions", "sessions"]
+
+_matcher: Tuple[int, Optional[KeywordMatcher]] = (0, None)
+_matcher_lock = threading.Lock()
+
+
+def _get_matcher() -> KeywordMatcher:
+    """
+    Matcher over the intent tables plus the current dataset rules,
+    recompiled whenever the routing rules are rebuilt.
+    """
+    global _matcher
+    rules = get_routing_rules()
+    version, matcher = _matcher
+    if matcher is None or version != rules.version:
+        with _matcher_lock:
+            if _matcher[1] is None or _matcher[0] != rules.version:
+                tables = {name: dict.fromkeys(keywords, 1.0) for name, keywords in KEYWORD_TABLES.items()}
+                tables.update({name: rules.datasets[name] for name in DATASETS if name in rules.datasets})
+                _matcher = (rules.version, KeywordMatcher(tables))
+            matcher = _matcher[1]
+    return matcher
+
+
+def scan_keywords(lower: str) -> Signals:
+    """
+    Find every intent and dataset signal in `lower` (already lowercased and
+    stripped) in one pass. Keywords match whole words only, so "hi" does
+    not fire inside "this".
+    """
+    return _get_matcher().scan(lower)
+
+
+def _dataset_from(signals: Signals) -> Dataset:
+    return pick_dataset(signals.scores, DATASETS) or "none"
+
+
 def route_message(text: str) -> RouteDecision:
     """
     Router for Slack messages:
-    - intent: help / small_talk / data_question / prediction / sql_query / list_queries / unknown
+    - intent: help / small_talk / data_question / prediction / sql_query / list_queries /
+      cancel_query / confirm_query / unknown
     - dataset: users / payments / subscriptions / sessions / none
     """
     lower = text.lower().strip()
+    signals = scan_keywords(lower)
 
     # 1) Help wins
-    if any(k in lower for k in HELP_KEYWORDS):
+    if "help" in signals:
         return RouteDecision(
             intent="help",
             dataset="none",
             reason="Matched help keywords",
         )
 
+    # 1.2) Cancel / confirm replies for the user's SQL queries
+    command = re.sub(r"[^\w\s]", "", lower).strip()
+    if command in CANCEL_QUERY_PHRASES:
+        return RouteDecision(
+            intent="cancel_query",
+            dataset="none",
+            reason="Matched cancel query reply",
+        )
+    if command in CONFIRM_QUERY_PHRASES:
+        return RouteDecision(
+            intent="confirm_query",
+            dataset="none",
+            reason="Matched confirm query reply",
+        )
+
     # 1.5) Check for generate SQL request (before list queries to catch "create sql query for...")
-    if any(k in lower for k in GENERATE_SQL_KEYWORDS):
+    if "generate_sql" in signals:
         # Try to identify dataset for context
-        dataset: Dataset = "none"
-        if any(k in lower for k in USERS_KEYWORDS):
-            dataset = "users"
-        if any(k in lower for k in PAYMENTS_KEYWORDS):
-            dataset = "payments"
-        if any(k in lower for k in SUBSCRIPTIONS_KEYWORDS):
-            dataset = "subscriptions"
-        if any(k in lower for k in SESSIONS_KEYWORDS):
-            dataset = "sessions"
+        dataset = _dataset_from(signals)
         
         return RouteDecision(
             intent="generate_sql",
@@ -88,18 +156,19 @@ def route_message(text: str) -> RouteDecision:
         )
 
     # 1.6) Check for list queries request
-    if any(k in lower for k in LIST_QUERIES_KEYWORDS):
+    if "list_queries" in signals:
         return RouteDecision(
             intent="list_queries",
             dataset="none",
             reason="Matched list queries keywords",
         )
 
-    # 1.7) Check for SQL queries - detect SQL syntax or explicit SQL indicators
+    # 1.7) Check for SQL queries - detect SQL syntax or explicit SQL indicators.
+    # "show me ..." is a data phrase, not the SQL SHOW command.
     is_sql_query = (
-        any(text.strip().lower().startswith(k) for k in SQL_KEYWORDS) or
-        any(indicator in lower for indicator in SQL_QUERY_INDICATORS) or
-        ("select" in lower and ("from" in lower or "where" in lower))
+        ("sql_start" in signals.leading and "data_phrase" not in signals.leading) or
+        "sql_indicator" in signals or
+        ("select" in lower and "sql_clause" in signals)
     )
     
     if is_sql_query:
@@ -110,20 +179,10 @@ def route_message(text: str) -> RouteDecision:
         )
 
     # 2) Try to identify dataset first
-    dataset: Dataset = "none"
-
-    if any(k in lower for k in USERS_KEYWORDS):
-        dataset = "users"
-    if any(k in lower for k in PAYMENTS_KEYWORDS):
-        dataset = "payments"
-    if any(k in lower for k in SUBSCRIPTIONS_KEYWORDS):
-        dataset = "subscriptions"
-    if any(k in lower for k in SESSIONS_KEYWORDS):
-        dataset = "sessions"
+    dataset = _dataset_from(signals)
 
     # 2.5) Check for prediction keywords - if subscriptions + prediction keywords, it's a prediction
-    mentions_prediction = any(k in lower for k in PREDICTION_KEYWORDS)
-    if mentions_prediction and dataset == "subscriptions":
+    if "prediction" in signals and dataset == "subscriptions":
         return RouteDecision(
             intent="prediction",
             dataset="subscriptions",
@@ -131,10 +190,10 @@ def route_message(text: str) -> RouteDecision:
         )
 
     # 3) If we see explicit analysis phrases or holiday words, it's a data question
-    looks_like_data_question = any(p in lower for p in DATA_PHRASES)
+    looks_like_data_question = "data_phrase" in signals
 
     # Holiday questions should default to payments unless something else is very clear
-    mentions_holiday = any(k in lower for k in HOLIDAY_KEYWORDS)
+    mentions_holiday = "holiday" in signals
     if mentions_holiday and dataset == "none":
         dataset = "payments"
 
@@ -149,7 +208,7 @@ def route_message(text: str) -> RouteDecision:
         )
 
     # 4) Small talk only if short and no data signals
-    if len(lower.split()) <= 4 and any(k in lower for k in SMALL_TALK_KEYWORDS):
+    if len(lower.split()) <= 4 and "small_talk" in signals:
         return RouteDecision(
             intent="small_talk",
             dataset="none",
@@ -0,0 +1,273 @@
+"""
+Data-driven routing rules.
+
+Dataset keywords are built from the semantic layer (model and table names,
+field names and example values, measure names, descriptions) plus the
+optional `semantic_layer/routing_rules.yml`, then compiled into a
+`KeywordMatcher`. Rules are rebuilt when any of those files change, so
+keyword edits take effect without restarting the bot.
+"""
+
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Mapping, Optional, Set, Tuple
+
+import yaml
+
+from core.services.semantic_layer import SEMANTIC_LAYER_DIR, SemanticModel, get_models
+
+RULES_FILE = SEMANTIC_LAYER_DIR / "routing_rules.yml"
+
+# Keyword weights by source
+NAME_WEIGHT = 3.0
+RULE_WEIGHT = 3.0
+FIELD_WEIGHT = 1.0
+DESCRIPTION_WEIGHT = 0.5
+
+# Inflections accepted on keyword words of 4+ letters ("forecast" ->
+# "forecasting", "order" -> "orders"); short words like "hi" or "yo" must
+# match exactly.
+_INFLECTIONS = ("ations", "ation", "ions", "ion", "ing", "es", "ed", "s", "d")
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+_WORD = re.compile(r"[a-z][a-z0-9]+")
+_END = "$"
+
+# Words too generic to point at a dataset, on top of the rules file `ignore`
+_STOPWORDS = {
+    "the", "and", "for", "with", "from", "into", "that", "this", "their", "its",
+    "all", "are", "was", "based", "during", "including", "performed", "main",
+    "made", "used", "when", "which", "what", "how", "in", "of", "on", "to", "by",
+    "if", "applicable", "or", "e", "g",
+}
+
+
+# ---------- keyword matcher ----------
+
+@dataclass(frozen=True)
+class Signals:
+    """Keyword signals found in a message."""
+    found: FrozenSet[str]
+    leading: FrozenSet[str]  # signals whose keyword starts the message
+    scores: Mapping[str, float] = field(default_factory=dict)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.found
+
+
+@lru_cache(maxsize=4096)
+def _token_forms(token: str) -> Tuple[str, ...]:
+    """The token plus its base forms with an inflection removed."""
+    forms = [token]
+    for suffix in _INFLECTIONS:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 4:
+            forms.append(token[:-len(suffix)])
+    return tuple(forms)
+
+
+class KeywordMatcher:
+    """
+    Single-pass matcher over weighted keyword tables.
+
+    Keywords are compiled into a trie over word tokens. Each node maps a
+    token to its child; the `_END` entry holds {signal: weight} for the
+    keyword ending there, so one walk reports every keyword along its path
+    ("show" and "show queries"). Matching is whole-word.
+    """
+
+    def __init__(self, tables: Mapping[str, Mapping[str, float]]):
+        self._trie: dict = {}
+        for name, keywords in tables.items():
+            for keyword, weight in keywords.items():
+                tokens = _TOKEN.findall(keyword.lower())
+                if not tokens:
+                    continue
+                node = self._trie
+                for token in tokens:
+                    node = node.setdefault(token, {})
+                ends = node.setdefault(_END, {})
+                ends[name] = max(ends.get(name, 0.0), weight)
+
+    def scan(self, lower: str) -> Signals:
+        """
+        Find every keyword signal in `lower` (already lowercased and
+        stripped) with one tokenization pass and a trie walk from each token.
+        Scores add up the weights of every keyword occurrence per signal.
+        """
+        tokens = _TOKEN.findall(lower)
+        scores: Dict[str, float] = defaultdict(float)
+        leading: Set[str] = set()
+        for start in range(len(tokens)):
+            node = self._trie
+            for token in tokens[start:]:
+                for form in _token_forms(token):
+                    child = node.get(form)
+                    if child is not None:
+                        break
+                else:
+                    break
+                node = child
+                ends = node.get(_END)
+                if ends:
+                    for name, weight in ends.items():
+                        scores[name] += weight
+                    if start == 0:
+                        leading.update(ends)
+        return Signals(found=frozenset(scores), leading=frozenset(leading), scores=dict(scores))
+
+
+# ---------- rules built from the semantic layer ----------
+
+@dataclass
+class RoutingRules:
+    """Weighted dataset keywords and the matcher compiled from them."""
+    version: int
+    datasets: Dict[str, Dict[str, float]]
+    matcher: KeywordMatcher
+
+
+def _read_rules_file(path) -> dict:
+    if not path.exists():
+        return {}
+    try:
+        content = yaml.safe_load(path.read_text())
+    except yaml.YAMLError:
+        return {}
+    return content if isinstance(content, dict) else {}
+
+
+def _words(text: str, ignore: Set[str]) -> Set[str]:
+    return {w for w in _WORD.findall(text.lower()) if len(w) > 2 and w not in ignore}
+
+
+def build_dataset_keywords(models: Mapping[str, SemanticModel], rules: dict) -> Dict[str, Dict[str, float]]:
+    """
+    Weighted keywords per dataset.
+
+    Model/table names and rules-file keywords weigh the most. Words taken
+    from fields, measures and example values, and from descriptions, are
+    divided by the number of datasets that share them, so a word like
+    "user" (from `user_id` in every table) barely moves the score.
+    """
+    ignore = _STOPWORDS | {str(w).lower() for w in rules.get("ignore") or []}
+
+    derived: Dict[str, Dict[str, float]] = {}
+    for name, model in models.items():
+        words: Dict[str, float] = {}
+
+        def add(word: str, weight: float) -> None:
+            words[word] = max(words.get(word, 0.0), weight)
+
+        for f in model.fields:
+            add(f.name.replace("_", " "), FIELD_WEIGHT)
+            for word in _words(f.name.replace("_", " "), ignore):
+                add(word, FIELD_WEIGHT)
+            for value in f.example_values:
+                add(value, FIELD_WEIGHT)
+            for word in _words(f.description, ignore):
+                add(word, DESCRIPTION_WEIGHT)
+        for m in model.measures:
+            for word in _words(m.name.replace("_", " "), ignore):
+                add(word, FIELD_WEIGHT)
+            for word in _words(m.description, ignore):
+                add(word, DESCRIPTION_WEIGHT)
+        for word in _words(model.description, ignore):
+            add(word, DESCRIPTION_WEIGHT)
+        derived[name] = words
+
+    shared: Dict[str, int] = defaultdict(int)
+    for words in derived.values():
+        for word in words:
+            shared[word] += 1
+
+    datasets: Dict[str, Dict[str, float]] = {}
+    for name, model in models.items():
+        keywords = {word: weight / shared[word] for word, weight in derived[name].items()}
+        for word in {name, model.table, name.rstrip("s")}:
+            keywords[word] = NAME_WEIGHT
+        datasets[name] = keywords
+
+    for name, spec in (rules.get("datasets") or {}).items():
+        if not isinstance(spec, dict):
+            continue
+        weight = float(spec.get("weight", RULE_WEIGHT))
+        keywords = datasets.setdefault(name, {})
+        for keyword in spec.get("keywords") or []:
+            keyword = str(keyword).lower()
+            keywords[keyword] = max(keywords.get(keyword, 0.0), weight)
+    return datasets
+
+
+class _RulesCache:
+    """
+    Holds the compiled rules and rebuilds them when the semantic layer or
+    the rules file changes. Files are checked at most every
+    ROUTING_RULES_CHECK_SECONDS (default 5) so routing stays cheap.
+    """
+
+    def __init__(self, rules_file):
+        self.rules_file = rules_file
+        self._lock = threading.Lock()
+        self._rules: Optional[RoutingRules] = None
+        self._signature: Optional[Tuple] = None
+        self._checked_at = 0.0
+
+    def _current_signature(self) -> Tuple:
+        directory = self.rules_file.parent
+        if not directory.exists():
+            return ()
+        return tuple((p.name, p.stat().st_mtime_ns) for p in sorted(directory.glob("*.yml")))
+
+    def get(self, force: bool = False) -> RoutingRules:
+        interval = float(os.environ.get("ROUTING_RULES_CHECK_SECONDS", "5"))
+        now = time.monotonic()
+        rules = self._rules
+        if rules is not None and not force and now - self._checked_at < interval:
+            return rules
+
+        with self._lock:
+            signature = self._current_signature()
+            if self._rules is None or force or signature != self._signature:
+                datasets = build_dataset_keywords(get_models(), _read_rules_file(self.rules_file))
+                version = (self._rules.version + 1) if self._rules else 1
+                self._rules = RoutingRules(version=version, datasets=datasets, matcher=KeywordMatcher(datasets))
+                self._signature = signature
+            self._checked_at = now
+            return self._rules
+
+
+_cache = _RulesCache(RULES_FILE)
+
+
+def get_routing_rules() -> RoutingRules:
+    """Current routing rules (rebuilt automatically when files change)."""
+    return _cache.get()
+
+
+def reload_routing_rules() -> RoutingRules:
+    """Rebuild the routing rules now, regardless of file changes."""
+    return _cache.get(force=True)
+
+
+def pick_dataset(scores: Mapping[str, float], datasets: List[str], min_score: float = 1.0) -> Optional[str]:
+    """
+    Highest-scoring dataset, or None when nothing reaches `min_score`.
+    Ties go to the dataset listed last.
+    """
+    best, best_score = None, min_score
+    for name in datasets:
+        score = scores.get(name, 0.0)
+        if score >= best_score:
+            best, best_score = name, score
+    return best
+
+
+def infer_dataset(text: str) -> Optional[str]:
+    """The dataset a question is about according to the routing rules, if any."""
+    rules = get_routing_rules()
+    signals = rules.matcher.scan(text.lower().strip())
+    return pick_dataset(signals.scores, list(rules.datasets))
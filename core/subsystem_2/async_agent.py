@@ -0,0 +1,321 @@
+# core/subsystem_2/async_agent.py
+"""
+Asyncio versions of the data agent entry points used by main_async.py.
+
+Postgres access goes through `core.services.async_db` and the insight LLM
+calls through LiteLLM's async client, so hundreds of questions can be in
+flight on one event loop. Parsing, validation, forecasting and formatting
+are shared with the sync agent in `pandas_agent`; forecasts come from the
+same forecast store and response cache, with refits on a worker thread.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Optional
+
+import psycopg2
+
+from core.messages import INSIGHTS_PENDING
+from core.services import async_db
+from core.services.forecast_store import get_forecast_store
+from core.services.insights import StageTimer, collect_insight_async
+from core.services.measure_resolver import (
+    MeasureQuery,
+    format_measure_answer,
+    measure_fast_path_enabled,
+    resolve_measure,
+)
+from core.services.progressive_reply import report
+from core.services.query_guard import (
+    GuardConfig,
+    PlanCheck,
+    check_plan,
+    read_only_prelude,
+    take_pending,
+    track_query,
+)
+from core.services.response_cache import get_response_cache, normalize_question
+from core.services.single_flight import get_async_single_flight
+from core.services.sql_stream import explain_sql, fetch_bounded, is_wrappable
+from core.services.sql_validator import sql_fingerprint
+from core.subsystem_2 import pandas_agent
+from core.subsystem_2.pandas_agent import (
+    NO_PENDING_QUERY_RESPONSE,
+    PANDASAI_AVAILABLE,
+    _assemble_prediction_response,
+    _assemble_sql_response,
+    _detect_prediction_segment,
+    _format_prediction_response,
+    _format_segmented_prediction_response,
+    _format_query_result,
+    _insufficient_history_response,
+    _prediction_error_response,
+    _prediction_insight_request,
+    _plan_guard_response,
+    _prepare_sql,
+    _query_stopped_response,
+    _segmented_insight_request,
+    _sql_error_response,
+    _sql_insight_request,
+)
+
+if PANDASAI_AVAILABLE:
+    from core.services.pandasai_service import (
+        analyze_with_llm_async,
+        explain_with_llm_async,
+    )
+
+logger = logging.getLogger(__name__)
+
+# PandasAI's SmartDataframe.chat is synchronous, so data questions run on
+# worker threads; this caps how many run at once.
+_pandasai_slots = None
+
+
+def _get_pandasai_slots() -> asyncio.Semaphore:
+    global _pandasai_slots
+    if _pandasai_slots is None:
+        _pandasai_slots = asyncio.Semaphore(int(os.environ.get("ASYNC_PANDASAI_CONCURRENCY", "8")))
+    return _pandasai_slots
+
+
+async def _check_plan_async(sql: str, guard: GuardConfig) -> PlanCheck:
+    if not is_wrappable(sql):
+        return PlanCheck(verdict="ok")
+    rows = await async_db.fetch_all(explain_sql(sql))
+    return check_plan(next(iter(rows[0].values())) if rows else None, guard)
+
+
+async def _execute_sql_answer_async(sql: str, check: PlanCheck, user: Optional[str], guard: GuardConfig,
+                                    timer: StageTimer, progress: Optional[Callable[[str], None]] = None) -> str:
+    """Async counterpart of `pandas_agent._execute_sql_answer`."""
+    running = None
+    try:
+        with timer.stage("query"):
+            task = asyncio.ensure_future(
+                fetch_bounded(sql, estimate=check.rows, prelude=read_only_prelude(guard.timeout_ms))
+            )
+            with track_query(user, sql, task.cancel) as running:
+                try:
+                    result = await task
+                except asyncio.CancelledError:
+                    if not running.cancelled:
+                        raise
+                    return _query_stopped_response(True, guard.timeout_ms)
+    except psycopg2.errors.QueryCanceled:
+        return _query_stopped_response(bool(running and running.cancelled), guard.timeout_ms)
+    result_rows = result.rows
+
+    # The explanation runs as its own task while the results are formatted and shown
+    insight = None
+    if PANDASAI_AVAILABLE:
+        insight = asyncio.ensure_future(
+            explain_with_llm_async(*_sql_insight_request(sql, result_rows, result.total_rows))
+        )
+    with timer.stage("format"):
+        base_results = _format_query_result(result)
+
+    llm_explanation = ""
+    if insight is not None:
+        report(progress, _assemble_sql_response(base_results, "") + INSIGHTS_PENDING)
+        with timer.stage("insights"):
+            llm_explanation = await collect_insight_async(insight)
+    timer.finish()
+
+    return _assemble_sql_response(base_results, llm_explanation)
+
+
+async def run_sql_query_async(sql_text: str, user: Optional[str] = None, confirmed: bool = False,
+                              progress: Optional[Callable[[str], None]] = None) -> str:
+    """
+    Async counterpart of `pandas_agent.run_sql_query`. The query runs as
+    its own task so cancelling it (from a "cancel" message) sends a
+    server-side cancel without cancelling the Slack handler; identical
+    queries in flight share that task.
+    """
+    guard = GuardConfig.from_env()
+    timer = StageTimer("sql_query")
+    try:
+        sql, error_response = _prepare_sql(sql_text)
+        if error_response:
+            return error_response
+
+        check = PlanCheck(verdict="ok")
+        if not confirmed:
+            with timer.stage("plan"):
+                check = await _check_plan_async(sql, guard)
+            if check.verdict != "ok":
+                return _plan_guard_response(sql, check, user)
+
+        return await get_async_single_flight().do(
+            # Per user: "cancel" stops the asker's own run, never someone else's answer
+            ("sql_query", user, sql_fingerprint(sql)),
+            lambda shared_progress: _execute_sql_answer_async(sql, check, user, guard, timer, shared_progress),
+            progress,
+        )
+
+    except Exception as e:
+        return _sql_error_response(e)
+
+
+async def run_confirmed_sql_query_async(user: Optional[str],
+                                        progress: Optional[Callable[[str], None]] = None) -> str:
+    """Async counterpart of `pandas_agent.run_confirmed_sql_query`."""
+    pending = take_pending(user)
+    if pending is None:
+        return NO_PENDING_QUERY_RESPONSE
+    return await run_sql_query_async(pending.sql, user=user, confirmed=True, progress=progress)
+
+
+async def _cached_answer_async(kind: str, dataset_name: str, question: str,
+                               compute: Callable[[], Awaitable[str]]) -> str:
+    """Async counterpart of `pandas_agent._cached_answer`."""
+    cache = get_response_cache()
+    watermark = await asyncio.to_thread(pandas_agent._dataset_watermark, dataset_name)
+    answer = cache.get(kind, dataset_name, question, watermark)
+    if answer is not None:
+        return answer
+
+    answer = await compute()
+    if "⚠️" not in answer:
+        cache.put(kind, dataset_name, question, answer, watermark)
+    return answer
+
+
+async def run_subscription_prediction_async(question: str,
+                                            progress: Optional[Callable[[str], None]] = None) -> str:
+    """
+    Async counterpart of `pandas_agent.run_subscription_prediction`.
+
+    Forecasts come from the forecast store like in the sync agent; a refit
+    (a query plus CPU-bound backtesting) runs on a worker thread so it does
+    not block the event loop.
+    """
+    segment = _detect_prediction_segment(question)
+    if segment:
+        return await _cached_answer_async(
+            f"prediction:{segment}", "subscriptions", question,
+            lambda: _run_segmented_prediction_async(question, segment, progress),
+        )
+    return await _cached_answer_async(
+        "prediction", "subscriptions", question,
+        lambda: _run_subscription_prediction_async(question, progress),
+    )
+
+
+async def _run_subscription_prediction_async(question: str,
+                                             progress: Optional[Callable[[str], None]] = None) -> str:
+    """
+    Async counterpart of `pandas_agent._run_subscription_prediction`.
+    """
+    timer = StageTimer("prediction")
+    try:
+        with timer.stage("forecast"):
+            stored = await asyncio.to_thread(get_forecast_store().get, "new_subscriptions")
+            historical_data, slope, forecast = stored.value
+
+        if forecast is None:
+            return _insufficient_history_response(len(historical_data))
+        predictions = forecast.predictions
+
+        insight = None
+        if PANDASAI_AVAILABLE:
+            insight = asyncio.ensure_future(analyze_with_llm_async(
+                *_prediction_insight_request(question, historical_data, predictions, slope, forecast)
+            ))
+        with timer.stage("format"):
+            base_response = _format_prediction_response(historical_data, predictions, slope, forecast)
+
+        llm_insight = ""
+        if insight is not None:
+            report(progress, _assemble_prediction_response(base_response, "") + INSIGHTS_PENDING)
+            with timer.stage("insights"):
+                llm_insight = await collect_insight_async(insight)
+        timer.finish()
+
+        return _assemble_prediction_response(base_response, llm_insight)
+
+    except Exception as e:
+        return _prediction_error_response(e)
+
+
+async def _run_segmented_prediction_async(question: str, segment: str,
+                                          progress: Optional[Callable[[str], None]] = None) -> str:
+    """
+    Async counterpart of `pandas_agent._run_segmented_prediction`.
+    """
+    timer = StageTimer("prediction")
+    try:
+        with timer.stage("forecast"):
+            stored = await asyncio.to_thread(get_forecast_store().get, "new_subscriptions", segment)
+            months, ranked, level = stored.value
+
+        if months < 6:
+            return _insufficient_history_response(months)
+
+        insight = None
+        if PANDASAI_AVAILABLE:
+            insight = asyncio.ensure_future(
+                analyze_with_llm_async(*_segmented_insight_request(question, segment, ranked))
+            )
+        with timer.stage("format"):
+            base_response = _format_segmented_prediction_response(segment, ranked, level)
+
+        llm_insight = ""
+        if insight is not None:
+            report(progress, _assemble_prediction_response(base_response, "") + INSIGHTS_PENDING)
+            with timer.stage("insights"):
+                llm_insight = await collect_insight_async(insight)
+        timer.finish()
+
+        return _assemble_prediction_response(base_response, llm_insight)
+
+    except Exception as e:
+        return _prediction_error_response(e)
+
+
+async def _answer_measure_question_async(query: MeasureQuery) -> Optional[str]:
+    """Async counterpart of `pandas_agent._answer_measure_question`."""
+    timer = StageTimer("measure_query")
+    try:
+        with timer.stage("query"):
+            rows = await async_db.fetch_all(query.sql, query.params)
+    except Exception as e:
+        logger.warning("Measure query %s.%s failed, falling back to PandasAI: %s", query.model, query.measure, e)
+        return None
+    with timer.stage("format"):
+        answer = format_measure_answer(query, rows)
+    timer.finish()
+    return answer
+
+
+async def run_data_question_async(dataset_name: str, question: str,
+                                  progress: Optional[Callable[[str], None]] = None) -> str:
+    """
+    Async counterpart of `pandas_agent.run_data_question`.
+
+    Single-measure questions are answered on the event loop with one query.
+    PandasAI generates and executes pandas code synchronously, so the call
+    runs on a worker thread bounded by ASYNC_PANDASAI_CONCURRENCY; progress
+    reports from that thread are handed back to the event loop. The same
+    question asked while it is being answered shares that run.
+    """
+    if measure_fast_path_enabled():
+        query = resolve_measure(question, dataset_name)
+        answer = await _answer_measure_question_async(query) if query is not None else None
+        if answer is not None:
+            return answer
+
+    async def answer(shared_progress) -> str:
+        args = (dataset_name, question)
+        if progress is not None:
+            loop = asyncio.get_running_loop()
+            args += (lambda text: loop.call_soon_threadsafe(shared_progress, text),)
+        async with _get_pandasai_slots():
+            return await asyncio.to_thread(pandas_agent.run_data_question, *args)
+
+    # Duplicates wait here instead of taking a PandasAI slot and a thread
+    return await get_async_single_flight().do(
+        ("data_question", dataset_name, normalize_question(question)), answer, progress
+    )
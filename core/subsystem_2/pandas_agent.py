@@ -1,14 +1,51 @@
 # core/subsystem_2/pandas_agent.py
 
+import logging
 import os
 import re
 import yaml
+from datetime import date, timedelta
 from pathlib import Path
-from typing import List, Optional, Tuple, Dict, Any
+from typing import Callable, List, Optional, Tuple, Dict, Any
 
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
+from core.messages import INSIGHTS_PENDING
+from core.services.db_pool import get_connection
+from core.services.forecast_store import get_forecast_store
+from core.services.forecasting import Forecast, forecast_monthly, forecast_segments
+from core.services.insights import StageTimer, collect_insight, start_insight
+from core.services.llm_gateway import LLMUnavailable, get_llm_gateway
+from core.services.measure_resolver import (
+    MeasureQuery,
+    format_measure_answer,
+    measure_fast_path_enabled,
+    resolve_measure,
+)
+from core.services.progressive_reply import report
+from core.services.query_guard import (
+    GuardConfig,
+    PlanCheck,
+    begin_read_only,
+    cancel_queries,
+    drop_pending,
+    explain_query,
+    park_query,
+    take_pending,
+    track_query,
+)
+from core.services.incremental import get_series
+from core.services.response_cache import get_response_cache, normalize_question
+from core.services.rollups import cached_rollup_table, rollup_table
+from core.services.single_flight import get_single_flight
+from core.services.sql_stream import QueryResult, execute_bounded
+from core.services.sql_validator import sql_fingerprint, validate_sql
+from core.services.table_loader import EU_COUNTRIES, detect_time_window, table_watermark
+from core.subsystem_1.routing_rules import infer_dataset
+
+logger = logging.getLogger(__name__)
+
 # Import PandasAI service
 try:
     from core.services.pandasai_service import query_with_pandasai
@@ -18,68 +55,107 @@ except ImportError:
     query_with_pandasai = None
 
 
-def _get_connection():
+def _get_connection(statement_timeout_ms: Optional[int] = None):
     """
-    Create a new Postgres connection using env vars.
+    Check out a Postgres connection from the shared pool.
+    Use as a context manager; the connection is returned on exit.
     """
-    conn = psycopg2.connect(
-        host=os.environ["DB_HOST"],
-        port=int(os.environ.get("DB_PORT", "5432")),
-        user=os.environ["DB_USER"],
-        password=os.environ["DB_PASS"],
-        dbname=os.environ["DB_NAME"],
-        sslmode=os.environ.get("DB_SSLMODE", "require"),
-    )
-    return conn
+    return get_connection(statement_timeout_ms=statement_timeout_ms)
 
 
-def _detect_payments_time_window(question: str) -> Tuple[Optional[int], str]:
+def _dataset_watermark(dataset_name: str):
     """
-    Very simple heuristic:
-    - 'last week'      -> 7 days
-    - 'last month'     -> 30 days
-    - 'last quarter'   -> 90 days
-    - 'last year'      -> 365 days
-    - otherwise        -> None (all time)
-    Returns (window_days, human_label)
+    Current data watermark of a dataset (None if unknown or unreachable).
+    Used to key cached answers so new rows make them unreachable.
     """
-    q = question.lower()
+    try:
+        with _get_connection() as conn:
+            return table_watermark(conn, dataset_name)
+    except Exception:
+        return None
 
-    if "last week" in q or "past week" in q:
-        return 7, "last 7 days"
-    if "last month" in q or "past month" in q:
-        return 30, "last 30 days"
-    if "last quarter" in q or "past quarter" in q:
-        return 90, "last 90 days"
-    if "last year" in q or "past year" in q:
-        return 365, "last 365 days"
 
-    return None, "all time"
+def _cached_answer(kind: str, dataset_name: str, question: str, compute) -> str:
+    """
+    Serve `question` from the response cache, or compute and cache it.
+    Replies containing a warning (errors, missing data) are never cached.
+    """
+    cache = get_response_cache()
+    watermark = _dataset_watermark(dataset_name)
+    answer = cache.get(kind, dataset_name, question, watermark)
+    if answer is not None:
+        return answer
+    
+    answer = compute()
+    if "⚠️" not in answer:
+        cache.put(kind, dataset_name, question, answer, watermark)
+    return answer
 
 
-def _query_total_payments(window_days: Optional[int]) -> float:
+def _detect_payments_time_window(question: str) -> Tuple[Optional[int], str]:
     """
-    Query total payments (sum of amount_usd) from the payments table,
-    optionally over the last N days.
+    Detect the time window of a question (see `table_loader.detect_time_window`).
+    Returns (window_days, human_label)
     """
-    base_sql = "SELECT COALESCE(SUM(amount_usd), 0) AS total_revenue_usd FROM payments"
-    params = ()
+    return detect_time_window(question)
 
-    if window_days is not None:
-        base_sql += " WHERE payment_date >= CURRENT_DATE - INTERVAL %s"
-        params = (f"{window_days} days",)
 
-    conn = _get_connection()
-    try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(base_sql, params)
-            row = cur.fetchone() or {}
-            return float(row.get("total_revenue_usd", 0.0))
-    finally:
-        conn.close()
+def _query_total_payments(window_days: Optional[int]) -> float:
+    """
+    Query total payments (sum of amount_usd), optionally over the last N days.
+    Daily revenue is kept in an incremental series, so only payments after
+    the last high-water mark are read from the payments table.
+    """
+    series = get_series("payments")
+    with _get_connection() as conn:
+        series.refresh(conn)
+    since = date.today() - timedelta(days=window_days) if window_days is not None else None
+    return series.totals(since)["sum_amount_usd"]
 
 # ---------- USERS QUERIES ----------
 
+# One scan: the total and both top-5 breakdowns via GROUPING SETS.
+# grp = GROUPING(country, device_type): 1 = by country, 2 = by device, 3 = total
+USERS_OVERVIEW_SQL = """
+WITH grouped AS (
+  SELECT
+    GROUPING(country, device_type) AS grp,
+    country,
+    device_type,
+    COUNT(*) AS users
+  FROM users
+  GROUP BY GROUPING SETS ((), (country), (device_type))
+), ranked AS (
+  SELECT *, ROW_NUMBER() OVER (PARTITION BY grp ORDER BY users DESC) AS rank
+  FROM grouped
+)
+SELECT grp, country, device_type, users
+FROM ranked
+WHERE grp = 3 OR rank <= 5
+ORDER BY grp, rank;
+"""
+
+# Same shape from rollup_users_daily (one row per day/country/device)
+USERS_OVERVIEW_ROLLUP_SQL = """
+WITH grouped AS (
+  SELECT
+    GROUPING(country, device_type) AS grp,
+    country,
+    device_type,
+    SUM(row_count) AS users
+  FROM rollup_users_daily
+  GROUP BY GROUPING SETS ((), (country), (device_type))
+), ranked AS (
+  SELECT *, ROW_NUMBER() OVER (PARTITION BY grp ORDER BY users DESC) AS rank
+  FROM grouped
+)
+SELECT grp, country, device_type, users
+FROM ranked
+WHERE grp = 3 OR rank <= 5
+ORDER BY grp, rank;
+"""
+
+
 def _query_users_overview() -> dict:
     """
     Returns:
@@ -89,47 +165,79 @@ def _query_users_overview() -> dict:
         "devices": list[dict{name, users}],
       }
     """
-    conn = _get_connection()
-    try:
-        result: dict = {}
-
+    with _get_connection() as conn:
+        sql = USERS_OVERVIEW_ROLLUP_SQL if rollup_table(conn, "users") else USERS_OVERVIEW_SQL
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            # total users
-            cur.execute("SELECT COUNT(*) AS total_users FROM users;")
-            row = cur.fetchone() or {}
-            result["total_users"] = int(row.get("total_users", 0))
-
-            # top countries (if country exists)
-            cur.execute(
-                """
-                SELECT country AS name, COUNT(*) AS users
-                FROM users
-                GROUP BY country
-                ORDER BY users DESC
-                LIMIT 5;
-                """
-            )
-            result["countries"] = cur.fetchall() or []
-
-            # top device types (if device_type exists)
-            cur.execute(
-                """
-                SELECT device_type AS name, COUNT(*) AS users
-                FROM users
-                GROUP BY device_type
-                ORDER BY users DESC
-                LIMIT 5;
-                """
-            )
-            result["devices"] = cur.fetchall() or []
+            cur.execute(sql)
+            rows = cur.fetchall() or []
 
-        return result
-    finally:
-        conn.close()
+    result: dict = {"total_users": 0, "countries": [], "devices": []}
+    for row in rows:
+        if row["grp"] == 3:
+            result["total_users"] = int(row["users"])
+        elif row["grp"] == 1:
+            result["countries"].append({"name": row["country"], "users": row["users"]})
+        elif row["grp"] == 2:
+            result["devices"].append({"name": row["device_type"], "users": row["users"]})
+    return result
 
 
 # ---------- SUBSCRIPTIONS QUERIES ----------
 
+# One scan: totals and active subs per plan via FILTER aggregates and
+# GROUPING SETS. grp = GROUPING(plan): 0 = per plan, 1 = overall.
+# Dates are compared by day, as in the rollup below, so both agree.
+SUBSCRIPTIONS_OVERVIEW_SQL = """
+WITH flagged AS (
+  SELECT
+    plan,
+    (start_date::date <= CURRENT_DATE AND (end_date IS NULL OR end_date::date > CURRENT_DATE)) AS is_active,
+    (end_date IS NOT NULL AND end_date::date <= CURRENT_DATE) AS is_churned
+  FROM subscriptions
+), grouped AS (
+  SELECT
+    GROUPING(plan) AS grp,
+    plan,
+    COUNT(*) AS total_subscriptions,
+    COUNT(*) FILTER (WHERE is_active) AS active_subscriptions,
+    COUNT(*) FILTER (WHERE is_churned) AS churned_subscriptions
+  FROM flagged
+  GROUP BY GROUPING SETS ((), (plan))
+), ranked AS (
+  SELECT *, ROW_NUMBER() OVER (PARTITION BY grp ORDER BY active_subscriptions DESC) AS rank
+  FROM grouped
+)
+SELECT grp, plan, total_subscriptions, active_subscriptions, churned_subscriptions
+FROM ranked
+WHERE grp = 1 OR (rank <= 5 AND active_subscriptions > 0)
+ORDER BY grp DESC, rank;
+"""
+
+# Same shape from rollup_subscriptions_daily: starts are counted on their
+# start day (row_count) and ends on their end day (end_date_count), so
+# active = starts up to today - ends up to today.
+SUBSCRIPTIONS_OVERVIEW_ROLLUP_SQL = """
+WITH grouped AS (
+  SELECT
+    GROUPING(plan) AS grp,
+    plan,
+    COALESCE(SUM(row_count), 0) AS total_subscriptions,
+    COALESCE(SUM(row_count) FILTER (WHERE day <= CURRENT_DATE), 0)
+      - COALESCE(SUM(end_date_count) FILTER (WHERE day <= CURRENT_DATE), 0) AS active_subscriptions,
+    COALESCE(SUM(end_date_count) FILTER (WHERE day <= CURRENT_DATE), 0) AS churned_subscriptions
+  FROM rollup_subscriptions_daily
+  GROUP BY GROUPING SETS ((), (plan))
+), ranked AS (
+  SELECT *, ROW_NUMBER() OVER (PARTITION BY grp ORDER BY active_subscriptions DESC) AS rank
+  FROM grouped
+)
+SELECT grp, plan, total_subscriptions, active_subscriptions, churned_subscriptions
+FROM ranked
+WHERE grp = 1 OR (rank <= 5 AND active_subscriptions > 0)
+ORDER BY grp DESC, rank;
+"""
+
+
 def _query_subscriptions_overview() -> dict:
     """
     Returns basic subscription metrics:
@@ -138,61 +246,55 @@ def _query_subscriptions_overview() -> dict:
       - churned subscriptions
       - active subs by plan
     """
-    conn = _get_connection()
-    try:
-        result: dict = {}
-
+    with _get_connection() as conn:
+        sql = SUBSCRIPTIONS_OVERVIEW_ROLLUP_SQL if rollup_table(conn, "subscriptions") else SUBSCRIPTIONS_OVERVIEW_SQL
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            # total
-            cur.execute("SELECT COUNT(*) AS total_subscriptions FROM subscriptions;")
-            row = cur.fetchone() or {}
-            result["total_subscriptions"] = int(row.get("total_subscriptions", 0))
-
-            # active = end_date is NULL or in the future
-            cur.execute(
-                """
-                SELECT COUNT(*) AS active_subscriptions
-                FROM subscriptions
-                WHERE start_date <= CURRENT_DATE
-                  AND (end_date IS NULL OR end_date > CURRENT_DATE);
-                """
-            )
-            row = cur.fetchone() or {}
-            result["active_subscriptions"] = int(row.get("active_subscriptions", 0))
-
-            # churned = end_date in the past
-            cur.execute(
-                """
-                SELECT COUNT(*) AS churned_subscriptions
-                FROM subscriptions
-                WHERE end_date IS NOT NULL
-                  AND end_date <= CURRENT_DATE;
-                """
-            )
-            row = cur.fetchone() or {}
-            result["churned_subscriptions"] = int(row.get("churned_subscriptions", 0))
-
-            # active subs by plan
-            cur.execute(
-                """
-                SELECT plan, COUNT(*) AS active_subscriptions
-                FROM subscriptions
-                WHERE start_date <= CURRENT_DATE
-                  AND (end_date IS NULL OR end_date > CURRENT_DATE)
-                GROUP BY plan
-                ORDER BY active_subscriptions DESC
-                LIMIT 5;
-                """
-            )
-            result["plans"] = cur.fetchall() or []
-
-        return result
-    finally:
-        conn.close()
+            cur.execute(sql)
+            rows = cur.fetchall() or []
+
+    result: dict = {
+        "total_subscriptions": 0,
+        "active_subscriptions": 0,
+        "churned_subscriptions": 0,
+        "plans": [],
+    }
+    for row in rows:
+        if row["grp"] == 1:
+            result["total_subscriptions"] = int(row["total_subscriptions"])
+            result["active_subscriptions"] = int(row["active_subscriptions"])
+            result["churned_subscriptions"] = int(row["churned_subscriptions"])
+        else:
+            result["plans"].append({"plan": row["plan"], "active_subscriptions": row["active_subscriptions"]})
+    return result
 
 
 # ---------- SESSIONS QUERIES ----------
 
+# One scan: overall metrics and the top-5 activities by minutes.
+# Stays on the raw table: COUNT(DISTINCT user_id) can't be rolled up.
+# grp = GROUPING(activity_type): 0 = per activity, 1 = overall
+SESSIONS_OVERVIEW_SQL = """
+WITH grouped AS (
+  SELECT
+    GROUPING(activity_type) AS grp,
+    activity_type,
+    COUNT(*) AS sessions,
+    COUNT(DISTINCT user_id) AS active_users,
+    AVG(duration_minutes) AS avg_duration,
+    SUM(duration_minutes) AS minutes
+  FROM sessions
+  GROUP BY GROUPING SETS ((), (activity_type))
+), ranked AS (
+  SELECT *, ROW_NUMBER() OVER (PARTITION BY grp ORDER BY minutes DESC NULLS LAST) AS rank
+  FROM grouped
+)
+SELECT grp, activity_type, sessions, active_users, avg_duration, minutes
+FROM ranked
+WHERE grp = 1 OR rank <= 5
+ORDER BY grp DESC, rank;
+"""
+
+
 def _query_sessions_overview() -> dict:
     """
     Returns:
@@ -201,74 +303,154 @@ def _query_sessions_overview() -> dict:
       - avg duration
       - top activities by minutes
     """
-    conn = _get_connection()
-    try:
-        result: dict = {}
-
+    with _get_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            # basic metrics
-            cur.execute(
-                """
-                SELECT
-                  COUNT(*) AS total_sessions,
-                  COUNT(DISTINCT user_id) AS active_users,
-                  AVG(duration_minutes) AS avg_duration
-                FROM sessions;
-                """
-            )
-            row = cur.fetchone() or {}
-            result["total_sessions"] = int(row.get("total_sessions", 0))
-            result["active_users"] = int(row.get("active_users", 0))
-            result["avg_duration"] = float(row.get("avg_duration") or 0.0)
-
-            # activity mix (top 5)
-            cur.execute(
-                """
-                SELECT
-                  activity_type,
-                  COUNT(*) AS sessions,
-                  SUM(duration_minutes) AS minutes
-                FROM sessions
-                GROUP BY activity_type
-                ORDER BY minutes DESC
-                LIMIT 5;
-                """
-            )
-            result["activities"] = cur.fetchall() or []
+            cur.execute(SESSIONS_OVERVIEW_SQL)
+            rows = cur.fetchall() or []
 
-        return result
-    finally:
-        conn.close()
+    result: dict = {"total_sessions": 0, "active_users": 0, "avg_duration": 0.0, "activities": []}
+    for row in rows:
+        if row["grp"] == 1:
+            result["total_sessions"] = int(row["sessions"])
+            result["active_users"] = int(row["active_users"])
+            result["avg_duration"] = float(row["avg_duration"] or 0.0)
+        else:
+            result["activities"].append({
+                "activity_type": row["activity_type"],
+                "sessions": row["sessions"],
+                "minutes": row["minutes"],
+            })
+    return result
 
 
 # ---------- PREDICTION FUNCTIONS ----------
 
-def _get_historical_new_subscriptions() -> List[Tuple[int, int, int]]:
+HISTORICAL_NEW_SUBSCRIPTIONS_SQL = """
+    SELECT 
+      EXTRACT(YEAR FROM start_date)::INTEGER AS year,
+      EXTRACT(MONTH FROM start_date)::INTEGER AS month,
+      COUNT(*)::INTEGER AS new_subscriptions
+    FROM subscriptions
+    WHERE start_date >= CURRENT_DATE - INTERVAL '3 years'
+    GROUP BY year, month
+    ORDER BY year, month;
+"""
+
+
+def _rows_to_monthly_series(rows: List[Dict[str, Any]]) -> List[Tuple[int, int, int]]:
+    """Convert (year, month, new_subscriptions) dict rows into tuples."""
+    return [(int(row["year"]), int(row["month"]), int(row["new_subscriptions"])) for row in rows]
+
+
+def _get_historical_new_subscriptions(force: bool = False) -> List[Tuple[int, int, int]]:
     """
-    Query subscriptions table for monthly counts of new subscriptions.
+    Monthly counts of new subscriptions over the last 3 years, from the
+    incremental daily series (only new or late rows are read on refresh).
+
+    Args:
+        force: Check the source now even if the series was checked within
+            INCREMENTAL_CHECK_SECONDS
     
     Returns:
         List of tuples: [(year, month, count), ...] ordered by year, month
     """
-    conn = _get_connection()
+    series = get_series("subscriptions")
+    with _get_connection() as conn:
+        series.refresh(conn, force=force)
+    today = date.today()
     try:
+        since = today.replace(year=today.year - 3)
+    except ValueError:  # Feb 29
+        since = today.replace(year=today.year - 3, day=28)
+    return [(year, month, int(count)) for year, month, count in series.monthly("row_count", since)]
+
+
+# ---------- SEGMENTED PREDICTIONS ----------
+
+# Segment dimension -> (column, whether the users join is needed)
+PREDICTION_SEGMENTS = {
+    "plan": ("s.plan", False),
+    "country": ("u.country", True),
+    "device": ("u.device_type", True),
+}
+
+_SEGMENT_PATTERN = re.compile(
+    r"\b(?:by|per|for each|each|across|split by|broken down by)\s+"
+    r"(plans?|countr(?:y|ies)|regions?|devices?|device types?)\b"
+)
+
+# Monthly new subscriptions for every segment in one grouped query
+SEGMENTED_NEW_SUBSCRIPTIONS_SQL = """
+    SELECT 
+      {column} AS segment,
+      EXTRACT(YEAR FROM s.start_date)::INTEGER AS year,
+      EXTRACT(MONTH FROM s.start_date)::INTEGER AS month,
+      COUNT(*)::INTEGER AS new_subscriptions
+    FROM subscriptions s{join}
+    WHERE s.start_date >= CURRENT_DATE - INTERVAL '3 years'
+    GROUP BY 1, 2, 3
+    ORDER BY 1, 2, 3;
+"""
+
+# Same for plans from rollup_subscriptions_daily
+SEGMENTED_NEW_SUBSCRIPTIONS_ROLLUP_SQL = """
+    SELECT 
+      plan AS segment,
+      EXTRACT(YEAR FROM day)::INTEGER AS year,
+      EXTRACT(MONTH FROM day)::INTEGER AS month,
+      SUM(row_count)::INTEGER AS new_subscriptions
+    FROM rollup_subscriptions_daily
+    WHERE day >= CURRENT_DATE - INTERVAL '3 years'
+    GROUP BY 1, 2, 3
+    HAVING SUM(row_count) > 0
+    ORDER BY 1, 2, 3;
+"""
+
+
+def _detect_prediction_segment(question: str) -> Optional[str]:
+    """Segment dimension asked for ("predict ... by plan"), or None for a total forecast."""
+    match = _SEGMENT_PATTERN.search(question.lower())
+    if not match:
+        return None
+    word = match.group(1)
+    if word.startswith("plan"):
+        return "plan"
+    if word.startswith("device"):
+        return "device"
+    return "country"
+
+
+def _segmented_prediction_sql(segment: str, rollup: bool = False) -> str:
+    """Grouped monthly-series query for a segment dimension."""
+    if rollup and segment == "plan":
+        return SEGMENTED_NEW_SUBSCRIPTIONS_ROLLUP_SQL
+    column, needs_users = PREDICTION_SEGMENTS[segment]
+    join = "\n    JOIN users u ON s.user_id = u.user_id" if needs_users else ""
+    return SEGMENTED_NEW_SUBSCRIPTIONS_SQL.format(column=column, join=join)
+
+
+def _rows_to_segment_series(rows: List[Dict[str, Any]]) -> Dict[str, List[Tuple[int, int, int]]]:
+    """Group (segment, year, month, new_subscriptions) rows into one monthly series per segment."""
+    series: Dict[str, List[Tuple[int, int, int]]] = {}
+    for row in rows:
+        name = str(row["segment"]) if row["segment"] is not None else "unknown"
+        series.setdefault(name, []).append((int(row["year"]), int(row["month"]), int(row["new_subscriptions"])))
+    return series
+
+
+def _get_segmented_new_subscriptions(segment: str) -> Dict[str, List[Tuple[int, int, int]]]:
+    """Monthly new subscriptions per plan, country or device, from one query."""
+    with _get_connection() as conn:
+        sql = _segmented_prediction_sql(segment, rollup=bool(rollup_table(conn, "subscriptions")))
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                """
-                SELECT 
-                  EXTRACT(YEAR FROM start_date)::INTEGER AS year,
-                  EXTRACT(MONTH FROM start_date)::INTEGER AS month,
-                  COUNT(*)::INTEGER AS new_subscriptions
-                FROM subscriptions
-                WHERE start_date >= CURRENT_DATE - INTERVAL '3 years'
-                GROUP BY year, month
-                ORDER BY year, month;
-                """
-            )
-            rows = cur.fetchall()
-            return [(int(row["year"]), int(row["month"]), int(row["new_subscriptions"])) for row in rows]
-    finally:
-        conn.close()
+            cur.execute(sql)
+            return _rows_to_segment_series(cur.fetchall())
+
+
+def _segment_history_months(series: Dict[str, List[Tuple[int, int, int]]]) -> int:
+    """Months spanned by all segments together."""
+    months = [year * 12 + month for rows in series.values() for year, month, _ in rows]
+    return max(months) - min(months) + 1 if months else 0
 
 
 def _calculate_linear_trend(historical_data: List[Tuple[int, int, int]]) -> Tuple[float, float]:
@@ -374,7 +556,8 @@ def _predict_future_subscriptions(
 def _format_prediction_response(
     historical_data: List[Tuple[int, int, int]],
     predictions: List[Tuple[int, int, float]],
-    slope: float
+    slope: float,
+    forecast: Optional[Forecast] = None
 ) -> str:
     """
     Format predictions as readable Slack message.
@@ -383,6 +566,7 @@ def _format_prediction_response(
         historical_data: Historical subscription data
         predictions: Future predictions
         slope: Trend slope (for trend direction)
+        forecast: Forecast the predictions came from (adds ranges and model)
     
     Returns:
         Formatted string for Slack
@@ -421,122 +605,458 @@ def _format_prediction_response(
         "*Monthly Breakdown (Next 12 Months):*",
     ]
     
-    for year, month, count in predictions:
+    for i, (year, month, count) in enumerate(predictions):
         month_name = month_names[month - 1]
-        lines.append(f"• {month_name} {year}: **{count:,.0f}** new subscriptions")
+        line = f"• {month_name} {year}: **{count:,.0f}** new subscriptions"
+        if forecast is not None:
+            line += f" ({forecast.lower[i]:,.0f}–{forecast.upper[i]:,.0f})"
+        lines.append(line)
     
     lines.append("")
-    lines.append("_Note: Predictions are based on linear trend extrapolation from historical data._")
+    if forecast is not None:
+        lines.append(
+            f"_Note: Predictions use {forecast.description}, the most accurate model in a "
+            f"backtest on historical data (error ≈ {forecast.scores[forecast.model]:,.0f}/month); "
+            f"ranges are {forecast.level:.0%} prediction intervals._"
+        )
+    else:
+        lines.append("_Note: Predictions are based on linear trend extrapolation from historical data._")
     
     return "\n".join(lines)
 
 
-def run_subscription_prediction(question: str) -> str:
+def _insufficient_history_response(months: int) -> str:
+    """Reply used when there are too few months of history to forecast."""
+    return (
+        "🤖 *Powered by PandasAI v3 + LLM*\n\n"
+        "[Prediction agent]\n"
+        "⚠️ Insufficient historical data for reliable predictions.\n"
+        f"I found only {months} month(s) of data. "
+        "Need at least 6 months of historical subscription data to generate predictions."
+    )
+
+
+def _prediction_insight_request(
+    question: str,
+    historical_data: List[Tuple[int, int, int]],
+    predictions: List[Tuple[int, int, float]],
+    slope: float,
+    forecast: Optional[Forecast] = None
+) -> Tuple[str, str]:
+    """
+    Build the (question, data_summary) pair sent to the LLM for prediction insights.
+    """
+    total_predicted = sum(count for _, _, count in predictions)
+    avg_per_month = total_predicted / 12 if predictions else 0
+    trend_direction = "increasing" if slope > 0.1 else "decreasing" if slope < -0.1 else "stable"
+    
+    data_summary = (
+        f"Historical data: {len(historical_data)} months. "
+        f"Predicted total: {total_predicted:,.0f} subscriptions over next 12 months. "
+        f"Average: {avg_per_month:,.0f} per month. Trend: {trend_direction}."
+    )
+    if forecast is not None:
+        data_summary += f" Model: {forecast.description} (selected by backtest)."
+    return f"Analyze subscription predictions: {question}", data_summary
+
+
+# Segments listed in the ranked summary
+PREDICTION_SEGMENT_LIMIT = 10
+
+
+def _rank_segment_forecasts(
+    series: Dict[str, List[Tuple[int, int, int]]],
+    forecasts: Dict[str, Forecast]
+) -> List[Dict[str, Any]]:
+    """Per-segment totals for the next 12 months vs the last 12, highest forecast first."""
+    last = max(year * 12 + month for rows in series.values() for year, month, _ in rows)
+    ranked = []
+    for name, forecast in forecasts.items():
+        recent = sum(count for year, month, count in series[name] if last - (year * 12 + month) < 12)
+        ranked.append({
+            "segment": name,
+            "predicted": sum(value for _, _, value in forecast.predictions),
+            "lower": sum(forecast.lower),
+            "upper": sum(forecast.upper),
+            "last_12_months": recent,
+            "model": forecast.description,
+        })
+    return sorted(ranked, key=lambda r: r["predicted"], reverse=True)
+
+
+def _format_segmented_prediction_response(segment: str, ranked: List[Dict[str, Any]], level: float) -> str:
+    """
+    Format a ranked per-segment forecast as a Slack message.
+    
+    Args:
+        segment: Segment dimension (plan, country, device)
+        ranked: Output of _rank_segment_forecasts
+        level: Prediction interval coverage
+    
+    Returns:
+        Formatted string for Slack
+    """
+    if not ranked:
+        return "[Prediction agent]\nNo predictions could be generated."
+    
+    total = sum(r["predicted"] for r in ranked)
+    lines = [
+        "[Prediction agent]",
+        "- dataset: subscriptions",
+        f"- prediction type: new subscriptions by {segment} (next year)",
+        "",
+        f"📊 *Ranked by predicted new subscriptions (next 12 months):*",
+    ]
+    for i, r in enumerate(ranked[:PREDICTION_SEGMENT_LIMIT], start=1):
+        change = ""
+        if r["last_12_months"]:
+            change = f", {r['predicted'] / r['last_12_months'] - 1:+.0%} vs last 12 months"
+        lines.append(
+            f"{i}. *{r['segment']}*: **{r['predicted']:,.0f}** "
+            f"({r['lower']:,.0f}–{r['upper']:,.0f}{change}) · {r['model']}"
+        )
+    if len(ranked) > PREDICTION_SEGMENT_LIMIT:
+        lines.append(f"_…and {len(ranked) - PREDICTION_SEGMENT_LIMIT} more {segment} segments_")
+    
+    lines.extend([
+        "",
+        f"• Total predicted new subscriptions: **{total:,.0f}**",
+        "",
+        f"_Note: each {segment} uses the model that did best in a backtest on its own history; "
+        f"ranges add up the monthly {level:.0%} prediction intervals._",
+    ])
+    return "\n".join(lines)
+
+
+def _segmented_insight_request(question: str, segment: str, ranked: List[Dict[str, Any]]) -> Tuple[str, str]:
+    """Build the (question, data_summary) pair sent to the LLM for segmented prediction insights."""
+    top = "; ".join(
+        f"{r['segment']}: {r['predicted']:,.0f} predicted vs {r['last_12_months']:,.0f} last 12 months"
+        for r in ranked[:PREDICTION_SEGMENT_LIMIT]
+    )
+    data_summary = f"{len(ranked)} {segment} segments, next 12 months of new subscriptions. Top: {top}."
+    return f"Analyze subscription predictions by {segment}: {question}", data_summary
+
+
+def _assemble_prediction_response(base_response: str, llm_insight: str) -> str:
+    """Wrap the formatted prediction with the LLM indicator and optional insights."""
+    response_parts = [
+        "🤖 *Powered by PandasAI v3 + LLM*",
+        "📋 *Using semantic layer*",
+        "",
+        base_response
+    ]
+    
+    if llm_insight and llm_insight.strip():
+        response_parts.extend([
+            "",
+            "💡 *LLM Insights:*",
+            llm_insight
+        ])
+    
+    return "\n".join(response_parts)
+
+
+def _prediction_error_response(error: Exception) -> str:
+    """Reply used when the prediction pipeline raised."""
+    if isinstance(error, ValueError):
+        return (
+            "🤖 *Powered by PandasAI v3 + LLM*\n\n"
+            "[Prediction agent]\n"
+            f"⚠️ Error: {str(error)}"
+        )
+    return (
+        "🤖 *Powered by PandasAI v3 + LLM*\n\n"
+        "[Prediction agent]\n"
+        f"⚠️ An error occurred while generating predictions.\n"
+        f"_Internal error:_ `{error}`"
+    )
+
+
+def run_subscription_prediction(question: str, progress: Optional[Callable[[str], None]] = None) -> str:
+    """
+    Answer a subscription prediction question, reusing the cached answer to
+    the same (or a near-identical) question while the subscriptions data is
+    unchanged. `progress` receives the forecast before the LLM insights.
+    """
+    segment = _detect_prediction_segment(question)
+    if segment:
+        return _cached_answer(
+            f"prediction:{segment}", "subscriptions", question,
+            lambda: _run_segmented_prediction(question, segment, progress)
+        )
+    return _cached_answer(
+        "prediction", "subscriptions", question, lambda: _run_subscription_prediction(question, progress)
+    )
+
+
+# ---------- PRECOMPUTED FORECASTS ----------
+#
+# Forecasts live in the forecast store keyed by ("new_subscriptions", segment)
+# and are only refitted when the data watermark moves (or on a schedule, see
+# FORECAST_REFRESH_SECONDS), so prediction questions skip the query and fit.
+
+def _compute_total_forecast():
+    """
+    Fit the total new-subscriptions forecast.
+    Value: (historical_data, slope, forecast); forecast is None with < 6 months.
+    The series is checked against the source now: the store files the fit
+    under the current watermark, which may be newer than the series' last check.
+    """
+    historical_data = _get_historical_new_subscriptions(force=True)
+    if len(historical_data) < 6:
+        return (historical_data, 0.0, None), {}
+    slope, _ = _calculate_linear_trend(historical_data)
+    forecast = forecast_monthly(historical_data, horizon=12)
+    return (historical_data, slope, forecast), {"total": forecast}
+
+
+def _compute_segment_forecast(segment: str):
+    """
+    Fit the per-segment forecasts for a dimension.
+    Value: (months_of_history, ranked_segments, interval_level); ranked is empty with < 6 months.
+    """
+    series = _get_segmented_new_subscriptions(segment)
+    months = _segment_history_months(series)
+    if months < 6:
+        return (months, [], 0.0), {}
+    forecasts = forecast_segments(series, horizon=12)
+    ranked = _rank_segment_forecasts(series, forecasts)
+    return (months, ranked, next(iter(forecasts.values())).level), forecasts
+
+
+def _segment_watermark(segment: str):
+    """Watermark of the tables a segment's series is built from."""
+    if PREDICTION_SEGMENTS[segment][1]:
+        return (_dataset_watermark("subscriptions"), _dataset_watermark("users"))
+    return _dataset_watermark("subscriptions")
+
+
+def _register_forecasts() -> None:
+    store = get_forecast_store()
+    store.register(
+        "new_subscriptions", None,
+        lambda: _compute_total_forecast(), lambda: _dataset_watermark("subscriptions"),
+    )
+    for segment in PREDICTION_SEGMENTS:
+        store.register(
+            "new_subscriptions", segment,
+            lambda s=segment: _compute_segment_forecast(s), lambda s=segment: _segment_watermark(s),
+        )
+
+
+_register_forecasts()
+
+
+def _run_segmented_prediction(question: str, segment: str,
+                              progress: Optional[Callable[[str], None]] = None) -> str:
+    """
+    Forecast new subscriptions for every plan, country or device at once.
+    
+    All segment series come from one grouped query and are forecast together
+    as a segments x months array; the reply ranks segments by predicted total.
+    The fitted result is served from the forecast store while the data is
+    unchanged.
+    """
+    try:
+        timer = StageTimer("prediction")
+        with timer.stage("forecast"):
+            months, ranked, level = get_forecast_store().get("new_subscriptions", segment).value
+        if months < 6:
+            return _insufficient_history_response(months)
+        
+        # Start the LLM insights before formatting so the two overlap
+        insight_future = None
+        if PANDASAI_AVAILABLE:
+            from core.services.pandasai_service import analyze_with_llm
+            insight_future = start_insight(analyze_with_llm, *_segmented_insight_request(question, segment, ranked))
+        
+        with timer.stage("format"):
+            base_response = _format_segmented_prediction_response(segment, ranked, level)
+        
+        llm_insight = ""
+        if insight_future is not None:
+            report(progress, _assemble_prediction_response(base_response, "") + INSIGHTS_PENDING)
+            with timer.stage("insights"):
+                llm_insight = collect_insight(insight_future)
+        timer.finish()
+        
+        return _assemble_prediction_response(base_response, llm_insight)
+        
+    except Exception as e:
+        return _prediction_error_response(e)
+
+
+def _run_subscription_prediction(question: str, progress: Optional[Callable[[str], None]] = None) -> str:
     """
     Main handler for subscription prediction queries using PandasAI/LLM.
     
     Orchestrates the prediction pipeline:
-    1. Extract historical data
-    2. Calculate trend
-    3. Generate predictions
-    4. Use LLM to provide insights and explanations
-    5. Format response
+    1. Get the forecast from the forecast store (historical data, trend and
+       the best backtested model, refitted only when the data changed)
+    2. Use LLM to provide insights and explanations
+    3. Format response
     
     Args:
         question: User's question for context and LLM analysis
+        progress: Optional callback receiving the forecast before the insights
     
     Returns:
         Formatted prediction response string with LLM insights
     """
     try:
-        # Get historical data
-        historical_data = _get_historical_new_subscriptions()
+        timer = StageTimer("prediction")
+        
+        # Precomputed forecast (with prediction intervals) for the current data
+        with timer.stage("forecast"):
+            historical_data, slope, forecast = get_forecast_store().get("new_subscriptions").value
         
         # Check if we have enough data
-        if len(historical_data) < 6:
-            return (
-                "🤖 *Powered by PandasAI v3 + LLM*\n\n"
-                "[Prediction agent]\n"
-                "⚠️ Insufficient historical data for reliable predictions.\n"
-                f"I found only {len(historical_data)} month(s) of data. "
-                "Need at least 6 months of historical subscription data to generate predictions."
-            )
+        if forecast is None:
+            return _insufficient_history_response(len(historical_data))
         
-        # Calculate trend
-        slope, intercept = _calculate_linear_trend(historical_data)
+        predictions = forecast.predictions
         
-        # Generate predictions
-        predictions = _predict_future_subscriptions(historical_data, slope, intercept)
+        # Start the LLM insights in the background - ALWAYS try to get insights
+        insight_future = None
+        if PANDASAI_AVAILABLE:
+            from core.services.pandasai_service import analyze_with_llm
+            insight_future = start_insight(
+                analyze_with_llm,
+                *_prediction_insight_request(question, historical_data, predictions, slope, forecast),
+            )
         
-        # Format base response
-        base_response = _format_prediction_response(historical_data, predictions, slope)
+        # Format base response while the insights are generated
+        with timer.stage("format"):
+            base_response = _format_prediction_response(historical_data, predictions, slope, forecast)
         
-        # Enhance with LLM insights - ALWAYS try to get insights
+        # Show the forecast, then wait (up to the deadline) for the insights
         llm_insight = ""
-        if PANDASAI_AVAILABLE:
-            try:
-                # Create data summary for LLM
-                total_predicted = sum(count for _, _, count in predictions)
-                avg_per_month = total_predicted / 12 if predictions else 0
-                trend_direction = "increasing" if slope > 0.1 else "decreasing" if slope < -0.1 else "stable"
-                
-                data_summary = (
-                    f"Historical data: {len(historical_data)} months. "
-                    f"Predicted total: {total_predicted:,.0f} subscriptions over next 12 months. "
-                    f"Average: {avg_per_month:,.0f} per month. Trend: {trend_direction}."
-                )
-                
-                # Use PandasAI service to get LLM insights
-                from core.services.pandasai_service import analyze_with_llm
-                llm_insight = analyze_with_llm(
-                    f"Analyze subscription predictions: {question}",
-                    data_summary
-                )
-            except Exception as e:
-                # Log error but continue - we'll show base response
-                import logging
-                logging.warning(f"LLM insight generation failed: {e}")
+        if insight_future is not None:
+            report(progress, _assemble_prediction_response(base_response, "") + INSIGHTS_PENDING)
+            with timer.stage("insights"):
+                llm_insight = collect_insight(insight_future)
+        timer.finish()
         
         # Always include LLM indicator and insights if available
-        response_parts = [
-            "🤖 *Powered by PandasAI v3 + LLM*",
-            "📋 *Using semantic layer*",
-            "",
-            base_response
-        ]
+        return _assemble_prediction_response(base_response, llm_insight)
         
-        if llm_insight and llm_insight.strip():
-            response_parts.extend([
-                "",
-                "💡 *LLM Insights:*",
-                llm_insight
-            ])
-        
-        return "\n".join(response_parts)
-        
-    except ValueError as e:
-        return (
-            "🤖 *Powered by PandasAI v3 + LLM*\n\n"
-            "[Prediction agent]\n"
-            f"⚠️ Error: {str(e)}"
-        )
+    except Exception as e:
+        return _prediction_error_response(e)
+
+
+# ---------- SEMANTIC-LAYER MEASURES (NO LLM) ----------
+
+def _answer_measure_question(query: MeasureQuery) -> Optional[str]:
+    """
+    Answer a question compiled to a single measure with one query.
+    Returns None if the query fails, so the question goes to PandasAI.
+    """
+    timer = StageTimer("measure_query")
+    try:
+        with timer.stage("query"):
+            with _get_connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    cur.execute(query.sql, query.params)
+                    rows = cur.fetchall() or []
+    except Exception as e:
+        logger.warning("Measure query %s.%s failed, falling back to PandasAI: %s", query.model, query.measure, e)
+        return None
+    with timer.stage("format"):
+        answer = format_measure_answer(query, rows)
+    timer.finish()
+    return answer
+
+
+# ---------- DEGRADED ANSWERS (LLM UNAVAILABLE) ----------
+
+def _format_users_overview(overview: dict) -> str:
+    lines = [f"• Total users: {overview['total_users']:,}"]
+    if overview["countries"]:
+        lines.append("• Top countries: " + ", ".join(f"{c['name']} ({int(c['users']):,})" for c in overview["countries"]))
+    if overview["devices"]:
+        lines.append("• Devices: " + ", ".join(f"{d['name']} ({int(d['users']):,})" for d in overview["devices"]))
+    return "\n".join(lines)
+
+
+def _format_subscriptions_overview(overview: dict) -> str:
+    lines = [
+        f"• Total subscriptions: {overview['total_subscriptions']:,}",
+        f"• Active: {overview['active_subscriptions']:,}",
+        f"• Churned: {overview['churned_subscriptions']:,}",
+    ]
+    if overview["plans"]:
+        lines.append("• Active by plan: " + ", ".join(
+            f"{p['plan']} ({int(p['active_subscriptions']):,})" for p in overview["plans"]
+        ))
+    return "\n".join(lines)
+
+
+def _format_sessions_overview(overview: dict) -> str:
+    lines = [
+        f"• Total sessions: {overview['total_sessions']:,}",
+        f"• Active users: {overview['active_users']:,}",
+        f"• Average duration: {overview['avg_duration']:.1f} minutes",
+    ]
+    if overview["activities"]:
+        lines.append("• Top activities by minutes: " + ", ".join(
+            f"{a['activity_type']} ({int(a['minutes'] or 0):,} min)" for a in overview["activities"]
+        ))
+    return "\n".join(lines)
+
+
+def _degraded_data_answer(dataset_name: str, question: str) -> str:
+    """
+    Answer a data question from the deterministic overview queries, used
+    while the LLM gateway is unavailable (never cached: it has a warning).
+    """
+    dataset = dataset_name if dataset_name in ("users", "subscriptions", "sessions", "payments") else None
+    dataset = dataset or infer_dataset(question) or "users"
+    try:
+        if dataset == "payments":
+            window_days, label = _detect_payments_time_window(question)
+            body = f"• Total payments ({label}): ${_query_total_payments(window_days):,.2f}"
+        elif dataset == "subscriptions":
+            body = _format_subscriptions_overview(_query_subscriptions_overview())
+        elif dataset == "sessions":
+            body = _format_sessions_overview(_query_sessions_overview())
+        else:
+            body = _format_users_overview(_query_users_overview())
     except Exception as e:
         return (
-            "🤖 *Powered by PandasAI v3 + LLM*\n\n"
-            "[Prediction agent]\n"
-            f"⚠️ An error occurred while generating predictions.\n"
-            f"_Internal error:_ `{e}`"
+            "⚠️ *The LLM is unavailable right now* and the fallback overview failed:\n"
+            f"```{str(e)}```\nPlease try again in a minute."
         )
+    return (
+        f"⚠️ _The LLM is unavailable right now, so here is the standard `{dataset}` overview "
+        f"instead of a tailored answer._\n\n📊 *{dataset.capitalize()} overview:*\n{body}"
+    )
 
 
-def run_data_question(dataset_name: str, question: str) -> str:
+def run_data_question(dataset_name: str, question: str,
+                      progress: Optional[Callable[[str], None]] = None) -> str:
     """
     Handle data questions using PandasAI v3 with semantic layer ONLY.
     No manual SQL fallback - all queries go through PandasAI/LLM.
 
     Uses semantic layer YAML files to automatically convert natural language
-    to SQL queries and execute them.
+    to SQL queries and execute them. `progress` receives partial answers
+    (data loaded, PandasAI result) before the final one. The same question
+    asked again while it is being answered waits for that answer. While the
+    LLM gateway's circuit breaker is open, the dataset's overview is
+    returned instead.
+
+    Questions that only ask for one semantic-layer measure (see
+    `measure_resolver`) are answered from its compiled SQL first, without
+    PandasAI or the LLM.
     """
+    # One measure, optionally by a dimension or over a window: one query, no LLM
+    if measure_fast_path_enabled():
+        query = resolve_measure(question, dataset_name)
+        answer = _answer_measure_question(query) if query is not None else None
+        if answer is not None:
+            return answer
+    
     # Check if PandasAI is available
     if not PANDASAI_AVAILABLE or not query_with_pandasai:
         return (
@@ -556,10 +1076,25 @@ def run_data_question(dataset_name: str, question: str) -> str:
             "Manual SQL queries have been disabled. All queries must go through PandasAI/LLM."
         )
     
-    # Use PandasAI for all queries
+    # While the LLM is down, answer from the overview queries instead of waiting on it
+    if not get_llm_gateway().available():
+        return _degraded_data_answer(dataset_name, question)
+    
+    # Use PandasAI for all queries; repeat questions are answered from the cache
     try:
-        result = query_with_pandasai(question, dataset_name if dataset_name != "none" else None)
-        return result
+        # Identical questions asked while one is being answered share its answer
+        return get_single_flight().do(
+            ("data_question", dataset_name, normalize_question(question)),
+            lambda shared_progress: _cached_answer(
+                "data_question", dataset_name, question,
+                lambda: query_with_pandasai(
+                    question, dataset_name if dataset_name != "none" else None, progress=shared_progress
+                ),
+            ),
+            progress,
+        )
+    except LLMUnavailable:
+        return _degraded_data_answer(dataset_name, question)
     except Exception as e:
         return (
             f"⚠️ *Error processing query with PandasAI*\n\n"
@@ -577,25 +1112,9 @@ def run_data_question(dataset_name: str, question: str) -> str:
 def _is_safe_sql_query(sql: str) -> bool:
     """
     Validate that SQL query is safe (read-only).
-    Only allows SELECT, WITH, EXPLAIN, DESCRIBE statements.
+    See core.services.sql_validator for what is allowed.
     """
-    sql_upper = sql.strip().upper()
-    
-    # Block dangerous keywords
-    dangerous_keywords = [
-        "DROP", "DELETE", "INSERT", "UPDATE", "ALTER", "CREATE",
-        "TRUNCATE", "GRANT", "REVOKE", "EXEC", "EXECUTE"
-    ]
-    
-    for keyword in dangerous_keywords:
-        if keyword in sql_upper:
-            return False
-    
-    # Only allow safe statement types
-    safe_prefixes = ["SELECT", "WITH", "EXPLAIN", "DESCRIBE", "SHOW"]
-    sql_start = sql_upper.split()[0] if sql_upper.split() else ""
-    
-    return sql_start in safe_prefixes
+    return validate_sql(sql).ok
 
 
 def _extract_sql_from_message(text: str) -> Optional[str]:
@@ -613,18 +1132,41 @@ def _extract_sql_from_message(text: str) -> Optional[str]:
     return text.strip() if text.strip() else None
 
 
-def _format_sql_results(rows: List[Dict[str, Any]], max_rows: int = 100) -> str:
+def _format_sql_results(
+    rows: List[Dict[str, Any]],
+    max_rows: int = 100,
+    total_rows: Optional[int] = None,
+    total_is_estimate: bool = False,
+    truncated: bool = False
+) -> str:
     """
     Format SQL query results for Slack display.
+    
+    Args:
+        rows: Result rows (only the first max_rows are shown)
+        max_rows: Rows to show
+        total_rows: Size of the full result when known (else len(rows))
+        total_is_estimate: Whether total_rows is a planner estimate
+        truncated: The query had more rows than `rows` holds
     """
     if not rows:
         return "Query executed successfully but returned no rows."
     
-    if len(rows) > max_rows:
-        rows = rows[:max_rows]
-        warning = f"\n⚠️ _Showing first {max_rows} of {len(rows)} rows_\n"
+    truncated = truncated or len(rows) > max_rows
+    if total_rows is None and not (truncated and len(rows) <= max_rows):
+        total_rows = len(rows)
+    rows = rows[:max_rows]
+    
+    if not truncated:
+        total_label = f"{len(rows):,}"
+    elif total_rows is None:
+        total_label = f"more than {len(rows):,}"
+    elif total_is_estimate:
+        total_label = f"~{total_rows:,}"
     else:
-        warning = ""
+        total_label = f"{total_rows:,}"
+    
+    warning = f"\n⚠️ _Showing first {len(rows):,} of {total_label} rows_\n" if truncated else ""
     
     # Get column names
     columns = list(rows[0].keys())
@@ -643,116 +1185,263 @@ def _format_sql_results(rows: List[Dict[str, Any]], max_rows: int = 100) -> str:
         row_str = " | ".join(row_values)
         lines.append(f"`{row_str}`")
     
-    if len(rows) == max_rows:
-        lines.append(f"\n_... and {len(rows) - max_rows} more rows_")
-    
-    lines.append(f"\n*Total rows returned:* {len(rows)}")
+    if truncated:
+        if total_rows is not None:
+            more = f"{'~' if total_is_estimate else ''}{total_rows - len(rows):,}"
+            lines.append(f"\n_... and {more} more rows_")
+        estimate_note = " (planner estimate)" if total_is_estimate and total_rows is not None else ""
+        lines.append(f"\n*Total rows:* {total_label}{estimate_note}")
+    else:
+        lines.append(f"\n*Total rows returned:* {len(rows)}")
     
     return "\n".join(lines)
 
 
-def run_sql_query(sql_text: str) -> str:
+def _format_query_result(result: QueryResult, max_rows: int = 100) -> str:
+    """Format a bounded QueryResult (see core.services.sql_stream) for Slack."""
+    return _format_sql_results(
+        result.rows,
+        max_rows=max(max_rows, len(result.rows)),
+        total_rows=result.total_rows,
+        total_is_estimate=result.total_is_estimate,
+        truncated=result.truncated,
+    )
+
+
+def _prepare_sql(sql_text: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Extract and validate the SQL in a message.
+    
+    Returns:
+        (sql, None) when the query may run, or (None, error_response)
+    """
+    # Extract SQL from message
+    sql = _extract_sql_from_message(sql_text)
+    
+    if not sql:
+        return None, (
+            "🤖 *Powered by PandasAI v3 + LLM*\n\n"
+            "⚠️ *SQL Query Error*\n"
+            "No SQL query found. Please provide a SELECT query.\n"
+            "You can wrap it in code blocks: ```sql\nSELECT ...\n```"
+        )
+    
+    # Validate SQL is safe
+    validation = validate_sql(sql)
+    if not validation.ok:
+        return None, (
+            "🤖 *Powered by PandasAI v3 + LLM*\n\n"
+            "⚠️ *Security Error*\n"
+            f"{validation.reason.rstrip('.')}.\n"
+            "Only single read-only queries (SELECT, WITH, EXPLAIN, SHOW) over the "
+            "semantic-layer tables are allowed."
+        )
+    
+    return sql, None
+
+
+def _sql_insight_request(
+    sql: str,
+    result_rows: List[Dict[str, Any]],
+    total_rows: Optional[int] = None
+) -> Tuple[str, str]:
+    """
+    Build the (context, data_summary) pair sent to the LLM for query explanations.
+    """
+    query_preview = f"{sql[:200]}..." if len(sql) > 200 else sql
+    returned = f"{len(result_rows)} rows" if total_rows is None or total_rows == len(result_rows) else (
+        f"{total_rows} rows (first {len(result_rows)} read)"
+    )
+    result_summary = (
+        f"SQL Query executed successfully. "
+        f"Returned {returned}. "
+        f"Query: {query_preview}"
+    )
+    return (
+        f"Explain what this SQL query does and provide insights on the results: {sql}",
+        result_summary,
+    )
+
+
+def _assemble_sql_response(base_results: str, llm_explanation: str) -> str:
+    """Wrap formatted SQL results with the LLM indicator and optional explanation."""
+    response_parts = [
+        "🤖 *Powered by PandasAI v3 + LLM*",
+        "📋 *Using semantic layer*",
+        "",
+        base_results
+    ]
+    
+    if llm_explanation and llm_explanation.strip():
+        response_parts.extend([
+            "",
+            "💡 *LLM Query Analysis:*",
+            llm_explanation
+        ])
+    
+    return "\n".join(response_parts)
+
+
+def _sql_error_response(error: Exception) -> str:
+    """Reply used when executing a user SQL query raised."""
+    if isinstance(error, psycopg2.Error):
+        return (
+            "🤖 *Powered by PandasAI v3 + LLM*\n\n"
+            f"⚠️ *Database Error*\n"
+            f"```{str(error)}```\n"
+            f"Please check your SQL syntax and try again."
+        )
+    return (
+        "🤖 *Powered by PandasAI v3 + LLM*\n\n"
+        f"⚠️ *Error executing query*\n"
+        f"```{str(error)}```"
+    )
+
+
+def _plan_guard_response(sql: str, check: PlanCheck, user: Optional[str]) -> str:
+    """
+    Reply for a query whose plan is over the guard thresholds; queries that
+    only need confirmation are parked for `user`.
+    """
+    reasons = "\n".join(f"• {reason}" for reason in check.reasons)
+    if check.verdict == "reject":
+        return (
+            "🤖 *Powered by PandasAI v3 + LLM*\n\n"
+            "⛔ *Query rejected*\n"
+            f"{reasons}\n"
+            "Add filters or aggregate it further, then try again."
+        )
+    park_query(user, sql, check)
+    ttl_minutes = max(1, round(GuardConfig.from_env().confirm_ttl / 60))
+    return (
+        "🤖 *Powered by PandasAI v3 + LLM*\n\n"
+        "⚠️ *This query looks expensive*\n"
+        f"{reasons}\n"
+        f"Reply *confirm* within {ttl_minutes} min to run it anyway, or *cancel* to drop it."
+    )
+
+
+def _query_stopped_response(cancelled: bool, timeout_ms: int) -> str:
+    """Reply for a query stopped by the user or by the statement timeout."""
+    if cancelled:
+        return "🛑 *Query cancelled.*"
+    return (
+        "🤖 *Powered by PandasAI v3 + LLM*\n\n"
+        f"⚠️ *Query timed out* after {timeout_ms / 1000:g}s\n"
+        "Narrow it down (filters, a LIMIT, fewer joins) and try again."
+    )
+
+
+def _execute_sql_answer(sql: str, check: PlanCheck, user: Optional[str], guard: GuardConfig,
+                        timer: StageTimer, progress: Optional[Callable[[str], None]] = None) -> str:
+    """Run a checked query and build its reply (results plus LLM explanation)."""
+    running = None
+    try:
+        # Execute query, streaming at most SQL_MAX_ROWS rows through a
+        # server-side cursor (the connection goes back to the pool before the LLM call)
+        with timer.stage("query"), _get_connection(statement_timeout_ms=guard.timeout_ms) as conn:
+            begin_read_only(conn)
+            with track_query(user, sql, conn.cancel) as running:
+                result = execute_bounded(conn, sql, estimate=check.rows)
+    except psycopg2.errors.QueryCanceled:
+        return _query_stopped_response(bool(running and running.cancelled), guard.timeout_ms)
+    result_rows = result.rows
+    
+    # Start the LLM explanation in the background - ALWAYS try to get insights
+    insight_future = None
+    if PANDASAI_AVAILABLE:
+        from core.services.pandasai_service import explain_with_llm
+        insight_future = start_insight(
+            explain_with_llm, *_sql_insight_request(sql, result_rows, result.total_rows)
+        )
+    
+    # Format base results while the explanation is generated
+    with timer.stage("format"):
+        base_results = _format_query_result(result)
+    
+    # Show the results, then wait (up to the deadline) for the explanation
+    llm_explanation = ""
+    if insight_future is not None:
+        report(progress, _assemble_sql_response(base_results, "") + INSIGHTS_PENDING)
+        with timer.stage("insights"):
+            llm_explanation = collect_insight(insight_future)
+    timer.finish()
+    
+    # Always include LLM indicator and insights if available
+    return _assemble_sql_response(base_results, llm_explanation)
+
+
+def run_sql_query(sql_text: str, user: Optional[str] = None, confirmed: bool = False,
+                  progress: Optional[Callable[[str], None]] = None) -> str:
     """
     Execute a SQL query safely (read-only) and return formatted results with LLM insights.
     Designed for data scientists who want to write custom SQL queries.
     Uses PandasAI/LLM to provide explanations and insights on query results.
     
+    The query's plan is checked first (see core.services.query_guard): too
+    expensive plans are rejected or parked until the user confirms them.
+    It then runs in a read-only transaction under QUERY_TIMEOUT_MS and can
+    be cancelled by its author. Identical queries (same tokens, whatever
+    the formatting) sent while one is running share its execution and reply.
+    
     Args:
         sql_text: SQL query text (may include code blocks or "sql:" prefix)
+        user: Slack user who sent it (for confirmations and cancellation)
+        confirmed: Skip the plan check (the user already confirmed it)
+        progress: Optional callback receiving the results before the LLM analysis
     
     Returns:
         Formatted query results with LLM insights or error message
     """
+    guard = GuardConfig.from_env()
+    timer = StageTimer("sql_query")
     try:
-        # Extract SQL from message
-        sql = _extract_sql_from_message(sql_text)
+        sql, error_response = _prepare_sql(sql_text)
+        if error_response:
+            return error_response
         
-        if not sql:
-            return (
-                "🤖 *Powered by PandasAI v3 + LLM*\n\n"
-                "⚠️ *SQL Query Error*\n"
-                "No SQL query found. Please provide a SELECT query.\n"
-                "You can wrap it in code blocks: ```sql\nSELECT ...\n```"
-            )
+        check = PlanCheck(verdict="ok")
+        if not confirmed:
+            with timer.stage("plan"), _get_connection(statement_timeout_ms=guard.timeout_ms) as conn:
+                begin_read_only(conn)
+                check = explain_query(conn, sql, guard)
+            if check.verdict != "ok":
+                return _plan_guard_response(sql, check, user)
         
-        # Validate SQL is safe
-        if not _is_safe_sql_query(sql):
-            return (
-                "🤖 *Powered by PandasAI v3 + LLM*\n\n"
-                "⚠️ *Security Error*\n"
-                "Only SELECT, WITH, EXPLAIN, and DESCRIBE queries are allowed.\n"
-                "Write operations (INSERT, UPDATE, DELETE, DROP, etc.) are not permitted."
-            )
-        
-        # Execute query
-        conn = _get_connection()
-        try:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute(sql)
-                rows = cur.fetchall()
-                
-                # Convert to list of dicts
-                result_rows = [dict(row) for row in rows]
-                
-                # Format base results
-                base_results = _format_sql_results(result_rows)
-                
-                # Enhance with LLM insights - ALWAYS try to get insights
-                llm_explanation = ""
-                if PANDASAI_AVAILABLE:
-                    try:
-                        from core.services.pandasai_service import explain_with_llm
-                        
-                        # Create summary for LLM
-                        result_summary = (
-                            f"SQL Query executed successfully. "
-                            f"Returned {len(result_rows)} rows. "
-                            f"Query: {sql[:200]}..." if len(sql) > 200 else f"Query: {sql}"
-                        )
-                        
-                        # Get LLM explanation
-                        llm_explanation = explain_with_llm(
-                            f"Explain what this SQL query does and provide insights on the results: {sql}",
-                            result_summary
-                        )
-                    except Exception as e:
-                        # Log error but continue - we'll show base results
-                        import logging
-                        logging.warning(f"LLM explanation generation failed: {e}")
-                
-                # Always include LLM indicator and insights if available
-                response_parts = [
-                    "🤖 *Powered by PandasAI v3 + LLM*",
-                    "📋 *Using semantic layer*",
-                    "",
-                    base_results
-                ]
-                
-                if llm_explanation and llm_explanation.strip():
-                    response_parts.extend([
-                        "",
-                        "💡 *LLM Query Analysis:*",
-                        llm_explanation
-                    ])
-                
-                return "\n".join(response_parts)
-                
-        finally:
-            conn.close()
-            
-    except psycopg2.Error as e:
-        return (
-            "🤖 *Powered by PandasAI v3 + LLM*\n\n"
-            f"⚠️ *Database Error*\n"
-            f"```{str(e)}```\n"
-            f"Please check your SQL syntax and try again."
+        return get_single_flight().do(
+            # Per user: "cancel" stops the asker's own run, never someone else's answer
+            ("sql_query", user, sql_fingerprint(sql)),
+            lambda shared_progress: _execute_sql_answer(sql, check, user, guard, timer, shared_progress),
+            progress,
         )
+
     except Exception as e:
-        return (
-            "🤖 *Powered by PandasAI v3 + LLM*\n\n"
-            f"⚠️ *Error executing query*\n"
-            f"```{str(e)}```"
-        )
+        return _sql_error_response(e)
+
+
+NO_PENDING_QUERY_RESPONSE = (
+    "There is no query waiting for confirmation (it may have expired). "
+    "Paste it again to re-run the check."
+)
+
+
+def run_confirmed_sql_query(user: Optional[str], progress: Optional[Callable[[str], None]] = None) -> str:
+    """Run the query `user` was asked to confirm, skipping the plan check."""
+    pending = take_pending(user)
+    if pending is None:
+        return NO_PENDING_QUERY_RESPONSE
+    return run_sql_query(pending.sql, user=user, confirmed=True, progress=progress)
+
+
+def cancel_sql_query(user: Optional[str]) -> str:
+    """Stop `user`'s running queries and drop any query waiting for confirmation."""
+    cancelled = cancel_queries(user)
+    dropped = drop_pending(user)
+    if cancelled:
+        return f"🛑 Cancelling {cancelled} running quer{'y' if cancelled == 1 else 'ies'}..."
+    if dropped:
+        return "🛑 Dropped the query that was waiting for confirmation."
+    return "You have no running queries to cancel."
 
 
 # ---------- GOLDEN QUERIES LISTING ----------
@@ -846,15 +1535,6 @@ def list_golden_queries() -> str:
 
 # ---------- SQL QUERY GENERATION ----------
 
-# EU countries list for filtering
-EU_COUNTRIES = [
-    "Austria", "Belgium", "Bulgaria", "Croatia", "Cyprus", "Czech Republic",
-    "Denmark", "Estonia", "Finland", "France", "Germany", "Greece", "Hungary",
-    "Ireland", "Italy", "Latvia", "Lithuania", "Luxembourg", "Malta", "Netherlands",
-    "Poland", "Portugal", "Romania", "Slovakia", "Slovenia", "Spain", "Sweden"
-]
-
-
 def _detect_filters_from_text(text: str, dataset: str) -> Dict[str, Any]:
     """
     Extract filters and requirements from natural language text.
@@ -897,7 +1577,22 @@ def _detect_filters_from_text(text: str, dataset: str) -> Dict[str, Any]:
 def _generate_subscriptions_sql(text: str, filters: Dict[str, Any]) -> str:
     """
     Generate SQL query for subscriptions based on natural language request.
+    Plain "by plan" counts read the daily rollup when it is known to exist.
     """
+    rollup = cached_rollup_table("subscriptions")
+    if rollup and filters.get("group_by") == "plan" and not filters.get("region") and not filters.get("status"):
+        days = {"last_month": 30, "last_quarter": 90, "last_year": 365}.get(filters.get("date_range"))
+        sql_parts = [
+            "SELECT",
+            "    plan,",
+            "    SUM(row_count) AS subscription_count",
+            f"FROM {rollup}",
+        ]
+        if days:
+            sql_parts.append(f"WHERE day >= CURRENT_DATE - {days}")
+        sql_parts += ["GROUP BY plan", "ORDER BY subscription_count DESC"]
+        return "\n".join(sql_parts) + ";"
+
     sql_parts = ["SELECT"]
     
     # Determine what to select
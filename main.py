@@ -4,8 +4,22 @@ from slack_bolt import App
 from slack_bolt.adapter.socket_mode import SocketModeHandler
 
 
+from core.messages import (
+    BUSY_MESSAGE,
+    HELP_MESSAGE,
+    UNKNOWN_MESSAGE,
+    format_answer,
+    format_error,
+    format_placeholder,
+)
+from core.services.dispatcher import get_dispatcher
+from core.services.forecast_store import start_forecast_refresher
+from core.services.progressive_reply import ProgressiveReply, progressive_replies_enabled
+from core.services.rollups import start_rollup_refresher
 from core.subsystem_1.router import route_message
 from core.subsystem_2.pandas_agent import (
+    cancel_sql_query,
+    run_confirmed_sql_query,
     run_data_question,
     run_subscription_prediction,
     run_sql_query,
@@ -30,11 +44,66 @@ app = App(
     signing_secret=SLACK_SIGNING_SECRET,
 )
 
+# ----------------------------------------
+# Worker-side handlers (run on the dispatcher pool)
+# ----------------------------------------
+def answer_for_intent(decision, text: str, user: str = None, progress=None) -> str:
+    """
+    Run the slow part of the pipeline (Postgres + LLM) for a routed message
+    and return the Slack reply text. `progress` receives partial replies
+    (with the intent header) as stages finish.
+    """
+    if progress is not None:
+        report_partial = progress
+        progress = lambda partial: report_partial(format_answer(decision.intent, decision.dataset, partial))  # noqa: E731
+
+    try:
+        if decision.intent == "data_question":
+            answer = run_data_question(decision.dataset, text, progress=progress)
+        elif decision.intent == "prediction":
+            answer = run_subscription_prediction(text, progress=progress)
+        elif decision.intent == "sql_query":
+            answer = run_sql_query(text, user=user, progress=progress)
+        elif decision.intent == "confirm_query":
+            answer = run_confirmed_sql_query(user, progress=progress)
+        elif decision.intent == "list_queries":
+            answer = list_golden_queries()
+        elif decision.intent == "generate_sql":
+            answer = generate_sql_query(text, decision.dataset)
+        else:
+            raise ValueError(f"No worker handler for intent {decision.intent!r}")
+    except Exception as e:
+        return format_error(decision.intent, e)
+
+    # The answer already includes indicators (PandasAI or manual SQL)
+    # so we just need to add the per-intent header
+    return format_answer(decision.intent, decision.dataset, answer)
+
+
+# Intents whose answers need Postgres and/or the LLM
+DISPATCHED_INTENTS = {"data_question", "prediction", "sql_query", "confirm_query", "list_queries", "generate_sql"}
+
+# Confirmed queries share the sql_query concurrency limit
+DISPATCH_POOLS = {"confirm_query": "sql_query"}
+
 # ----------------------------------------
 # Single message handler that uses the router
 # ----------------------------------------
+def _progressive_reply(say, client, channel: str) -> ProgressiveReply:
+    """Reply posted with `say` and edited in place with chat.update."""
+    return ProgressiveReply(
+        post=lambda text: say(text).get("ts"),
+        edit=lambda ts, text: client.chat_update(channel=channel, ts=ts, text=text),
+    )
+
+
 @app.event("message")
-def handle_message_events(body, say):
+def handle_message_events(body, say, client):
+    """
+    Route the message and return right away so the event is acked; intents
+    that hit the database or the LLM are answered from the dispatcher pool.
+    A placeholder is posted immediately and updated as the answer builds up.
+    """
     event = body.get("event", {})
     user = event.get("user")
     text = event.get("text", "")
@@ -46,94 +115,40 @@ def handle_message_events(body, say):
     decision = route_message(text)
 
     if decision.intent == "help":
-        say(
-            "👋 I'm your analyst agent powered by PandasAI v3!\n\n"
-            "*For non-technical users:*\n"
-            "Ask me questions in natural language:\n"
-            "• *Which regions had the most users last month?*\n"
-            "• *What products drove the most revenue last holiday season?*\n"
-            "• *What is churn rate by plan?*\n"
-            "• *Show me subscriptions in the EU*\n"
-            "• *Predict new subscriptions for next year?*\n\n"
-            "*For data scientists:*\n"
-            "• *List queries* - See available golden queries\n"
-            "• *Create SQL query for [table] [filters]* - Generate SQL queries\n"
-            "  Example: \"Create SQL query for subscriptions in EU\"\n"
-            "• Paste SQL queries directly (SELECT only)\n"
-            "• Use queries from semantic layer as templates\n\n"
-            "*Powered by:* PandasAI v3 with semantic layer integration"
-        )
-        return
-
-    if decision.intent == "data_question":
-        try:
-            answer = run_data_question(decision.dataset, text)
-            # The answer already includes indicators (PandasAI or manual SQL)
-            # so we just need to format it nicely
-            if decision.dataset != "none":
-                say(f"🧠 *Answer from `{decision.dataset}` data:*\n{answer}")
-            else:
-                say(answer)
-        except Exception as e:
-            say(
-                "I tried to run that analysis on the data but hit an error ⚠️.\n"
-                f"_Internal error:_ `{e}`"
-            )
-        return
-
-    if decision.intent == "prediction":
-        try:
-            answer = run_subscription_prediction(text)
-            say(f"🔮 *Subscription Prediction:*\n{answer}")
-        except Exception as e:
-            say(
-                "I tried to generate predictions but hit an error ⚠️.\n"
-                f"_Internal error:_ `{e}`"
-            )
+        say(HELP_MESSAGE)
         return
 
-    if decision.intent == "sql_query":
-        try:
-            answer = run_sql_query(text)
-            say(answer)
-        except Exception as e:
-            say(
-                "I tried to execute your SQL query but hit an error ⚠️.\n"
-                f"_Internal error:_ `{e}`"
-            )
+    # Cancelling must not wait behind the queries it is meant to stop
+    if decision.intent == "cancel_query":
+        say(cancel_sql_query(user))
         return
 
-    if decision.intent == "list_queries":
-        try:
-            answer = list_golden_queries()
-            say(answer)
-        except Exception as e:
-            say(
-                "I tried to list golden queries but hit an error ⚠️.\n"
-                f"_Internal error:_ `{e}`"
-            )
-        return
-
-    if decision.intent == "generate_sql":
-        try:
-            answer = generate_sql_query(text, decision.dataset)
-            say(answer)
-        except Exception as e:
-            say(
-                "I tried to generate a SQL query but hit an error ⚠️.\n"
-                f"_Internal error:_ `{e}`"
-            )
+    if decision.intent in DISPATCHED_INTENTS:
+        pool = DISPATCH_POOLS.get(decision.intent, decision.intent)
+        if not progressive_replies_enabled():
+            accepted = get_dispatcher().submit(pool, lambda: say(answer_for_intent(decision, text, user)))
+            if not accepted:
+                say(BUSY_MESSAGE)
+            return
+
+        reply = _progressive_reply(say, client, event.get("channel"))
+        reply.start(format_placeholder(decision.intent, decision.dataset))
+        accepted = get_dispatcher().submit(
+            pool,
+            lambda: reply.finish(answer_for_intent(decision, text, user, progress=reply.update)),
+        )
+        if not accepted:
+            reply.finish(BUSY_MESSAGE)
         return
 
     # Unknown / fallback
-    say(
-        "Hmm, I’m not sure what to do with that yet 🤔.\n"
-        "Try asking for *help* or mention *users, payments, subscriptions, or sessions*."
-    )
+    say(UNKNOWN_MESSAGE)
 
 # ----------------------------------------
 # Start Socket Mode
 # ----------------------------------------
 if __name__ == "__main__":
     print("🤖 Slackbot with router is running...")
+    start_rollup_refresher()
+    start_forecast_refresher()
     SocketModeHandler(app, SLACK_APP_TOKEN).start()
@@ -0,0 +1,133 @@
+import asyncio
+import os
+from dotenv import load_dotenv
+from slack_bolt.async_app import AsyncApp
+from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
+
+
+from core.messages import (
+    HELP_MESSAGE,
+    UNKNOWN_MESSAGE,
+    format_answer,
+    format_error,
+    format_placeholder,
+)
+from core.services.forecast_store import start_forecast_refresher
+from core.services.progressive_reply import AsyncProgressiveReply, progressive_replies_enabled
+from core.services.rollups import start_rollup_refresher
+from core.subsystem_1.router import route_message
+from core.subsystem_2.async_agent import (
+    run_confirmed_sql_query_async,
+    run_data_question_async,
+    run_subscription_prediction_async,
+    run_sql_query_async,
+)
+from core.subsystem_2.pandas_agent import (
+    cancel_sql_query,
+    list_golden_queries,
+    generate_sql_query,
+)
+
+# ----------------------------------------
+# Load environment variables
+# ----------------------------------------
+load_dotenv()
+
+SLACK_BOT_TOKEN = os.getenv("SLACK_BOT_TOKEN")
+SLACK_SIGNING_SECRET = os.getenv("SLACK_SIGNING_SECRET")
+SLACK_APP_TOKEN = os.getenv("SLACK_APP_TOKEN")
+
+# ----------------------------------------
+# Initialize async Slack App
+# ----------------------------------------
+app = AsyncApp(
+    token=SLACK_BOT_TOKEN,
+    signing_secret=SLACK_SIGNING_SECRET,
+)
+
+
+# ----------------------------------------
+# Intent handlers
+# ----------------------------------------
+async def answer_for_intent(decision, text: str, user: str = None, progress=None) -> str:
+    """
+    Produce the Slack reply for a routed message without blocking the loop.
+    `progress` receives partial replies (with the intent header).
+    """
+    if progress is not None:
+        report_partial = progress
+        progress = lambda partial: report_partial(format_answer(decision.intent, decision.dataset, partial))  # noqa: E731
+
+    try:
+        if decision.intent == "data_question":
+            answer = await run_data_question_async(decision.dataset, text, progress=progress)
+        elif decision.intent == "prediction":
+            answer = await run_subscription_prediction_async(text, progress=progress)
+        elif decision.intent == "sql_query":
+            answer = await run_sql_query_async(text, user=user, progress=progress)
+        elif decision.intent == "confirm_query":
+            answer = await run_confirmed_sql_query_async(user, progress=progress)
+        elif decision.intent == "list_queries":
+            answer = await asyncio.to_thread(list_golden_queries)
+        elif decision.intent == "generate_sql":
+            answer = await asyncio.to_thread(generate_sql_query, text, decision.dataset)
+        else:
+            return UNKNOWN_MESSAGE
+    except Exception as e:
+        return format_error(decision.intent, e)
+
+    return format_answer(decision.intent, decision.dataset, answer)
+
+
+# ----------------------------------------
+# Single message handler that uses the router
+# ----------------------------------------
+async def _post_ts(say, text: str):
+    return (await say(text)).get("ts")
+
+
+@app.event("message")
+async def handle_message_events(body, say, client):
+    event = body.get("event", {})
+    user = event.get("user")
+    text = event.get("text", "")
+
+    # Ignore bot/system messages
+    if user is None or not text:
+        return
+
+    decision = route_message(text)
+
+    if decision.intent == "help":
+        await say(HELP_MESSAGE)
+        return
+
+    if decision.intent == "cancel_query":
+        await say(cancel_sql_query(user))
+        return
+
+    if not progressive_replies_enabled() or decision.intent == "unknown":
+        await say(await answer_for_intent(decision, text, user))
+        return
+
+    channel = event.get("channel")
+    reply = AsyncProgressiveReply(
+        post=lambda reply_text: _post_ts(say, reply_text),
+        edit=lambda ts, reply_text: client.chat_update(channel=channel, ts=ts, text=reply_text),
+    )
+    await reply.start(format_placeholder(decision.intent, decision.dataset))
+    await reply.finish(await answer_for_intent(decision, text, user, progress=reply.update))
+
+
+# ----------------------------------------
+# Start async Socket Mode
+# ----------------------------------------
+async def main():
+    print("🤖 Async Slackbot with router is running...")
+    start_rollup_refresher()
+    start_forecast_refresher()
+    await AsyncSocketModeHandler(app, SLACK_APP_TOKEN).start_async()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
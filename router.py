@@ -1,10 +1,27 @@
-from langchain_openai import ChatOpenAI
+from core.services.llm_gateway import estimate_tokens, get_llm_gateway
+from core.subsystem_1.intent_classifier import classify_locally, confidence_threshold
 
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+_llm = None
 
-def classify_query(text: str) -> str:
+
+def _get_llm():
     """
-    Classify the question into one of:
+    Create the ChatOpenAI client on first use (only low-confidence questions
+    need it). Retries and deadlines are left to the LLM gateway.
+    """
+    global _llm
+    if _llm is None:
+        from langchain_openai import ChatOpenAI
+        _llm = ChatOpenAI(
+            model="gpt-4o-mini", temperature=0, max_retries=0,
+            timeout=get_llm_gateway().config.timeout,
+        )
+    return _llm
+
+
+def classify_query_with_llm(text: str) -> str:
+    """
+    Classify the question with the LLM into one of:
     users, payments, subscriptions, sessions, unknown
     """
     prompt = f"""
@@ -20,5 +37,23 @@ def classify_query(text: str) -> str:
     Respond with only the category name.
     """
 
-    resp = llm.invoke(prompt)
-    return resp.content.strip().lower()
\ No newline at end of file
+    resp = get_llm_gateway().call(lambda timeout: _get_llm().invoke(prompt), estimate_tokens(prompt))
+    return resp.content.strip().lower()
+
+
+def classify_query(text: str) -> str:
+    """
+    Classify the question into one of:
+    users, payments, subscriptions, sessions, unknown
+
+    The local classifier answers when it is confident; only low-confidence
+    questions are sent to the LLM.
+    """
+    prediction = classify_locally(text)
+    if prediction.confidence >= confidence_threshold():
+        return prediction.label
+
+    try:
+        return classify_query_with_llm(text)
+    except Exception:
+        return "unknown"
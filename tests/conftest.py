@@ -47,3 +47,88 @@ def sample_subscription_data():
         (2023, 6, 150),
     ]
 
+
+
+@pytest.fixture(autouse=True)
+def clear_response_cache():
+    """Keep cached answers from leaking between tests."""
+    from core.services.response_cache import get_response_cache
+    get_response_cache().clear()
+    yield
+    get_response_cache().clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_rollup_availability():
+    """Forget which rollup tables were seen so tests don't depend on order."""
+    from core.services import rollups
+    rollups._available.clear()
+    rollups._marks.clear()
+    rollups._full_at.clear()
+    yield
+    rollups._available.clear()
+    rollups._marks.clear()
+    rollups._full_at.clear()
+
+
+@pytest.fixture(autouse=True)
+def reset_incremental_series():
+    """Start every test without in-memory aggregates."""
+    from core.services.incremental import reset_series
+    reset_series()
+    yield
+    reset_series()
+
+
+@pytest.fixture(autouse=True)
+def clear_forecast_store():
+    """Make every test fit its forecasts from its own (mocked) data."""
+    from core.services.forecast_store import get_forecast_store
+    get_forecast_store().clear()
+    yield
+    get_forecast_store().clear()
+
+
+@pytest.fixture(autouse=True)
+def reset_query_guard():
+    """Forget queries parked for confirmation or registered as running."""
+    from core.services.query_guard import reset_guard_state
+    reset_guard_state()
+    yield
+    reset_guard_state()
+
+
+@pytest.fixture(autouse=True)
+def clear_sql_validation_cache():
+    """Validate every test's SQL from scratch (verdicts depend on env settings)."""
+    from core.services.sql_validator import clear_validation_cache
+    clear_validation_cache()
+    yield
+    clear_validation_cache()
+
+
+@pytest.fixture(autouse=True)
+def reset_stage_metrics():
+    """Start every test with empty stage timings."""
+    from core.services.insights import reset_stage_metrics
+    reset_stage_metrics()
+    yield
+    reset_stage_metrics()
+
+
+@pytest.fixture(autouse=True)
+def reset_single_flight():
+    """Start every test without in-flight shared computations."""
+    from core.services.single_flight import reset_single_flight
+    reset_single_flight()
+    yield
+    reset_single_flight()
+
+
+@pytest.fixture(autouse=True)
+def reset_llm_gateway():
+    """Give every test a fresh LLM gateway (closed breaker, full buckets)."""
+    from core.services.llm_gateway import reset_llm_gateway
+    reset_llm_gateway()
+    yield
+    reset_llm_gateway()
@@ -0,0 +1,118 @@
+"""
+Tests for the async data agent (subsystem_2/async_agent.py)
+Tests the asyncio SQL, prediction and data question paths.
+"""
+
+import asyncio
+import threading
+from unittest.mock import AsyncMock, patch
+
+from core.subsystem_2.async_agent import (
+    run_data_question_async,
+    run_sql_query_async,
+    run_subscription_prediction_async,
+)
+
+
+class TestAsyncSQLQuery:
+    """Test async SQL query execution."""
+
+    @patch('core.subsystem_2.async_agent.explain_with_llm_async', new_callable=AsyncMock)
+    @patch('core.subsystem_2.async_agent.async_db.fetch_all', new_callable=AsyncMock)
+    def test_sql_query_results(self, mock_fetch, mock_explain):
+        """Test that rows are fetched asynchronously and formatted."""
+        mock_fetch.return_value = [{"id": 1, "name": "test"}]
+        mock_explain.return_value = "Lists one user."
+
+        result = asyncio.run(run_sql_query_async("SELECT * FROM users LIMIT 1"))
+
+        assert "Query Results" in result
+        assert "Lists one user." in result
+        sql = mock_fetch.await_args[0][0]
+        assert "SELECT * FROM users LIMIT 1" in sql
+        assert sql.endswith("LIMIT 101")
+
+    @patch('core.subsystem_2.async_agent.async_db.fetch_all', new_callable=AsyncMock)
+    def test_sql_query_unsafe_rejected(self, mock_fetch):
+        """Test that unsafe SQL never reaches the database."""
+        result = asyncio.run(run_sql_query_async("DELETE FROM users"))
+
+        assert "Security Error" in result
+        mock_fetch.assert_not_awaited()
+
+
+class TestAsyncPrediction:
+    """Test async subscription prediction."""
+
+    @patch('core.subsystem_2.async_agent.analyze_with_llm_async', new_callable=AsyncMock)
+    @patch('core.subsystem_2.pandas_agent._dataset_watermark', return_value="wm-1")
+    @patch('core.subsystem_2.pandas_agent._get_historical_new_subscriptions')
+    def test_prediction_success(self, mock_history, mock_watermark, mock_analyze, sample_subscription_data):
+        """Test that the async prediction path forecasts and adds insights."""
+        mock_history.return_value = sample_subscription_data
+        mock_analyze.return_value = "Growth is steady."
+
+        result = asyncio.run(run_subscription_prediction_async("predict subscriptions"))
+
+        assert "Prediction agent" in result
+        assert "Growth is steady." in result
+
+    @patch('core.subsystem_2.pandas_agent._dataset_watermark', return_value="wm-1")
+    @patch('core.subsystem_2.pandas_agent._get_historical_new_subscriptions')
+    def test_prediction_insufficient_data(self, mock_history, mock_watermark):
+        """Test the async prediction path with too little history."""
+        mock_history.return_value = [(2024, 1, 10)]
+
+        result = asyncio.run(run_subscription_prediction_async("predict subscriptions"))
+        assert "Insufficient historical data" in result
+
+    @patch('core.subsystem_2.async_agent.analyze_with_llm_async', new_callable=AsyncMock)
+    @patch('core.subsystem_2.pandas_agent._dataset_watermark', return_value="wm-1")
+    @patch('core.subsystem_2.pandas_agent._get_segmented_new_subscriptions')
+    def test_segmented_prediction(self, mock_series, mock_watermark, mock_analyze, sample_subscription_data):
+        """Test that the async path ranks every segment's forecast."""
+        mock_series.return_value = {
+            plan: [(y, m, c * scale) for y, m, c in sample_subscription_data]
+            for plan, scale in (("monthly", 1), ("annual", 3))
+        }
+        mock_analyze.return_value = ""
+
+        result = asyncio.run(run_subscription_prediction_async("predict subscriptions by plan"))
+
+        assert "new subscriptions by plan" in result
+        assert result.index("*annual*") < result.index("*monthly*")
+
+    @patch('core.subsystem_2.async_agent.analyze_with_llm_async', new_callable=AsyncMock)
+    @patch('core.subsystem_2.pandas_agent._dataset_watermark', return_value="wm-1")
+    @patch('core.subsystem_2.pandas_agent._get_historical_new_subscriptions')
+    def test_forecast_fitted_off_the_loop_and_reused(self, mock_history, mock_watermark, mock_analyze,
+                                                     sample_subscription_data):
+        """Test that the fit runs on a worker thread once and repeat questions reuse it."""
+        fitted_on = []
+        mock_history.side_effect = lambda force=False: fitted_on.append(threading.current_thread()) or sample_subscription_data
+        mock_analyze.return_value = ""
+
+        async def run():
+            first = await run_subscription_prediction_async("predict subscriptions for next year")
+            second = await run_subscription_prediction_async("how many new subscriptions will we get next months")
+            return first, second
+
+        first, second = asyncio.run(run())
+
+        assert len(fitted_on) == 1
+        assert fitted_on[0] is not threading.main_thread()
+        assert "Monthly Breakdown" in first and "Monthly Breakdown" in second
+
+
+class TestAsyncDataQuestion:
+    """Test async data questions."""
+
+    @patch('core.subsystem_2.async_agent.pandas_agent.run_data_question')
+    def test_data_question_runs_sync_agent_off_loop(self, mock_run):
+        """Test that PandasAI questions are delegated to the sync agent."""
+        mock_run.return_value = "answer"
+
+        result = asyncio.run(run_data_question_async("users", "which countries have the most users?"))
+
+        assert result == "answer"
+        mock_run.assert_called_once_with("users", "which countries have the most users?")
@@ -0,0 +1,99 @@
+"""
+Tests for the DataFrame cache (services/dataframe_cache.py)
+Tests TTL expiry, LRU byte eviction, watermark staleness and invalidation.
+"""
+
+from unittest.mock import MagicMock, patch
+
+import pandas as pd
+
+from core.services.dataframe_cache import DataFrameCache
+from core.services.table_loader import load_table
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _frame(rows=10):
+    return pd.DataFrame({"amount_usd": [1.0] * rows})
+
+
+class TestDataFrameCache:
+    """Test cache hits, expiry and eviction."""
+
+    def test_hit_after_put(self):
+        """Test that a cached frame is returned for the same key."""
+        cache = DataFrameCache(max_bytes=10**6, ttl_seconds=60)
+        df = _frame()
+        cache.put("k", "payments", df)
+
+        entry = cache.get("k")
+        assert entry is not None and entry.df is df
+        assert cache.stats().hits == 1
+
+    def test_ttl_expiry(self):
+        """Test that entries older than the TTL are misses."""
+        clock = FakeClock()
+        cache = DataFrameCache(max_bytes=10**6, ttl_seconds=60, clock=clock)
+        cache.put("k", "payments", _frame())
+
+        clock.now = 61
+        assert cache.get("k") is None
+        assert cache.stats().expired == 1
+
+    def test_stale_watermark(self):
+        """Test that a moved watermark drops the cached frame."""
+        cache = DataFrameCache(max_bytes=10**6, ttl_seconds=60)
+        cache.put("k", "payments", _frame(), watermark=("2024-01-01",))
+
+        assert cache.get("k", ("2024-01-01",)) is not None
+        assert cache.get("k", ("2024-01-02",)) is None
+        assert cache.stats().stale == 1
+
+    def test_lru_eviction_by_bytes(self):
+        """Test that the least recently used frame is evicted to fit the budget."""
+        size = _frame(100).memory_usage(index=True, deep=True).sum()
+        cache = DataFrameCache(max_bytes=int(size * 2.5), ttl_seconds=60)
+        cache.put("a", "payments", _frame(100))
+        cache.put("b", "payments", _frame(100))
+        cache.get("a")
+        cache.put("c", "payments", _frame(100))
+
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert cache.stats().evictions == 1
+
+    def test_invalidate_notifies_listeners(self):
+        """Test that invalidating a table drops its entries and calls listeners."""
+        cache = DataFrameCache(max_bytes=10**6, ttl_seconds=60)
+        listener = MagicMock()
+        cache.add_invalidation_listener(listener)
+        cache.put("a", "payments", _frame())
+        cache.put("b", "users", _frame())
+
+        assert cache.invalidate("payments") == 1
+        assert cache.get("b") is not None
+        listener.assert_called_once_with("payments")
+
+
+class TestCachedLoad:
+    """Test that load_table reuses cached frames."""
+
+    @patch('core.services.table_loader.table_watermark', return_value=("2024-01-01",))
+    @patch('core.services.table_loader._estimate_rows', return_value=100)
+    @patch('pandas.read_sql_query')
+    def test_repeat_question_served_from_cache(self, mock_read, mock_rows, mock_watermark):
+        """Test that the same slice is only read from Postgres once."""
+        mock_read.return_value = _frame()
+        cache = DataFrameCache(max_bytes=10**6, ttl_seconds=60)
+
+        first = load_table(MagicMock(), "total revenue last month", "payments", cache=cache)
+        second = load_table(MagicMock(), "total revenue last month", "payments", cache=cache)
+
+        assert mock_read.call_count == 1
+        assert second.version == first.version
@@ -0,0 +1,110 @@
+"""
+Tests for the shared connection pool (services/db_pool.py)
+Uses fake connections so no database is required.
+"""
+
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+from core.services.db_pool import ConnectionPool, PoolConfig, PoolTimeoutError
+
+
+def _fake_connect():
+    conn = MagicMock()
+    conn.closed = 0
+    return conn
+
+
+def _make_pool(**overrides):
+    config = PoolConfig(**{"min_size": 1, "max_size": 2, "checkout_timeout": 0.2, **overrides})
+    connect = MagicMock(side_effect=_fake_connect)
+    return ConnectionPool(config, connect=connect), connect
+
+
+class TestConnectionPool:
+    """Test pool checkout, recycling and metrics."""
+
+    def test_connection_is_reused(self):
+        """Test that sequential checkouts reuse the same connection."""
+        pool, connect = _make_pool()
+
+        with pool.connection() as first:
+            pass
+        with pool.connection() as second:
+            pass
+
+        assert first is second
+        assert connect.call_count == 1
+        first.rollback.assert_called()
+
+    def test_statement_timeout_set_per_checkout(self):
+        """Test that each checkout sets a local statement timeout."""
+        pool, _ = _make_pool(statement_timeout_ms=1500)
+
+        with pool.connection() as conn:
+            cursor = conn.cursor.return_value.__enter__.return_value
+            cursor.execute.assert_called_with("SET LOCAL statement_timeout = %s", (1500,))
+
+    def test_checkout_times_out_when_exhausted(self):
+        """Test that callers beyond max_size time out instead of connecting."""
+        pool, connect = _make_pool(max_size=1)
+
+        with pool.connection():
+            with pytest.raises(PoolTimeoutError):
+                with pool.connection():
+                    pass
+
+        assert connect.call_count == 1
+        assert pool.stats().checkout_timeouts == 1
+
+    def test_waiter_receives_returned_connection(self):
+        """Test that a waiting caller gets the connection once it is returned."""
+        pool, connect = _make_pool(max_size=1, checkout_timeout=2.0)
+        got = []
+
+        with pool.connection():
+            worker = threading.Thread(target=lambda: got.append(pool.connection().__enter__()))
+            worker.start()
+            worker.join(0.1)
+            assert pool.stats().waiters == 1
+        worker.join(2.0)
+
+        assert len(got) == 1
+        assert connect.call_count == 1
+
+    def test_expired_connection_is_recycled(self):
+        """Test that connections past max_lifetime are replaced."""
+        pool, connect = _make_pool(max_lifetime=0.0001)
+
+        with pool.connection():
+            pass
+        threading.Event().wait(0.01)
+        with pool.connection():
+            pass
+
+        assert connect.call_count == 2
+        assert pool.stats().connections_recycled >= 1
+
+    def test_closed_connection_is_discarded(self):
+        """Test that a connection closed by the server is not returned to the pool."""
+        pool, connect = _make_pool()
+
+        with pool.connection() as conn:
+            conn.closed = 2
+
+        stats = pool.stats()
+        assert stats.idle == 0
+        assert stats.size == 0
+
+    def test_stats_track_in_use(self):
+        """Test that in-use and checkout counters are reported."""
+        pool, _ = _make_pool()
+
+        with pool.connection():
+            assert pool.stats().in_use == 1
+        stats = pool.stats()
+
+        assert stats.in_use == 0
+        assert stats.checkouts == 1
+        assert stats.idle == 1
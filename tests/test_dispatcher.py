@@ -0,0 +1,103 @@
+"""
+Tests for the event dispatcher (services/dispatcher.py)
+Tests per-intent concurrency limits, queue bounds and metrics.
+"""
+
+import threading
+
+from core.services.dispatcher import (
+    DispatcherConfig,
+    EventDispatcher,
+    _parse_intent_limits,
+)
+
+
+def _blocking_job(started: threading.Event, release: threading.Event):
+    def job():
+        started.set()
+        release.wait(2.0)
+    return job
+
+
+class TestEventDispatcher:
+    """Test cases for dispatching Slack work."""
+
+    def test_job_runs_on_worker(self):
+        """Test that submitted jobs run and are counted."""
+        dispatcher = EventDispatcher(DispatcherConfig(max_workers=2, max_queue=5))
+        done = threading.Event()
+
+        assert dispatcher.submit("list_queries", done.set) is True
+        assert done.wait(2.0)
+        dispatcher.shutdown()
+
+        assert dispatcher.stats().intents["list_queries"].completed == 1
+
+    def test_intent_limit_queues_extra_jobs(self):
+        """Test that jobs over an intent's limit wait instead of running."""
+        config = DispatcherConfig(max_workers=4, max_queue=5, intent_limits={"data_question": 1})
+        dispatcher = EventDispatcher(config)
+        started, release = threading.Event(), threading.Event()
+        second = threading.Event()
+
+        dispatcher.submit("data_question", _blocking_job(started, release))
+        started.wait(2.0)
+        dispatcher.submit("data_question", second.set)
+
+        stats = dispatcher.stats()
+        assert stats.intents["data_question"].running == 1
+        assert stats.intents["data_question"].waiting == 1
+        assert stats.queue_depth == 1
+        assert not second.is_set()
+
+        release.set()
+        assert second.wait(2.0)
+        dispatcher.shutdown()
+
+    def test_other_intents_not_blocked(self):
+        """Test that a saturated intent does not block other intents."""
+        config = DispatcherConfig(max_workers=4, max_queue=5, intent_limits={"data_question": 1})
+        dispatcher = EventDispatcher(config)
+        started, release = threading.Event(), threading.Event()
+        listed = threading.Event()
+
+        dispatcher.submit("data_question", _blocking_job(started, release))
+        started.wait(2.0)
+        dispatcher.submit("list_queries", listed.set)
+
+        assert listed.wait(2.0)
+        release.set()
+        dispatcher.shutdown()
+
+    def test_rejects_when_saturated(self):
+        """Test that submit returns False once the queue is full."""
+        config = DispatcherConfig(max_workers=1, max_queue=0, intent_limits={"sql_query": 1})
+        dispatcher = EventDispatcher(config)
+        started, release = threading.Event(), threading.Event()
+
+        assert dispatcher.submit("sql_query", _blocking_job(started, release)) is True
+        started.wait(2.0)
+        assert dispatcher.submit("sql_query", lambda: None) is False
+        assert dispatcher.stats().rejected == 1
+
+        release.set()
+        dispatcher.shutdown()
+
+    def test_failed_job_is_counted(self):
+        """Test that exceptions in jobs are contained and counted."""
+        dispatcher = EventDispatcher(DispatcherConfig(max_workers=1, max_queue=1))
+
+        def boom():
+            raise RuntimeError("boom")
+
+        dispatcher.submit("prediction", boom)
+        dispatcher.shutdown()
+
+        assert dispatcher.stats().intents["prediction"].failed == 1
+
+    def test_parse_intent_limits(self):
+        """Test parsing of DISPATCH_INTENT_LIMITS."""
+        assert _parse_intent_limits("data_question=3, prediction=1,bad,x=") == {
+            "data_question": 3,
+            "prediction": 1,
+        }
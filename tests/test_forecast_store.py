@@ -0,0 +1,100 @@
+"""
+Tests for the precomputed forecast store.
+"""
+
+import json
+from unittest.mock import Mock, patch
+
+import pytest
+
+from core.services.forecast_store import ForecastStore, get_forecast_store
+from core.services.forecasting import forecast_monthly
+from core.subsystem_2.pandas_agent import run_subscription_prediction
+
+
+def _forecast():
+    return forecast_monthly([(2024, m, 10 * m) for m in range(1, 8)])
+
+
+class TestForecastStore:
+    """Test serving, refitting and diagnostics."""
+
+    def _store(self, watermark, **kwargs):
+        store = ForecastStore(**kwargs)
+        compute = Mock(side_effect=lambda: ("value", {"total": _forecast()}))
+        store.register("new_subscriptions", None, compute, lambda: watermark[0])
+        return store, compute
+
+    def test_serves_until_watermark_moves(self):
+        """Test that a forecast is reused until the data watermark changes."""
+        watermark = [1]
+        store, compute = self._store(watermark)
+
+        assert store.get("new_subscriptions").value == "value"
+        store.get("new_subscriptions")
+        assert compute.call_count == 1
+
+        watermark[0] = 2
+        store.get("new_subscriptions")
+        assert compute.call_count == 2
+        assert store.stats().hits == 1
+
+    def test_expires(self):
+        """Test that forecasts older than max_age are refitted."""
+        store, compute = self._store([1], max_age_seconds=0)
+        store.get("new_subscriptions")
+        store.get("new_subscriptions")
+        assert compute.call_count == 2
+
+    def test_refresh_precomputes(self):
+        """Test that refresh fits stale forecasts and skips fresh ones."""
+        store, compute = self._store([1])
+        assert store.refresh() == {("new_subscriptions", None): True}
+        assert store.refresh() == {("new_subscriptions", None): False}
+        assert compute.call_count == 1
+
+    def test_refresh_survives_failures(self):
+        """Test that one failing producer doesn't stop the refresh."""
+        store = ForecastStore()
+        store.register("broken", None, Mock(side_effect=RuntimeError("db down")), lambda: 1)
+        assert store.refresh() == {("broken", None): False}
+        assert store.stats().failures == 1
+
+    def test_records_diagnostics(self, tmp_path):
+        """Test that every fit records the chosen model and backtest error."""
+        path = tmp_path / "fits.jsonl"
+        watermark = [1]
+        store, _ = self._store(watermark, diagnostics_file=str(path))
+        store.get("new_subscriptions")
+        watermark[0] = 2
+        store.get("new_subscriptions")
+
+        history = store.diagnostics("new_subscriptions")
+        assert len(history) == 2
+        assert history[0].models == {"linear": 1}
+        assert history[0].history_months == 7
+        assert history[0].mean_backtest_mae == pytest.approx(0.0)
+        lines = [json.loads(line) for line in path.read_text().splitlines()]
+        assert [line["watermark"] for line in lines] == ["1", "2"]
+
+    def test_unknown_key(self):
+        """Test that unregistered series are rejected."""
+        with pytest.raises(KeyError):
+            ForecastStore().get("revenue")
+
+
+class TestPredictionUsesStore:
+    """Test that prediction questions are answered from the store."""
+
+    @patch('core.subsystem_2.pandas_agent._dataset_watermark', return_value="wm-1")
+    @patch('core.subsystem_2.pandas_agent._get_historical_new_subscriptions')
+    def test_fit_once_for_different_questions(self, mock_history, mock_watermark, sample_subscription_data):
+        """Test that differently worded questions share one fitted forecast."""
+        mock_history.return_value = sample_subscription_data
+
+        first = run_subscription_prediction("predict subscriptions for next year")
+        second = run_subscription_prediction("how many new subscriptions will we get in the coming months")
+
+        assert mock_history.call_count == 1
+        assert "Monthly Breakdown" in first and "Monthly Breakdown" in second
+        assert get_forecast_store().diagnostics("new_subscriptions")[-1].segment is None
@@ -0,0 +1,114 @@
+"""
+Tests for the monthly forecasting engine.
+"""
+
+import numpy as np
+import pytest
+
+from core.services.forecasting import MODELS, backtest, forecast_monthly, forecast_segments, monthly_values
+
+
+def _series(months, value):
+    return [(2021 + i // 12, i % 12 + 1, value(i)) for i in range(months)]
+
+
+class TestModels:
+    """Test that batch models only use history before each origin."""
+
+    @pytest.mark.parametrize("model", MODELS, ids=lambda m: m.name)
+    def test_no_lookahead(self, model):
+        """Test that changing future values doesn't change earlier forecasts."""
+        rng = np.random.default_rng(1)
+        y = rng.uniform(50, 150, (3, 36))
+        origins = np.arange(model.min_history, 30)
+        before = model.batch(y, origins, 6)
+        y[:, 30:] += 1000
+        after = model.batch(y, origins, 6)
+        np.testing.assert_allclose(before, after)
+
+    def test_linear_matches_pure_python(self):
+        """Test that the batched OLS agrees with _calculate_linear_trend."""
+        from core.subsystem_2.pandas_agent import _calculate_linear_trend
+
+        data = [(2023, m, v) for m, v in zip(range(1, 10), [5, 9, 4, 12, 15, 11, 18, 21, 19])]
+        slope, intercept = _calculate_linear_trend(data)
+        forecast = MODELS[1].batch(monthly_values(data)[None], np.array([9]), 1)[0, 0, 0, 0]
+        assert forecast == pytest.approx(slope * 9 + intercept)
+
+
+class TestForecast:
+    """Test model selection and intervals."""
+
+    def test_linear_series_picks_linear(self):
+        """Test that an exact trend is forecast exactly."""
+        forecast = forecast_monthly([(2023, m, 100 + 5 * m) for m in range(1, 7)])
+        assert forecast.model == "linear"
+        assert forecast.predictions[0] == (2023, 7, 135.0)
+        assert forecast.predictions[-1][:2] == (2024, 6)
+
+    def test_seasonal_series_picks_seasonal_model(self):
+        """Test that a Q4 bump is captured by a seasonal model."""
+        rng = np.random.default_rng(0)
+        data = _series(36, lambda i: 100 + 2 * i + (50 if i % 12 in (10, 11) else 0) + rng.normal(0, 3))
+        forecast = forecast_monthly(data)
+        assert forecast.model in ("decomposition", "holt_winters")
+        by_month = {month: value for _, month, value in forecast.predictions}
+        assert by_month[11] > by_month[9] + 30
+
+    def test_intervals_contain_forecast(self):
+        """Test that intervals bracket the forecast and are non-negative."""
+        rng = np.random.default_rng(2)
+        forecast = forecast_monthly(_series(24, lambda i: 20 + rng.normal(0, 10)), level=0.95)
+        for (_, _, value), low, high in zip(forecast.predictions, forecast.lower, forecast.upper):
+            assert 0 <= low <= value <= high
+        assert forecast.upper[-1] > forecast.lower[-1]
+
+    def test_missing_months_are_zero(self):
+        """Test that gaps in the monthly series are filled with zeros."""
+        assert list(monthly_values([(2023, 11, 5), (2024, 2, 7)])) == [5, 0, 0, 7]
+
+    def test_scores_are_sorted(self):
+        """Test that backtest scores come best first."""
+        forecast = forecast_monthly([(2021 + i // 12, i % 12 + 1, float(i)) for i in range(30)])
+        assert list(forecast.scores.values()) == sorted(forecast.scores.values())
+
+    def test_too_short(self):
+        """Test that a series too short to backtest is rejected."""
+        with pytest.raises(ValueError):
+            forecast_monthly([(2023, 1, 10), (2023, 2, 12)])
+
+
+class TestSegments:
+    """Test forecasting many segments in one pass."""
+
+    def test_matches_single_series(self):
+        """Test that a segment's forecast equals forecasting it alone."""
+        rng = np.random.default_rng(3)
+        series = {
+            name: _series(30, lambda i, base=base: base + i + rng.normal(0, 4))
+            for name, base in (("monthly", 50), ("annual", 200), ("trial", 10))
+        }
+        together = forecast_segments(series)
+        for name, rows in series.items():
+            alone = forecast_monthly(rows)
+            assert together[name].model == alone.model
+            np.testing.assert_allclose(
+                [v for _, _, v in together[name].predictions], [v for _, _, v in alone.predictions]
+            )
+            np.testing.assert_allclose(together[name].upper, alone.upper)
+
+    def test_aligns_segments_on_one_grid(self):
+        """Test that segments starting later are zero-filled before their first month."""
+        series = {
+            "old": _series(12, lambda i: 10.0 + i),
+            "new": [(2021, m, 5.0 * m) for m in range(7, 13)],
+        }
+        forecasts = forecast_segments(series)
+        assert forecasts["new"].predictions[0][:2] == (2022, 1)
+        assert forecasts["old"].predictions[0][:2] == (2022, 1)
+        assert len(forecasts["new"].predictions) == 12
+
+    def test_backtest_shapes(self):
+        """Test that backtest errors keep a segment axis."""
+        results = backtest(np.ones((4, 20)), 6)
+        assert all(r.errors.shape[0] == 4 and r.mae.shape == (4,) for r in results)
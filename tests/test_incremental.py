@@ -0,0 +1,155 @@
+"""
+Tests for incremental watermark-based refreshes.
+"""
+
+from datetime import date, datetime, timedelta
+from unittest.mock import MagicMock, patch
+
+from core.services.incremental import IncrementalSeries, get_series, plan_refresh
+from core.services.rollups import RollupSpec
+from core.subsystem_2.pandas_agent import (
+    _compute_total_forecast,
+    _get_historical_new_subscriptions,
+    _query_total_payments,
+)
+
+
+def _spec():
+    return RollupSpec(
+        model="payments",
+        source_table="payments",
+        time_column="payment_date",
+        dimensions=["method"],
+        sum_columns=["amount_usd"],
+    )
+
+
+def _conn(fetchone, fetchall):
+    conn = MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+    cursor.fetchone.side_effect = fetchone
+    cursor.fetchall.side_effect = fetchall
+    return conn, cursor
+
+
+class TestPlanRefresh:
+    """Test how high-water marks translate into rebuilt days."""
+
+    def test_first_refresh_is_full(self):
+        """Test that no previous marks means rebuilding everything."""
+        plan = plan_refresh(None, {"payment_date": date(2024, 3, 10)})
+        assert plan.changed and plan.since is None
+
+    def test_unchanged_marks_skip(self):
+        """Test that nothing is rebuilt when no mark moved."""
+        marks = {"payment_date": datetime(2024, 3, 10, 12, 0)}
+        assert not plan_refresh(dict(marks), marks).changed
+
+    def test_rebuilds_from_oldest_previous_mark(self):
+        """Test that the window starts at the oldest previous mark minus lateness."""
+        previous = {"start_date": date(2024, 3, 10), "end_date": datetime(2024, 3, 5, 9, 30)}
+        current = {"start_date": date(2024, 3, 11), "end_date": datetime(2024, 3, 5, 9, 30)}
+        plan = plan_refresh(previous, current, lateness=3)
+        assert plan.since == date(2024, 3, 2)
+
+    def test_empty_columns_are_ignored(self):
+        """Test that a column with no rows yet doesn't force a full rebuild."""
+        previous = {"start_date": date(2024, 3, 10), "end_date": None}
+        current = {"start_date": date(2024, 3, 11), "end_date": None}
+        assert plan_refresh(previous, current, lateness=1).since == date(2024, 3, 9)
+
+    def test_first_rows_in_column_force_full(self):
+        """Test that a column gaining its first rows rebuilds everything."""
+        previous = {"start_date": date(2024, 3, 10), "end_date": None}
+        current = {"start_date": date(2024, 3, 10), "end_date": date(2024, 3, 10)}
+        assert plan_refresh(previous, current).since is None
+
+
+class TestIncrementalSeries:
+    """Test the in-memory daily series."""
+
+    def test_merges_only_recent_days(self, monkeypatch):
+        """Test that a refresh replaces buckets from the window and keeps older ones."""
+        monkeypatch.setenv("INCREMENTAL_CHECK_SECONDS", "0")
+        monkeypatch.setenv("INCREMENTAL_LATENESS_DAYS", "1")
+        series = IncrementalSeries(_spec())
+        conn, cursor = _conn(
+            fetchone=[(date(2024, 3, 10),), (date(2024, 3, 11),)],
+            fetchall=[
+                [(date(2024, 3, 1), 2, 20), (date(2024, 3, 10), 1, 5)],
+                [(date(2024, 3, 10), 2, 15), (date(2024, 3, 11), 1, 7)],
+            ],
+        )
+
+        series.refresh(conn)
+        plan = series.refresh(conn)
+
+        assert plan.since == date(2024, 3, 9)
+        assert cursor.execute.call_args_list[-1][0][1] == [date(2024, 3, 9)]
+        assert series.totals() == {"row_count": 5.0, "sum_amount_usd": 42.0}
+        assert series.totals(date(2024, 3, 10))["sum_amount_usd"] == 22.0
+
+    def test_drops_dimensions(self):
+        """Test that the series aggregates by day only."""
+        series = IncrementalSeries(_spec())
+        sql, _ = series.spec.source_sql(None)
+        assert "method" not in sql
+
+    def test_skips_check_within_interval(self):
+        """Test that sources are not re-checked within INCREMENTAL_CHECK_SECONDS."""
+        series = IncrementalSeries(_spec())
+        conn, cursor = _conn(fetchone=[(date(2024, 3, 10),)], fetchall=[[]])
+        series.refresh(conn)
+        cursor.execute.reset_mock()
+
+        assert not series.refresh(conn).changed
+        cursor.execute.assert_not_called()
+
+    def test_monthly_skips_empty_months(self):
+        """Test that months without rows are left out of the monthly series."""
+        series = IncrementalSeries(_spec())
+        conn, _ = _conn(
+            fetchone=[(date(2024, 3, 10),)],
+            fetchall=[[(date(2024, 1, 5), 2, 0), (date(2024, 1, 20), 1, 0), (date(2024, 2, 1), 0, 0), (date(2024, 3, 2), 4, 0)]],
+        )
+        series.refresh(conn)
+        assert series.monthly("row_count") == [(2024, 1, 3.0), (2024, 3, 4.0)]
+
+
+class TestConsumers:
+    """Test the agent queries backed by incremental series."""
+
+    @patch('core.subsystem_2.pandas_agent._get_connection')
+    def test_total_payments(self, mock_conn):
+        """Test that revenue totals come from the payments series."""
+        today = date.today()
+        cursor = mock_conn.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value
+        cursor.fetchone.side_effect = [(today,)]
+        cursor.fetchall.side_effect = [[(date(2000, 1, 1), 1, 100), (today, 2, 30)]]
+
+        assert _query_total_payments(window_days=30) == 30.0
+        assert _query_total_payments(window_days=None) == 130.0
+        assert get_series("payments").spec.sum_columns == ["amount_usd"]
+
+    @patch('core.subsystem_2.pandas_agent._get_connection')
+    def test_historical_new_subscriptions(self, mock_conn):
+        """Test that the history counts subscription starts per month."""
+        today = date.today()
+        cursor = mock_conn.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value
+        cursor.fetchone.side_effect = [(today, None)]
+        cursor.fetchall.side_effect = [[(date(2000, 1, 1), 9, 0), (today, 3, 2)]]
+
+        assert _get_historical_new_subscriptions() == [(today.year, today.month, 3)]
+
+    @patch('core.subsystem_2.pandas_agent._get_connection')
+    def test_forecast_refit_reads_new_rows(self, mock_conn):
+        """Test that a refit checks the source even if the series was checked moments ago."""
+        today = date.today()
+        cursor = mock_conn.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value
+        cursor.fetchone.side_effect = [(today - timedelta(days=1), None), (today, None)]
+        cursor.fetchall.side_effect = [[(today - timedelta(days=1), 3, 0)], [(today - timedelta(days=1), 3, 0), (today, 2, 0)]]
+        _get_historical_new_subscriptions()
+
+        (history, _, _), _ = _compute_total_forecast()
+
+        assert sum(count for _, _, count in history) == 5
@@ -0,0 +1,107 @@
+"""
+Tests for background LLM insights (deadline, dropping) and stage timings.
+"""
+
+import asyncio
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+from core.services.insights import (
+    StageTimer,
+    collect_insight,
+    collect_insight_async,
+    get_stage_metrics,
+    start_insight,
+)
+from core.subsystem_2.pandas_agent import run_sql_query
+
+
+class TestCollectInsight:
+    """Test waiting for background insights."""
+
+    def test_ready_insight_returned(self):
+        """Test that an insight finished within the deadline is returned."""
+        future = start_insight(lambda q, c: f"{q}: {c}", "trend", "up")
+        assert collect_insight(future, deadline=1.0) == "trend: up"
+
+    def test_late_insight_dropped(self):
+        """Test that an insight missing the deadline is dropped and counted."""
+        release = threading.Event()
+        future = start_insight(lambda: release.wait(2) and "too late")
+        started = time.monotonic()
+        assert collect_insight(future, deadline=0.05) == ""
+        assert time.monotonic() - started < 1.0
+        assert get_stage_metrics()["insights_dropped"] == 1
+        release.set()
+
+    def test_deadline_counts_from_start(self):
+        """Test that time spent before collecting counts against the deadline."""
+        release = threading.Event()
+        future = start_insight(lambda: release.wait(2) and "late")
+        time.sleep(0.1)
+        started = time.monotonic()
+        assert collect_insight(future, deadline=0.1) == ""
+        assert time.monotonic() - started < 0.05
+        release.set()
+
+    def test_failed_insight_is_empty(self):
+        """Test that a failing insight call yields no insight."""
+        future = start_insight(MagicMock(side_effect=RuntimeError("rate limited")))
+        assert collect_insight(future, deadline=1.0) == ""
+
+    def test_async_late_insight_dropped(self):
+        """Test that async insights are cancelled after the deadline."""
+        async def slow():
+            await asyncio.sleep(1)
+            return "too late"
+
+        assert asyncio.run(collect_insight_async(slow(), deadline=0.05)) == ""
+        assert get_stage_metrics()["insights_dropped"] == 1
+
+
+class TestStageTimer:
+    """Test per-stage timing aggregation."""
+
+    def test_stages_recorded(self):
+        """Test that stage timings and totals are aggregated per operation."""
+        for _ in range(2):
+            timer = StageTimer("sql_query")
+            with timer.stage("query"):
+                time.sleep(0.01)
+            with timer.stage("insights"):
+                pass
+            stages = timer.finish()
+        assert stages["query"] >= 10
+        assert stages["total"] >= stages["query"]
+
+        metrics = get_stage_metrics()["operations"]["sql_query"]
+        assert metrics["query"]["count"] == 2
+        assert metrics["query"]["avg_ms"] >= 10
+        assert set(metrics) == {"query", "insights", "total"}
+
+
+class TestSQLInsightDeadline:
+    """Test that SQL answers do not wait for slow insights."""
+
+    @patch('core.subsystem_2.pandas_agent.PANDASAI_AVAILABLE', True)
+    @patch('core.subsystem_2.pandas_agent._get_connection')
+    def test_results_returned_without_late_insight(self, mock_conn, monkeypatch):
+        """Test that results are returned once the insight deadline passes."""
+        monkeypatch.setenv("INSIGHT_DEADLINE_SECONDS", "0.1")
+        mock_cursor = MagicMock()
+        mock_cursor.fetchmany.return_value = [{"id": 1, "country": "US"}]
+        mock_conn.return_value.__enter__.return_value.cursor.return_value = mock_cursor
+        release = threading.Event()
+
+        with patch('core.services.pandasai_service.explain_with_llm',
+                   side_effect=lambda *args: release.wait(2) and "Late insight"):
+            started = time.monotonic()
+            result = run_sql_query("SELECT id, country FROM users LIMIT 1")
+            elapsed = time.monotonic() - started
+        release.set()
+
+        assert "Late insight" not in result
+        assert "Query Results" in result
+        assert elapsed < 1.0
+        assert "insights" in get_stage_metrics()["operations"]["sql_query"]
@@ -0,0 +1,75 @@
+"""
+Tests for the local dataset classifier (subsystem_1/intent_classifier.py)
+and the LLM fallback in the legacy router.classify_query.
+"""
+
+from unittest.mock import patch
+
+import router
+from core.subsystem_1.intent_classifier import NaiveBayesClassifier, classify_locally, get_classifier
+from core.subsystem_1.routing_rules import RoutingRules, get_routing_rules
+
+
+class TestLocalClassifier:
+    """Test the Naive Bayes classifier."""
+
+    def test_fit_and_predict(self):
+        """Test training on a handful of weighted examples."""
+        model = NaiveBayesClassifier().fit([
+            ("total revenue", "payments", 1.0),
+            ("paypal payments", "payments", 1.0),
+            ("session duration", "sessions", 1.0),
+            ("minutes per session", "sessions", 1.0),
+        ])
+        prediction = model.predict("revenue from paypal")
+        assert prediction.label == "payments"
+        assert prediction.confidence > 0.5
+
+    def test_unknown_words_have_no_confidence(self):
+        """Test that text without known words is never confident."""
+        prediction = classify_locally("zzz qqq")
+        assert prediction.label == "unknown"
+        assert prediction.confidence == 0.0
+
+    def test_semantic_layer_questions(self):
+        """Test the trained classifier on typical questions."""
+        assert classify_locally("what was revenue in november").label == "payments"
+        assert classify_locally("churn by plan last quarter").label == "subscriptions"
+        assert classify_locally("average minutes per session last week").label == "sessions"
+
+    def test_retrained_when_routing_rules_change(self):
+        """Test that rebuilt routing rules retrain the classifier with their vocabulary."""
+        rules = get_routing_rules()
+        assert classify_locally("zorblax").confidence == 0.0
+
+        datasets = {**rules.datasets, "payments": {**rules.datasets["payments"], "zorblax": 3.0}}
+        updated = RoutingRules(version=rules.version + 1, datasets=datasets, matcher=rules.matcher)
+        with patch('core.subsystem_1.intent_classifier.get_routing_rules', return_value=updated):
+            assert classify_locally("zorblax").label == "payments"
+            model = get_classifier()
+            assert get_classifier() is model
+
+        assert classify_locally("zorblax").confidence == 0.0
+
+
+class TestClassifyQuery:
+    """Test confidence-based LLM fallback."""
+
+    @patch('router.classify_query_with_llm')
+    def test_confident_question_skips_llm(self, mock_llm):
+        """Test that confident local predictions don't call the LLM."""
+        assert router.classify_query("what is our total revenue last quarter") == "payments"
+        mock_llm.assert_not_called()
+
+    @patch('router.classify_query_with_llm')
+    def test_low_confidence_falls_back_to_llm(self, mock_llm):
+        """Test that low-confidence questions go to the LLM."""
+        mock_llm.return_value = "users"
+        assert router.classify_query("zzz qqq") == "users"
+        mock_llm.assert_called_once()
+
+    @patch('router.classify_query_with_llm')
+    def test_llm_failure_is_unknown(self, mock_llm):
+        """Test that an LLM error yields unknown."""
+        mock_llm.side_effect = RuntimeError("no api key")
+        assert router.classify_query("zzz qqq") == "unknown"
@@ -0,0 +1,221 @@
+"""
+Tests for the LLM gateway (rate limits, retries, deadlines, circuit breaker).
+"""
+
+import asyncio
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import router
+from core.services.llm_gateway import (
+    CircuitBreaker,
+    CircuitOpenError,
+    GatewayConfig,
+    LLMDeadlineExceeded,
+    LLMGateway,
+    LLMRateLimited,
+    TokenBucket,
+    get_llm_gateway,
+)
+from core.subsystem_2.pandas_agent import run_data_question
+
+
+class RateLimitError(Exception):
+    """Stands in for the provider's retryable 429 error."""
+
+
+class BadRequestError(Exception):
+    """Stands in for the provider's error for an invalid request."""
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _gateway(clock=None, **overrides):
+    config = GatewayConfig(requests_per_minute=0, tokens_per_minute=0, retry_base=0.01, **overrides)
+    return LLMGateway(config, clock=clock) if clock else LLMGateway(config)
+
+
+class TestTokenBucket:
+    """Test the token bucket."""
+
+    def test_waits_for_refill(self):
+        """Test that an empty bucket tells callers how long to wait."""
+        clock = FakeClock()
+        bucket = TokenBucket(rate=1.0, capacity=2, clock=clock)
+        assert bucket.reserve(2, max_wait=5) == 0
+        assert bucket.reserve(1, max_wait=5) == pytest.approx(1.0)
+        assert bucket.reserve(1, max_wait=5) == pytest.approx(2.0)
+
+    def test_refuses_beyond_max_wait(self):
+        """Test that a reservation is refused (and nothing taken) past max_wait."""
+        clock = FakeClock()
+        bucket = TokenBucket(rate=1.0, capacity=1, clock=clock)
+        bucket.reserve(1, max_wait=0)
+        assert bucket.reserve(1, max_wait=0.5) is None
+        clock.now += 1
+        assert bucket.reserve(1, max_wait=0) == 0
+
+    def test_zero_rate_is_unlimited(self):
+        """Test that a rate of 0 disables the bucket."""
+        bucket = TokenBucket(rate=0, capacity=1)
+        assert all(bucket.reserve(10, max_wait=0) == 0 for _ in range(5))
+
+
+class TestCircuitBreaker:
+    """Test the breaker state machine."""
+
+    def test_opens_after_consecutive_failures(self):
+        """Test that the breaker opens after the failure threshold."""
+        breaker = CircuitBreaker(failures=2, reset_seconds=30, clock=FakeClock())
+        breaker.record_failure()
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == "open"
+        assert not breaker.allow()
+
+    def test_success_resets_count(self):
+        """Test that failures must be consecutive."""
+        breaker = CircuitBreaker(failures=2, reset_seconds=30, clock=FakeClock())
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        assert breaker.state == "closed"
+
+    def test_half_open_single_probe(self):
+        """Test that after the reset time one probe decides the state."""
+        clock = FakeClock()
+        breaker = CircuitBreaker(failures=1, reset_seconds=30, clock=clock)
+        breaker.record_failure()
+        clock.now += 31
+        assert breaker.state == "half_open"
+        assert breaker.allow()
+        assert not breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == "open"
+
+        clock.now += 31
+        assert breaker.allow()
+        breaker.record_success()
+        assert breaker.state == "closed"
+
+
+@patch('core.services.llm_gateway.time.sleep')
+class TestGatewayCall:
+    """Test calls through the gateway."""
+
+    def test_retries_transient_errors(self, mock_sleep):
+        """Test that retryable errors are retried with backoff."""
+        fn = MagicMock(side_effect=[RateLimitError("429"), "ok"])
+        gateway = _gateway(max_retries=2)
+        assert gateway.call(fn) == "ok"
+        assert fn.call_count == 2
+        assert mock_sleep.call_count == 1
+        assert gateway.metrics()["retries"] == 1
+
+    def test_gives_up_after_max_retries(self, mock_sleep):
+        """Test that the last error is raised once retries run out."""
+        fn = MagicMock(side_effect=RateLimitError("429"))
+        with pytest.raises(RateLimitError):
+            _gateway(max_retries=2).call(fn)
+        assert fn.call_count == 3
+
+    def test_caller_errors_not_retried_or_counted(self, mock_sleep):
+        """Test that bad requests fail at once and don't trip the breaker."""
+        gateway = _gateway(breaker_failures=1)
+        fn = MagicMock(side_effect=BadRequestError("context too long"))
+        with pytest.raises(BadRequestError):
+            gateway.call(fn)
+        assert fn.call_count == 1
+        assert gateway.breaker.state == "closed"
+
+    def test_open_breaker_short_circuits(self, mock_sleep):
+        """Test that calls fail fast while the breaker is open."""
+        gateway = _gateway(breaker_failures=1, max_retries=0)
+        with pytest.raises(RuntimeError):
+            gateway.call(MagicMock(side_effect=RuntimeError("auth")))
+        fn = MagicMock()
+        with pytest.raises(CircuitOpenError):
+            gateway.call(fn)
+        fn.assert_not_called()
+        assert not gateway.available()
+
+    def test_rate_limited_when_wait_too_long(self, mock_sleep):
+        """Test that calls are refused rather than queued past LLM_RATE_WAIT_SECONDS."""
+        config = GatewayConfig(requests_per_minute=1, tokens_per_minute=0, rate_wait=1)
+        gateway = LLMGateway(config, clock=FakeClock())
+        gateway.call(lambda timeout: "first")
+        with pytest.raises(LLMRateLimited):
+            gateway.call(lambda timeout: "second")
+        assert gateway.breaker.state == "closed"
+
+    def test_attempts_get_remaining_time(self, mock_sleep):
+        """Test that each attempt is given the time left before the deadline."""
+        fn = MagicMock(return_value="ok")
+        _gateway(timeout=12).call(fn)
+        assert 0 < fn.call_args.args[0] <= 12
+
+    def test_async_deadline(self, mock_sleep):
+        """Test that async attempts are cut off at the deadline."""
+        async def slow(timeout):
+            await asyncio.sleep(1)
+
+        gateway = _gateway(timeout=0.05, max_retries=0)
+        with pytest.raises(LLMDeadlineExceeded):
+            asyncio.run(gateway.acall(slow))
+        assert gateway.metrics()["deadline_exceeded"] == 1
+
+
+class TestDegradation:
+    """Test what callers do while the LLM is unavailable."""
+
+    def _open_breaker(self, monkeypatch):
+        monkeypatch.setenv("LLM_BREAKER_FAILURES", "1")
+        get_llm_gateway().breaker.record_failure()
+
+    @patch('core.subsystem_2.pandas_agent.query_with_pandasai')
+    @patch('core.subsystem_2.pandas_agent._query_users_overview')
+    def test_data_question_uses_overview(self, mock_overview, mock_pandasai, monkeypatch):
+        """Test that data questions fall back to the overview query."""
+        monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+        self._open_breaker(monkeypatch)
+        mock_overview.return_value = {
+            "total_users": 1200,
+            "countries": [{"name": "US", "users": 700}],
+            "devices": [{"name": "ios", "users": 500}],
+        }
+
+        result = run_data_question("users", "which countries have the most users?")
+
+        mock_pandasai.assert_not_called()
+        assert "LLM is unavailable" in result
+        assert "1,200" in result and "US (700)" in result
+
+    @patch('core.subsystem_2.pandas_agent._query_sessions_overview')
+    @patch('core.subsystem_2.pandas_agent.query_with_pandasai', side_effect=CircuitOpenError("open"))
+    def test_breaker_opening_mid_question(self, mock_pandasai, mock_overview, monkeypatch):
+        """Test that a question whose LLM calls get refused is answered from the overview."""
+        monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+        mock_overview.return_value = {
+            "total_sessions": 10, "active_users": 4, "avg_duration": 12.5, "activities": [],
+        }
+
+        result = run_data_question("sessions", "what do people do in long sessions?")
+
+        assert "`sessions` overview" in result
+        assert "12.5 minutes" in result
+
+    @patch('router.classify_locally')
+    @patch('router._get_llm')
+    def test_classifier_unknown_when_open(self, mock_llm, mock_local, monkeypatch):
+        """Test that the classifier fallback answers unknown without calling the LLM."""
+        mock_local.return_value = MagicMock(confidence=0.0)
+        self._open_breaker(monkeypatch)
+        assert router.classify_query("zzz qqq") == "unknown"
+        mock_llm.assert_not_called()
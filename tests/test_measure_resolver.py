@@ -0,0 +1,138 @@
+"""
+Tests for the semantic-layer measure fast path (core/services/measure_resolver.py).
+"""
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from core.services.measure_resolver import _compile_formula, format_measure_answer, resolve_measure
+from core.subsystem_2.async_agent import run_data_question_async
+from core.subsystem_2.pandas_agent import run_data_question
+
+
+class TestResolveMeasure:
+    """Test matching questions to measures and compiling their SQL."""
+
+    def test_total_revenue_last_month(self):
+        """Test that a windowed measure filters on the model's time column."""
+        query = resolve_measure("What was our total revenue last month?", "payments")
+        assert query.measure == "total_revenue_usd"
+        assert query.sql == (
+            "SELECT SUM(amount_usd) AS value FROM payments "
+            "WHERE payment_date >= CURRENT_DATE - INTERVAL '30 days'"
+        )
+        assert query.window_label == "last 30 days"
+
+    def test_breakdown_by_dimension(self):
+        """Test that "by <dimension>" groups by a categorical field."""
+        query = resolve_measure("average session length by activity type", "sessions")
+        assert query.measure == "avg_session_minutes"
+        assert query.group_by == "activity_type"
+        assert "GROUP BY activity_type" in query.sql
+
+    def test_filter_on_example_value(self):
+        """Test that known field values become parameterised filters."""
+        query = resolve_measure("how many users on iOS?", "users")
+        assert query.measure == "total_users"
+        assert "LOWER(device_type) IN (%s)" in query.sql
+        assert query.params == ("ios",)
+
+    def test_time_grain(self):
+        """Test that "monthly" buckets the measure by its time column."""
+        query = resolve_measure("monthly revenue", "payments")
+        assert query.grain == "month"
+        assert "DATE_TRUNC('month', payment_date)" in query.sql
+
+    def test_predicate_measure_counted_as_of_today(self):
+        """Test that a row predicate with a date parameter is counted for today."""
+        query = resolve_measure("how many active subscriptions by plan", "subscriptions")
+        assert query.measure == "active_subscriptions_on_date"
+        assert "COUNT(*) FILTER (WHERE start_date <= CURRENT_DATE" in query.sql
+
+    def test_period_measure_uses_question_window(self):
+        """Test that churn rate is computed over the asked window (30 days by default)."""
+        assert "INTERVAL '90 DAYS'" in resolve_measure("churn rate per plan last quarter", "subscriptions").sql
+        assert resolve_measure("what's the churn rate?", "subscriptions").window_label == "last 30 days"
+
+    def test_unaccounted_words_go_to_pandasai(self):
+        """Test that questions with words the resolver can't place are not answered."""
+        assert resolve_measure("how many users in Germany", "users") is None
+        assert resolve_measure("why did average session length drop?", "sessions") is None
+        assert resolve_measure("revenue by customer", "payments") is None
+        assert resolve_measure("active subscriptions last month", "subscriptions") is None
+
+    def test_free_form_formula_not_compiled(self):
+        """Test that measures whose formula isn't SQL are left to PandasAI."""
+        assert resolve_measure("churned users", "users") is None
+
+
+class TestCompileFormula:
+    """Test formula compilation."""
+
+    def test_ratio_is_fractional_and_safe(self):
+        """Test that ratios keep their fraction and don't divide by zero."""
+        sql = _compile_formula("COUNT(*) / COUNT (DISTINCT user_id)", (), ("user_id",), None)
+        assert sql == "CAST(COUNT(*) AS DECIMAL) / NULLIF(COUNT(DISTINCT user_id), 0)"
+
+    def test_unknown_column_rejected(self):
+        """Test that formulas referring to other tables' columns are rejected."""
+        assert _compile_formula("SUM(amount_usd)", (), ("user_id",), None) is None
+
+
+class TestMeasureAnswers:
+    """Test answering data questions from a measure."""
+
+    def _cursor(self, mock_conn, rows):
+        cursor = MagicMock()
+        cursor.fetchall.return_value = rows
+        mock_conn.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value = cursor
+        return cursor
+
+    def test_format_breakdown(self):
+        """Test that breakdowns list each group with the measure's unit."""
+        query = resolve_measure("revenue by payment method", "payments")
+        answer = format_measure_answer(query, [{"grp": "card", "value": 1200.5}, {"grp": "paypal", "value": 300}])
+        assert "• card: $1,200.50" in answer
+        assert "payments.total_revenue_usd" in answer
+
+    @patch('core.subsystem_2.pandas_agent.query_with_pandasai')
+    @patch('core.subsystem_2.pandas_agent._get_connection')
+    def test_answered_without_pandasai(self, mock_conn, mock_pandasai):
+        """Test that a measure question is one query and no PandasAI call."""
+        cursor = self._cursor(mock_conn, [{"value": 4200}])
+
+        result = run_data_question("users", "how many users do we have?")
+
+        assert "4,200" in result
+        assert cursor.execute.call_count == 1
+        mock_pandasai.assert_not_called()
+
+    @patch('core.subsystem_2.pandas_agent.query_with_pandasai', return_value="PandasAI answer")
+    @patch('core.subsystem_2.pandas_agent._get_connection')
+    def test_failed_query_falls_back(self, mock_conn, mock_pandasai, monkeypatch):
+        """Test that a failing measure query hands the question to PandasAI."""
+        monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+        mock_conn.side_effect = RuntimeError("connection refused")
+
+        assert run_data_question("users", "how many users?") == "PandasAI answer"
+
+    @patch('core.subsystem_2.pandas_agent.query_with_pandasai', return_value="PandasAI answer")
+    @patch('core.subsystem_2.pandas_agent._get_connection')
+    def test_toggle(self, mock_conn, mock_pandasai, monkeypatch):
+        """Test that MEASURE_FAST_PATH=false sends every question to PandasAI."""
+        monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+        monkeypatch.setenv("MEASURE_FAST_PATH", "false")
+
+        assert run_data_question("payments", "total revenue") == "PandasAI answer"
+
+    @patch('core.subsystem_2.async_agent.pandas_agent.run_data_question')
+    @patch('core.subsystem_2.async_agent.async_db.fetch_all', new_callable=AsyncMock)
+    def test_async_answered_on_event_loop(self, mock_fetch, mock_run):
+        """Test that the async agent answers measures without a PandasAI thread."""
+        mock_fetch.return_value = [{"value": 12.5}]
+
+        result = asyncio.run(run_data_question_async("sessions", "average session minutes last week"))
+
+        assert "12.50" in result
+        assert "INTERVAL '7 days'" in mock_fetch.call_args[0][0]
+        mock_run.assert_not_called()
@@ -10,7 +10,12 @@ from core.subsystem_2.pandas_agent import (
     run_subscription_prediction,
     run_sql_query,
     _is_safe_sql_query,
-    _extract_sql_from_message
+    _extract_sql_from_message,
+    _query_users_overview,
+    _detect_prediction_segment,
+    _get_segmented_new_subscriptions,
+    _query_subscriptions_overview,
+    _query_sessions_overview,
 )
 
 
@@ -40,6 +45,14 @@ class TestSQLSafety:
     def test_unsafe_drop_query(self):
         """Test that DROP queries are rejected."""
         assert _is_safe_sql_query("DROP TABLE users") is False
+    
+    def test_keyword_substrings_are_safe(self):
+        """Test that column names containing blocked keywords are allowed."""
+        assert _is_safe_sql_query("SELECT created_at, last_updated FROM users") is True
+    
+    def test_data_modifying_cte_rejected(self):
+        """Test that a DELETE hidden behind WITH is rejected."""
+        assert _is_safe_sql_query("WITH gone AS (DELETE FROM users RETURNING *) SELECT * FROM gone") is False
 
 
 class TestSQLExtraction:
@@ -76,7 +89,7 @@ class TestDataQuestion:
         mock_getenv.return_value = "test-api-key"
         mock_query.return_value = "🤖 Powered by PandasAI v3 + LLM\n\n📊 Analysis Result:\nTest result"
         
-        result = run_data_question("users", "how many users?")
+        result = run_data_question("users", "which countries have the most users?")
         assert "PandasAI" in result
         mock_query.assert_called_once()
     
@@ -86,7 +99,7 @@ class TestDataQuestion:
         """Test data question without API key."""
         mock_getenv.return_value = None
         
-        result = run_data_question("users", "how many users?")
+        result = run_data_question("users", "which countries have the most users?")
         assert "LLM API Key Required" in result
         mock_query.assert_not_called()
 
@@ -122,6 +135,57 @@ class TestPrediction:
         assert "Prediction agent" in result
 
 
+class TestSegmentedPrediction:
+    """Test per-segment subscription prediction."""
+    
+    def _series(self, base):
+        return [(2022 + i // 12, i % 12 + 1, base + i) for i in range(18)]
+    
+    @patch('core.services.pandasai_service.analyze_with_llm', return_value="")
+    @patch('core.subsystem_2.pandas_agent._get_segmented_new_subscriptions')
+    def test_ranks_segments(self, mock_series, mock_analyze):
+        """Test that segments are forecast together and ranked by predicted total."""
+        mock_series.return_value = {"monthly": self._series(10), "annual": self._series(50)}
+        
+        result = run_subscription_prediction("predict new subscriptions by plan next year")
+        
+        mock_series.assert_called_once_with("plan")
+        assert "new subscriptions by plan" in result
+        assert result.index("*annual*") < result.index("*monthly*")
+    
+    @patch('core.subsystem_2.pandas_agent._get_segmented_new_subscriptions')
+    def test_segment_insufficient_data(self, mock_series):
+        """Test that short segment histories are rejected."""
+        mock_series.return_value = {"DE": [(2024, 1, 3), (2024, 2, 4)]}
+        
+        result = run_subscription_prediction("predict subscriptions by country")
+        assert "Insufficient historical data" in result
+    
+    @patch('core.subsystem_2.pandas_agent.rollup_table', return_value=None)
+    @patch('core.subsystem_2.pandas_agent._get_connection')
+    def test_one_grouped_query(self, mock_conn, mock_rollup):
+        """Test that all device series come from a single grouped statement."""
+        cursor = mock_conn.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value
+        cursor.fetchall.return_value = [
+            {"segment": "iOS", "year": 2024, "month": 1, "new_subscriptions": 5},
+            {"segment": "iOS", "year": 2024, "month": 2, "new_subscriptions": 6},
+            {"segment": None, "year": 2024, "month": 1, "new_subscriptions": 1},
+        ]
+        
+        series = _get_segmented_new_subscriptions("device")
+        
+        assert cursor.execute.call_count == 1
+        assert "u.device_type AS segment" in cursor.execute.call_args[0][0]
+        assert series == {"iOS": [(2024, 1, 5), (2024, 2, 6)], "unknown": [(2024, 1, 1)]}
+    
+    def test_detect_segment(self):
+        """Test which questions ask for a segmented forecast."""
+        assert _detect_prediction_segment("predict subscriptions per plan") == "plan"
+        assert _detect_prediction_segment("forecast signups by countries") == "country"
+        assert _detect_prediction_segment("predict subscriptions by device type") == "device"
+        assert _detect_prediction_segment("predict subscriptions next year") is None
+
+
 class TestSQLQuery:
     """Test SQL query execution."""
     
@@ -130,8 +194,8 @@ class TestSQLQuery:
         """Test safe SQL query execution."""
         # Mock database connection and cursor
         mock_cursor = MagicMock()
-        mock_cursor.fetchall.return_value = [{"id": 1, "name": "test"}]
-        mock_conn.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value = mock_cursor
+        mock_cursor.fetchmany.return_value = [{"id": 1, "name": "test"}]
+        mock_conn.return_value.__enter__.return_value.cursor.return_value = mock_cursor
         
         result = run_sql_query("SELECT * FROM users LIMIT 1")
         assert "Query Results" in result or "Powered by PandasAI" in result
@@ -146,3 +210,63 @@ class TestSQLQuery:
         result = run_sql_query("This is not SQL")
         assert "No SQL query found" in result
 
+
+
+class TestOverviewQueries:
+    """Test single-statement overview queries."""
+    
+    def _cursor(self, mock_conn, rows):
+        mock_cursor = MagicMock()
+        mock_cursor.fetchall.return_value = rows
+        mock_conn.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value = mock_cursor
+        return mock_cursor
+    
+    @patch('core.subsystem_2.pandas_agent.rollup_table', return_value=None)
+    @patch('core.subsystem_2.pandas_agent._get_connection')
+    def test_users_overview_one_round_trip(self, mock_conn, mock_rollup):
+        """Test that users totals and breakdowns come from one statement."""
+        cursor = self._cursor(mock_conn, [
+            {"grp": 1, "country": "Germany", "device_type": None, "users": 40},
+            {"grp": 2, "country": None, "device_type": "iOS", "users": 70},
+            {"grp": 3, "country": None, "device_type": None, "users": 100},
+        ])
+        
+        result = _query_users_overview()
+        
+        assert cursor.execute.call_count == 1
+        assert "GROUPING SETS" in cursor.execute.call_args[0][0]
+        assert result["total_users"] == 100
+        assert result["countries"] == [{"name": "Germany", "users": 40}]
+        assert result["devices"] == [{"name": "iOS", "users": 70}]
+    
+    @patch('core.subsystem_2.pandas_agent.rollup_table', return_value=None)
+    @patch('core.subsystem_2.pandas_agent._get_connection')
+    def test_subscriptions_overview_one_round_trip(self, mock_conn, mock_rollup):
+        """Test that subscription counts use FILTER aggregates in one statement."""
+        cursor = self._cursor(mock_conn, [
+            {"grp": 1, "plan": None, "total_subscriptions": 10, "active_subscriptions": 6, "churned_subscriptions": 4},
+            {"grp": 0, "plan": "annual", "total_subscriptions": 5, "active_subscriptions": 4, "churned_subscriptions": 1},
+        ])
+        
+        result = _query_subscriptions_overview()
+        
+        assert cursor.execute.call_count == 1
+        assert "FILTER (WHERE is_active)" in cursor.execute.call_args[0][0]
+        assert result["active_subscriptions"] == 6
+        assert result["churned_subscriptions"] == 4
+        assert result["plans"] == [{"plan": "annual", "active_subscriptions": 4}]
+    
+    @patch('core.subsystem_2.pandas_agent._get_connection')
+    def test_sessions_overview_one_round_trip(self, mock_conn):
+        """Test that session metrics and top activities come from one statement."""
+        cursor = self._cursor(mock_conn, [
+            {"grp": 1, "activity_type": None, "sessions": 20, "active_users": 5, "avg_duration": 12.5, "minutes": 250},
+            {"grp": 0, "activity_type": "read", "sessions": 8, "active_users": 3, "avg_duration": 20, "minutes": 160},
+        ])
+        
+        result = _query_sessions_overview()
+        
+        assert cursor.execute.call_count == 1
+        assert result["total_sessions"] == 20
+        assert result["avg_duration"] == 12.5
+        assert result["activities"] == [{"activity_type": "read", "sessions": 8, "minutes": 160}]
@@ -6,14 +6,33 @@ Tests PandasAI integration and LLM functions.
 import pytest
 from unittest.mock import Mock, patch, MagicMock
 import os
+from core.services.dataframe_cache import CachedFrame
+from core.services.table_loader import LoadPlan
 from core.services.pandasai_service import (
     is_pandasai_configured,
     explain_with_llm,
     analyze_with_llm,
-    query_with_pandasai
+    query_with_pandasai,
+    reconfigure_pandasai,
+    _initialize_pandasai,
+    _LLMHolder,
+    _SmartDataframeRegistry,
 )
 
 
+def _cached_frame(version=1):
+    return CachedFrame(
+        key=("users", "SELECT user_id FROM users", ()),
+        table="users",
+        df=MagicMock(),
+        plan=LoadPlan(table="users", columns=["user_id"]),
+        watermark=None,
+        loaded_at=0.0,
+        nbytes=0,
+        version=version,
+    )
+
+
 class TestPandasAIConfiguration:
     """Test PandasAI configuration checks."""
     
@@ -30,47 +49,139 @@ class TestPandasAIConfiguration:
         assert is_pandasai_configured() is False
 
 
+class TestLLMInitialization:
+    """Test the process-wide LLM/config holder."""
+    
+    @patch('core.services.pandasai_service._llm_holder', new_callable=_LLMHolder)
+    @patch('core.services.pandasai_service.pai.config.set')
+    @patch('core.services.pandasai_service.GatewayLiteLLM')
+    def test_llm_built_once(self, mock_litellm, mock_config_set, mock_holder, mock_env_vars):
+        """Test that repeated initialization reuses the same client."""
+        first = _initialize_pandasai()
+        second = _initialize_pandasai()
+        
+        assert first is second
+        assert mock_litellm.call_count == 1
+        assert mock_config_set.call_count == 1
+    
+    @patch('core.services.pandasai_service._llm_holder', new_callable=_LLMHolder)
+    @patch('core.services.pandasai_service.pai.config.set')
+    @patch('core.services.pandasai_service.GatewayLiteLLM')
+    def test_llm_rebuilt_on_env_change(self, mock_litellm, mock_config_set, mock_holder, mock_env_vars):
+        """Test that changing LLM settings rebuilds the client."""
+        _initialize_pandasai()
+        mock_env_vars.setenv("LLM_MODEL", "gpt-4o")
+        _initialize_pandasai()
+        
+        assert mock_litellm.call_count == 2
+        assert mock_litellm.call_args.kwargs["model"] == "gpt-4o"
+    
+    @patch('core.services.pandasai_service._llm_holder', new_callable=_LLMHolder)
+    @patch('core.services.pandasai_service.pai.config.set')
+    @patch('core.services.pandasai_service.GatewayLiteLLM')
+    def test_forced_reconfigure(self, mock_litellm, mock_config_set, mock_holder, mock_env_vars):
+        """Test that reconfigure_pandasai(force=True) always rebuilds."""
+        _initialize_pandasai()
+        reconfigure_pandasai(force=True)
+        
+        assert mock_litellm.call_count == 2
+    
+    @patch('core.services.pandasai_service._llm_holder', new_callable=_LLMHolder)
+    def test_missing_api_key_raises(self, mock_holder, monkeypatch):
+        """Test that a missing API key raises ValueError."""
+        monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+        monkeypatch.delenv("LLM_API_KEY", raising=False)
+        
+        with pytest.raises(ValueError):
+            _initialize_pandasai()
+
+
 class TestLLMFunctions:
     """Test LLM helper functions."""
     
-    @patch('core.services.pandasai_service._initialize_pandasai')
+    @patch('core.services.pandasai_service._complete')
     @patch('core.services.pandasai_service.pai.SmartDataframe')
-    def test_explain_with_llm(self, mock_smart_df, mock_init):
-        """Test explain_with_llm function."""
-        # Mock SmartDataframe
-        mock_df_instance = MagicMock()
-        mock_df_instance.chat.return_value = "This is an explanation"
-        mock_smart_df.return_value = mock_df_instance
+    def test_explain_with_llm(self, mock_smart_df, mock_complete):
+        """Test explain_with_llm goes straight to the LLM."""
+        mock_complete.return_value = "This is an explanation"
         
         result = explain_with_llm("Test context", "Test summary")
-        assert "explanation" in result.lower() or len(result) > 0
+        assert result == "This is an explanation"
+        mock_smart_df.assert_not_called()
     
-    @patch('core.services.pandasai_service._initialize_pandasai')
+    @patch('core.services.pandasai_service._complete')
     @patch('core.services.pandasai_service.pai.SmartDataframe')
-    def test_analyze_with_llm(self, mock_smart_df, mock_init):
-        """Test analyze_with_llm function."""
-        # Mock SmartDataframe
-        mock_df_instance = MagicMock()
-        mock_df_instance.chat.return_value = "This is an analysis"
-        mock_smart_df.return_value = mock_df_instance
+    def test_analyze_with_llm(self, mock_smart_df, mock_complete):
+        """Test analyze_with_llm goes straight to the LLM."""
+        mock_complete.return_value = "This is an analysis"
         
         result = analyze_with_llm("Test question", "Test context")
-        assert "analysis" in result.lower() or len(result) > 0
+        assert result == "This is an analysis"
+        mock_smart_df.assert_not_called()
+    
+    @patch('core.services.pandasai_service._complete')
+    def test_llm_failure_falls_back(self, mock_complete):
+        """Test that LLM errors return the fallback text."""
+        mock_complete.side_effect = RuntimeError("timeout")
+        
+        result = analyze_with_llm("Test question", "Test context")
+        assert "Test context" in result
+
+
+class TestSmartDataframeRegistry:
+    """Test reuse of SmartDataframe instances."""
+    
+    @patch('core.services.pandasai_service.pai.SmartDataframe')
+    def test_reused_for_same_version(self, mock_smart_df):
+        """Test that an unchanged frame reuses its SmartDataframe."""
+        registry = _SmartDataframeRegistry(max_entries=4)
+        llm = object()
+        
+        first = registry.get(_cached_frame(version=1), llm)
+        second = registry.get(_cached_frame(version=1), llm)
+        
+        assert first is second
+        assert mock_smart_df.call_count == 1
+    
+    @patch('core.services.pandasai_service.pai.SmartDataframe')
+    def test_rebuilt_when_frame_reloaded(self, mock_smart_df):
+        """Test that a new frame version or LLM rebuilds the SmartDataframe."""
+        registry = _SmartDataframeRegistry(max_entries=4)
+        llm = object()
+        
+        registry.get(_cached_frame(version=1), llm)
+        registry.get(_cached_frame(version=2), llm)
+        registry.get(_cached_frame(version=2), object())
+        
+        assert mock_smart_df.call_count == 3
+    
+    @patch('core.services.pandasai_service.pai.SmartDataframe')
+    def test_drop_table(self, mock_smart_df):
+        """Test that invalidating a table drops its SmartDataframes."""
+        registry = _SmartDataframeRegistry(max_entries=4)
+        llm = object()
+        
+        registry.get(_cached_frame(), llm)
+        registry.drop_table("users")
+        registry.get(_cached_frame(), llm)
+        
+        assert mock_smart_df.call_count == 2
 
 
 class TestPandasAIQuery:
     """Test PandasAI query function."""
     
+    @patch('core.services.pandasai_service._get_registry', new=lambda: _SmartDataframeRegistry(max_entries=4))
+    @patch('core.services.pandasai_service.analyze_with_llm', return_value="")
     @patch('core.services.pandasai_service._initialize_pandasai')
     @patch('core.services.pandasai_service._load_table_to_dataframe')
     @patch('core.services.pandasai_service.pai.SmartDataframe')
     @patch('core.services.pandasai_service.os.getenv')
-    def test_query_with_pandasai(self, mock_getenv, mock_smart_df, mock_load_df, mock_init):
+    def test_query_with_pandasai(self, mock_getenv, mock_smart_df, mock_load_df, mock_init, mock_analyze):
         """Test query_with_pandasai function."""
         # Setup mocks
         mock_getenv.return_value = "test-api-key"
-        mock_df = MagicMock()
-        mock_load_df.return_value = mock_df
+        mock_load_df.return_value = _cached_frame()
         
         mock_df_instance = MagicMock()
         mock_df_instance.chat.return_value = "Query result"
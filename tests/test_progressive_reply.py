@@ -0,0 +1,179 @@
+"""
+Tests for progressive Slack replies (placeholder, partial updates, final answer).
+"""
+
+import asyncio
+import time
+from unittest.mock import MagicMock, patch
+
+from core.messages import INSIGHTS_PENDING, format_placeholder
+from core.services.progressive_reply import (
+    AsyncProgressiveReply,
+    ProgressiveReply,
+    progressive_replies_enabled,
+    report,
+)
+from core.subsystem_2.pandas_agent import run_sql_query
+
+
+def _recording_reply(min_interval=0.0, edit_error=None):
+    """A ProgressiveReply whose post/edit calls are recorded in `sent`."""
+    sent = []
+
+    def post(text):
+        sent.append(("post", text))
+        return "123.456"
+
+    def edit(ts, text):
+        if edit_error:
+            raise edit_error
+        sent.append(("edit", text))
+
+    return ProgressiveReply(post=post, edit=edit, min_interval=min_interval), sent
+
+
+class TestProgressiveReply:
+    """Test the thread-based reply."""
+
+    def test_placeholder_updates_and_final(self):
+        """Test that the placeholder is posted once and then edited in order."""
+        reply, sent = _recording_reply()
+        reply.start("⏳ Working...")
+        reply.update("partial")
+        reply.finish("final")
+        assert sent == [("post", "⏳ Working..."), ("edit", "partial"), ("edit", "final")]
+        assert reply.ts == "123.456"
+
+    def test_updates_are_throttled(self):
+        """Test that quick updates collapse into one deferred edit of the latest text."""
+        reply, sent = _recording_reply(min_interval=0.2)
+        reply.start("placeholder")
+        reply.update("first")
+        reply.update("second")
+        assert sent == [("post", "placeholder")]
+        time.sleep(0.35)
+        assert sent == [("post", "placeholder"), ("edit", "second")]
+
+    def test_finish_supersedes_pending_update(self):
+        """Test that the final answer cancels a deferred partial update."""
+        reply, sent = _recording_reply(min_interval=0.2)
+        reply.start("placeholder")
+        reply.update("partial")
+        reply.finish("final")
+        time.sleep(0.3)
+        assert sent == [("post", "placeholder"), ("edit", "final")]
+
+    def test_updates_after_finish_ignored(self):
+        """Test that a late partial answer does not overwrite the final one."""
+        reply, sent = _recording_reply()
+        reply.start("placeholder")
+        reply.finish("final")
+        reply.update("late")
+        assert sent[-1] == ("edit", "final")
+
+    def test_finish_posts_when_edit_fails(self):
+        """Test that the final answer is posted as a new message if chat.update fails."""
+        reply, sent = _recording_reply(edit_error=RuntimeError("message_not_found"))
+        reply.start("placeholder")
+        reply.finish("final")
+        assert sent == [("post", "placeholder"), ("post", "final")]
+
+    def test_finish_posts_without_placeholder(self):
+        """Test that the final answer is still sent when the placeholder could not be posted."""
+        post = MagicMock(side_effect=[RuntimeError("rate_limited"), "1.0"])
+        edit = MagicMock()
+        reply = ProgressiveReply(post=post, edit=edit, min_interval=0)
+        reply.start("placeholder")
+        reply.update("partial")
+        reply.finish("final")
+        edit.assert_not_called()
+        assert post.call_args_list[-1].args == ("final",)
+
+
+class TestAsyncProgressiveReply:
+    """Test the asyncio reply."""
+
+    def test_placeholder_updates_and_final(self):
+        """Test that updates are edited in and the final answer wins."""
+        sent = []
+
+        async def post(text):
+            sent.append(("post", text))
+            return "1.0"
+
+        async def edit(ts, text):
+            sent.append(("edit", text))
+
+        async def run():
+            reply = AsyncProgressiveReply(post=post, edit=edit, min_interval=0)
+            await reply.start("placeholder")
+            reply.update("partial")
+            await asyncio.sleep(0)
+            await asyncio.sleep(0)
+            await reply.finish("final")
+
+        asyncio.run(run())
+        assert sent == [("post", "placeholder"), ("edit", "partial"), ("edit", "final")]
+
+    def test_throttled_update_dropped_by_finish(self):
+        """Test that a deferred update does not land after the final answer."""
+        sent = []
+
+        async def post(text):
+            sent.append(("post", text))
+            return "1.0"
+
+        async def edit(ts, text):
+            sent.append(("edit", text))
+
+        async def run():
+            reply = AsyncProgressiveReply(post=post, edit=edit, min_interval=0.1)
+            await reply.start("placeholder")
+            reply.update("partial")
+            await reply.finish("final")
+            await asyncio.sleep(0.2)
+
+        asyncio.run(run())
+        assert sent == [("post", "placeholder"), ("edit", "final")]
+
+
+class TestProgressHelpers:
+    """Test the progress callback helpers and placeholder text."""
+
+    def test_report_without_callback(self):
+        """Test that reporting without a callback is a no-op."""
+        report(None, "anything")
+
+    def test_report_swallows_errors(self):
+        """Test that a failing callback does not break the answer."""
+        report(MagicMock(side_effect=RuntimeError("slack down")), "partial")
+
+    def test_toggle(self, monkeypatch):
+        """Test the SLACK_PROGRESSIVE_REPLIES switch."""
+        monkeypatch.delenv("SLACK_PROGRESSIVE_REPLIES", raising=False)
+        assert progressive_replies_enabled()
+        monkeypatch.setenv("SLACK_PROGRESSIVE_REPLIES", "false")
+        assert not progressive_replies_enabled()
+
+    def test_placeholder_mentions_dataset(self):
+        """Test that data-question placeholders name the dataset."""
+        assert "users" in format_placeholder("data_question", "users")
+        assert format_placeholder("sql_query", None)
+
+    @patch('core.services.pandasai_service.explain_with_llm', return_value="Mostly US users.")
+    @patch('core.subsystem_2.pandas_agent.PANDASAI_AVAILABLE', True)
+    @patch('core.subsystem_2.pandas_agent._get_connection')
+    def test_sql_results_reported_before_insights(self, mock_conn, mock_explain):
+        """Test that SQL results are reported before the LLM insights are added."""
+        mock_cursor = MagicMock()
+        mock_cursor.fetchmany.return_value = [{"id": 1, "country": "US"}]
+        mock_conn.return_value.__enter__.return_value.cursor.return_value = mock_cursor
+        progress = MagicMock()
+
+        result = run_sql_query("SELECT id, country FROM users LIMIT 1", progress=progress)
+
+        progress.assert_called_once()
+        partial = progress.call_args.args[0]
+        assert partial.endswith(INSIGHTS_PENDING)
+        assert "Mostly US users." not in partial
+        assert "Mostly US users." in result
@@ -0,0 +1,255 @@
+"""
+Tests for the SQL guardrails (plan cost gate, confirmation, cancellation).
+"""
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, call, patch
+
+import psycopg2.errors
+
+from core.services.query_guard import (
+    GuardConfig,
+    PlanCheck,
+    cancel_queries,
+    check_plan,
+    park_query,
+    read_only_prelude,
+    running_queries,
+    take_pending,
+    track_query,
+)
+from core.subsystem_1.router import route_message
+from core.subsystem_2.async_agent import run_sql_query_async
+from core.subsystem_2.pandas_agent import cancel_sql_query, run_confirmed_sql_query, run_sql_query
+
+CONFIG = GuardConfig(confirm_cost=1000, reject_cost=100000, confirm_rows=10000, reject_rows=0)
+
+
+def _plan(cost, rows):
+    return [{"Plan": {"Node Type": "Seq Scan", "Total Cost": cost, "Plan Rows": rows}}]
+
+
+def _guarded_conn(mock_conn, plan, rows=None, execute_error=None):
+    """Wire a mocked pooled connection: EXPLAIN returns `plan`, the query `rows`."""
+    conn = mock_conn.return_value.__enter__.return_value
+    plain = conn.cursor.return_value.__enter__.return_value
+    plain.fetchone.return_value = (plan,)
+    named = conn.cursor.return_value
+    named.fetchmany.return_value = rows or []
+    if execute_error:
+        named.execute.side_effect = execute_error
+    return conn, plain, named
+
+
+class TestCheckPlan:
+    """Test the plan thresholds."""
+
+    def test_cheap_plan_passes(self):
+        """Test that plans under every threshold are ok."""
+        check = check_plan(_plan(50.0, 10), CONFIG)
+        assert check.verdict == "ok"
+        assert check.rows == 10
+
+    def test_confirm_threshold(self):
+        """Test that moderately expensive plans need confirmation."""
+        check = check_plan(_plan(5000.0, 100), CONFIG)
+        assert check.verdict == "confirm"
+        assert "cost 5,000" in check.reasons[0]
+
+    def test_reject_threshold(self):
+        """Test that very expensive plans are rejected, with every reason listed."""
+        config = GuardConfig(confirm_cost=1000, reject_cost=100000, confirm_rows=0, reject_rows=1000)
+        check = check_plan(_plan(250000.0, 2_000_000), config)
+        assert check.verdict == "reject"
+        assert len(check.reasons) == 2
+
+    def test_zero_disables(self):
+        """Test that a threshold of 0 is off."""
+        config = GuardConfig(confirm_cost=0, reject_cost=0, confirm_rows=0, reject_rows=0)
+        assert check_plan(_plan(1e12, 10**9), config).verdict == "ok"
+
+    def test_unreadable_plan_passes(self):
+        """Test that output without a plan is let through."""
+        assert check_plan(None, CONFIG).verdict == "ok"
+        assert check_plan([{}], CONFIG).verdict == "ok"
+
+    def test_env_config(self, monkeypatch):
+        """Test reading thresholds from the environment."""
+        monkeypatch.setenv("QUERY_CONFIRM_COST", "10")
+        monkeypatch.setenv("QUERY_TIMEOUT_MS", "2500")
+        config = GuardConfig.from_env()
+        assert config.confirm_cost == 10.0
+        assert config.timeout_ms == 2500
+
+    def test_read_only_prelude(self):
+        """Test the statements opening an async guarded transaction."""
+        assert read_only_prelude(2500) == "BEGIN READ ONLY; SET LOCAL statement_timeout = 2500"
+        assert read_only_prelude(0) == "BEGIN READ ONLY"
+
+
+class TestRegistry:
+    """Test parked and running queries."""
+
+    def test_park_and_take(self):
+        """Test that a parked query is taken once."""
+        park_query("U1", "SELECT 1", PlanCheck(verdict="confirm"))
+        assert take_pending("U2", CONFIG) is None
+        assert take_pending("U1", CONFIG).sql == "SELECT 1"
+        assert take_pending("U1", CONFIG) is None
+
+    def test_parked_query_expires(self):
+        """Test that confirmations after the TTL are refused."""
+        park_query("U1", "SELECT 1", PlanCheck(verdict="confirm"))
+        with patch('core.services.query_guard.time.monotonic', return_value=1e12):
+            assert take_pending("U1", CONFIG) is None
+
+    def test_cancel_only_own_queries(self):
+        """Test that cancelling stops the user's queries and nobody else's."""
+        mine, theirs = MagicMock(), MagicMock()
+        with track_query("U1", "SELECT 1", mine) as running, track_query("U2", "SELECT 2", theirs):
+            assert len(running_queries()) == 2
+            assert cancel_queries("U1") == 1
+            assert cancel_queries("U1") == 0
+            assert running.cancelled
+        mine.assert_called_once()
+        theirs.assert_not_called()
+        assert running_queries() == []
+
+
+class TestGuardedSQLQuery:
+    """Test the guard inside run_sql_query."""
+
+    @patch('core.subsystem_2.pandas_agent.PANDASAI_AVAILABLE', False)
+    @patch('core.subsystem_2.pandas_agent._get_connection')
+    def test_runs_read_only_with_timeout(self, mock_conn, monkeypatch):
+        """Test that cheap queries run read-only under QUERY_TIMEOUT_MS."""
+        monkeypatch.setenv("QUERY_TIMEOUT_MS", "2500")
+        _, plain, named = _guarded_conn(mock_conn, _plan(10.0, 1), rows=[{"id": 1}])
+
+        result = run_sql_query("SELECT id FROM users", user="U1")
+
+        assert "Query Results" in result
+        # The plan check and the run each use a read-only checkout
+        assert mock_conn.call_args_list == [call(statement_timeout_ms=2500)] * 2
+        statements = [c[0][0] for c in plain.execute.call_args_list]
+        assert statements[0] == "SET TRANSACTION READ ONLY"
+        assert statements[1].startswith("EXPLAIN (FORMAT JSON)")
+        assert statements[2] == "SET TRANSACTION READ ONLY"
+        assert "LIMIT" in named.execute.call_args[0][0]
+
+    @patch('core.subsystem_2.pandas_agent._get_connection')
+    def test_rejects_expensive_plan(self, mock_conn, monkeypatch):
+        """Test that plans above the reject threshold never run."""
+        monkeypatch.setenv("QUERY_REJECT_COST", "1000")
+        _, _, named = _guarded_conn(mock_conn, _plan(5000.0, 10))
+
+        result = run_sql_query("SELECT * FROM sessions s JOIN users u ON true", user="U1")
+
+        assert "Query rejected" in result
+        named.execute.assert_not_called()
+        assert take_pending("U1") is None
+
+    @patch('core.subsystem_2.pandas_agent.PANDASAI_AVAILABLE', False)
+    @patch('core.subsystem_2.pandas_agent._get_connection')
+    def test_confirmation_flow(self, mock_conn, monkeypatch):
+        """Test that a parked query runs without a second plan check once confirmed."""
+        monkeypatch.setenv("QUERY_CONFIRM_COST", "1000")
+        _, plain, named = _guarded_conn(mock_conn, _plan(5000.0, 10), rows=[{"id": 1}])
+
+        first = run_sql_query("SELECT * FROM sessions", user="U1")
+        assert "looks expensive" in first and "confirm" in first
+        named.execute.assert_not_called()
+
+        second = run_confirmed_sql_query("U1")
+        assert "Query Results" in second
+        assert not any("EXPLAIN" in c[0][0] for c in plain.execute.call_args_list[2:])
+        assert "no query waiting" in run_confirmed_sql_query("U1")
+
+    @patch('core.subsystem_2.pandas_agent._get_connection')
+    def test_timeout_message(self, mock_conn):
+        """Test that hitting statement_timeout is reported as a timeout."""
+        _guarded_conn(mock_conn, _plan(10.0, 1), execute_error=psycopg2.errors.QueryCanceled("timeout"))
+        result = run_sql_query("SELECT * FROM sessions", user="U1")
+        assert "timed out" in result
+
+    @patch('core.subsystem_2.pandas_agent._get_connection')
+    def test_cancel_running_query(self, mock_conn):
+        """Test that a cancel from the user stops the query and says so."""
+        conn, _, named = _guarded_conn(mock_conn, _plan(10.0, 1))
+
+        def blocked(*args):
+            # The user says "cancel" while the statement is running
+            assert "Cancelling 1 running query" in cancel_sql_query("U1")
+            raise psycopg2.errors.QueryCanceled("canceling statement due to user request")
+
+        named.execute.side_effect = blocked
+        result = run_sql_query("SELECT * FROM sessions", user="U1")
+
+        conn.cancel.assert_called_once()
+        assert "Query cancelled" in result
+        assert "no running queries" in cancel_sql_query("U1")
+
+    def test_cancel_drops_parked_query(self):
+        """Test that cancel also forgets a query waiting for confirmation."""
+        park_query("U1", "SELECT 1", PlanCheck(verdict="confirm"))
+        assert "Dropped" in cancel_sql_query("U1")
+        assert take_pending("U1") is None
+
+
+class TestAsyncGuardedSQLQuery:
+    """Test the guard in the async agent."""
+
+    @patch('core.subsystem_2.async_agent.PANDASAI_AVAILABLE', False)
+    @patch('core.services.async_db.fetch_all', new_callable=AsyncMock)
+    def test_runs_in_read_only_transaction(self, mock_fetch):
+        """Test that the query is explained first and runs behind the prelude."""
+        mock_fetch.side_effect = [[{"QUERY PLAN": _plan(10.0, 1)}], [{"id": 1}]]
+        result = asyncio.run(run_sql_query_async("SELECT id FROM users", user="U1"))
+        assert "Query Results" in result
+        assert mock_fetch.await_args_list[0][0][0].startswith("EXPLAIN")
+        assert mock_fetch.await_args_list[1][1]["prelude"].startswith("BEGIN READ ONLY")
+
+    @patch('core.services.async_db.fetch_all', new_callable=AsyncMock)
+    def test_parks_expensive_query(self, mock_fetch, monkeypatch):
+        """Test that the async path asks for confirmation too."""
+        monkeypatch.setenv("QUERY_CONFIRM_COST", "1000")
+        mock_fetch.return_value = [{"QUERY PLAN": _plan(5000.0, 10)}]
+        result = asyncio.run(run_sql_query_async("SELECT * FROM sessions", user="U1"))
+        assert "looks expensive" in result
+        assert mock_fetch.await_count == 1
+        assert take_pending("U1").sql == "SELECT * FROM sessions"
+
+    @patch('core.services.async_db.fetch_all', new_callable=AsyncMock)
+    def test_cancel_running_task(self, mock_fetch):
+        """Test that cancelling stops the query task but not the handler."""
+        async def scenario():
+            gate = asyncio.Event()
+
+            async def slow(sql, params=None, prelude=None):
+                if sql.startswith("EXPLAIN"):
+                    return [{"QUERY PLAN": _plan(10.0, 1)}]
+                gate.set()
+                await asyncio.sleep(60)
+
+            mock_fetch.side_effect = slow
+            query = asyncio.ensure_future(run_sql_query_async("SELECT * FROM sessions", user="U1"))
+            await gate.wait()
+            assert cancel_queries("U1") == 1
+            return await query
+
+        assert "Query cancelled" in asyncio.run(scenario())
+
+
+class TestRouting:
+    """Test the cancel/confirm replies."""
+
+    def test_cancel_and_confirm_replies(self):
+        """Test that short control replies are routed to the guard."""
+        assert route_message("cancel").intent == "cancel_query"
+        assert route_message("Stop!").intent == "cancel_query"
+        assert route_message("confirm").intent == "confirm_query"
+        assert route_message("yes, run it").intent == "confirm_query"
+
+    def test_questions_are_not_commands(self):
+        """Test that questions mentioning the words still route as questions."""
+        assert route_message("how many users cancel their subscriptions").intent == "data_question"
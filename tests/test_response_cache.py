@@ -0,0 +1,110 @@
+"""
+Tests for the response cache (services/response_cache.py)
+Tests normalization, near-duplicate matching, watermark keys and limits.
+"""
+
+from unittest.mock import patch
+
+from core.services.response_cache import ResponseCache, normalize_question
+from core.subsystem_2.pandas_agent import run_data_question
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestNormalization:
+    """Test question normalization."""
+
+    def test_filler_and_punctuation_removed(self):
+        """Test that phrasing differences normalize to the same text."""
+        assert normalize_question("What's the churn rate per plan?") == normalize_question("churn rate by plan")
+
+
+class TestResponseCache:
+    """Test cache lookups."""
+
+    def test_exact_hit(self):
+        """Test that the same question returns the stored answer."""
+        cache = ResponseCache(max_entries=10, ttl_seconds=60)
+        cache.put("data_question", "payments", "revenue last month", "answer")
+        assert cache.get("data_question", "payments", "Revenue last month?") == "answer"
+
+    def test_similar_hit(self):
+        """Test that a near-duplicate phrasing is matched."""
+        cache = ResponseCache(max_entries=10, ttl_seconds=60)
+        cache.put("data_question", "users", "how many users signed up by country", "answer")
+        assert cache.get("data_question", "users", "how many users signed up by countries please") == "answer"
+        assert cache.stats().similar_hits == 1
+
+    def test_guarded_differences_miss(self):
+        """Test that different numbers, windows or negations never match."""
+        cache = ResponseCache(max_entries=10, ttl_seconds=60, similarity=0.5)
+        cache.put("data_question", "users", "top 5 countries by users last month", "answer")
+        assert cache.get("data_question", "users", "top 10 countries by users last month") is None
+        assert cache.get("data_question", "users", "top 5 countries by users last year") is None
+
+        cache.put("data_question", "subscriptions", "active subscriptions by plan", "answer")
+        assert cache.get("data_question", "subscriptions", "inactive subscriptions by plan") is None
+
+    def test_different_filter_values_miss(self):
+        """Test that questions about different slices of the data never match."""
+        cache = ResponseCache(max_entries=10, ttl_seconds=60, similarity=0.5)
+        cache.put("data_question", "payments", "total paypal payments last year", "paypal answer")
+        assert cache.get("data_question", "payments", "total card payments last year") is None
+        assert cache.get("data_question", "payments", "total paypal payment amounts last year") == "paypal answer"
+
+        cache.put("data_question", "subscriptions", "active subscriptions by plan", "answer")
+        assert cache.get("data_question", "subscriptions", "churned subscriptions by plan") is None
+        assert cache.get("data_question", "subscriptions", "active subscriptions by status") is None
+
+    def test_watermark_change_misses(self):
+        """Test that answers are keyed by the data watermark."""
+        cache = ResponseCache(max_entries=10, ttl_seconds=60)
+        cache.put("data_question", "payments", "total revenue", "old", watermark=("2024-01-01",))
+        assert cache.get("data_question", "payments", "total revenue", watermark=("2024-01-02",)) is None
+
+    def test_ttl_and_size_cap(self):
+        """Test that entries expire and the oldest are evicted."""
+        clock = FakeClock()
+        cache = ResponseCache(max_entries=2, ttl_seconds=60, clock=clock)
+        cache.put("data_question", "users", "total users", "a")
+        cache.put("data_question", "users", "users by device", "b")
+        cache.put("data_question", "users", "users by country", "c")
+        assert cache.get("data_question", "users", "total users") is None
+        assert cache.stats().evictions == 1
+
+        clock.now = 61
+        assert cache.get("data_question", "users", "users by country") is None
+
+
+class TestCachedDataQuestion:
+    """Test that run_data_question uses the cache."""
+
+    @patch('core.subsystem_2.pandas_agent._dataset_watermark', return_value=None)
+    @patch('core.subsystem_2.pandas_agent.query_with_pandasai')
+    @patch('core.subsystem_2.pandas_agent.os.getenv')
+    def test_repeat_question_skips_pandasai(self, mock_getenv, mock_query, mock_watermark):
+        """Test that a repeated question is answered without PandasAI."""
+        mock_getenv.return_value = "test-api-key"
+        mock_query.return_value = "Result"
+
+        assert run_data_question("users", "which countries have the most users?") == "Result"
+        assert run_data_question("users", "Which countries have the most users") == "Result"
+        mock_query.assert_called_once()
+
+    @patch('core.subsystem_2.pandas_agent._dataset_watermark', return_value=None)
+    @patch('core.subsystem_2.pandas_agent.query_with_pandasai')
+    @patch('core.subsystem_2.pandas_agent.os.getenv')
+    def test_warnings_not_cached(self, mock_getenv, mock_query, mock_watermark):
+        """Test that error replies are recomputed next time."""
+        mock_getenv.return_value = "test-api-key"
+        mock_query.return_value = "⚠️ *Error*"
+
+        run_data_question("users", "which countries have the most users?")
+        run_data_question("users", "which countries have the most users?")
+        assert mock_query.call_count == 2
@@ -0,0 +1,291 @@
+"""
+Tests for the daily rollup tables.
+"""
+
+import time
+from datetime import date
+from unittest.mock import MagicMock, patch
+
+import pytest
+import sqlglot
+
+from core.services import rollups
+from core.services.rollups import RollupSpec, build_rollup_spec, get_rollup_specs, refresh_rollup, rollup_table
+from core.services.semantic_layer import get_models
+from core.subsystem_2.pandas_agent import (
+    SUBSCRIPTIONS_OVERVIEW_ROLLUP_SQL,
+    SUBSCRIPTIONS_OVERVIEW_SQL,
+    _generate_subscriptions_sql,
+    _query_subscriptions_overview,
+)
+
+
+def _spec():
+    return RollupSpec(
+        model="subscriptions",
+        source_table="subscriptions",
+        time_column="start_date",
+        dimensions=["plan"],
+        event_columns=["end_date"],
+    )
+
+
+class TestRollupSpec:
+    """Test rollup specs derived from the semantic layer."""
+
+    def test_payments_sums_amount(self):
+        """Test that SUM/AVG measures become sum columns."""
+        spec = build_rollup_spec(get_models()["payments"])
+        assert spec.table == "rollup_payments_daily"
+        assert spec.time_column == "payment_date"
+        assert spec.sum_columns == ["amount_usd"]
+        assert spec.dimensions == ["method"]
+
+    def test_subscriptions_counts_end_dates(self):
+        """Test that a measure on another date field becomes an event column."""
+        spec = build_rollup_spec(get_models()["subscriptions"])
+        assert spec.time_column == "start_date"
+        assert spec.event_columns == ["end_date"]
+        assert spec.measure_columns == ["row_count", "end_date_count"]
+
+    def test_every_spec_renders_valid_sql(self):
+        """Test that generated DDL and source queries parse as Postgres."""
+        for spec in get_rollup_specs().values():
+            sqlglot.parse(spec.create_sql(), read="postgres")
+            sql, params = spec.source_sql(date(2024, 1, 1))
+            sqlglot.parse_one(sql.replace("%s", "'2024-01-01'"), read="postgres")
+            assert len(params) == 1 + len(spec.event_columns)
+
+    def test_full_source_has_no_params(self):
+        """Test that a full rebuild scans every non-null day."""
+        sql, params = _spec().source_sql(None)
+        assert params == []
+        assert "end_date IS NOT NULL" in sql
+        assert "UNION ALL" in sql
+
+    def test_rejects_bad_identifiers(self):
+        """Test that odd column names never reach the SQL."""
+        spec = _spec()
+        spec.dimensions = ["plan; DROP TABLE users"]
+        try:
+            spec.create_sql()
+        except ValueError:
+            return
+        raise AssertionError("expected ValueError")
+
+
+class TestRefreshRollup:
+    """Test incremental rebuilds."""
+
+    def test_rebuilds_lateness_window(self, monkeypatch):
+        """Test that only days within the lateness window are replaced."""
+        monkeypatch.setenv("INCREMENTAL_LATENESS_DAYS", "2")
+        conn = MagicMock()
+        cursor = conn.cursor.return_value.__enter__.return_value
+        # source high-water marks, then the marks stored by the last refresh
+        stored = '{"end_date": "2024-03-10", "start_date": "2024-03-10 00:00:00"}'
+        cursor.fetchone.side_effect = [(date(2024, 3, 12), date(2024, 3, 11)), (stored,)]
+
+        plan = refresh_rollup(conn, _spec())
+
+        assert plan.changed
+        assert plan.since == date(2024, 3, 8)
+        statements = [c[0][0] for c in cursor.execute.call_args_list]
+        assert any(s.startswith("DELETE FROM rollup_subscriptions_daily WHERE day >=") for s in statements)
+        assert any(s.startswith("INSERT INTO rollup_subscriptions_daily") for s in statements)
+        assert statements[-1].startswith("INSERT INTO rollup_refreshes")
+        assert cursor.execute.call_args[0][1][0] == "subscriptions"
+        conn.commit.assert_called_once()
+        assert rollups.cached_rollup_table("subscriptions") == "rollup_subscriptions_daily"
+
+    def test_empty_rollup_rebuilds_everything(self):
+        """Test that a rollup without stored marks is filled from scratch."""
+        conn = MagicMock()
+        cursor = conn.cursor.return_value.__enter__.return_value
+        cursor.fetchone.side_effect = [(date(2024, 3, 12), None), None]
+
+        assert refresh_rollup(conn, _spec()).since is None
+        statements = [c[0][0] for c in cursor.execute.call_args_list]
+        assert "DELETE FROM rollup_subscriptions_daily" in statements
+
+    def test_skips_when_marks_unchanged(self):
+        """Test that a second refresh with the same source marks does nothing."""
+        conn = MagicMock()
+        cursor = conn.cursor.return_value.__enter__.return_value
+        cursor.fetchone.side_effect = [(date(2024, 3, 12), None), None, (date(2024, 3, 12), None)]
+        refresh_rollup(conn, _spec())
+        cursor.execute.reset_mock()
+
+        plan = refresh_rollup(conn, _spec())
+
+        assert not plan.changed
+        statements = [c[0][0] for c in cursor.execute.call_args_list]
+        assert not any(s.startswith(("DELETE", "INSERT INTO rollup_subscriptions_daily")) for s in statements)
+        assert statements[-1].startswith("INSERT INTO rollup_refreshes")
+
+    def test_unreadable_stored_marks_rebuild_everything(self):
+        """Test that stored marks for other columns force a full rebuild."""
+        conn = MagicMock()
+        cursor = conn.cursor.return_value.__enter__.return_value
+        cursor.fetchone.side_effect = [(date(2024, 3, 12), None), ('{"signup_date": "2024-03-10"}',)]
+
+        assert refresh_rollup(conn, _spec()).since is None
+
+    def test_restart_with_future_end_dates(self):
+        """Test that a restarted process still picks up new starts when end dates lie ahead."""
+        duckdb = pytest.importorskip("duckdb")
+        db = duckdb.connect()
+        db.execute("CREATE TABLE subscriptions (plan varchar, start_date timestamp, end_date timestamp)")
+        db.execute("""
+            INSERT INTO subscriptions VALUES
+              ('monthly', CURRENT_DATE - 30, NULL),
+              ('annual', CURRENT_DATE - 20, CURRENT_DATE + 300)
+        """)
+        conn = _DuckConnection(db)
+        refresh_rollup(conn, _spec())
+
+        # The bot restarts, then new subscriptions arrive
+        rollups._marks.clear()
+        rollups._full_at.clear()
+        db.execute("INSERT INTO subscriptions VALUES ('monthly', CURRENT_DATE - 1, NULL), ('free', CURRENT_DATE, NULL)")
+        plan = refresh_rollup(conn, _spec())
+
+        assert plan.since is not None
+        rolled = db.execute("SELECT SUM(row_count) FROM rollup_subscriptions_daily").fetchone()[0]
+        assert rolled == db.execute("SELECT COUNT(*) FROM subscriptions").fetchone()[0] == 4
+
+
+class _DuckConnection:
+    """psycopg2-style connection over DuckDB (%s placeholders, cursor context)."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=()):
+        self.db.execute(sql.replace("%s", "?"), list(params))
+
+    def fetchone(self):
+        return self.db.fetchone()
+
+    def commit(self):
+        pass
+
+
+class TestRollupMatchesRaw:
+    """Test that overview answers don't depend on whether a rollup exists."""
+
+    def test_subscriptions_overview_counts_today(self):
+        """Test that starts and ends dated today count the same in both queries."""
+        duckdb = pytest.importorskip("duckdb")
+        db = duckdb.connect()
+        db.execute("CREATE TABLE subscriptions (plan varchar, start_date timestamp, end_date timestamp)")
+        db.execute("""
+            INSERT INTO subscriptions VALUES
+              ('monthly', CURRENT_DATE - 10, NULL),
+              ('monthly', CURRENT_DATE + INTERVAL 10 HOUR, NULL),
+              ('annual', CURRENT_DATE - 5, CURRENT_DATE + INTERVAL 9 HOUR),
+              ('annual', CURRENT_DATE - 20, CURRENT_DATE - 3),
+              ('annual', CURRENT_DATE - 2, CURRENT_DATE + 1),
+              ('free', CURRENT_DATE + 1, NULL)
+        """)
+        spec = build_rollup_spec(get_models()["subscriptions"])
+        db.execute(spec.create_sql())
+        sql, _ = spec.source_sql(None)
+        db.execute(f"INSERT INTO {spec.table} (day, plan, row_count, end_date_count) {sql}")
+
+        raw = db.execute(SUBSCRIPTIONS_OVERVIEW_SQL).fetchall()
+        rolled = db.execute(SUBSCRIPTIONS_OVERVIEW_ROLLUP_SQL).fetchall()
+
+        assert raw == rolled
+        assert raw[0][:5] == (1, None, 6, 3, 2)
+
+
+class TestRollupReaders:
+    """Test that readers use rollups when present and fall back otherwise."""
+
+    def test_missing_table(self):
+        """Test that a missing rollup table is reported as None."""
+        conn = MagicMock()
+        conn.cursor.return_value.__enter__.return_value.fetchone.return_value = (False,)
+        assert rollup_table(conn, "payments") is None
+        assert rollups.cached_rollup_table("payments") is None
+
+    def _state_conn(self, stored_marks, age_seconds, source_marks):
+        conn = MagicMock()
+        conn.cursor.return_value.__enter__.return_value.fetchone.side_effect = [
+            (True,), (rollups._marks_key(stored_marks), age_seconds), source_marks,
+        ]
+        return conn
+
+    def test_fresh_rollup_used(self):
+        """Test that a rollup whose recorded marks match the source is used."""
+        marks = {"payment_date": date(2024, 3, 12)}
+        conn = self._state_conn(marks, 7200, (date(2024, 3, 12),))
+        assert rollup_table(conn, "payments") == "rollup_payments_daily"
+        assert rollups.cached_rollup_table("payments") == "rollup_payments_daily"
+
+    def test_stale_rollup_falls_back(self):
+        """Test that new source rows since the last refresh mean no rollup."""
+        conn = self._state_conn({"payment_date": date(2024, 3, 12)}, 7200, (date(2024, 3, 13),))
+        assert rollup_table(conn, "payments") is None
+        assert rollups.cached_rollup_table("payments") is None
+
+    def test_recent_refresh_within_staleness_allowance(self, monkeypatch):
+        """Test ROLLUP_MAX_STALENESS_SECONDS: a recent refresh is used without reading the source."""
+        monkeypatch.setenv("ROLLUP_MAX_STALENESS_SECONDS", "600")
+        conn = self._state_conn({"payment_date": date(2024, 3, 12)}, 60, None)
+        assert rollup_table(conn, "payments") == "rollup_payments_daily"
+        assert conn.cursor.return_value.__enter__.return_value.execute.call_count == 2
+
+    def test_never_refreshed(self):
+        """Test that a rollup table without a recorded refresh is not used."""
+        conn = MagicMock()
+        conn.cursor.return_value.__enter__.return_value.fetchone.side_effect = [(True,), None]
+        assert rollup_table(conn, "payments") is None
+
+    def test_cached_check_expires(self, monkeypatch):
+        """Test that SQL rendering stops using a rollup once its check is old."""
+        monkeypatch.setenv("ROLLUP_CHECK_SECONDS", "300")
+        rollups._available["payments"] = (time.monotonic() - 301, True)
+        assert rollups.cached_rollup_table("payments") is None
+
+    def test_check_failure_falls_back(self):
+        """Test that errors during the check mean no rollup."""
+        conn = MagicMock()
+        conn.cursor.side_effect = Exception("boom")
+        assert rollup_table(conn, "payments") is None
+        conn.rollback.assert_called_once()
+
+    @patch('core.subsystem_2.pandas_agent.rollup_table', return_value="rollup_subscriptions_daily")
+    @patch('core.subsystem_2.pandas_agent._get_connection')
+    def test_subscriptions_overview_from_rollup(self, mock_conn, mock_rollup):
+        """Test that the subscriptions overview reads the rollup when present."""
+        cursor = mock_conn.return_value.__enter__.return_value.cursor.return_value.__enter__.return_value
+        cursor.fetchall.return_value = [
+            {"grp": 1, "plan": None, "total_subscriptions": 10, "active_subscriptions": 6, "churned_subscriptions": 4},
+        ]
+
+        result = _query_subscriptions_overview()
+
+        assert "rollup_subscriptions_daily" in cursor.execute.call_args[0][0]
+        assert result["active_subscriptions"] == 6
+
+    def test_generated_plan_sql_uses_known_rollup(self):
+        """Test that plan breakdowns read the rollup only once it is known to exist."""
+        filters = {"group_by": "plan", "date_range": "last_month"}
+        assert "FROM subscriptions" in _generate_subscriptions_sql("subscriptions by plan", filters)
+
+        rollups._available["subscriptions"] = (time.monotonic(), True)
+        sql = _generate_subscriptions_sql("subscriptions by plan", filters)
+        assert "FROM rollup_subscriptions_daily" in sql
+        assert "CURRENT_DATE - 30" in sql
+        sqlglot.parse_one(sql, read="postgres")
@@ -4,7 +4,7 @@ Tests message routing and intent classification.
 """
 
 import pytest
-from core.subsystem_1.router import route_message, Intent
+from core.subsystem_1.router import route_message, scan_keywords, Intent
 
 
 class TestRouter:
@@ -54,3 +54,29 @@ class TestRouter:
         decision = route_message("random gibberish xyz123")
         assert decision.intent == "unknown"
 
+
+
+class TestKeywordMatcher:
+    """Test the compiled single-pass keyword matcher."""
+    
+    def test_word_boundaries(self):
+        """Test that short keywords don't fire inside other words."""
+        assert "small_talk" not in scan_keywords("this is your summary")
+        assert "small_talk" in scan_keywords("hi there")
+    
+    def test_inflections(self):
+        """Test that longer keywords match common inflections."""
+        decision = route_message("forecasting cancellations next quarter")
+        assert decision.intent == "prediction"
+        assert decision.dataset == "subscriptions"
+    
+    def test_overlapping_keywords(self):
+        """Test that a longer keyword also reports its whole-word prefixes."""
+        signals = scan_keywords("show queries")
+        assert "list_queries" in signals
+        assert "sql_start" in signals.leading
+    
+    def test_dataset_precedence(self):
+        """Test that later datasets win when several match."""
+        decision = route_message("revenue per session by user")
+        assert decision.dataset == "sessions"
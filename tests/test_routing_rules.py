@@ -0,0 +1,102 @@
+"""
+Tests for data-driven routing rules (subsystem_1/routing_rules.py)
+Tests keyword building from the semantic layer, matching and hot reload.
+"""
+
+import os
+
+from core.services.semantic_layer import SemanticField, SemanticMeasure, SemanticModel
+from core.subsystem_1.routing_rules import (
+    KeywordMatcher,
+    _RulesCache,
+    build_dataset_keywords,
+    infer_dataset,
+    pick_dataset,
+)
+
+MODELS = {
+    "payments": SemanticModel(
+        name="payments",
+        table="payments",
+        fields=[
+            SemanticField(name="user_id", type="int4"),
+            SemanticField(name="method", type="varchar", description="Payment method (e.g., card, paypal)."),
+        ],
+        measures=[SemanticMeasure(name="total_revenue_usd")],
+    ),
+    "sessions": SemanticModel(
+        name="sessions",
+        table="sessions",
+        fields=[
+            SemanticField(name="user_id", type="int4"),
+            SemanticField(name="duration_minutes", type="int4"),
+        ],
+    ),
+}
+
+
+class TestBuildKeywords:
+    """Test keyword extraction from semantic models."""
+
+    def test_model_fields_and_measures(self):
+        """Test that names, fields, measures and example values become keywords."""
+        datasets = build_dataset_keywords(MODELS, {})
+        assert datasets["payments"]["payment"] == 3.0
+        assert datasets["payments"]["paypal"] == 1.0
+        assert datasets["payments"]["revenue"] == 1.0
+        assert datasets["sessions"]["minutes"] == 1.0
+
+    def test_shared_words_are_downweighted(self):
+        """Test that words every model has barely count."""
+        datasets = build_dataset_keywords(MODELS, {})
+        assert datasets["payments"]["user"] == 0.5
+
+    def test_rules_file_keywords(self):
+        """Test that rules-file keywords are merged in with their weight."""
+        rules = {"datasets": {"payments": {"keywords": ["gmv"]}}, "ignore": ["revenue"]}
+        datasets = build_dataset_keywords(MODELS, rules)
+        assert datasets["payments"]["gmv"] == 3.0
+        assert "revenue" not in datasets["payments"]
+
+
+class TestMatcher:
+    """Test weighted matching."""
+
+    def test_scores_and_pick(self):
+        """Test that the dataset with the highest score is picked."""
+        matcher = KeywordMatcher(build_dataset_keywords(MODELS, {}))
+        signals = matcher.scan("paypal revenue per user")
+        assert pick_dataset(signals.scores, ["payments", "sessions"]) == "payments"
+
+    def test_weak_signals_ignored(self):
+        """Test that nothing is picked below the minimum score."""
+        assert pick_dataset({"sessions": 0.5}, ["payments", "sessions"]) is None
+
+    def test_infer_dataset_from_semantic_layer(self):
+        """Test table inference used by PandasAI."""
+        assert infer_dataset("total revenue by payment method") == "payments"
+        assert infer_dataset("average session duration") == "sessions"
+        assert infer_dataset("tell me a joke") is None
+
+
+class TestHotReload:
+    """Test that rules are rebuilt when the rules file changes."""
+
+    def test_rules_file_change_rebuilds(self, tmp_path, monkeypatch):
+        """Test that editing the rules file changes routing without a restart."""
+        monkeypatch.setenv("ROUTING_RULES_CHECK_SECONDS", "0")
+        rules_file = tmp_path / "routing_rules.yml"
+        rules_file.write_text("datasets:\n  payments:\n    keywords: [gmv]\n")
+        cache = _RulesCache(rules_file)
+
+        first = cache.get()
+        assert "gmv" in first.datasets["payments"]
+        assert cache.get() is first
+
+        rules_file.write_text("datasets:\n  payments:\n    keywords: [bookings]\n")
+        stat = rules_file.stat()
+        os.utime(rules_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+        second = cache.get()
+        assert second.version == first.version + 1
+        assert "bookings" in second.datasets["payments"]
@@ -0,0 +1,242 @@
+"""
+Tests for coalescing identical in-flight requests.
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+from core.services.query_guard import cancel_queries
+from core.services.single_flight import (
+    AsyncSingleFlight,
+    SingleFlight,
+    get_single_flight_metrics,
+)
+from core.services.sql_validator import sql_fingerprint
+from core.subsystem_2.async_agent import run_data_question_async
+from core.subsystem_2.pandas_agent import run_data_question, run_sql_query
+
+
+class TestSingleFlight:
+    """Test the thread-based coalescer."""
+
+    def test_duplicates_share_one_run(self):
+        """Test that concurrent calls with one key run the computation once."""
+        flight = SingleFlight()
+        release = threading.Event()
+        compute = MagicMock(side_effect=lambda progress: release.wait(2) and "answer")
+
+        def ask():
+            return flight.do("key", compute)
+
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            futures = [pool.submit(ask) for _ in range(3)]
+            time.sleep(0.1)
+            release.set()
+            results = [f.result(timeout=5) for f in futures]
+
+        assert results == ["answer"] * 3
+        assert compute.call_count == 1
+        assert get_single_flight_metrics()["shared"] == 2
+        assert flight.in_flight() == 0
+
+    def test_different_keys_run_separately(self):
+        """Test that different keys are not coalesced."""
+        flight = SingleFlight()
+        compute = MagicMock(side_effect=lambda progress: "answer")
+        flight.do("a", compute)
+        flight.do("b", compute)
+        assert compute.call_count == 2
+
+    def test_sequential_calls_rerun(self):
+        """Test that a finished computation is not reused for later calls."""
+        flight = SingleFlight()
+        compute = MagicMock(side_effect=lambda progress: "answer")
+        flight.do("key", compute)
+        flight.do("key", compute)
+        assert compute.call_count == 2
+
+    def test_error_shared_and_released(self):
+        """Test that every waiter sees the error and the key is freed."""
+        flight = SingleFlight()
+        release = threading.Event()
+
+        def fail(progress):
+            release.wait(2)
+            raise RuntimeError("db down")
+
+        def ask():
+            try:
+                return flight.do("key", fail)
+            except RuntimeError as e:
+                return str(e)
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            futures = [pool.submit(ask) for _ in range(2)]
+            time.sleep(0.1)
+            release.set()
+            assert [f.result(timeout=5) for f in futures] == ["db down"] * 2
+        assert flight.in_flight() == 0
+
+    def test_progress_reaches_every_waiter(self):
+        """Test that partial answers go to all waiters, including late joiners."""
+        flight = SingleFlight()
+        reported = threading.Event()
+        release = threading.Event()
+        first, second = MagicMock(), MagicMock()
+
+        def compute(progress):
+            progress("partial")
+            reported.set()
+            release.wait(2)
+            return "final"
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            leader = pool.submit(flight.do, "key", compute, first)
+            reported.wait(2)
+            follower = pool.submit(flight.do, "key", compute, second)
+            time.sleep(0.1)
+            release.set()
+            assert leader.result(timeout=5) == follower.result(timeout=5) == "final"
+
+        first.assert_called_once_with("partial")
+        second.assert_called_once_with("partial")
+
+
+class TestAsyncSingleFlight:
+    """Test the asyncio coalescer."""
+
+    def test_duplicates_share_one_task(self):
+        """Test that concurrent awaits with one key share one task."""
+        calls = []
+
+        async def compute(progress):
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "answer"
+
+        async def run():
+            flight = AsyncSingleFlight()
+            return await asyncio.gather(*(flight.do("key", compute) for _ in range(3)))
+
+        assert asyncio.run(run()) == ["answer"] * 3
+        assert len(calls) == 1
+
+    def test_cancelled_waiter_does_not_cancel_others(self):
+        """Test that one caller giving up leaves the shared task running."""
+        async def compute(progress):
+            await asyncio.sleep(0.05)
+            return "answer"
+
+        async def run():
+            flight = AsyncSingleFlight()
+            first = asyncio.ensure_future(flight.do("key", compute))
+            second = asyncio.ensure_future(flight.do("key", compute))
+            await asyncio.sleep(0)
+            first.cancel()
+            return await second
+
+        assert asyncio.run(run()) == "answer"
+
+
+class TestSQLFingerprint:
+    """Test which queries are considered identical."""
+
+    def test_formatting_ignored(self):
+        """Test that case, whitespace and trailing semicolons do not matter."""
+        assert sql_fingerprint("select id from users") == sql_fingerprint("SELECT id\n  FROM Users;")
+
+    def test_literals_matter(self):
+        """Test that different literals and quoted names are different queries."""
+        assert sql_fingerprint("SELECT 'US'") != sql_fingerprint("SELECT 'us'")
+        assert sql_fingerprint('SELECT "A" FROM t') != sql_fingerprint('SELECT "a" FROM t')
+
+
+class TestAgentCoalescing:
+    """Test coalescing in the agent entry points."""
+
+    @patch('core.subsystem_2.pandas_agent.query_with_pandasai')
+    def test_duplicate_data_questions_share_answer(self, mock_query, monkeypatch):
+        """Test that the same question asked concurrently runs PandasAI once."""
+        monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+        release = threading.Event()
+        mock_query.side_effect = lambda *args, **kwargs: release.wait(2) and "⚠️ 42 users"
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            futures = [
+                pool.submit(run_data_question, "users", "Which countries have the most users?"),
+                pool.submit(run_data_question, "users", "which countries have the most users"),
+            ]
+            time.sleep(0.1)
+            release.set()
+            results = [f.result(timeout=5) for f in futures]
+
+        assert results == ["⚠️ 42 users"] * 2
+        assert mock_query.call_count == 1
+
+    @patch('core.subsystem_2.pandas_agent.PANDASAI_AVAILABLE', False)
+    @patch('core.subsystem_2.pandas_agent._get_connection')
+    def test_duplicate_sql_runs_once(self, mock_conn):
+        """Test that identical SQL pasted twice by one user runs one query."""
+        release = threading.Event()
+        conn = mock_conn.return_value.__enter__.return_value
+        conn.cursor.return_value.__enter__.return_value.fetchone.return_value = (None,)
+        named = conn.cursor.return_value
+        named.execute.side_effect = lambda *args: release.wait(2)
+        named.fetchmany.return_value = [{"id": 1}]
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            futures = [
+                pool.submit(run_sql_query, "SELECT id FROM users", "U1"),
+                pool.submit(run_sql_query, "select id\nfrom users;", "U1"),
+            ]
+            time.sleep(0.2)
+            release.set()
+            results = [f.result(timeout=5) for f in futures]
+
+        assert results[0] == results[1]
+        assert "Query Results" in results[0]
+        bounded = [c for c in named.execute.call_args_list if "LIMIT" in c[0][0]]
+        assert len(bounded) == 1
+
+    @patch('core.subsystem_2.pandas_agent.PANDASAI_AVAILABLE', False)
+    @patch('core.subsystem_2.pandas_agent._get_connection')
+    def test_other_users_cancel_only_their_own_query(self, mock_conn):
+        """Test that the same SQL from two users runs twice and one user's cancel leaves the other's."""
+        release = threading.Event()
+        conn = mock_conn.return_value.__enter__.return_value
+        conn.cursor.return_value.__enter__.return_value.fetchone.return_value = (None,)
+        named = conn.cursor.return_value
+        named.execute.side_effect = lambda *args: release.wait(2)
+        named.fetchmany.return_value = [{"id": 1}]
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            futures = [
+                pool.submit(run_sql_query, "SELECT id FROM users", "U1"),
+                pool.submit(run_sql_query, "SELECT id FROM users", "U2"),
+            ]
+            time.sleep(0.2)
+            assert cancel_queries("U2") == 1
+            release.set()
+            results = [f.result(timeout=5) for f in futures]
+
+        assert "Query Results" in results[0]
+        bounded = [c for c in named.execute.call_args_list if "LIMIT" in c[0][0]]
+        assert len(bounded) == 2
+
+    @patch('core.subsystem_2.async_agent.pandas_agent.run_data_question')
+    def test_async_duplicates_take_one_slot(self, mock_run):
+        """Test that async duplicates wait on one worker-thread run."""
+        release = threading.Event()
+        mock_run.side_effect = lambda *args: release.wait(2) and "answer"
+
+        async def run():
+            asks = [asyncio.ensure_future(run_data_question_async("users", "which countries have the most users?")) for _ in range(3)]
+            await asyncio.sleep(0.1)
+            release.set()
+            return await asyncio.gather(*asks)
+
+        assert asyncio.run(run()) == ["answer"] * 3
+        assert mock_run.call_count == 1
@@ -0,0 +1,159 @@
+"""
+Tests for bounded (streaming) execution of ad-hoc SQL.
+"""
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import psycopg2
+import sqlglot
+
+from core.services.sql_stream import (
+    execute_bounded,
+    fetch_bounded,
+    is_wrappable,
+    limited_sql,
+    plan_rows,
+    statement_body,
+)
+from core.subsystem_2.pandas_agent import _format_sql_results
+
+
+def _streaming_conn(total_rows, count_row=None):
+    """Connection whose named cursor yields `total_rows` rows in fetchmany batches."""
+    conn = MagicMock()
+    produced = {"n": 0}
+
+    def fetchmany(size):
+        start = produced["n"]
+        end = min(total_rows, start + size)
+        produced["n"] = end
+        return [{"id": i} for i in range(start, end)]
+
+    named = MagicMock()
+    named.fetchmany.side_effect = fetchmany
+    counter = MagicMock()
+    counter.fetchone.return_value = count_row
+    conn.cursor.side_effect = lambda *args, **kwargs: named if "name" in kwargs else MagicMock(
+        __enter__=MagicMock(return_value=counter), __exit__=MagicMock(return_value=False)
+    )
+    return conn, named, counter, produced
+
+
+class TestWrapping:
+    """Test the LIMIT wrapper."""
+
+    def test_wraps_select(self):
+        """Test that selects get an outer LIMIT of max_rows + 1."""
+        sql = limited_sql("SELECT * FROM sessions ORDER BY session_date;  ", 100)
+        assert sql.endswith("LIMIT 101")
+        assert ";" not in sql
+        sqlglot.parse_one(sql, read="postgres")
+
+    def test_wrappable_statements(self):
+        """Test which statements can become subqueries."""
+        assert is_wrappable("with x as (select 1) select * from x")
+        assert is_wrappable("(SELECT 1) UNION (SELECT 2)")
+        assert not is_wrappable("EXPLAIN SELECT 1")
+        assert not is_wrappable("SHOW search_path")
+
+    def test_statement_body(self):
+        """Test that trailing semicolons are dropped."""
+        assert statement_body("  SELECT 1 ;\n; ") == "SELECT 1"
+
+    def test_plan_rows(self):
+        """Test reading the row estimate from EXPLAIN JSON."""
+        assert plan_rows([{"Plan": {"Plan Rows": 12345}}]) == 12345
+        assert plan_rows(None) is None
+
+
+class TestExecuteBounded:
+    """Test that only max_rows + 1 rows are ever read."""
+
+    def test_small_result(self):
+        """Test that small results come back whole and exact."""
+        conn, named, _, _ = _streaming_conn(3)
+        result = execute_bounded(conn, "SELECT id FROM users", max_rows=100)
+        assert len(result.rows) == 3
+        assert not result.truncated
+        assert result.total_rows == 3
+        assert "LIMIT 101" in named.execute.call_args[0][0]
+        named.close.assert_called_once()
+
+    def test_large_result_reads_one_extra_row(self, monkeypatch):
+        """Test that a huge result stops after max_rows + 1 rows, in batches."""
+        monkeypatch.setenv("SQL_FETCH_BATCH", "40")
+        conn, named, _, produced = _streaming_conn(5_000_000, count_row=([{"Plan": {"Plan Rows": 4_900_000}}],))
+
+        result = execute_bounded(conn, "SELECT * FROM sessions", max_rows=100)
+
+        assert produced["n"] == 101
+        assert [c[0][0] for c in named.fetchmany.call_args_list] == [40, 40, 21]
+        assert len(result.rows) == 100
+        assert result.truncated
+        assert result.total_rows == 4_900_000 and result.total_is_estimate
+
+    def test_exact_count(self):
+        """Test the exact COUNT(*) strategy."""
+        conn, _, counter, _ = _streaming_conn(500, count_row=(500,))
+        result = execute_bounded(conn, "SELECT * FROM payments", max_rows=10, count="exact")
+        assert result.total_rows == 500 and not result.total_is_estimate
+        assert "COUNT(*)" in counter.execute.call_args[0][0]
+
+    def test_count_failure_is_unknown(self):
+        """Test that a failing count leaves the total unknown."""
+        conn, _, counter, _ = _streaming_conn(500)
+        counter.execute.side_effect = psycopg2.OperationalError("timeout")
+        result = execute_bounded(conn, "SELECT * FROM payments", max_rows=10)
+        assert result.truncated and result.total_rows is None
+
+    def test_explain_is_not_wrapped(self):
+        """Test that EXPLAIN runs as-is on a regular cursor."""
+        conn = MagicMock()
+        cursor = conn.cursor.return_value
+        cursor.fetchmany.return_value = [{"QUERY PLAN": "Seq Scan"}]
+        result = execute_bounded(conn, "EXPLAIN SELECT * FROM users;")
+        assert cursor.execute.call_args[0][0] == "EXPLAIN SELECT * FROM users"
+        assert "name" not in conn.cursor.call_args[1]
+        assert result.rows == [{"QUERY PLAN": "Seq Scan"}]
+
+    @patch('core.services.async_db.fetch_all', new_callable=AsyncMock)
+    def test_async_wrapper(self, mock_fetch):
+        """Test the async path caps rows and estimates the total."""
+        mock_fetch.side_effect = [
+            [{"id": i} for i in range(11)],
+            [{"QUERY PLAN": [{"Plan": {"Plan Rows": 999}}]}],
+        ]
+        result = asyncio.run(fetch_bounded("SELECT * FROM users", max_rows=10))
+        assert len(result.rows) == 10
+        assert result.total_rows == 999 and result.total_is_estimate
+        assert mock_fetch.await_args_list[0][0][0].endswith("LIMIT 11")
+
+
+class TestFormatting:
+    """Test how cut-off results are reported."""
+
+    def test_truncated_legacy_rows(self):
+        """Test that a full row list reports its real size (not max_rows)."""
+        text = _format_sql_results([{"id": i} for i in range(250)], max_rows=100)
+        assert "Showing first 100 of 250 rows" in text
+        assert "and 150 more rows" in text
+
+    def test_estimated_total(self):
+        """Test that planner estimates are marked as such."""
+        text = _format_sql_results(
+            [{"id": i} for i in range(100)], total_rows=5000, total_is_estimate=True, truncated=True
+        )
+        assert "of ~5,000 rows" in text
+        assert "planner estimate" in text
+
+    def test_unknown_total(self):
+        """Test the wording when the total could not be counted."""
+        text = _format_sql_results([{"id": i} for i in range(100)], truncated=True)
+        assert "of more than 100 rows" in text
+
+    def test_complete_result(self):
+        """Test that complete results keep the plain row count."""
+        text = _format_sql_results([{"id": 1}, {"id": 2}])
+        assert "Showing first" not in text
+        assert "*Total rows returned:* 2" in text
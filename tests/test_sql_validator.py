@@ -0,0 +1,174 @@
+"""
+Tests for the parser-based SQL validator.
+"""
+
+import pytest
+
+from core.services import sql_validator
+from core.services.sql_validator import get_validation_cache_metrics, validate_sql
+
+
+class TestReadOnlyStatements:
+    """Test which statements are accepted."""
+
+    @pytest.mark.parametrize("sql", [
+        "SELECT created_at, last_updated FROM users",
+        "select * from users;",
+        "WITH t AS (SELECT * FROM payments) SELECT method, COUNT(*) FROM t GROUP BY method",
+        "(SELECT user_id FROM users) UNION ALL (SELECT user_id FROM payments)",
+        "SELECT * FROM public.sessions",
+        "SELECT * FROM users WHERE country = 'DROP TABLE users; --'",
+        "SELECT g FROM generate_series(1, 3) AS g",
+        "VALUES (1, 'a')",
+        "EXPLAIN SELECT * FROM users",
+        "EXPLAIN (VERBOSE, FORMAT JSON) SELECT * FROM payments",
+        "SHOW search_path",
+        "TABLE users",
+        "table public.payments ORDER BY payment_date DESC LIMIT 5;",
+        "WITH t AS (TABLE payments) SELECT COUNT(*) FROM t",
+        "TABLE users UNION ALL TABLE users",
+        "EXPLAIN TABLE sessions",
+    ])
+    def test_allowed(self, sql):
+        """Test that read-only queries over known tables pass."""
+        result = validate_sql(sql)
+        assert result.ok, result.reason
+
+    @pytest.mark.parametrize("sql, reason", [
+        ("INSERT INTO users VALUES (1)", "INSERT statements"),
+        ("UPDATE users SET country = 'DE'", "UPDATE statements"),
+        ("DROP TABLE users", "DROP statements"),
+        ("COPY users TO '/tmp/users.csv'", "COPY statements"),
+        ("WITH gone AS (DELETE FROM users RETURNING *) SELECT * FROM gone", "DELETE is not allowed"),
+        ("SELECT * INTO users_copy FROM users", "INTO is not allowed"),
+        ("SELECT * FROM users FOR UPDATE", "LOCK is not allowed"),
+        ("SELECT 1; DELETE FROM users", "one statement"),
+        ("SELECT 1 -- harmless\n; DROP TABLE users", "one statement"),
+        ("SHOW search_path; DROP TABLE users", "one statement"),
+        ("EXPLAIN DELETE FROM users", "DELETE statements"),
+        ("EXPLAIN EXPLAIN SELECT 1", "EXPLAIN only accepts a query"),
+        ("EXPLAIN ANALYZE SELECT * FROM users a, users b, users c", "EXPLAIN ANALYZE"),
+        ("explain analyse verbose SELECT * FROM users", "EXPLAIN ANALYZE"),
+        ("EXPLAIN (ANALYZE) SELECT * FROM users a, users b, users c", "EXPLAIN ANALYZE"),
+        ("EXPLAIN (FORMAT JSON, analyze true) SELECT * FROM payments", "EXPLAIN ANALYZE"),
+        ("SHOW data_directory", "server files"),
+        ("show hba_file", "server files"),
+        ("This is not SQL", "Could not parse"),
+    ])
+    def test_rejected(self, sql, reason):
+        """Test that writes, locks and multi-statement payloads are rejected."""
+        result = validate_sql(sql)
+        assert not result.ok
+        assert reason in result.reason
+
+
+class TestTablesAndFunctions:
+    """Test the table allow-list and function deny-list."""
+
+    def test_unknown_table(self):
+        """Test that tables outside the semantic layer are rejected."""
+        result = validate_sql("SELECT * FROM secrets JOIN users ON true")
+        assert not result.ok
+        assert "secrets" in result.reason and "users" not in result.reason
+
+    @pytest.mark.parametrize("sql", [
+        "TABLE secrets",
+        "WITH x AS (TABLE pg_shadow) SELECT * FROM x",
+        "SELECT * FROM (TABLE secrets) t",
+        "TABLE users UNION TABLE secrets",
+    ])
+    def test_table_queries_checked_like_selects(self, sql):
+        """Test that `TABLE name` is checked against the allow-list like SELECT * FROM name."""
+        result = validate_sql(sql)
+        assert not result.ok
+        assert "Table not available" in result.reason
+
+    def test_other_schema(self):
+        """Test that catalog tables are rejected even under a known name."""
+        assert not validate_sql("SELECT * FROM pg_catalog.pg_user").ok
+        assert not validate_sql("SELECT * FROM information_schema.users").ok
+
+    def test_rollup_tables_allowed(self):
+        """Test that rollup tables of the semantic models can be read."""
+        assert validate_sql("SELECT * FROM rollup_payments_daily").ok
+
+    def test_extra_allowed_tables(self, monkeypatch):
+        """Test SQL_ALLOWED_TABLES."""
+        monkeypatch.setenv("SQL_ALLOWED_TABLES", "experiments, Campaigns")
+        assert validate_sql("SELECT * FROM campaigns").ok
+
+    def test_cte_names_are_not_tables(self):
+        """Test that CTE references do not count as tables."""
+        result = validate_sql("WITH secrets AS (SELECT 1 AS x) SELECT * FROM secrets")
+        assert result.ok
+        assert result.tables == set()
+
+    @pytest.mark.parametrize("sql", [
+        "SELECT pg_sleep(30)",
+        "SELECT * FROM users WHERE pg_read_file('/etc/passwd') IS NOT NULL",
+        "SELECT query_to_xml('DELETE FROM users', true, true, '')",
+        "SELECT * FROM dblink('host=x', 'SELECT 1') AS t(a int)",
+        "SELECT pg_advisory_lock_shared(1)",
+        "SELECT pg_try_advisory_lock(1)",
+        "SELECT pg_catalog.pg_advisory_lock(42)",
+        "SELECT dblink_open('c', 'SELECT 1')",
+        "SELECT lo_from_bytea(0, 'x')",
+        "SELECT * FROM pg_ls_logdir()",
+        "SELECT PG_READ_FILE('postgresql.conf')",
+        "SELECT pg_switch_wal()",
+        "SELECT pg_create_restore_point('x')",
+        "SELECT pg_stat_reset()",
+        "SELECT pg_promote()",
+        "SELECT pg_drop_replication_slot('s')",
+        "SELECT pg_create_logical_replication_slot('s', 'test_decoding')",
+        "SELECT pg_logical_emit_message(true, 'p', 'm')",
+        "SELECT pg_file_write('f', 'x', false)",
+        "SELECT pg_replication_origin_drop('o')",
+        "SELECT current_setting('data_directory')",
+        "SELECT set_config('statement_timeout', '0', false)",
+    ])
+    def test_denied_functions(self, sql):
+        """Test that dangerous functions are rejected wherever they appear."""
+        result = validate_sql(sql)
+        assert not result.ok
+        assert "Function" in result.reason
+
+    def test_extra_denied_functions(self, monkeypatch):
+        """Test SQL_DENIED_FUNCTIONS."""
+        monkeypatch.setenv("SQL_DENIED_FUNCTIONS", "md5")
+        assert not validate_sql("SELECT md5(country) FROM users").ok
+
+
+class TestValidationCache:
+    """Test that repeated queries are not parsed again."""
+
+    def test_exact_repeat_skips_parsing(self, monkeypatch):
+        """Test that the second validation of the same text is a cache hit."""
+        sql = "SELECT method, SUM(amount_usd) FROM payments GROUP BY method"
+        assert validate_sql(sql).ok
+
+        def fail(*args, **kwargs):
+            raise AssertionError("parsed again")
+
+        monkeypatch.setattr(sql_validator, "_check_tokens", fail)
+        monkeypatch.setattr(sql_validator.DIALECT, "tokenize", fail)
+        assert validate_sql(f"  {sql}\n").ok
+        assert get_validation_cache_metrics()["hits"] == 1
+
+    def test_reformatted_repeat_skips_parsing(self, monkeypatch):
+        """Test that whitespace and keyword case changes hit the token-hash entry."""
+        assert validate_sql("SELECT country FROM users").ok
+        monkeypatch.setattr(sql_validator, "_check_tokens", lambda *a, **k: pytest.fail("parsed again"))
+        assert validate_sql("select   country\nfrom users").ok
+        assert get_validation_cache_metrics()["misses"] == 1
+
+    def test_identifiers_are_part_of_the_key(self):
+        """Test that queries differing only in identifiers get their own verdicts."""
+        assert validate_sql("SELECT * FROM users").ok
+        assert not validate_sql("SELECT * FROM secrets").ok
+
+    def test_allow_list_checked_on_hits(self, monkeypatch):
+        """Test that cached verdicts still see allow-list changes."""
+        assert not validate_sql("SELECT * FROM campaigns").ok
+        monkeypatch.setenv("SQL_ALLOWED_TABLES", "campaigns")
+        assert validate_sql("SELECT * FROM campaigns").ok
@@ -0,0 +1,108 @@
+"""
+Tests for question-aware table loading (services/table_loader.py)
+Tests column pruning, filter pushdown and memory-budget load modes.
+"""
+
+import pytest
+from core.services.table_loader import LoadPlan, detect_time_window, plan_table_load
+
+
+class TestTimeWindow:
+    """Test time window detection."""
+
+    def test_last_quarter(self):
+        """Test that 'last quarter' maps to 90 days."""
+        assert detect_time_window("revenue last quarter") == (90, "last 90 days")
+
+    def test_all_time(self):
+        """Test that no window means all time."""
+        assert detect_time_window("total revenue") == (None, "all time")
+
+
+class TestColumnPruning:
+    """Test that only relevant columns are selected."""
+
+    def test_revenue_selects_amount_and_time(self):
+        """Test that revenue questions load amount and payment date only."""
+        plan = plan_table_load("what is total revenue?", "payments")
+        assert plan.columns == ["payment_date", "amount_usd"]
+
+    def test_description_examples_select_column(self):
+        """Test that example values in field descriptions select the column."""
+        plan = plan_table_load("how many paypal payments?", "payments")
+        assert "method" in plan.columns
+
+    def test_no_match_loads_all_fields(self):
+        """Test that unmatched questions fall back to every semantic field."""
+        plan = plan_table_load("tell me something interesting", "sessions")
+        assert plan.columns == ["session_id", "user_id", "session_date", "duration_minutes", "activity_type"]
+
+
+class TestFilterPushdown:
+    """Test that filters are pushed into Postgres."""
+
+    def test_time_window_pushed_down(self):
+        """Test that the detected window becomes a WHERE clause."""
+        plan = plan_table_load("revenue last month", "payments")
+        sql, params = plan.to_sql()
+
+        assert "WHERE payment_date >= CURRENT_DATE - INTERVAL %s" in sql
+        assert params == ["30 days"]
+
+    def test_categorical_value_filter(self):
+        """Test that a mentioned plan value becomes an IN filter."""
+        plan = plan_table_load("how many annual subscriptions are active?", "subscriptions")
+        sql, params = plan.to_sql()
+
+        assert "LOWER(plan) IN %s" in sql
+        assert ("annual",) in params
+        assert "end_date IS NULL OR end_date > CURRENT_DATE" in sql
+
+    def test_comparisons_keep_every_value(self):
+        """Test that comparison and share questions load the values they compare against."""
+        for question, table in [
+            ("active vs churned subscriptions", "subscriptions"),
+            ("what share of subscriptions are active?", "subscriptions"),
+            ("what share of payments are paypal?", "payments"),
+            ("paypal or card: which brings more revenue?", "payments"),
+        ]:
+            plan = plan_table_load(question, table)
+            assert plan.filters == [], question
+
+    def test_raw_load_keeps_newest_rows(self):
+        """Test that a raw load orders by the time column so its limit drops the oldest rows."""
+        plan = plan_table_load("how many paypal payments?", "payments")
+        sql, _ = plan.to_sql()
+        assert sql.endswith(f"ORDER BY payment_date DESC LIMIT {plan.row_limit}")
+
+
+class TestMemoryBudget:
+    """Test load mode selection for large tables."""
+
+    def test_small_table_loads_raw(self):
+        """Test that tables within budget load raw rows."""
+        plan = plan_table_load("revenue by method", "payments", estimated_rows=5000, budget_bytes=10 * 1024 * 1024)
+        assert plan.mode == "raw"
+
+    def test_large_breakdown_is_aggregated(self):
+        """Test that a large breakdown is aggregated in Postgres."""
+        plan = plan_table_load("revenue by method", "payments", estimated_rows=50_000_000, budget_bytes=1024 * 1024)
+        sql, _ = plan.to_sql()
+
+        assert plan.mode == "aggregate"
+        assert "GROUP BY method" in sql
+        assert "SUM(amount_usd) AS sum_amount_usd" in sql
+
+    def test_large_lookup_is_sampled(self):
+        """Test that a large non-aggregate question loads a sample."""
+        plan = plan_table_load("what is the typical payment?", "payments", estimated_rows=50_000_000, budget_bytes=1024 * 1024)
+        sql, _ = plan.to_sql()
+
+        assert plan.mode == "sample"
+        assert "TABLESAMPLE SYSTEM" in sql
+        assert plan.sample_percent < 1
+
+    def test_invalid_identifier_rejected(self):
+        """Test that unsafe identifiers never reach the SQL text."""
+        with pytest.raises(ValueError):
+            LoadPlan(table="users; DROP TABLE users", columns=["*"]).to_sql()